@@ -0,0 +1,42 @@
+"""
+Миграция для добавления таблицы conversation_messages (история диалогов ИИ-режима).
+"""
+
+import asyncio
+import logging
+from sqlalchemy import inspect
+from bot.database.engine import create_engine
+from bot.models.base import Base
+import bot.models  # регистрация всех моделей
+from bot.config import settings
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+async def main():
+    """Добавляем таблицу conversation_messages"""
+
+    engine = create_engine(settings.database.url)
+
+    log.info("Создаём таблицу conversation_messages...")
+
+    async with engine.begin() as conn:
+        # Создаём все таблицы, которых ещё нет
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Проверяем существование таблицы
+    async with engine.begin() as conn:
+        columns = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_columns("conversation_messages")
+        )
+        log.info("✅ Таблица conversation_messages существует:")
+        for col in columns:
+            log.info(f"  - {col['name']} ({col['type']})")
+
+    # Закрываем соединение
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""
+Миграция для добавления подсчёта токенов к репликам conversation_messages
+(колонки tokens и tokenizer): кэш подсчёта токенов ИИ-сессии хранится
+вместе с историей, а не в FSM. Реплики без подсчёта досчитываются при загрузке.
+"""
+
+import asyncio
+import logging
+from sqlalchemy import inspect, text
+from bot.database.engine import create_engine
+from bot.models.base import Base
+import bot.models  # регистрация всех моделей
+from bot.config import settings
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+NEW_COLUMNS = {
+    "tokens": "INTEGER",
+    "tokenizer": "VARCHAR(100)",
+}
+
+
+async def main():
+    """Добавляем колонки tokens и tokenizer в conversation_messages"""
+
+    engine = create_engine(settings.database.url)
+
+    async with engine.begin() as conn:
+        # Создаём все таблицы, которых ещё нет (новые — сразу с колонками)
+        await conn.run_sync(Base.metadata.create_all)
+
+        existing = {
+            col["name"]
+            for col in await conn.run_sync(
+                lambda sync_conn: inspect(sync_conn).get_columns("conversation_messages")
+            )
+        }
+        for name, sql_type in NEW_COLUMNS.items():
+            if name in existing:
+                log.info(f"Колонка {name} уже существует, пропускаем")
+                continue
+            log.info(f"Добавляем колонку {name}...")
+            await conn.execute(
+                text(f"ALTER TABLE conversation_messages ADD COLUMN {name} {sql_type}")
+            )
+
+    # Проверяем колонки
+    async with engine.begin() as conn:
+        columns = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_columns("conversation_messages")
+        )
+        log.info("✅ Колонки conversation_messages:")
+        for col in columns:
+            log.info(f"  - {col['name']} ({col['type']})")
+
+    # Закрываем соединение
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
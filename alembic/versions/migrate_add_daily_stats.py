@@ -0,0 +1,51 @@
+"""
+Миграция для добавления таблицы daily_stats (дневная статистика для админки)
+и первичного заполнения её по исходным таблицам.
+"""
+
+import asyncio
+import logging
+from sqlalchemy import inspect
+from bot.database.engine import create_engine
+from bot.models.base import Base
+import bot.models  # регистрация всех моделей
+from bot.config import settings
+from bot.services.daily_stats import DailyStatsService
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+async def main():
+    """Добавляем таблицу daily_stats и заполняем её"""
+
+    engine = create_engine(settings.database.url)
+
+    log.info("Создаём таблицу daily_stats...")
+
+    async with engine.begin() as conn:
+        # Создаём все таблицы, которых ещё нет
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Проверяем существование таблицы
+    async with engine.begin() as conn:
+        columns = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_columns("daily_stats")
+        )
+        log.info("✅ Таблица daily_stats существует:")
+        for col in columns:
+            log.info(f"  - {col['name']} ({col['type']})")
+
+    # Пересчёт по исходным таблицам (повторный запуск безопасен)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        corrections = await DailyStatsService.reconcile(session)
+    log.info(f"✅ Дневная статистика заполнена, поправки состояний: {corrections}")
+
+    # Закрываем соединение
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Миграция для добавления составных индексов keyset-пагинации:
+история консультаций и предсказаний — (user_id, created_at, id),
+все заказы — (created_at, id), очередь черновиков — (status, created_at, id).
+"""
+
+import asyncio
+import logging
+from sqlalchemy import inspect
+from bot.database.engine import create_engine
+from bot.models.base import Base
+import bot.models  # регистрация всех моделей
+from bot.models.consultation import Consultation
+from bot.models.hybrid_draft import HybridDraft
+from bot.models.order import Order
+from bot.models.prediction_history import PredictionHistory
+from bot.config import settings
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+KEYSET_INDEXES = {
+    Consultation.__table__: "ix_consultations_user_id_created_at_id",
+    PredictionHistory.__table__: "ix_prediction_history_user_id_created_at_id",
+    Order.__table__: "ix_orders_created_at_id",
+    HybridDraft.__table__: "ix_hybrid_drafts_status_created_at_id",
+}
+
+
+def _create_indexes(sync_conn) -> None:
+    for table, name in KEYSET_INDEXES.items():
+        index = next(index for index in table.indexes if index.name == name)
+        index.create(sync_conn, checkfirst=True)
+
+
+async def main():
+    """Добавляем составные индексы к существующим таблицам"""
+
+    engine = create_engine(settings.database.url)
+
+    log.info("Создаём индексы keyset-пагинации...")
+
+    async with engine.begin() as conn:
+        # Создаём все таблицы, которых ещё нет (новые — сразу с индексами)
+        await conn.run_sync(Base.metadata.create_all)
+        # Существующим таблицам create_all индексы не добавляет
+        await conn.run_sync(_create_indexes)
+
+    # Проверяем существование индексов
+    async with engine.begin() as conn:
+        for table, name in KEYSET_INDEXES.items():
+            indexes = await conn.run_sync(
+                lambda sync_conn, table_name=table.name: inspect(sync_conn).get_indexes(table_name)
+            )
+            found = next((index for index in indexes if index["name"] == name), None)
+            if found:
+                log.info(f"✅ Индекс {name} на {table.name} ({', '.join(found['column_names'])})")
+            else:
+                log.error(f"❌ Индекс {name} не найден")
+
+    # Закрываем соединение
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,7 +7,7 @@ import os
 import logging
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 # Загружаем .env из корня проекта
@@ -42,8 +42,43 @@ class TelegramConfig:
 
 @dataclass(frozen=True)
 class DatabaseConfig:
-    """Конфигурация базы данных."""
+    """Конфигурация базы данных и пула соединений."""
     url: str = "sqlite+aiosqlite:///mysticbot.db"
+    pool_size: int = 5                  # постоянных соединений в пуле
+    max_overflow: int = 10              # сверх pool_size на пиках
+    pool_timeout: float = 30.0          # ожидание свободного соединения (сек)
+    pool_recycle: int = 3600            # пересоздавать соединение старше N сек (-1 — никогда)
+    pool_pre_ping: bool = True          # проверка соединения перед выдачей (кроме SQLite)
+    warmup_connections: int = 2         # соединений открыть при старте (0 — без прогрева)
+    sqlite_busy_timeout: int = 5000     # SQLite: ждать снятия блокировки записи (мс)
+    sqlite_synchronous: str = "NORMAL"  # SQLite: fsync только на checkpoint WAL (FULL — на каждый COMMIT)
+    sqlite_cache_size_kb: int = 65536   # SQLite: страничный кэш соединения (КиБ)
+    sqlite_mmap_size_mb: int = 256      # SQLite: чтение файла через mmap (0 — выключено)
+    sqlite_writer: bool = True          # SQLite: записи истории через одного писателя (group commit)
+    sqlite_writer_batch: int = 100      # SQLite: записей в одном COMMIT писателя (не больше)
+
+
+@dataclass(frozen=True)
+class HttpTransportConfig:
+    """Пул соединений httpx одного LLM-провайдера."""
+    max_connections: int = 100          # всего соединений (активные + простаивающие)
+    max_keepalive_connections: int = 20 # простаивающих соединений держим открытыми
+    keepalive_expiry: float = 120.0     # сколько держать простаивающее соединение (сек)
+    http2: bool = False                 # HTTP/2 (нужен пакет h2), иначе HTTP/1.1
+    connect_timeout: float = 10.0       # установка TCP/TLS (сек)
+    pool_timeout: float = 10.0          # ожидание свободного соединения из пула (сек)
+    warmup_connections: int = 2         # соединений прогреть при старте (0 — без прогрева)
+
+
+@dataclass(frozen=True)
+class RateLimitConfig:
+    """Клиентский лимит запросов к LLM-провайдеру (token bucket, подстройка по 429 и заголовкам)."""
+    enabled: bool = True
+    requests_per_minute: int = 0        # RPM (0 — неизвестен: из заголовков / оценка по 429)
+    tokens_per_minute: int = 0          # TPM (0 — неизвестен: из заголовков x-ratelimit-*)
+    max_wait: float = 20.0              # дольше ждать квоту не стоит — запрос уйдёт другому провайдеру
+    backoff_factor: float = 0.7         # множитель скорости после 429
+    recovery_per_minute: float = 0.1    # возврат скорости после 429 (доля лимита в минуту)
 
 
 @dataclass(frozen=True)
@@ -55,6 +90,10 @@ class FeatherlessConfig:
     timeout: int = 120          # секунды (холодный старт модели)
     max_retries: int = 3        # retry при 503
     retry_delay: float = 30.0   # пауза между retry (сек)
+    context_window: int = 32768 # окно контекста модели (токены)
+    max_concurrency: int = 4    # одновременных запросов (лимит тарифа)
+    transport: HttpTransportConfig = field(default_factory=HttpTransportConfig)
+    rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
     enabled: bool = False
 
 
@@ -65,6 +104,10 @@ class PerplexityConfig:
     base_url: str = "https://api.perplexity.ai"
     model: str = "sonar-pro"
     timeout: int = 60
+    context_window: int = 127072
+    max_concurrency: int = 10
+    transport: HttpTransportConfig = field(default_factory=HttpTransportConfig)
+    rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
     enabled: bool = False
 
 
@@ -75,9 +118,131 @@ class OpenAIConfig:
     base_url: str = "https://api.openai.com/v1"
     model: str = "gpt-4o-mini"
     timeout: int = 60
+    context_window: int = 128000
+    max_concurrency: int = 20
+    transport: HttpTransportConfig = field(default_factory=HttpTransportConfig)
+    rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
     enabled: bool = False
 
 
+@dataclass(frozen=True)
+class LLMCacheConfig:
+    """Кэш ответов LLM: LRU в процессе + опциональный Redis-уровень."""
+    enabled: bool = True
+    max_entries: int = 1000         # размер LRU в процессе
+    default_ttl: int = 3600         # TTL по умолчанию (сек)
+    max_temperature: float = 0.3    # кэшируются только запросы с temperature ≤ порога
+    use_redis: bool = True          # второй уровень в Redis (если задан REDIS_URL)
+    # ИИ-режим: температура первого вопроса сессии, чтобы ответ попадал в кэш;
+    # None — как у всего диалога (опенеры не кэшируются)
+    opener_temperature: Optional[float] = None
+    feature_ttls: Dict[str, int] = field(default_factory=lambda: {
+        "ask": 6 * 3600,
+        "ai_mode_opener": 3600,
+    })
+
+
+@dataclass(frozen=True)
+class LLMRoutingConfig:
+    """Маршрутизация между LLM-провайдерами: хеджирование, circuit breaker, выбор по задержкам."""
+    hedging_enabled: bool = True
+    hedge_percentile: float = 0.95  # дедлайн = этот перцентиль задержек провайдера
+    hedge_min_delay: float = 2.0    # нижняя граница дедлайна (сек)
+    hedge_max_delay: float = 30.0   # верхняя граница дедлайна (сек)
+    hedge_default_delay: float = 15.0  # дедлайн, пока замеров мало (сек)
+    latency_window: int = 200       # размер скользящего окна замеров
+    min_samples: int = 20           # замеров для расчёта перцентиля
+    prefer_fastest: bool = True     # порядок опроса — по медианной задержке здоровых провайдеров
+    # Circuit breaker
+    breaker_enabled: bool = True
+    breaker_window: float = 60.0    # окно оценки (сек)
+    breaker_min_requests: int = 5   # мин. исходов в окне для решения
+    breaker_error_rate: float = 0.5     # доля ошибок для размыкания
+    breaker_slow_call_seconds: float = 60.0  # ответ дольше — «медленный»
+    breaker_slow_call_rate: float = 0.8     # доля медленных для размыкания
+    breaker_open_seconds: float = 30.0  # пауза перед пробным запросом
+    probe_interval: float = 30.0    # период фоновой проверки разомкнутых провайдеров
+
+
+@dataclass(frozen=True)
+class LLMSchedulerConfig:
+    """Очередь LLM-запросов: справедливое распределение мест между пользователями."""
+    enabled: bool = True
+    paid_weight: float = 4.0        # вес оплативших (доля мест относительно обычных)
+    background_weight: float = 0.25 # вес фоновых задач (конспекты, рассылки)
+    user_max_queued: int = 3        # макс. ожидающих запросов одного пользователя
+
+
+@dataclass(frozen=True)
+class LLMContextConfig:
+    """Бюджет контекста диалога: токенизатор и запас до окна модели."""
+    tokenizer: str = "auto"         # auto | tiktoken | huggingface | heuristic
+    safety_margin: int = 256        # токенов запаса сверх ответа (расхождения токенизаторов)
+    # Сжатие длинных диалогов в конспект (в фоне, после ответа)
+    summary_enabled: bool = True
+    summary_trigger_tokens: int = 3000  # токенов истории для запуска сжатия
+    summary_trigger_messages: int = 12  # или столько реплик
+    summary_keep_last: int = 4          # последних реплик остаются дословно
+    summary_max_tokens: int = 400       # лимит длины конспекта
+
+
+@dataclass(frozen=True)
+class ConversationConfig:
+    """Хранилище истории диалогов ИИ-режима (FSM держит только указатель)."""
+    backend: str = "auto"           # auto | redis | sql | memory
+    ttl: int = 86400                # срок жизни сессии в Redis (сек)
+
+
+@dataclass(frozen=True)
+class BroadcastConfig:
+    """Массовые рассылки (ежедневные уведомления, /admin_broadcast)."""
+    workers: int = 16                   # параллельных отправителей
+    global_rate: float = 25.0           # сообщений в секунду на бота (лимит Telegram ~30)
+    per_chat_interval: float = 1.0      # мин. пауза между сообщениями в один чат (сек)
+    max_retries: int = 3                # попыток при сетевых ошибках / 5xx
+    checkpoint_every: int = 50          # сохранять прогресс каждые N доставок
+    checkpoint_dir: str = "data/broadcasts"  # файлы прогресса (относительно корня проекта)
+    checkpoint_keep_hours: int = 48     # завершённые checkpoint старше — удаляются
+
+
+@dataclass(frozen=True)
+class CounterBufferConfig:
+    """Буфер счётчиков активности: инкременты пишутся в БД пачками."""
+    enabled: bool = True
+    flush_interval: float = 5.0     # период записи в БД (сек)
+    quota_ttl: int = 300            # снимок лимита ИИ из БД перечитывается раз в N сек
+
+
+@dataclass(frozen=True)
+class UserContextConfig:
+    """Кэш настроек пользователей (загружаются один раз на апдейт в middleware)."""
+    cache_ttl: float = 30.0         # сек; 0 — без кэша (SELECT на каждый апдейт)
+    cache_size: int = 10000         # макс. пользователей в кэше
+
+
+@dataclass(frozen=True)
+class StatsConfig:
+    """Статистика для админки и консультанта."""
+    cache_ttl: float = 30.0         # сек: панель пересчитывается не чаще; 0 — без кэша
+    rollups: bool = True            # дневные счётчики (daily_stats) вместо агрегатов по таблицам
+    flush_interval: float = 5.0     # период записи накопленных отметок в daily_stats (сек)
+    reconcile_hour: int = 3         # час (UTC), после которого идёт ночная сверка
+    reconcile_days: int = 2         # сколько последних дней пересчитывать при сверке
+
+
+@dataclass(frozen=True)
+class AIQuotaConfig:
+    """Дневной лимит ИИ-запросов: где хранится счётчик."""
+    backend: str = "auto"           # auto (буфер счётчиков, иначе sql) | buffer | sql | redis
+
+
+@dataclass(frozen=True)
+class NotificationSchedulerConfig:
+    """Планировщик ежедневных уведомлений внутри бота (вместо cron)."""
+    enabled: bool = True
+    catch_up_minutes: int = 10      # пропущенные минуты (рестарт, задержка цикла) догоняются
+
+
 @dataclass(frozen=True)
 class FeaturesConfig:
     """Флаги функционала."""
@@ -105,6 +270,17 @@ class Settings:
     perplexity: PerplexityConfig = field(default_factory=PerplexityConfig)
     openai: OpenAIConfig = field(default_factory=OpenAIConfig)
     features: FeaturesConfig = field(default_factory=FeaturesConfig)
+    llm_cache: LLMCacheConfig = field(default_factory=LLMCacheConfig)
+    llm_routing: LLMRoutingConfig = field(default_factory=LLMRoutingConfig)
+    llm_context: LLMContextConfig = field(default_factory=LLMContextConfig)
+    llm_scheduler: LLMSchedulerConfig = field(default_factory=LLMSchedulerConfig)
+    conversation: ConversationConfig = field(default_factory=ConversationConfig)
+    broadcast: BroadcastConfig = field(default_factory=BroadcastConfig)
+    notifications: NotificationSchedulerConfig = field(default_factory=NotificationSchedulerConfig)
+    counters: CounterBufferConfig = field(default_factory=CounterBufferConfig)
+    ai_quota: AIQuotaConfig = field(default_factory=AIQuotaConfig)
+    user_context: UserContextConfig = field(default_factory=UserContextConfig)
+    stats: StatsConfig = field(default_factory=StatsConfig)
     rate_limit: float = 2.0
     rate_window: int = 5
     REDIS_URL: str = ""
@@ -126,6 +302,11 @@ class Settings:
             providers.append("openai")
         return providers
 
+    @property
+    def is_llm_configured(self) -> bool:
+        """Настроен ли хотя бы один LLM-провайдер."""
+        return bool(self.llm_providers_order)
+
 
 def _parse_bool(value: str, default: bool = False) -> bool:
     """Парсинг строкового bool из .env."""
@@ -134,6 +315,56 @@ def _parse_bool(value: str, default: bool = False) -> bool:
     return value.strip().lower() in ("true", "1", "yes", "on")
 
 
+def _parse_ttl_map(value: str, default: Dict[str, int]) -> Dict[str, int]:
+    """Парсинг карты TTL вида 'ask=21600,ai_mode_opener=3600'."""
+    result = dict(default)
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        name, ttl = item.split("=", 1)
+        name = name.strip()
+        if name:
+            result[name] = _parse_int(ttl, result.get(name, 0))
+    return result
+
+
+def _load_transport(prefix: str, base: HttpTransportConfig) -> HttpTransportConfig:
+    """
+    Настройки пула провайдера: {PREFIX}_HTTP_* поверх общих LLM_HTTP_*.
+    """
+    def env(name: str) -> str:
+        return os.getenv(f"{prefix}_HTTP_{name}", "").strip()
+
+    return HttpTransportConfig(
+        max_connections=_parse_int(env("MAX_CONNECTIONS"), base.max_connections),
+        max_keepalive_connections=_parse_int(
+            env("MAX_KEEPALIVE"), base.max_keepalive_connections
+        ),
+        keepalive_expiry=_parse_float(env("KEEPALIVE_EXPIRY"), base.keepalive_expiry),
+        http2=_parse_bool(env("HTTP2"), base.http2),
+        connect_timeout=_parse_float(env("CONNECT_TIMEOUT"), base.connect_timeout),
+        pool_timeout=_parse_float(env("POOL_TIMEOUT"), base.pool_timeout),
+        warmup_connections=_parse_int(env("WARMUP_CONNECTIONS"), base.warmup_connections),
+    )
+
+
+def _load_rate_limit(prefix: str, base: RateLimitConfig) -> RateLimitConfig:
+    """
+    Лимиты провайдера: {PREFIX}_RATE_* поверх общих LLM_RATE_*.
+    """
+    def env(name: str) -> str:
+        return os.getenv(f"{prefix}_RATE_{name}", "").strip()
+
+    return RateLimitConfig(
+        enabled=_parse_bool(env("LIMIT_ENABLED"), base.enabled),
+        requests_per_minute=_parse_int(env("RPM"), base.requests_per_minute),
+        tokens_per_minute=_parse_int(env("TPM"), base.tokens_per_minute),
+        max_wait=_parse_float(env("MAX_WAIT"), base.max_wait),
+        backoff_factor=_parse_float(env("BACKOFF"), base.backoff_factor),
+        recovery_per_minute=_parse_float(env("RECOVERY"), base.recovery_per_minute),
+    )
+
+
 def load_settings() -> Settings:
     """
     Загрузка настроек из переменных окружения.
@@ -168,7 +399,31 @@ def load_settings() -> Settings:
 
     # --- Database ---
     db_url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///mysticbot.db").strip()
-    database = DatabaseConfig(url=db_url)
+    sqlite_synchronous = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").strip().upper()
+    if sqlite_synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        warnings.append(f"⚠️ SQLITE_SYNCHRONOUS={sqlite_synchronous} не поддерживается, используется NORMAL")
+        sqlite_synchronous = "NORMAL"
+    database = DatabaseConfig(
+        url=db_url,
+        pool_size=max(1, _parse_int(os.getenv("DB_POOL_SIZE", "5"), 5)),
+        max_overflow=max(0, _parse_int(os.getenv("DB_MAX_OVERFLOW", "10"), 10)),
+        pool_timeout=max(0.1, _parse_float(os.getenv("DB_POOL_TIMEOUT", "30"), 30.0)),
+        pool_recycle=_parse_int(os.getenv("DB_POOL_RECYCLE", "3600"), 3600),
+        pool_pre_ping=_parse_bool(os.getenv("DB_POOL_PRE_PING", "true"), True),
+        warmup_connections=max(0, _parse_int(os.getenv("DB_WARMUP_CONNECTIONS", "2"), 2)),
+        sqlite_busy_timeout=max(0, _parse_int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"), 5000)),
+        sqlite_synchronous=sqlite_synchronous,
+        sqlite_cache_size_kb=max(0, _parse_int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"), 65536)),
+        sqlite_mmap_size_mb=max(0, _parse_int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"), 256)),
+        sqlite_writer=_parse_bool(os.getenv("SQLITE_WRITER", "true"), True),
+        sqlite_writer_batch=max(1, _parse_int(os.getenv("SQLITE_WRITER_BATCH", "100"), 100)),
+    )
+
+    # --- Пулы соединений LLM (общие LLM_HTTP_*, переопределения {PROVIDER}_HTTP_*) ---
+    llm_transport = _load_transport("LLM", HttpTransportConfig())
+
+    # --- Rate limit LLM (общие LLM_RATE_*, переопределения {PROVIDER}_RATE_*) ---
+    llm_rate_limit = _load_rate_limit("LLM", RateLimitConfig())
 
     # --- Featherless AI ---
     fl_key = os.getenv("FEATHERLESS_API_KEY", "").strip()
@@ -180,6 +435,7 @@ def load_settings() -> Settings:
     fl_model = os.getenv("FEATHERLESS_MODEL", "zai-org/GLM-4.7-Flash").strip()
     fl_timeout = _parse_int(os.getenv("FEATHERLESS_TIMEOUT", "120"), 120)
     fl_retries = _parse_int(os.getenv("FEATHERLESS_MAX_RETRIES", "3"), 3)
+    fl_context = _parse_int(os.getenv("FEATHERLESS_CONTEXT_WINDOW", "32768"), 32768)
 
     # Улучшенная валидация base_url
     if fl_key:
@@ -207,6 +463,10 @@ def load_settings() -> Settings:
         model=fl_model,
         timeout=fl_timeout,
         max_retries=fl_retries,
+        context_window=fl_context,
+        max_concurrency=_parse_int(os.getenv("FEATHERLESS_MAX_CONCURRENCY", "4"), 4),
+        transport=_load_transport("FEATHERLESS", llm_transport),
+        rate_limit=_load_rate_limit("FEATHERLESS", llm_rate_limit),
         enabled=bool(fl_key),
     )
 
@@ -220,6 +480,10 @@ def load_settings() -> Settings:
     perplexity = PerplexityConfig(
         api_key=px_key,
         model=px_model,
+        context_window=_parse_int(os.getenv("PERPLEXITY_CONTEXT_WINDOW", "127072"), 127072),
+        max_concurrency=_parse_int(os.getenv("PERPLEXITY_MAX_CONCURRENCY", "10"), 10),
+        transport=_load_transport("PERPLEXITY", llm_transport),
+        rate_limit=_load_rate_limit("PERPLEXITY", llm_rate_limit),
         enabled=bool(px_key),
     )
 
@@ -233,6 +497,10 @@ def load_settings() -> Settings:
     openai_cfg = OpenAIConfig(
         api_key=oai_key,
         model=oai_model,
+        context_window=_parse_int(os.getenv("OPENAI_CONTEXT_WINDOW", "128000"), 128000),
+        max_concurrency=_parse_int(os.getenv("OPENAI_MAX_CONCURRENCY", "20"), 20),
+        transport=_load_transport("OPENAI", llm_transport),
+        rate_limit=_load_rate_limit("OPENAI", llm_rate_limit),
         enabled=bool(oai_key),
     )
 
@@ -253,6 +521,106 @@ def load_settings() -> Settings:
         enable_meditation=_parse_bool(os.getenv("ENABLE_MEDITATION", "true"), True),
     )
 
+    # --- LLM cache ---
+    cache_defaults = LLMCacheConfig()
+    llm_cache = LLMCacheConfig(
+        enabled=_parse_bool(os.getenv("LLM_CACHE_ENABLED", "true"), True),
+        max_entries=_parse_int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"), 1000),
+        default_ttl=_parse_int(os.getenv("LLM_CACHE_TTL", "3600"), 3600),
+        max_temperature=_parse_float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"), 0.3),
+        use_redis=_parse_bool(os.getenv("LLM_CACHE_REDIS", "true"), True),
+        opener_temperature=(
+            _parse_float(os.getenv("LLM_CACHE_OPENER_TEMPERATURE", ""), 0.3)
+            if os.getenv("LLM_CACHE_OPENER_TEMPERATURE", "").strip()
+            else None
+        ),
+        feature_ttls=_parse_ttl_map(os.getenv("LLM_CACHE_TTLS", ""), cache_defaults.feature_ttls),
+    )
+
+    # --- LLM routing (hedged requests) ---
+    llm_routing = LLMRoutingConfig(
+        hedging_enabled=_parse_bool(os.getenv("LLM_HEDGE_ENABLED", "true"), True),
+        hedge_percentile=_parse_float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"), 0.95),
+        hedge_min_delay=_parse_float(os.getenv("LLM_HEDGE_MIN_DELAY", "2.0"), 2.0),
+        hedge_max_delay=_parse_float(os.getenv("LLM_HEDGE_MAX_DELAY", "30.0"), 30.0),
+        hedge_default_delay=_parse_float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "15.0"), 15.0),
+        latency_window=_parse_int(os.getenv("LLM_LATENCY_WINDOW", "200"), 200),
+        min_samples=_parse_int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "20"), 20),
+        prefer_fastest=_parse_bool(os.getenv("LLM_PREFER_FASTEST", "true"), True),
+        breaker_enabled=_parse_bool(os.getenv("LLM_BREAKER_ENABLED", "true"), True),
+        breaker_window=_parse_float(os.getenv("LLM_BREAKER_WINDOW", "60"), 60.0),
+        breaker_min_requests=_parse_int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "5"), 5),
+        breaker_error_rate=_parse_float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"), 0.5),
+        breaker_slow_call_seconds=_parse_float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "60"), 60.0),
+        breaker_slow_call_rate=_parse_float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"), 0.8),
+        breaker_open_seconds=_parse_float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"), 30.0),
+        probe_interval=_parse_float(os.getenv("LLM_PROBE_INTERVAL", "30"), 30.0),
+    )
+
+    # --- Бюджет контекста ---
+    llm_context = LLMContextConfig(
+        tokenizer=os.getenv("LLM_TOKENIZER", "auto").strip().lower() or "auto",
+        safety_margin=_parse_int(os.getenv("LLM_CONTEXT_SAFETY_MARGIN", "256"), 256),
+        summary_enabled=_parse_bool(os.getenv("AI_SUMMARY_ENABLED", "true"), True),
+        summary_trigger_tokens=_parse_int(os.getenv("AI_SUMMARY_TRIGGER_TOKENS", "3000"), 3000),
+        summary_trigger_messages=_parse_int(os.getenv("AI_SUMMARY_TRIGGER_MESSAGES", "12"), 12),
+        summary_keep_last=_parse_int(os.getenv("AI_SUMMARY_KEEP_LAST", "4"), 4),
+        summary_max_tokens=_parse_int(os.getenv("AI_SUMMARY_MAX_TOKENS", "400"), 400),
+    )
+
+    # --- Очередь LLM-запросов ---
+    llm_scheduler = LLMSchedulerConfig(
+        enabled=_parse_bool(os.getenv("LLM_QUEUE_ENABLED", "true"), True),
+        paid_weight=_parse_float(os.getenv("LLM_QUEUE_PAID_WEIGHT", "4.0"), 4.0),
+        background_weight=_parse_float(os.getenv("LLM_QUEUE_BACKGROUND_WEIGHT", "0.25"), 0.25),
+        user_max_queued=_parse_int(os.getenv("LLM_QUEUE_USER_MAX", "3"), 3),
+    )
+
+    # --- История диалогов ИИ-режима ---
+    conversation = ConversationConfig(
+        backend=os.getenv("CONVERSATION_STORE", "auto").strip().lower() or "auto",
+        ttl=_parse_int(os.getenv("CONVERSATION_TTL", "86400"), 86400),
+    )
+
+    # --- Рассылки ---
+    broadcast = BroadcastConfig(
+        workers=max(1, _parse_int(os.getenv("BROADCAST_WORKERS", "16"), 16)),
+        global_rate=_parse_float(os.getenv("BROADCAST_RATE", "25"), 25.0),
+        per_chat_interval=_parse_float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0"), 1.0),
+        max_retries=_parse_int(os.getenv("BROADCAST_MAX_RETRIES", "3"), 3),
+        checkpoint_every=max(1, _parse_int(os.getenv("BROADCAST_CHECKPOINT_EVERY", "50"), 50)),
+        checkpoint_dir=os.getenv("BROADCAST_CHECKPOINT_DIR", "data/broadcasts").strip()
+        or "data/broadcasts",
+        checkpoint_keep_hours=max(1, _parse_int(os.getenv("BROADCAST_CHECKPOINT_KEEP_HOURS", "48"), 48)),
+    )
+
+    # --- Планировщик ежедневных уведомлений ---
+    notifications = NotificationSchedulerConfig(
+        enabled=_parse_bool(os.getenv("NOTIFICATION_SCHEDULER_ENABLED", "true"), True),
+        catch_up_minutes=max(0, _parse_int(os.getenv("NOTIFICATION_CATCH_UP_MINUTES", "10"), 10)),
+    )
+
+    # --- Буфер счётчиков активности ---
+    counters = CounterBufferConfig(
+        enabled=_parse_bool(os.getenv("COUNTER_BUFFER_ENABLED", "true"), True),
+        flush_interval=max(0.1, _parse_float(os.getenv("COUNTER_FLUSH_INTERVAL", "5"), 5.0)),
+        quota_ttl=_parse_int(os.getenv("COUNTER_QUOTA_TTL", "300"), 300),
+    )
+    ai_quota = AIQuotaConfig(
+        backend=os.getenv("AI_QUOTA_BACKEND", "auto").strip().lower() or "auto",
+    )
+    user_context = UserContextConfig(
+        cache_ttl=max(0.0, _parse_float(os.getenv("USER_CACHE_TTL", "30"), 30.0)),
+        cache_size=max(1, _parse_int(os.getenv("USER_CACHE_SIZE", "10000"), 10000)),
+    )
+    stats = StatsConfig(
+        cache_ttl=max(0.0, _parse_float(os.getenv("STATS_CACHE_TTL", "30"), 30.0)),
+        rollups=_parse_bool(os.getenv("STATS_ROLLUPS", "true"), True),
+        flush_interval=max(0.1, _parse_float(os.getenv("STATS_FLUSH_INTERVAL", "5"), 5.0)),
+        reconcile_hour=min(23, max(0, _parse_int(os.getenv("STATS_RECONCILE_HOUR", "3"), 3))),
+        reconcile_days=max(0, _parse_int(os.getenv("STATS_RECONCILE_DAYS", "2"), 2)),
+    )
+
     log_level = os.getenv("LOG_LEVEL", "INFO").strip().upper()
 
     # Rate limiting and Redis
@@ -272,6 +640,17 @@ def load_settings() -> Settings:
         perplexity=perplexity,
         openai=openai_cfg,
         features=features,
+        llm_cache=llm_cache,
+        llm_routing=llm_routing,
+        llm_context=llm_context,
+        llm_scheduler=llm_scheduler,
+        conversation=conversation,
+        broadcast=broadcast,
+        notifications=notifications,
+        counters=counters,
+        ai_quota=ai_quota,
+        user_context=user_context,
+        stats=stats,
         rate_limit=rate_limit,
         rate_window=rate_window,
         REDIS_URL=REDIS_URL,
@@ -2,51 +2,216 @@
 Движок базы данных SQLAlchemy с connection pooling.
 """
 import logging
-from typing import AsyncGenerator
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncGenerator, AsyncIterator, Optional
 
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     AsyncSession,
     async_sessionmaker,
     AsyncEngine,
 )
-from sqlalchemy.pool import QueuePool, NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+if TYPE_CHECKING:
+    from bot.config import DatabaseConfig
 
 logger = logging.getLogger(__name__)
 
+# Общий engine процесса: один пул на все handlers и сервисы
+_engine: Optional[AsyncEngine] = None
+_session_maker: Optional[async_sessionmaker] = None
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    QueuePool со счётчиками ожидания соединения: сколько запросов ждёт
+    прямо сейчас, сколько всего ждали и сколько отвалилось по pool_timeout.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self.waiting -= 1
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(0, self.overflow()),
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "wait_seconds": self.wait_seconds,
+            "wait_max_seconds": self.wait_max,
+            "timeouts": self.timeouts,
+        }
+
+
+def is_sqlite_file(database_url: str) -> bool:
+    """SQLite с файлом на диске (не :memory:)."""
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(engine: AsyncEngine, config: "DatabaseConfig") -> None:
+    """
+    Профиль производительности для каждого нового соединения SQLite:
+    WAL (чтение не ждёт записи), synchronous=NORMAL (в WAL — без fsync на
+    каждый COMMIT, целостность сохраняется), страничный кэш и mmap.
+    """
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(config.sqlite_cache_size_kb)}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.sqlite_mmap_size_mb) * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
 
-def create_engine(database_url: str, echo: bool = False) -> AsyncEngine:
+
+def create_engine(
+    database_url: str,
+    echo: bool = False,
+    config: Optional["DatabaseConfig"] = None,
+) -> AsyncEngine:
     """
     Создание async engine с настроенным connection pooling.
 
-    - SQLite: NullPool (потокобезопасность)
-    - PostgreSQL: QueuePool с разумными лимитами
+    - SQLite (файл): пул соединений в режиме WAL — файл не переоткрывается
+      на каждую сессию, чтение идёт параллельно записи
+    - SQLite (:memory:): одно общее соединение (StaticPool)
+    - PostgreSQL: QueuePool с параметрами из DatabaseConfig
     """
-    if "sqlite" in database_url:
-        logger.info(f"🗄️ SQLite engine: {database_url}")
-        return create_async_engine(
+    if config is None:
+        from bot.config import settings
+
+        config = settings.database
+
+    if make_url(database_url).get_backend_name() == "sqlite":
+        if not is_sqlite_file(database_url):
+            logger.info(f"🗄️ SQLite engine (in-memory): {database_url}")
+            return create_async_engine(
+                database_url,
+                echo=echo,
+                poolclass=StaticPool,   # у каждой in-memory базы своё соединение
+                connect_args={"check_same_thread": False},
+            )
+        logger.info(
+            f"🗄️ SQLite engine: {database_url} "
+            f"(WAL, synchronous={config.sqlite_synchronous}, "
+            f"pool_size={config.pool_size}, max_overflow={config.max_overflow})"
+        )
+        engine = create_async_engine(
             database_url,
             echo=echo,
-            poolclass=NullPool,  # SQLite не поддерживает QueuePool
+            poolclass=InstrumentedQueuePool,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.pool_timeout,
+            pool_recycle=config.pool_recycle,
             connect_args={"check_same_thread": False},
         )
+        _sqlite_pragmas(engine, config)
+        return engine
 
     # PostgreSQL / другие СУБД
-    logger.info(f"🐘 PostgreSQL engine: pool_size=5, max_overflow=10")
+    logger.info(
+        f"🐘 PostgreSQL engine: pool_size={config.pool_size}, "
+        f"max_overflow={config.max_overflow}, pool_timeout={config.pool_timeout:g}s"
+    )
     return create_async_engine(
         database_url,
         echo=echo,
-        poolclass=QueuePool,
-        pool_size=5,           # 5 постоянных соединений (было 10)
-        max_overflow=10,       # +10 пиковых (было 20)
-        pool_timeout=30,
-        pool_recycle=3600,     # Пересоздание каждый час
-        pool_pre_ping=True,    # Проверка перед использованием
+        poolclass=InstrumentedQueuePool,
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_timeout=config.pool_timeout,
+        pool_recycle=config.pool_recycle,
+        pool_pre_ping=config.pool_pre_ping,
     )
 
 
-def get_session_maker(engine: AsyncEngine) -> async_sessionmaker:
-    """Фабрика сессий."""
+async def warm_up_pool(engine: AsyncEngine, connections: int) -> int:
+    """
+    Прогрев пула: открыть до connections соединений (не больше pool_size)
+    и вернуть их в пул, чтобы первые апдейты не ждали подключения к БД.
+    """
+    pool = engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return 0
+    count = min(connections, pool.size())
+    opened = []
+    try:
+        for _ in range(count):
+            conn = await engine.connect()
+            opened.append(conn)
+            await conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in opened:
+            await conn.close()
+    return len(opened)
+
+
+def pool_stats(engine: Optional[AsyncEngine] = None) -> Optional[dict[str, float]]:
+    """Состояние пула общего engine (для /metrics); None — engine не создан."""
+    engine = engine or _engine
+    if engine is None or not isinstance(engine.pool, InstrumentedQueuePool):
+        return None
+    return engine.pool.stats()
+
+
+def get_engine() -> AsyncEngine:
+    """Общий engine процесса (создаётся при первом обращении по DATABASE_URL)."""
+    global _engine
+    if _engine is None:
+        from bot.config import settings
+
+        _engine = create_engine(settings.database.url)
+    return _engine
+
+
+async def dispose_engine() -> None:
+    """Закрыть пул общего engine (при остановке бота)."""
+    global _engine, _session_maker
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _session_maker = None
+
+
+def get_session_maker(engine: Optional[AsyncEngine] = None) -> async_sessionmaker:
+    """Фабрика сессий; без аргумента — общая фабрика над get_engine()."""
+    global _session_maker
+    if engine is None:
+        if _session_maker is None:
+            _session_maker = get_session_maker(get_engine())
+        return _session_maker
     return async_sessionmaker(
         engine,
         class_=AsyncSession,
@@ -56,6 +221,31 @@ def get_session_maker(engine: AsyncEngine) -> async_sessionmaker:
     )
 
 
+def dialect_insert(session: AsyncSession):
+    """insert() диалекта сессии — с on_conflict_do_update (UPSERT)."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"UPSERT для {dialect} не поддерживается")
+    return insert
+
+
+@asynccontextmanager
+async def session_scope(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия апдейта (из DbSessionMiddleware), а вне апдейта — новая сессия
+    из общего пула. Переданную сессию не закрывает: её закрывает middleware.
+    """
+    if session is not None:
+        yield session
+        return
+    async with get_session_maker()() as new_session:
+        yield new_session
+
+
 async def get_session(
     session_maker: async_sessionmaker,
 ) -> AsyncGenerator[AsyncSession, None]:
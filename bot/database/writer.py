@@ -0,0 +1,173 @@
+"""
+Единственный писатель SQLite (group commit).
+
+В SQLite писать может только одно соединение за раз, а каждый COMMIT —
+это синхронизация журнала. Записи из очереди выполняет одна фоновая задача:
+всё, что накопилось к моменту её пробуждения (до batch_size), уходит одним
+COMMIT. Если одна из записей пачки падает, пачка откатывается и записи
+повторяются по одной — ошибка достаётся только её автору.
+
+Чтение идёт как обычно через пул соединений (WAL: читатели не ждут писателя).
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.config import settings
+from bot.database.engine import is_sqlite_file
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Запись: получает сессию писателя, добавляет/меняет объекты, но не коммитит
+WriteJob = Callable[[AsyncSession], Awaitable[T]]
+
+
+class SQLiteWriter:
+    """
+    Использование:
+        writer = SQLiteWriter(session_maker)
+        writer.start()
+
+        async def write(session):
+            session.add(obj)
+            await session.flush()
+            return obj
+
+        obj = await writer.submit(write, session=caller_session)
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, batch_size: int = 100):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue[tuple[WriteJob, asyncio.Future]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, job: WriteJob[T], session: Optional[AsyncSession] = None) -> T:
+        """
+        Поставить запись в очередь и дождаться её COMMIT.
+
+        session — сессия вызывающего: её открытая транзакция фиксируется
+        заранее (незакоммиченная запись в ней держала бы блокировку SQLite,
+        которую ждёт писатель).
+        """
+        if session is not None and session.in_transaction():
+            await session.commit()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((job, future))
+        return await future
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописать очередь и остановить задачу."""
+        if self._task:
+            await self._queue.join()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.error(f"❌ Писатель SQLite: ошибка записи пачки: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: list[tuple[WriteJob, asyncio.Future]]) -> None:
+        # Общий COMMIT на всю пачку
+        error: Optional[Exception] = None
+        async with self.session_maker() as session:
+            try:
+                results = [await job(session) for job, _ in batch]
+                await session.commit()
+            except Exception as e:
+                # Именно rollback (не close): новые объекты пачки снова станут
+                # transient и при повторе вставятся заново
+                await session.rollback()
+                error = e
+        if error is not None:
+            if len(batch) == 1:
+                raise error
+            logger.warning(f"⚠️ Писатель SQLite: пачка из {len(batch)} откатена ({error}), запись по одной")
+            for item in batch:
+                await self._write_one(*item)
+            return
+        for (_, future), result in zip(batch, results, strict=True):
+            if not future.done():
+                future.set_result(result)
+        logger.debug(f"💾 Писатель SQLite: {len(batch)} записей одним COMMIT")
+
+    async def _write_one(self, job: WriteJob, future: asyncio.Future) -> None:
+        async with self.session_maker() as session:
+            try:
+                result = await job(session)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                if not future.done():
+                    future.set_exception(e)
+                return
+        if not future.done():
+            future.set_result(result)
+
+
+_writer: Optional[SQLiteWriter] = None
+
+
+def init_sqlite_writer(session_maker: async_sessionmaker) -> Optional[SQLiteWriter]:
+    """Запуск писателя при старте бота (только SQLite-файл и SQLITE_WRITER=true)."""
+    global _writer
+    config = settings.database
+    if not config.sqlite_writer or not is_sqlite_file(config.url):
+        return None
+    _writer = SQLiteWriter(session_maker, batch_size=config.sqlite_writer_batch)
+    _writer.start()
+    logger.info(f"💾 Писатель SQLite: group commit до {config.sqlite_writer_batch} записей")
+    return _writer
+
+
+async def close_sqlite_writer() -> None:
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+
+def get_sqlite_writer() -> Optional[SQLiteWriter]:
+    """Запущенный писатель или None (тогда запись — в сессии вызывающего)."""
+    return _writer
+
+
+async def persist(session: AsyncSession, obj: T) -> T:
+    """
+    Сохранить новый объект с COMMIT: через писателя SQLite, если он запущен,
+    иначе в сессии вызывающего.
+    """
+    writer = get_sqlite_writer()
+    if writer is None:
+        session.add(obj)
+        await session.commit()
+        await session.refresh(obj)
+        return obj
+
+    async def write(writer_session: AsyncSession) -> T:
+        writer_session.add(obj)
+        await writer_session.flush()
+        return obj
+
+    return await writer.submit(write, session=session)
@@ -2,23 +2,47 @@
 Административные команды
 """
 
+import asyncio
 import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
 
-from aiogram import Router, types, F
+from aiogram import Bot, Router, types, F
 from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.services.order import OrderService, OrderStatus
+from bot.models.hybrid_draft import DraftStatus
 from bot.services.hybrid_draft import HybridDraftService
-from bot.database.engine import get_session_maker, create_engine
+from bot.services.daily_stats import (
+    AI_REQUESTS,
+    CONSULTATIONS,
+    DRAFT_STATUS,
+    ORDER_STATUS,
+    ORDERS_CREATED,
+    ORDERS_PAID,
+    PREDICTIONS,
+    USERS_NEW,
+    DailyStatsService,
+    rollups_active,
+    status_metric,
+)
+from bot.services.broadcast import BroadcastEngine, BroadcastStats, unfinished_broadcasts
+from bot.services.user_settings import UserSettingsService
+from bot.database.engine import session_scope
 from bot.config import settings
 
 log = logging.getLogger(__name__)
 
 router = Router()
 
+# Фоновые рассылки (ссылки держим, чтобы задачи не собрал GC)
+_broadcast_tasks: set[asyncio.Task] = set()
+
 def is_admin(user_id: int) -> bool:
     """Проверка прав администратора"""
     return user_id == settings.telegram.admin_user_id
@@ -50,36 +74,93 @@ async def cmd_admin(message: Message):
 
 
 @router.message(Command("admin_stats"))
-async def cmd_admin_stats(message: Message):
-    """Статистика для администратора"""
+async def cmd_admin_stats(
+    message: Message,
+    command: CommandObject,
+    session: Optional[AsyncSession] = None,
+):
+    """
+    Статистика для администратора (из daily_stats).
+
+    /admin_stats — итоги, сегодня и последние 7 дней
+    /admin_stats 2025-01-01 2025-01-31 — по дням за период
+    """
     if not is_admin(message.from_user.id):
         await message.answer("⛔️ Доступ запрещён.")
         return
-    
-    stats_text = """
-📈 *Административная статистика*
+    if not settings.database.url:
+        await message.answer("❌ База данных не настроена.")
+        return
 
-*Пользователи:*
-- Всего: 1
-- Новые за день: 1
-- Активные за неделю: 1
+    today = datetime.utcnow().date()
+    start, end = today - timedelta(days=6), today
+    if command.args:
+        try:
+            parts = command.args.split()
+            start = date.fromisoformat(parts[0])
+            end = date.fromisoformat(parts[1]) if len(parts) > 1 else start
+        except (ValueError, IndexError):
+            await message.answer("Формат: /admin_stats [ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]]")
+            return
+        if end < start or (end - start).days > 92:
+            await message.answer("❌ Период — не длиннее 93 дней, начало не позже конца.")
+            return
 
-*Запросы:*
-- Всего: 0
-- Успешных: 0
-- Ошибок: 0
+    async with session_scope(session) as db:
+        totals = await DailyStatsService.rollup(db)
+        days = await DailyStatsService.by_day(db, start, end)
+
+    def metric(values: dict, name: str) -> int:
+        return values.get(name, 0)
+
+    predictions = sum(n for m, n in totals.items() if m.startswith(PREDICTIONS + "."))
+    orders_total = sum(n for m, n in totals.items() if m.startswith(ORDER_STATUS + "."))
+    today_values = days.get(today, {})
+
+    lines = [
+        "📈 *Административная статистика*",
+        "",
+        "*Всего:*",
+        f"- Пользователей: {metric(totals, USERS_NEW)}",
+        f"- Консультаций: {metric(totals, CONSULTATIONS)}",
+        f"- Предсказаний: {predictions}",
+        f"- Заказов: {orders_total} (оплачено: {metric(totals, ORDERS_PAID)})",
+        f"- Черновиков в очереди: {metric(totals, status_metric(DRAFT_STATUS, DraftStatus.PENDING))}",
+    ]
+    if start <= today <= end:
+        lines += [
+            "",
+            "*Сегодня:*",
+            f"- Новых пользователей: {metric(today_values, USERS_NEW)}",
+            f"- Запросов к ИИ: {metric(today_values, AI_REQUESTS)}",
+            f"- Консультаций: {metric(today_values, CONSULTATIONS)}",
+            f"- Заказов: {metric(today_values, ORDERS_CREATED)}",
+        ]
+
+    lines += ["", f"*По дням {start:%d.%m}–{end:%d.%m}* (новые / ИИ / конс. / заказы):"]
+    day = start
+    while day <= end:
+        values = days.get(day, {})
+        lines.append(
+            f"`{day:%d.%m}` {metric(values, USERS_NEW)} / {metric(values, AI_REQUESTS)} / "
+            f"{metric(values, CONSULTATIONS)} / {metric(values, ORDERS_CREATED)}"
+        )
+        day += timedelta(days=1)
 
-*Система:*
-- Время работы: 0 ч 0 мин
-- Использование памяти: ~50 MB
-- База данных: работает
-"""
-    await message.answer(stats_text, parse_mode="Markdown")
+    if not rollups_active():
+        lines += ["", "⚠️ Запись дневной статистики не запущена (`STATS_ROLLUPS`) — данные могут отставать."]
+    await message.answer("\n".join(lines), parse_mode="Markdown")
 
 
 @router.message(Command("admin_broadcast"))
-async def cmd_admin_broadcast(message: Message, command: CommandObject, state: FSMContext):
-    """Начать рассылку"""
+async def cmd_admin_broadcast(
+    message: Message,
+    command: CommandObject,
+    state: FSMContext,
+    session_maker=None,
+    session: Optional[AsyncSession] = None,
+):
+    """Начать рассылку всем пользователям (в фоне, с отчётом о прогрессе)"""
     if not is_admin(message.from_user.id):
         await message.answer("⛔️ Доступ запрещён.")
         return
@@ -88,22 +169,94 @@ async def cmd_admin_broadcast(message: Message, command: CommandObject, state: F
         await message.answer("📢 *Рассылка*\n\nИспользование: `/admin_broadcast текст`", parse_mode="Markdown")
         return
     
-    # Заглушка: просто эхо
-    await message.answer(f"📢 Рассылка (заглушка):\n\n{command.args}")
+    if session_maker is None:
+        await message.answer("❌ База данных недоступна — получателей взять неоткуда.")
+        return
+    
+    async with session_scope(session) as db:
+        recipients = await UserSettingsService.get_broadcast_recipients(db)
+    
+    if not recipients:
+        await message.answer("📭 Нет пользователей для рассылки.")
+        return
+    
+    run_id = f"admin-{int(time.time())}"
+    status = await message.answer(f"📢 Рассылка запущена: 0/{len(recipients)}")
+    _start_broadcast(
+        message.bot,
+        session_maker,
+        run_id,
+        dict.fromkeys(recipients, command.args),
+        meta={"kind": "admin", "text": command.args, "chat_id": message.chat.id},
+        status=status,
+    )
+
+
+def _start_broadcast(
+    bot: Bot,
+    session_maker,
+    run_id: str,
+    messages: dict[int, str],
+    meta: dict,
+    status: Message | None = None,
+) -> None:
+    """Запустить рассылку в фоне; прогресс — правкой сообщения status."""
+    
+    async def report(stats: BroadcastStats, final: bool = False) -> None:
+        text = (
+            f"{'✅ Рассылка завершена' if final else '📢 Рассылка'}: "
+            f"{stats.done}/{stats.total}\n"
+            f"Отправлено: {stats.sent} • Ошибок: {stats.failed} • "
+            f"Заблокировали: {stats.blocked}"
+        )
+        if final:
+            text += f"\n⏱ {stats.elapsed:.0f} с ({stats.rate:.1f} сообщ./с)"
+        if status is not None:
+            await status.edit_text(text)
+        elif final:
+            await bot.send_message(meta["chat_id"], text)
+    
+    async def run() -> None:
+        engine = BroadcastEngine(bot, session_maker)
+        try:
+            stats = await engine.run(run_id, messages, meta=meta, on_progress=report)
+            await report(stats, final=True)
+        except Exception as e:
+            log.exception(f"Рассылка {run_id} прервана: {e}")
+    
+    task = asyncio.create_task(run())
+    _broadcast_tasks.add(task)
+    task.add_done_callback(_broadcast_tasks.discard)
+
+
+def resume_admin_broadcasts(bot: Bot, session_maker) -> int:
+    """Продолжить рассылки администратора, прерванные падением/рестартом бота."""
+    resumed = 0
+    for checkpoint in unfinished_broadcasts("admin-"):
+        text = checkpoint.meta.get("text")
+        if not text:
+            continue
+        log.info(f"📢 Продолжаю рассылку {checkpoint.run_id}")
+        _start_broadcast(
+            bot,
+            session_maker,
+            checkpoint.run_id,
+            dict.fromkeys(checkpoint.recipients, text),
+            meta=checkpoint.meta,
+        )
+        resumed += 1
+    return resumed
 
 
 @router.message(Command("admin_orders"))
-async def cmd_admin_orders(message: Message):
+async def cmd_admin_orders(message: Message, session: Optional[AsyncSession] = None):
     """Управление заказами"""
     if not is_admin(message.from_user.id):
         await message.answer("⛔️ Доступ запрещён.")
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        order_service = OrderService(session)
+    async with session_scope(session) as db:
+        order_service = OrderService(db)
         
         # Получаем неоплаченные заказы
         unpaid_orders = await order_service.get_unpaid_orders(limit=20)
@@ -149,7 +302,7 @@ async def cmd_admin_orders(message: Message):
 
 
 @router.callback_query(lambda c: c.data.startswith("confirm_payment:"))
-async def handle_confirm_payment(callback: CallbackQuery):
+async def handle_confirm_payment(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Обработчик подтверждения оплаты"""
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -161,11 +314,8 @@ async def handle_confirm_payment(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        order_service = OrderService(session)
+    async with session_scope(session) as db:
+        order_service = OrderService(db)
         order = await order_service.get_order_by_id(order_id)
         
         if not order:
@@ -215,7 +365,7 @@ async def handle_add_note(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(F.text & F.from_user.id == settings.telegram.admin_user_id)
-async def handle_admin_note(message: Message, state: FSMContext):
+async def handle_admin_note(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработчик текстовых сообщений администратора для добавления заметки"""
     data = await state.get_data()
     order_id = data.get("admin_note_order_id")
@@ -223,10 +373,8 @@ async def handle_admin_note(message: Message, state: FSMContext):
     if order_id:
         note_text = message.text.strip()
         if note_text:
-            engine = create_engine(settings.database.url)
-
-            async with get_session_maker(engine)() as session:
-                order_service = OrderService(session)
+            async with session_scope(session) as db:
+                order_service = OrderService(db)
                 await order_service.add_admin_notes(order_id, note_text)
                 
             await message.answer(f"✅ Заметка добавлена к заказу #{order_id}.")
@@ -236,7 +384,7 @@ async def handle_admin_note(message: Message, state: FSMContext):
 
 
 @router.callback_query(lambda c: c.data.startswith("order_details:"))
-async def handle_order_details(callback: CallbackQuery):
+async def handle_order_details(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Обработчик просмотра деталей заказа"""
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -248,11 +396,8 @@ async def handle_order_details(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        order_service = OrderService(session)
+    async with session_scope(session) as db:
+        order_service = OrderService(db)
         order = await order_service.get_order_by_id(order_id)
         
         if not order:
@@ -280,7 +425,7 @@ async def handle_order_details(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data.startswith("ocr_screenshot:"))
-async def handle_ocr_screenshot(callback: CallbackQuery):
+async def handle_ocr_screenshot(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Распознавание текста на скриншоте оплаты"""
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -292,11 +437,8 @@ async def handle_ocr_screenshot(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        order_service = OrderService(session)
+    async with session_scope(session) as db:
+        order_service = OrderService(db)
         order = await order_service.get_order_by_id(order_id)
         
         if not order:
@@ -389,18 +531,15 @@ async def handle_ocr_screenshot(callback: CallbackQuery):
 
 
 @router.message(Command("admin_drafts"))
-async def cmd_admin_drafts(message: Message):
+async def cmd_admin_drafts(message: Message, session: Optional[AsyncSession] = None):
     """Просмотр черновиков, ожидающих проверки человеком"""
     if not is_admin(message.from_user.id):
         await message.answer("⛔️ Доступ запрещён.")
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
+    async with session_scope(session) as db:
         # Получаем черновики, ожидающие проверки
-        pending_drafts = await HybridDraftService.get_pending_drafts(session, limit=20)
+        pending_drafts = await HybridDraftService.get_pending_drafts(db, limit=20)
         
         if not pending_drafts:
             await message.answer("✅ *Нет черновиков, ожидающих проверки.*", parse_mode="Markdown")
@@ -438,7 +577,7 @@ async def cmd_admin_drafts(message: Message):
 
 
 @router.callback_query(lambda c: c.data.startswith("view_draft:"))
-async def handle_view_draft(callback: CallbackQuery):
+async def handle_view_draft(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Просмотр деталей черновика"""
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -450,11 +589,8 @@ async def handle_view_draft(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        draft = await HybridDraftService.get_draft_by_id(session, draft_id)
+    async with session_scope(session) as db:
+        draft = await HybridDraftService.get_draft_by_id(db, draft_id)
         
         if not draft:
             await callback.answer("❌ Черновик не найден.", show_alert=True)
@@ -487,7 +623,7 @@ async def handle_view_draft(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data.startswith("approve_draft:"))
-async def handle_approve_draft(callback: CallbackQuery):
+async def handle_approve_draft(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Одобрение черновика (отправка как есть)"""
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -499,12 +635,9 @@ async def handle_approve_draft(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
+    async with session_scope(session) as db:
         draft = await HybridDraftService.approve_draft(
-            session=session,
+            session=db,
             draft_id=draft_id,
             reviewer_id=callback.from_user.id,
             final_answer=None,  # отправляем как есть
@@ -523,7 +656,7 @@ async def handle_approve_draft(callback: CallbackQuery):
                 parse_mode="Markdown"
             )
             # Помечаем как отправленный
-            await HybridDraftService.mark_as_sent(session, draft_id)
+            await HybridDraftService.mark_as_sent(db, draft_id)
             await callback.answer("✅ Черновик одобрен и отправлен пользователю.")
             
             # Обновляем сообщение
@@ -562,7 +695,7 @@ async def handle_edit_draft_admin(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(F.text & F.from_user.id == settings.telegram.admin_user_id)
-async def handle_admin_edited_draft(message: Message, state: FSMContext):
+async def handle_admin_edited_draft(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработчик отредактированного черновика администратором"""
     data = await state.get_data()
     draft_id = data.get("admin_edit_draft_id")
@@ -576,12 +709,9 @@ async def handle_admin_edited_draft(message: Message, state: FSMContext):
         await message.answer("❌ Текст не может быть пустым.")
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
+    async with session_scope(session) as db:
         draft = await HybridDraftService.approve_draft(
-            session=session,
+            session=db,
             draft_id=draft_id,
             reviewer_id=message.from_user.id,
             final_answer=edited_text,
@@ -601,7 +731,7 @@ async def handle_admin_edited_draft(message: Message, state: FSMContext):
                 parse_mode="Markdown"
             )
             # Помечаем как отправленный
-            await HybridDraftService.mark_as_sent(session, draft_id)
+            await HybridDraftService.mark_as_sent(db, draft_id)
             await message.answer(f"✅ Черновик #{draft_id} отредактирован и отправлен пользователю.")
         except Exception as e:
             log.error(f"Ошибка при отправке черновика пользователю: {e}")
@@ -635,7 +765,7 @@ async def handle_reject_draft(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(F.text & F.from_user.id == settings.telegram.admin_user_id)
-async def handle_admin_reject_reason(message: Message, state: FSMContext):
+async def handle_admin_reject_reason(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработчик причины отклонения черновика"""
     data = await state.get_data()
     draft_id = data.get("admin_reject_draft_id")
@@ -649,12 +779,9 @@ async def handle_admin_reject_reason(message: Message, state: FSMContext):
         await message.answer("❌ Причина не может быть пустой.")
         return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
+    async with session_scope(session) as db:
         draft = await HybridDraftService.reject_draft(
-            session=session,
+            session=db,
             draft_id=draft_id,
             reviewer_id=message.from_user.id,
             reviewer_notes=reason
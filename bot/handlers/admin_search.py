@@ -11,20 +11,16 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.services.user_search_service import UserSearchService, search_users_by_criteria, get_user_full_profile
-from bot.database.engine import create_engine, get_session_maker
+from bot.database.engine import session_scope
 from bot.config import settings
 from bot.handlers.consultant import is_consultant
 
 router = Router()
 log = logging.getLogger(__name__)
 
-# Создаем engine и session_maker для работы с БД
-
-engine = create_engine(settings.database.url)
-session_maker = get_session_maker(engine)
-
 
 class SearchStates(StatesGroup):
     """Состояния FSM для расширенного поиска"""
@@ -33,7 +29,12 @@ class SearchStates(StatesGroup):
 
 
 @router.message(Command("search"))
-async def cmd_search(message: Message, command: Optional[CommandObject] = None):
+async def cmd_search(
+    message: Message,
+    command: Optional[CommandObject] = None,
+    state: Optional[FSMContext] = None,
+    session: Optional[AsyncSession] = None,
+):
     """Расширенный поиск пользователей"""
     if not is_consultant(message.from_user.id):
         await message.answer("⛔️ Доступ запрещён.")
@@ -74,34 +75,60 @@ async def cmd_search(message: Message, command: Optional[CommandObject] = None):
     
     if query:
         # Если есть запрос, сразу выполняем поиск
-        await perform_search(message, query)
+        await perform_search(message, query, state, session=session)
     else:
         await message.answer(help_text, reply_markup=builder.as_markup(), parse_mode="Markdown")
 
 
-async def perform_search(message: Message, query: str, page: int = 1, limit: int = 10):
-    """Выполняет поиск и отображает результаты"""
-    async with session_maker() as session:
+async def perform_search(
+    message: Message,
+    query: str,
+    state: Optional[FSMContext] = None,
+    page: int = 1,
+    cursor: Optional[str] = None,
+    limit: int = 10,
+    session: Optional[AsyncSession] = None,
+):
+    """
+    Выполняет поиск и отображает страницу результатов.
+    
+    Курсоры страниц и общее количество хранятся в данных FSM
+    (search_cursors[n] — курсор страницы n + 1): в callback_data — только номер.
+    """
+    async with session_scope(session) as db:
         try:
-            users, total = await search_users_by_criteria(
-                session=session,
+            users, total, next_cursor = await search_users_by_criteria(
+                session=db,
                 query=query,
                 limit=limit,
-                offset=(page - 1) * limit
+                cursor=cursor
             )
             
             if not users:
                 await message.answer(f"❌ По запросу `{query}` ничего не найдено.")
                 return
             
+            search_data = (await state.get_data()) if state else {}
+            if page == 1:
+                cursors = [None]
+            else:
+                cursors = search_data.get("search_cursors", [None])[:page]
+                total = search_data.get("search_total")
+            cursors.append(next_cursor)
+            if state:
+                await state.update_data(search_query=query, search_cursors=cursors, search_total=total)
+            
             # Формируем ответ
             response = f"🔍 *Результаты поиска: `{query}`*\n"
-            response += f"*Найдено пользователей:* {total}\n"
-            response += f"*Страница:* {page} из {((total - 1) // limit) + 1}\n\n"
+            if total is not None:
+                response += f"*Найдено пользователей:* {total}\n"
+                response += f"*Страница:* {page} из {((total - 1) // limit) + 1}\n\n"
+            else:
+                response += f"*Страница:* {page}\n\n"
             
-            for i, user in enumerate(users, start=1):
+            for i, user in enumerate(users, start=(page - 1) * limit + 1):
                 response += f"*{i}. Пользователь ID:* `{user['user_id']}`\n"
-                response += f"   *Язык:* {user['preferred_language']}\n"
+                response += f"   *Имя:* {user['first_name'] or 'Неизвестно'} (@{user['username'] or 'нет'})\n"
                 response += f"   *Активность:* {user['last_active'][:10] if user['last_active'] else 'нет данных'}\n"
                 response += f"   *Консультации:* {user['total_consultations']} | *Заказы:* {user['total_orders']} ({user['paid_orders']} оплач.)\n"
                 response += f"   *Предсказания:* {user['total_predictions']} | *Режим ИИ:* {'✅' if user['ai_mode'] else '❌'}\n"
@@ -114,10 +141,10 @@ async def perform_search(message: Message, query: str, page: int = 1, limit: int
             
             # Создаём клавиатуру пагинации
             builder = InlineKeyboardBuilder()
-            if page > 1:
-                builder.button(text="◀️ Назад", callback_data=f"search_page:{query}:{page-1}")
-            if page < ((total - 1) // limit) + 1:
-                builder.button(text="Вперёд ▶️", callback_data=f"search_page:{query}:{page+1}")
+            if state and page > 1:
+                builder.button(text="◀️ Назад", callback_data=f"search_page:{page-1}")
+            if state and next_cursor:
+                builder.button(text="Вперёд ▶️", callback_data=f"search_page:{page+1}")
             
             builder.button(text="🔍 Новый поиск", callback_data="search_new")
             builder.button(text="🔙 В меню", callback_data="consultant_menu")
@@ -131,19 +158,27 @@ async def perform_search(message: Message, query: str, page: int = 1, limit: int
 
 
 @router.callback_query(lambda c: c.data.startswith("search_page:"))
-async def handle_search_pagination(callback: CallbackQuery):
+async def handle_search_pagination(
+    callback: CallbackQuery, state: FSMContext, session: Optional[AsyncSession] = None,
+):
     """Обработка пагинации результатов поиска"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
         return
     
     try:
-        # Формат: search_page:запрос:страница
-        _, query, page_str = callback.data.split(":", 2)
-        page = int(page_str)
+        # Формат: search_page:страница (запрос и курсоры — в данных FSM)
+        page = int(callback.data.rsplit(":", 1)[1])
+        data = await state.get_data()
+        cursors = data.get("search_cursors") or []
+        if not data.get("search_query") or page < 1 or page > len(cursors):
+            await callback.answer("⚠️ Результаты устарели, повторите поиск.", show_alert=True)
+            return
         
         await callback.answer()
-        await perform_search(callback.message, query, page)
+        await perform_search(
+            callback.message, data["search_query"], state, page, cursors[page - 1], session=session,
+        )
         
     except Exception as e:
         log.error(f"Ошибка пагинации: {e}", exc_info=True)
@@ -171,7 +206,9 @@ async def handle_search_quick(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(SearchStates.waiting_search_query)
-async def handle_search_query(message: Message, state: FSMContext):
+async def handle_search_query(
+    message: Message, state: FSMContext, session: Optional[AsyncSession] = None,
+):
     """Обработка запроса поиска"""
     query = message.text.strip()
     if not query:
@@ -179,20 +216,20 @@ async def handle_search_query(message: Message, state: FSMContext):
         return
     
     await state.clear()
-    await perform_search(message, query)
+    await perform_search(message, query, state, session=session)
 
 
 @router.callback_query(lambda c: c.data == "search_active")
-async def handle_search_active(callback: CallbackQuery):
+async def handle_search_active(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Поиск активных пользователей"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
         return
     
     await callback.answer()
-    async with session_maker() as session:
-        service = UserSearchService(session)
-        users, total = await service.search_users(is_active=True, active_days=7, limit=20)
+    async with session_scope(session) as db:
+        service = UserSearchService(db)
+        users, _, _ = await service.search_users(is_active=True, active_days=7, limit=20)
         
         if not users:
             await callback.message.answer("❌ Нет активных пользователей за последние 7 дней.")
@@ -209,16 +246,16 @@ async def handle_search_active(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "search_paid")
-async def handle_search_paid(callback: CallbackQuery):
+async def handle_search_paid(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Поиск платящих пользователей"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
         return
     
     await callback.answer()
-    async with session_maker() as session:
-        service = UserSearchService(session)
-        users, total = await service.search_users(has_paid_order=True, limit=20)
+    async with session_scope(session) as db:
+        service = UserSearchService(db)
+        users, _, _ = await service.search_users(has_paid_order=True, limit=20)
         
         if not users:
             await callback.message.answer("❌ Нет пользователей с оплаченными заказами.")
@@ -238,26 +275,22 @@ async def handle_search_paid(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "search_stats")
-async def handle_search_stats(callback: CallbackQuery):
+async def handle_search_stats(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Общая статистика"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
         return
     
     await callback.answer()
-    async with session_maker() as session:
-        service = UserSearchService(session)
+    async with session_scope(session) as db:
+        service = UserSearchService(db)
         stats = await service.get_global_stats()
         
         response = "📈 *Глобальная статистика*\n\n"
         response += f"*Всего пользователей:* {stats['total_users']}\n"
         response += f"*Активных (7 дней):* {stats['active_users']} ({stats['activity_rate']}%)\n"
         response += f"*С оплаченными заказами:* {stats['paid_users']} ({stats['conversion_rate']}%)\n"
-        response += f"*Новых за сегодня:* {stats['new_users_today']}\n\n"
-        
-        response += "*Распределение по языкам:*\n"
-        for lang, count in stats['languages'].items():
-            response += f"  • {lang}: {count}\n"
+        response += f"*Новых за сегодня:* {stats['new_users_today']}\n"
         
         await callback.message.answer(response, parse_mode="Markdown")
 
@@ -274,7 +307,7 @@ async def handle_search_new(callback: CallbackQuery):
 
 
 @router.message(Command("user"))
-async def cmd_user_profile(message: Message, command: Optional[CommandObject] = None):
+async def cmd_user_profile(message: Message, command: Optional[CommandObject] = None, session: Optional[AsyncSession] = None):
     """Детальный профиль пользователя"""
     if not is_consultant(message.from_user.id):
         await message.answer("⛔️ Доступ запрещён.")
@@ -290,9 +323,9 @@ async def cmd_user_profile(message: Message, command: Optional[CommandObject] =
         await message.answer("❌ ID пользователя должен быть числом.")
         return
     
-    async with session_maker() as session:
+    async with session_scope(session) as db:
         try:
-            profile = await get_user_full_profile(session, user_id)
+            profile = await get_user_full_profile(db, user_id)
             
             if "error" in profile:
                 await message.answer(f"❌ Пользователь с ID `{user_id}` не найден.")
@@ -302,7 +335,7 @@ async def cmd_user_profile(message: Message, command: Optional[CommandObject] =
             
             response = f"👤 *Детальный профиль пользователя*\n\n"
             response += f"*ID:* `{user['user_id']}`\n"
-            response += f"*Язык:* {user['preferred_language']}\n"
+            response += f"*Имя:* {user['first_name'] or 'Неизвестно'} (@{user['username'] or 'нет'})\n"
             response += f"*Последняя активность:* {user['last_active'][:19] if user['last_active'] else 'нет данных'}\n"
             response += f"*Дата регистрации:* {user['created_at'][:19] if user['created_at'] else 'нет данных'}\n\n"
             
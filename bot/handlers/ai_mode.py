@@ -7,9 +7,11 @@ MysticBot — AI Mode Handler
 import asyncio
 import logging
 import time
-from typing import Optional
+import uuid
+from typing import AsyncIterator, Optional
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -22,9 +24,26 @@ from aiogram.types import (
     KeyboardButton,
     ReplyKeyboardRemove,
 )
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.config import settings
-from bot.services.llm import get_llm_service, LLMError, AllProvidersFailedError
+from bot.database.engine import session_scope
+from bot.services.llm import (
+    get_llm_service,
+    LLMError,
+    AllProvidersFailedError,
+    Priority,
+    QueueFullError,
+)
+from bot.services.order import OrderService
+from bot.services.tokenizer import ContextLedger, Tokenizer, get_tokenizer
+from bot.services.conversation_store import TurnWrite, get_conversation_store
+from bot.services.dialog_summary import (
+    compaction_cut,
+    join_system,
+    split_system,
+    summarize_dialog,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -44,9 +63,16 @@ class AIMode(StatesGroup):
 # ============================================================
 
 MAX_CONTEXT_MESSAGES = 20       # Макс. сообщений в контексте диалога
-MAX_CONTEXT_TOKENS_APPROX = 24000  # ~24K токенов (оставляем запас из 32K)
+AI_MAX_TOKENS = 4096            # Лимит ответа (резервируется в окне контекста)
 AI_SESSION_TIMEOUT = 600        # 10 мин без активности → авто-выход
 MAX_MESSAGE_LENGTH = 4096       # Лимит Telegram на длину сообщения
+AI_TEMPERATURE = 0.7            # Температура диалога
+
+# Потоковая выдача ответа (правка одного сообщения по мере генерации)
+STREAM_EDIT_INTERVAL = 1.2      # Мин. пауза между правками сообщения (сек)
+STREAM_MIN_DELTA = 30           # Мин. прирост текста для очередной правки (символов)
+STREAM_CURSOR = " ▌"            # Индикатор «ещё печатает»
+STREAM_FINALIZE_ATTEMPTS = 3    # Попыток финальной правки (flood control, откат разметки)
 
 SYSTEM_PROMPT = """Ты — MysticBot, мистический ИИ-помощник в Telegram.
 Отвечай на русском языке. Будь полезным, точным и дружелюбным.
@@ -92,102 +118,368 @@ def get_ai_inline_controls() -> InlineKeyboardMarkup:
 # Вспомогательные функции
 # ============================================================
 
-def _estimate_tokens(text: str) -> int:
-    """Грубая оценка токенов (1 токен ≈ 3.5 символа для русского)."""
-    return len(text) // 3
-
-
-def _trim_context(
-    messages: list[dict],
-    max_messages: int = MAX_CONTEXT_MESSAGES,
-    max_tokens: int = MAX_CONTEXT_TOKENS_APPROX,
-) -> list[dict]:
+def _context_budget() -> tuple[Tokenizer, int]:
     """
-    Обрезка контекста диалога для вписывания в лимит.
-    Системное сообщение всегда остаётся первым.
+    Токенизатор и бюджет истории (токены) по провайдеру с самым узким
+    окном контекста: окно − ответ − запас на расхождение токенизаторов.
     """
-    if not messages:
-        return messages
-
-    # Системное сообщение — всегда первое
-    system_msg = messages[0] if messages[0]["role"] == "system" else None
-    history = messages[1:] if system_msg else messages[:]
-
-    # Ограничение по количеству
-    if len(history) > max_messages:
-        history = history[-max_messages:]
-
-    # Ограничение по токенам (удаляем старые сообщения)
-    total_tokens = sum(_estimate_tokens(m["content"]) for m in history)
-    if system_msg:
-        total_tokens += _estimate_tokens(system_msg["content"])
-
-    while total_tokens > max_tokens and len(history) > 2:
-        removed = history.pop(0)
-        total_tokens -= _estimate_tokens(removed["content"])
-
-    result = []
-    if system_msg:
-        result.append(system_msg)
-    result.extend(history)
-    return result
+    provider = get_llm_service().context_provider()
+    model = provider.model if provider else ""
+    window = provider.context_window if provider else 32768
+    budget = window - AI_MAX_TOKENS - settings.llm_context.safety_margin
+    return get_tokenizer(model), budget
 
 
 async def _get_ai_context(state: FSMContext) -> dict:
-    """Получение данных ИИ-сессии из FSM."""
+    """
+    Получение данных ИИ-сессии из FSM. Сама история (и подсчёт токенов
+    реплик) — в хранилище диалогов, в FSM только указатель на неё
+    (session_id), ревизия и счётчики.
+    """
     data = await state.get_data()
     return {
-        "messages": data.get("ai_messages", []),
+        "session_id": data.get("ai_session_id"),
         "last_activity": data.get("ai_last_activity", 0),
         "request_count": data.get("ai_request_count", 0),
         "session_start": data.get("ai_session_start", 0),
+        "history_rev": data.get("ai_history_rev", 0),
     }
 
 
-async def _save_ai_context(
+async def _load_counted_history(
+    state: FSMContext, ctx: dict, tokenizer: Tokenizer,
+) -> tuple[list[dict], ContextLedger]:
+    """История сессии и кэш подсчёта токенов (досчитываются только реплики без подсчёта)."""
+    if not ctx["session_id"]:
+        return [], ContextLedger.load([], [], tokenizer)
+    messages, counts = await get_conversation_store().load_counted(
+        state.key.user_id, ctx["session_id"], tokenizer.name,
+    )
+    return messages, ContextLedger.load(messages, counts, tokenizer)
+
+
+async def _start_history(
     state: FSMContext,
-    messages: list[dict],
     request_count: int,
     session_start: float,
 ) -> None:
-    """Сохранение данных ИИ-сессии в FSM."""
+    """Новая история диалога с системным промптом; прежняя удаляется."""
+    store = get_conversation_store()
+    old_session = await state.get_value("ai_session_id")
+    if old_session:
+        await store.delete(state.key.user_id, old_session)
+
+    session_id = uuid.uuid4().hex
+    system = {"role": "system", "content": SYSTEM_PROMPT}
+    tokenizer, _ = _context_budget()
+    await store.start(
+        state.key.user_id, session_id, system,
+        tokens=tokenizer.count_message(system), tokenizer=tokenizer.name,
+    )
     await state.update_data(
-        ai_messages=messages,
+        ai_session_id=session_id,
         ai_last_activity=time.time(),
         ai_request_count=request_count,
         ai_session_start=session_start,
+        ai_history_rev=0,
     )
 
 
-async def _send_long_message(message: Message, text: str, **kwargs) -> Message:
-    """Отправка длинного сообщения с разбивкой по лимиту Telegram."""
-    if len(text) <= MAX_MESSAGE_LENGTH:
+async def _save_ai_context(
+    state: FSMContext,
+    ctx: dict,
+    write: TurnWrite,
+    request_count: int,
+) -> None:
+    """
+    Сохранение хода: дельта истории вместе с подсчётом токенов новых
+    реплик — в хранилище (O(1) на реплику), скалярные счётчики — в FSM.
+
+    Если пока шёл ответ историю успели сжать в конспект, старейшие
+    реплики уже удалены — обрезка пропускается. Если начат новый
+    диалог — история старой сессии не пишется.
+    """
+    async def save() -> None:
+        data = await state.get_data()
+        same_session = data.get("ai_session_id") == ctx["session_id"]
+        compacted = data.get("ai_history_rev", 0) != ctx["history_rev"]
+        if same_session:
+            if compacted:
+                write.drop_oldest = 0
+            await get_conversation_store().apply(state.key.user_id, ctx["session_id"], write)
+        await state.update_data(ai_last_activity=time.time(), ai_request_count=request_count)
+
+    lock = _compactions.get(state.key)
+    if lock is None:
+        await save()
+        return
+    async with lock:
+        await save()
+
+
+# Сессии, история которых сейчас сжимается: ключ FSM → блокировка записи истории
+_compactions: dict = {}
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _schedule_compaction(
+    state: FSMContext,
+    ctx: dict,
+    messages: list[dict],
+    ledger: ContextLedger,
+) -> None:
+    """
+    Запустить фоновое сжатие старых реплик в конспект, если история
+    переросла порог. Пользователь ответа не ждёт; на сессию — одно сжатие за раз.
+    """
+    cut = compaction_cut(messages, ledger.total)
+    if cut is None or state.key in _compactions:
+        return
+    _compactions[state.key] = asyncio.Lock()
+    task = asyncio.create_task(_compact_history(state, ctx["session_id"], messages[:cut]))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _compact_history(state: FSMContext, session_id: str, snapshot: list[dict]) -> None:
+    """
+    Сжать snapshot (системное сообщение + старые реплики) в конспект и
+    подменить его в истории. Если за время генерации история изменилась
+    не только дописыванием (новый диалог, выход, обрезка) — результат отбрасывается.
+    """
+    lock = _compactions[state.key]
+    try:
+        prompt, previous = split_system(snapshot[0]["content"])
+        summary = await summarize_dialog(previous, snapshot[1:], user_id=state.key.user_id)
+
+        async with lock:
+            if await state.get_state() != AIMode.active.state:
+                return
+            ctx = await _get_ai_context(state)
+            if ctx["session_id"] != session_id:
+                return
+            tokenizer, _ = _context_budget()
+            messages, ledger = await _load_counted_history(state, ctx, tokenizer)
+            if messages[:len(snapshot)] != snapshot:
+                logger.debug(f"📜 Chat {state.key.chat_id}: история изменилась, конспект отброшен")
+                return
+            system = {"role": "system", "content": join_system(prompt, summary)}
+            ledger.compact(messages, len(snapshot), system, tokenizer)
+            await get_conversation_store().compact(
+                state.key.user_id, session_id, system, len(snapshot) - 1,
+                tokens=ledger.counts[0], tokenizer=tokenizer.name,
+            )
+            await state.update_data(ai_history_rev=ctx["history_rev"] + 1)
+
+        logger.info(
+            f"📜 Chat {state.key.chat_id}: {len(snapshot) - 1} реплик сжато в конспект, "
+            f"контекст {ledger.total} токенов"
+        )
+    except LLMError as e:
+        logger.warning(f"⚠️ Chat {state.key.chat_id}: не удалось сжать диалог: {e}")
+    except Exception as e:
+        logger.exception(f"💥 Ошибка сжатия диалога: {e}")
+    finally:
+        _compactions.pop(state.key, None)
+
+
+def _find_split_point(text: str, start: int, limit: int) -> int:
+    """
+    Позиция разреза text[start:] не дальше limit символов.
+    Предпочтение: граница абзаца → строки → пробела.
+    """
+    end = start + limit
+    if len(text) <= end:
+        return len(text)
+    for sep in ("\n\n", "\n", " "):
+        pos = text.rfind(sep, start + limit // 2, end)
+        if pos != -1:
+            return pos + len(sep)
+    return end
+
+
+async def _edit_progress(msg: Message, text: str) -> float:
+    """
+    Промежуточная правка сообщения без разметки (Markdown может быть незакрыт).
+
+    Returns:
+        float — сколько секунд Telegram просит подождать до следующей правки
+    """
+    try:
+        await msg.edit_text(text)
+    except TelegramRetryAfter as e:
+        logger.debug(f"Стриминг: flood control, пауза правок {e.retry_after}с")
+        return float(e.retry_after)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            logger.debug(f"Стриминг: правка не удалась: {e}")
+    return 0.0
+
+
+async def _finalize_part(msg: Message, text: str, **kwargs) -> None:
+    """
+    Финальная правка части ответа: с разметкой, при ошибке парсинга — без неё.
+    Flood control — пауза и повтор с теми же параметрами.
+    """
+    for _ in range(STREAM_FINALIZE_ATTEMPTS):
+        try:
+            await msg.edit_text(text, **kwargs)
+            return
+        except TelegramRetryAfter as e:
+            logger.debug(f"Стриминг: flood control, финальная правка через {e.retry_after}с")
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return
+            if "can't parse entities" not in str(e) or "parse_mode" not in kwargs:
+                logger.warning(f"Стриминг: не удалось завершить сообщение: {e}")
+                return
+            logger.debug(f"Стриминг: финальная правка без разметки: {e}")
+            kwargs.pop("parse_mode")
+    logger.warning("Стриминг: не удалось завершить сообщение: flood control")
+
+
+async def _answer_part(message: Message, text: str, **kwargs) -> Message:
+    """Отправка готовой части ответа: с разметкой, при ошибке парсинга — без неё."""
+    try:
+        return await message.answer(text, **kwargs)
+    except TelegramBadRequest as e:
+        logger.debug(f"Стриминг: отправка без разметки: {e}")
+        kwargs.pop("parse_mode", None)
         return await message.answer(text, **kwargs)
 
-    # Разбиваем по абзацам
-    parts = []
-    current = ""
-    for paragraph in text.split("\n\n"):
-        if len(current) + len(paragraph) + 2 > MAX_MESSAGE_LENGTH:
-            if current:
-                parts.append(current.strip())
-            current = paragraph
-        else:
-            current += "\n\n" + paragraph if current else paragraph
 
-    if current:
-        parts.append(current.strip())
+async def _stream_ai_response(
+    message: Message,
+    chunks: AsyncIterator[str],
+    **kwargs,
+) -> str:
+    """
+    Показ ответа LLM по мере генерации.
+
+    Первое сообщение отправляется сразу с первым фрагментом, далее
+    редактируется не чаще STREAM_EDIT_INTERVAL. При достижении
+    MAX_MESSAGE_LENGTH часть фиксируется и начинается новое сообщение.
+    kwargs (reply_markup, parse_mode) применяются к финальной версии.
 
-    last_msg = None
-    for i, part in enumerate(parts):
-        # Кнопки только под последним сообщением
-        if i == len(parts) - 1:
-            last_msg = await message.answer(part, **kwargs)
+    Returns:
+        str — полный текст ответа
+    """
+    part_limit = MAX_MESSAGE_LENGTH - len(STREAM_CURSOR)
+    final_kwargs = dict(kwargs)
+    part_kwargs = {k: v for k, v in kwargs.items() if k != "reply_markup"}
+
+    full_text = ""
+    offset = 0                      # начало текущей части в full_text
+    current: Optional[Message] = None
+    shown_len = 0                   # длина текста, уже показанного в current
+    next_edit_at = 0.0
+
+    try:
+        async for chunk in chunks:
+            full_text += chunk
+
+            # Текущая часть переполнена — фиксируем её и начинаем новую
+            while len(full_text) - offset > part_limit:
+                cut = _find_split_point(full_text, offset, part_limit)
+                part = full_text[offset:cut].strip()
+                if part:
+                    if current is None:
+                        await _answer_part(message, part, **part_kwargs)
+                    else:
+                        await _finalize_part(current, part, **part_kwargs)
+                    await asyncio.sleep(0.3)  # Anti-flood
+                offset = cut
+                current = None
+                shown_len = 0
+
+            pending = full_text[offset:]
+            if not pending.strip():
+                continue
+
+            now = time.monotonic()
+            if current is None:
+                current = await message.answer(pending + STREAM_CURSOR)
+                shown_len = len(pending)
+                next_edit_at = now + STREAM_EDIT_INTERVAL
+            elif now >= next_edit_at and len(pending) - shown_len >= STREAM_MIN_DELTA:
+                wait = await _edit_progress(current, pending + STREAM_CURSOR)
+                shown_len = len(pending)
+                next_edit_at = now + max(STREAM_EDIT_INTERVAL, wait)
+
+    except Exception:
+        # Генерация оборвалась — убираем курсор у уже показанной части
+        tail = full_text[offset:].strip()
+        if current is not None and tail:
+            await _edit_progress(current, tail + " …")
+        raise
+
+    if not full_text.strip():
+        raise LLMError("ИИ вернул пустой ответ")
+
+    tail = full_text[offset:].strip()
+    if tail:
+        if current is None:
+            await _answer_part(message, tail, **final_kwargs)
         else:
-            last_msg = await message.answer(part)
-        await asyncio.sleep(0.3)  # Anti-flood
+            await _finalize_part(current, tail, **final_kwargs)
+    return full_text
 
-    return last_msg
+
+async def _llm_priority(user_id: int, session: Optional[AsyncSession] = None) -> Priority:
+    """
+    Полоса очереди LLM: пользователи с оплаченным заказом — приоритетная.
+    Проверка — в сессии апдейта (DbSessionMiddleware); без БД — обычная полоса.
+    """
+    if session is None:
+        return Priority.NORMAL
+    try:
+        async with session_scope(session) as db:
+            paid = await OrderService(db).has_paid_order(user_id)
+            # Соединение не держим, пока генерируется ответ
+            await db.commit()
+        if paid:
+            return Priority.PAID
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось проверить оплату {user_id}: {e}")
+        await session.rollback()
+    return Priority.NORMAL
+
+
+class _QueueNotice:
+    """Сообщение «Вы в очереди #N»: создаётся при ожидании, удаляется при старте ответа."""
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.notice: Optional[Message] = None
+        self.closed = False
+        self._lock = asyncio.Lock()
+
+    async def update(self, position: int) -> None:
+        async with self._lock:
+            if self.closed:
+                return
+            if not position:
+                await self._delete()
+                return
+            text = f"⏳ Вы в очереди: #{position}. Ответ начнётся, как только освободится ИИ."
+            if self.notice is None:
+                self.notice = await self.message.answer(text)
+            else:
+                await _edit_progress(self.notice, text)
+
+    async def close(self) -> None:
+        async with self._lock:
+            self.closed = True
+            await self._delete()
+
+    async def _delete(self) -> None:
+        if self.notice is not None:
+            try:
+                await self.notice.delete()
+            except TelegramBadRequest:
+                pass
+            self.notice = None
 
 
 # ============================================================
@@ -207,16 +499,8 @@ async def cmd_ai_enter(message: Message, state: FSMContext) -> None:
         return
 
     # Инициализация сессии
-    now = time.time()
-    initial_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-
     await state.set_state(AIMode.active)
-    await _save_ai_context(
-        state,
-        messages=initial_messages,
-        request_count=0,
-        session_start=now,
-    )
+    await _start_history(state, request_count=0, session_start=time.time())
 
     provider_name = providers[0].capitalize()
     await message.answer(
@@ -272,6 +556,8 @@ async def _exit_ai_mode(message: Message, state: FSMContext, reason: str = "") -
         return
     
     ctx = await _get_ai_context(state)
+    if ctx["session_id"]:
+        await get_conversation_store().delete(state.key.user_id, ctx["session_id"])
     # Если сессия не была начата (session_start == 0), не показываем статистику
     if ctx["session_start"] <= 0:
         await state.clear()
@@ -304,14 +590,7 @@ async def _exit_ai_mode(message: Message, state: FSMContext, reason: str = "") -
 async def btn_new_chat(message: Message, state: FSMContext) -> None:
     """Кнопка «Новый диалог» — очистка контекста."""
     ctx = await _get_ai_context(state)
-    initial_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-
-    await _save_ai_context(
-        state,
-        messages=initial_messages,
-        request_count=ctx["request_count"],
-        session_start=ctx["session_start"],
-    )
+    await _start_history(state, ctx["request_count"], ctx["session_start"])
 
     await message.answer(
         "🔮 **Контекст очищен!** Начинаем новый диалог.\n"
@@ -328,22 +607,31 @@ async def cb_new_chat(callback: CallbackQuery, state: FSMContext) -> None:
 
 
 @router.callback_query(F.data == "ai_retry")
-async def cb_retry(callback: CallbackQuery, state: FSMContext) -> None:
+async def cb_retry(
+    callback: CallbackQuery, state: FSMContext, session: Optional[AsyncSession] = None,
+) -> None:
     """Инлайн-кнопка «Переспросить» — повтор последнего запроса."""
     await callback.answer("Переспрашиваю...")
 
     ctx = await _get_ai_context(state)
-    messages = ctx["messages"]
+    tokenizer, _ = _context_budget()
+    messages, ledger = await _load_counted_history(state, ctx, tokenizer)
 
     if len(messages) < 2:
         await callback.message.answer("❌ Нет предыдущего запроса для повтора.")
         return
 
+    write = TurnWrite(tokenizer=tokenizer.name)
+
     # Удаляем последний ответ ИИ (если есть) и повторяем запрос
     if messages[-1]["role"] == "assistant":
-        messages = messages[:-1]
+        ledger.pop(messages)
+        write.pop_last = True
 
-    await _process_ai_request(callback.message, state, messages, ctx["request_count"])
+    await _process_ai_request(
+        callback.message, state, ctx, messages, write, ledger=ledger,
+        priority=await _llm_priority(callback.from_user.id, session),
+    )
 
 
 # ============================================================
@@ -351,7 +639,9 @@ async def cb_retry(callback: CallbackQuery, state: FSMContext) -> None:
 # ============================================================
 
 @router.message(AIMode.active, F.text)
-async def handle_ai_message(message: Message, state: FSMContext) -> None:
+async def handle_ai_message(
+    message: Message, state: FSMContext, session: Optional[AsyncSession] = None,
+) -> None:
     """
     Главный обработчик — текст пользователя в ИИ-режиме.
     Отправляет запрос к LLM с контекстом диалога.
@@ -371,52 +661,109 @@ async def handle_ai_message(message: Message, state: FSMContext) -> None:
         )
         return
 
-    # Формируем контекст
-    messages = ctx["messages"]
-    messages.append({"role": "user", "content": message.text})
-    messages = _trim_context(messages)
+    # Формируем контекст: считаются только токены нового сообщения
+    tokenizer, budget = _context_budget()
+    messages, ledger = await _load_counted_history(state, ctx, tokenizer)
+    if not messages:
+        # Сессия истекла в хранилище (TTL) или не была создана — начинаем заново
+        await _start_history(state, ctx["request_count"], ctx["session_start"] or time.time())
+        ctx = await _get_ai_context(state)
+        messages, ledger = await _load_counted_history(state, ctx, tokenizer)
+    question = {"role": "user", "content": message.text}
+    question_tokens = ledger.append(messages, question, tokenizer)
+    before = len(messages)
+    messages = ledger.trim(messages, MAX_CONTEXT_MESSAGES, budget)
+    write = TurnWrite(drop_oldest=before - len(messages), tokenizer=tokenizer.name)
+    write.add(question, question_tokens)
+    if ledger.total > budget:
+        logger.warning(
+            f"⚠️ User {message.from_user.id}: контекст {ledger.total} токенов "
+            f"больше бюджета {budget} даже после обрезки"
+        )
+
+    # Первый вопрос новой сессии (system + user) — типовой «опенер»: кэшируется,
+    # только если для опенеров задана своя (низкая) температура
+    opener_temperature = settings.llm_cache.opener_temperature
+    is_opener = (
+        opener_temperature is not None
+        and len(messages) == 2
+        and messages[0]["role"] == "system"
+    )
 
-    await _process_ai_request(message, state, messages, ctx["request_count"])
+    await _process_ai_request(
+        message,
+        state,
+        ctx,
+        messages,
+        write,
+        temperature=opener_temperature if is_opener else AI_TEMPERATURE,
+        cache_feature="ai_mode_opener" if is_opener else None,
+        ledger=ledger,
+        priority=await _llm_priority(message.from_user.id, session),
+    )
 
 
 async def _process_ai_request(
     message: Message,
     state: FSMContext,
+    ctx: dict,
     messages: list[dict],
-    request_count: int,
+    write: TurnWrite,
+    temperature: float = AI_TEMPERATURE,
+    cache_feature: Optional[str] = None,
+    ledger: Optional[ContextLedger] = None,
+    priority: Priority = Priority.NORMAL,
 ) -> None:
-    """Отправка запроса к LLM и обработка ответа."""
+    """
+    Отправка запроса к LLM и обработка ответа.
+    cache_feature включает кэш LLMService (повтор «Переспросить» идёт мимо кэша).
+    write — изменения истории за ход (пишутся в хранилище только при успешном ответе).
+    ledger — кэш подсчёта токенов, синхронный с messages.
+    priority — полоса очереди LLM; пока запрос ждёт, виден номер в очереди.
+    """
     # Индикатор «печатает...»
     await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
 
     llm = get_llm_service()
+    queue_notice = _QueueNotice(message)
 
     try:
-        data = await llm.chat_completion(
-            messages=messages,
-            temperature=0.7,
-            max_tokens=4096,
+        # Ответ показывается по мере генерации, кнопки — под финальной версией
+        ai_text = await _stream_ai_response(
+            message,
+            llm.stream_chat_completion(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=AI_MAX_TOKENS,
+                cache_feature=cache_feature,
+                user_id=state.key.user_id,
+                priority=priority,
+                on_queue=queue_notice.update,
+            ),
+            reply_markup=get_ai_inline_controls(),
+            parse_mode="Markdown",
         )
 
-        # Извлекаем ответ
-        ai_text = data["choices"][0]["message"]["content"]
-
         # Сохраняем в контекст
-        messages.append({"role": "assistant", "content": ai_text})
-        ctx = await _get_ai_context(state)
+        reply = {"role": "assistant", "content": ai_text}
+        if ledger:
+            tokenizer, _ = _context_budget()
+            write.add(reply, ledger.append(messages, reply, tokenizer))
+        else:
+            messages.append(reply)
+            write.add(reply)
         await _save_ai_context(
             state,
-            messages=messages,
-            request_count=request_count + 1,
-            session_start=ctx["session_start"],
+            ctx,
+            write,
+            request_count=ctx["request_count"] + 1,
         )
+        if ledger:
+            _schedule_compaction(state, ctx, messages, ledger)
 
-        # Отправляем с инлайн-кнопками
-        await _send_long_message(
-            message,
-            ai_text,
-            reply_markup=get_ai_inline_controls(),
-            parse_mode="Markdown",
+    except QueueFullError:
+        await message.answer(
+            "⏳ Предыдущие вопросы ещё в очереди. Дождитесь ответа и спросите снова.",
         )
 
     except AllProvidersFailedError as e:
@@ -439,6 +786,9 @@ async def _process_ai_request(
             "💥 Произошла непредвиденная ошибка. Попробуйте ещё раз.",
         )
 
+    finally:
+        await queue_notice.close()
+
 
 async def handle_ai_mode_button(message: Message, state: FSMContext):
     """Обработчик кнопки входа в ИИ-режим"""
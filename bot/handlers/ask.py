@@ -3,23 +3,33 @@
 """
 
 import logging
+from typing import Optional
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.services.llm import get_llm_service
+from bot.services.llm import get_llm_service, LLMError, Priority, QueueFullError
 from bot.services.history import ConsultationHistory
 from bot.services.user_settings import UserSettingsService
 from bot.services.order import OrderService
-from bot.database.engine import get_session_maker, create_engine
+from bot.database.engine import session_scope
 from bot.config import settings
 
 router = Router()
 log = logging.getLogger(__name__)
 
+ASK_SYSTEM_PROMPT = (
+    "Ты — MysticBot, AI-эксперт по эзотерике, Таро, нумерологии, астрологии "
+    "и психологии. Пользователь просит консультацию по эзотерическому вопросу. "
+    "Отвечай на русском языке, развёрнуто и доброжелательно."
+)
+# Низкая температура — ответы на типовые вопросы берутся из кэша LLMService
+ASK_TEMPERATURE = 0.3
+
 
 # Состояния для консультации
 class Consultation(StatesGroup):
@@ -27,7 +37,7 @@ class Consultation(StatesGroup):
 
 
 @router.message(Command("ask"))
-async def cmd_ask(message: Message, state: FSMContext):
+async def cmd_ask(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Команда /ask - консультация с AI"""
     if not settings.is_llm_configured:
         await message.answer(
@@ -40,15 +50,14 @@ async def cmd_ask(message: Message, state: FSMContext):
     
     user_id = message.from_user.id
     
-    engine = create_engine(settings.database.url)
-    async with get_session_maker(engine)() as session:
+    async with session_scope(session) as db:
         # Проверяем, является ли пользователь платным подписчиком
-        order_service = OrderService(session)
+        order_service = OrderService(db)
         is_premium = await order_service.has_paid_order(user_id)
         
         # Проверяем лимиты запросов
         can_request, reason = await UserSettingsService.can_make_ai_request(
-            session, user_id, is_premium
+            db, user_id, is_premium
         )
         
         if not can_request:
@@ -97,66 +106,91 @@ async def cmd_ask(message: Message, state: FSMContext):
 
 
 @router.message(Consultation.waiting_for_question)
-async def process_ai_question(message: Message, state: FSMContext, session_maker=None):
+async def process_ai_question(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработка вопроса для AI"""
     question = message.text.strip()
     user_id = message.from_user.id
     
     log.info(f"AI consultation request from {user_id}: {question[:100]}...")
     
-    # Создаём сессию, если не передана
-    local_session = None
-    if not session_maker:
-        engine = create_engine(settings.database.url)
-        session_maker = get_session_maker(engine)
+    # Проверяем платный статус и списываем запрос из дневного лимита (атомарно)
+    async with session_scope(session) as db:
+        try:
+            order_service = OrderService(db)
+            is_premium = await order_service.has_paid_order(user_id)
+            can_request, reason = await UserSettingsService.try_consume_ai_request(
+                db, user_id, is_premium
+            )
+            # Соединение не держим, пока запрос ждёт очереди и генерируется ответ
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
     
-    # Проверяем лимиты и платный статус перед генерацией
-    async with session_maker() as session:
-        order_service = OrderService(session)
-        is_premium = await order_service.has_paid_order(user_id)
-        can_request, reason = await UserSettingsService.can_make_ai_request(
-            session, user_id, is_premium
-        )
-        
-        if not can_request:
-            await message.answer(reason, parse_mode="Markdown")
-            await state.clear()
-            return
-        
-        # Увеличиваем счётчик запросов ИИ
-        await UserSettingsService.increment_ai_request_count(session, user_id)
-        
-        # Показываем статус "думаю"
-        thinking_msg = await message.answer("🤔 *AI думает...*", parse_mode="Markdown")
-        
-        # Получаем сервис LLM
-        llm_service = get_llm_service(settings)
-        
-        # Генерируем ответ
-        response = await llm_service.generate_interpretation(
-            prompt=question,
-            context="Пользователь просит консультацию по эзотерическому вопросу."
+    if not can_request:
+        await message.answer(reason, parse_mode="Markdown")
+        await state.clear()
+        return
+    
+    # Показываем статус "думаю"
+    thinking_msg = await message.answer("🤔 *AI думает...*", parse_mode="Markdown")
+    
+    # Получаем сервис LLM
+    llm_service = get_llm_service()
+    
+    async def on_queue(position: int) -> None:
+        # Пока запрос ждёт свободного места у провайдеров — показываем позицию
+        text = f"⏳ *Вы в очереди: #{position}*" if position else "🤔 *AI думает...*"
+        await thinking_msg.edit_text(text, parse_mode="Markdown")
+
+    # Генерируем ответ (типовые вопросы отдаются из кэша;
+    # подписчики идут приоритетной полосой очереди)
+    try:
+        response = await llm_service.chat(
+            question,
+            system_prompt=ASK_SYSTEM_PROMPT,
+            temperature=ASK_TEMPERATURE,
+            cache_feature="ask",
+            user_id=user_id,
+            priority=Priority.PAID if is_premium else Priority.NORMAL,
+            on_queue=on_queue,
         )
-        
-        # Удаляем сообщение "думаю"
+    except QueueFullError:
+        # Запрос не принят в очередь — списанный из лимита возвращаем
+        try:
+            async with session_scope(session) as db:
+                await UserSettingsService.refund_ai_request(db, user_id)
+        except Exception as e:
+            log.error(f"Не удалось вернуть запрос ИИ в лимит {user_id}: {e}")
         await thinking_msg.delete()
-        
-        answer_text = None
-        if response:
-            # Форматируем ответ
-            answer_text = f"""
+        await message.answer(
+            "⏳ У вас уже есть вопросы в очереди. Дождитесь ответа и спросите снова."
+        )
+        await state.clear()
+        return
+    except LLMError as e:
+        log.error(f"Ошибка LLM при консультации {user_id}: {e}")
+        response = None
+    
+    # Удаляем сообщение "думаю"
+    await thinking_msg.delete()
+    
+    answer_text = None
+    if response:
+        # Форматируем ответ
+        answer_text = f"""
 🧠 *Вопрос:* {question}
 
 {response}
 
 ✨ *Совет от MysticBot:* Используйте эту информацию как руководство, но всегда доверяйте своей интуиции.
 """
-            await message.answer(answer_text, parse_mode="Markdown")
-        else:
-            # Если AI не ответил, проверяем причину
-            if not settings.is_llm_configured:
-                # Нет настроенного API ключа
-                error_text = f"""
+        await message.answer(answer_text, parse_mode="Markdown")
+    else:
+        # Если AI не ответил, проверяем причину
+        if not settings.is_llm_configured:
+            # Нет настроенного API ключа
+            error_text = f"""
 🧠 *Вопрос:* {question}
 
 ⚠️ *ИИ-режим временно недоступен*
@@ -175,9 +209,9 @@ async def process_ai_question(message: Message, state: FSMContext, session_maker
 
 *Технические детали:* Отсутствует настроенный ключ LLM.
 """
-            else:
-                # API ключ есть, но API не ответил
-                error_text = f"""
+        else:
+            # API ключ есть, но API не ответил
+            error_text = f"""
 🧠 *Вопрос:* {question}
 
 ⚠️ *ИИ-режим временно недоступен*
@@ -196,14 +230,15 @@ Perplexity API не ответил на запрос. Возможные при
 
 *Технические детали:* Perplexity API вернул ошибку или timeout.
 """
-            answer_text = error_text
-            await message.answer(answer_text, parse_mode="Markdown")
-        
-        # Сохраняем консультацию в историю
-        if answer_text:
+        answer_text = error_text
+        await message.answer(answer_text, parse_mode="Markdown")
+    
+    # Сохраняем консультацию в историю
+    if answer_text:
+        async with session_scope(session) as db:
             try:
                 await ConsultationHistory.add(
-                    session=session,
+                    session=db,
                     user_id=user_id,
                     question=question,
                     answer=answer_text
@@ -211,9 +246,10 @@ Perplexity API не ответил на запрос. Возможные при
                 log.debug(f"Консультация сохранена для пользователя {user_id}")
                 
                 # Обновляем статистику пользователя
-                await UserSettingsService.increment_consultation_count(session, user_id)
+                await UserSettingsService.increment_consultation_count(db, user_id)
             except Exception as e:
                 log.error(f"Ошибка при сохранении консультации: {e}")
+                await db.rollback()
                 # Не прерываем выполнение из-за ошибки БД
     
     await state.clear()
@@ -3,8 +3,8 @@
 """
 
 import logging
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 from aiogram import Router, types, F
 from aiogram.filters import Command, CommandObject
@@ -12,13 +12,15 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import select, desc
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.services.order import OrderService, OrderStatus
 from bot.services.hybrid_draft import HybridDraftService
 from bot.services.history import ConsultationHistory
 from bot.services.user_settings import UserSettingsService
 from bot.services.prediction_history_service import PredictionHistoryService
-from bot.database.engine import create_engine, get_session_maker
+from bot.services.stats import StatsService
+from bot.database.engine import session_scope
 from bot.models.consultation import Consultation
 from bot.models.user_settings import UserSettings
 from bot.config import settings
@@ -27,10 +29,6 @@ log = logging.getLogger(__name__)
 
 router = Router()
 
-# Создаем engine и session_maker для работы с БД
-engine = create_engine(settings.database.url)
-session_maker = get_session_maker(engine)
-
 log.info(f"Consultant module loaded. ADMIN_USER_ID={settings.telegram.admin_user_id}")
 
 
@@ -110,7 +108,7 @@ async def cmd_consultant(message: Message):
     await message.answer(menu_text, reply_markup=builder.as_markup(), parse_mode="Markdown")
 
 
-async def _consultations_logic(user_id: int, chat_id: int, args: str = "", reply_to_message_id: int = None):
+async def _consultations_logic(user_id: int, chat_id: int, args: str = "", reply_to_message_id: int = None, session: Optional[AsyncSession] = None):
     """Логика просмотра консультаций (вынесена для reuse)"""
     if not is_consultant(user_id):
         log.warning(f"Access denied for user_id={user_id}")
@@ -123,10 +121,10 @@ async def _consultations_logic(user_id: int, chat_id: int, args: str = "", reply
         except ValueError:
             return False, "❌ Неверный формат ID пользователя. Использование: `/consultations [user_id]`"
     
-    async with session_maker() as session:
+    async with session_scope(session) as db:
         if user_id_arg:
             # Консультации конкретного пользователя
-            consultations = await ConsultationHistory.get_by_user(session, user_id_arg, limit=20)
+            consultations = await ConsultationHistory.get_by_user(db, user_id_arg, limit=20)
             if not consultations:
                 return False, f"❌ У пользователя {user_id_arg} нет консультаций."
             
@@ -137,7 +135,7 @@ async def _consultations_logic(user_id: int, chat_id: int, args: str = "", reply
                 response += f"   *Сообщение:* {consult.message[:100]}...\n\n"
         else:
             # Последние 10 консультаций
-            result = await session.execute(
+            result = await db.execute(
                 select(Consultation).order_by(Consultation.created_at.desc()).limit(10)
             )
             consultations = result.scalars().all()
@@ -154,15 +152,15 @@ async def _consultations_logic(user_id: int, chat_id: int, args: str = "", reply
     return True, response
 
 
-async def _orders_logic(user_id: int, chat_id: int, reply_to_message_id: int = None):
+async def _orders_logic(user_id: int, chat_id: int, reply_to_message_id: int = None, session: Optional[AsyncSession] = None):
     """Логика просмотра заказов (вынесена для reuse)"""
     if not is_consultant(user_id):
         log.warning(f"Access denied for user_id={user_id}")
         return False, "⛔️ Доступ запрещён.", None
     
-    async with session_maker() as session:
+    async with session_scope(session) as db:
         # Получаем заказы, отсортированные по дате
-        orders = await OrderService(session).get_all_orders(limit=20)
+        orders = await OrderService(db).get_all_orders(limit=20)
         
         if not orders:
             return True, "📭 *Нет заказов.*", None
@@ -180,7 +178,7 @@ async def _orders_logic(user_id: int, chat_id: int, reply_to_message_id: int = N
             response += "*Последние ожидающие оплаты:*\n"
             for order in unpaid_orders[:5]:
                 user_info = f"👤 {order.user_id}"
-                user_settings = await UserSettingsService.get_by_user_id(session, order.user_id)
+                user_settings = await UserSettingsService.get_by_user_id(db, order.user_id)
                 if user_settings and user_settings.first_name:
                     user_info = f"👤 {user_settings.first_name}"
                 
@@ -207,15 +205,15 @@ async def _orders_logic(user_id: int, chat_id: int, reply_to_message_id: int = N
         return True, response, builder.as_markup()
 
 
-async def _drafts_logic(user_id: int, chat_id: int, reply_to_message_id: int = None):
+async def _drafts_logic(user_id: int, chat_id: int, reply_to_message_id: int = None, session: Optional[AsyncSession] = None):
     """Логика просмотра черновиков (вынесена для reuse)"""
     if not is_consultant(user_id):
         log.warning(f"Access denied for user_id={user_id}")
         return False, "⛔️ Доступ запрещён.", None
     
-    async with session_maker() as session:
+    async with session_scope(session) as db:
         # Получаем черновики, ожидающие проверки
-        pending_drafts = await HybridDraftService.get_pending_drafts(session, limit=20)
+        pending_drafts = await HybridDraftService.get_pending_drafts(db, limit=20)
         
         if not pending_drafts:
             return True, "✅ *Нет черновиков, ожидающих проверки.*", None
@@ -232,60 +230,35 @@ async def _drafts_logic(user_id: int, chat_id: int, reply_to_message_id: int = N
         return True, response, None  # Для черновиков кнопки создаются отдельно для каждого
 
 
-async def _stats_logic(user_id: int, chat_id: int, reply_to_message_id: int = None):
+async def _stats_logic(user_id: int, chat_id: int, reply_to_message_id: int = None, session: Optional[AsyncSession] = None):
     """Логика просмотра статистики (вынесена для reuse)"""
     if not is_consultant(user_id):
         log.warning(f"Access denied for user_id={user_id}")
         return False, "⛔️ Доступ запрещён.", None
     
-    async with session_maker() as session:
-        # Получаем базовую статистику
-        # 1. Общее количество пользователей
-        from bot.models.user_settings import UserSettings
-        stmt = select(UserSettings)
-        result = await session.execute(stmt)
-        all_users = result.scalars().all()
-        total_users = len(all_users)
-        
-        # 2. Активные пользователи (за последние 7 дней)
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        # Нужно добавить поле last_activity в UserSettings, пока заглушка
-        active_users = total_users  # заглушка
-        
-        # 3. Консультации за сегодня
-        today = datetime.utcnow().date()
-        stmt = select(Consultation).where(Consultation.created_at >= datetime(today.year, today.month, today.day))
-        result = await session.execute(stmt)
-        today_consultations = len(result.scalars().all())
-        
-        # 4. Заказы
-        orders = await OrderService(session).get_all_orders()
-        total_orders = len(orders)
-        paid_orders = len([o for o in orders if o.is_paid])
-        
-        # 5. Черновики
-        all_drafts = await HybridDraftService.get_all_drafts(session)
-        pending_drafts = len([d for d in all_drafts if d.status == "pending"])
+    async with session_scope(session) as db:
+        # Все счётчики — одним агрегирующим запросом (с коротким кэшем)
+        stats = await StatsService.consultant_dashboard(db)
         
         stats_text = f"""
 📊 *Статистика для консультанта*
 
 👥 *Пользователи:*
-• Всего: {total_users}
-• Активные (7 дней): {active_users}
+• Всего: {stats['users_total']}
+• Активные (7 дней): {stats['users_active']}
 
 💬 *Консультации:*
-• Сегодня: {today_consultations}
-• Всего: {len(all_drafts) + today_consultations} (примерно)
+• Сегодня: {stats['consultations_today']}
+• Всего: {stats['consultations_total']}
 
 💰 *Заказы:*
-• Всего: {total_orders}
-• Оплачено: {paid_orders}
-• Ожидают: {total_orders - paid_orders}
+• Всего: {stats['orders_total']}
+• Оплачено: {stats['orders_paid']}
+• Ожидают: {stats['orders_total'] - stats['orders_paid']}
 
 📝 *Черновики:*
-• Ожидают проверки: {pending_drafts}
-• Всего черновиков: {len(all_drafts)}
+• Ожидают проверки: {stats['drafts_pending']}
+• Всего черновиков: {stats['drafts_total']}
 
 ⏰ *Обновлено:* {datetime.now().strftime('%d.%m.%Y %H:%M')}
 """
@@ -300,7 +273,7 @@ async def _stats_logic(user_id: int, chat_id: int, reply_to_message_id: int = No
 
 
 @router.message(Command("consultations"))
-async def cmd_consultations(message: Message, command: CommandObject):
+async def cmd_consultations(message: Message, command: CommandObject, session: Optional[AsyncSession] = None):
     """Просмотр консультаций (последние 10 или по пользователю)"""
     log.debug(f"cmd_consultations called by user_id={message.from_user.id}, args={command.args}")
     log.debug(f"Settings ADMIN_USER_ID={settings.telegram.admin_user_id}")
@@ -309,7 +282,8 @@ async def cmd_consultations(message: Message, command: CommandObject):
         user_id=message.from_user.id,
         chat_id=message.chat.id,
         args=command.args,
-        reply_to_message_id=message.message_id
+        reply_to_message_id=message.message_id,
+        session=session
     )
     if not success:
         await message.answer(result, parse_mode="Markdown")
@@ -318,12 +292,13 @@ async def cmd_consultations(message: Message, command: CommandObject):
 
 
 @router.message(Command("orders"))
-async def cmd_orders_consultant(message: Message):
+async def cmd_orders_consultant(message: Message, session: Optional[AsyncSession] = None):
     """Просмотр заказов (особенно с оплатой)"""
     success, result, markup = await _orders_logic(
         user_id=message.from_user.id,
         chat_id=message.chat.id,
-        reply_to_message_id=message.message_id
+        reply_to_message_id=message.message_id,
+        session=session
     )
     
     if not success:
@@ -339,12 +314,13 @@ async def cmd_orders_consultant(message: Message):
 
 
 @router.message(Command("drafts"))
-async def cmd_drafts_consultant(message: Message):
+async def cmd_drafts_consultant(message: Message, session: Optional[AsyncSession] = None):
     """Просмотр черновиков на проверку (аналог /admin_drafts)"""
     success, result, _ = await _drafts_logic(
         user_id=message.from_user.id,
         chat_id=message.chat.id,
-        reply_to_message_id=message.message_id
+        reply_to_message_id=message.message_id,
+        session=session
     )
     
     if not success:
@@ -355,8 +331,8 @@ async def cmd_drafts_consultant(message: Message):
     await message.answer(result, parse_mode="Markdown")
     
     # Для каждого черновика создаем inline-кнопки
-    async with session_maker() as session:
-        pending_drafts = await HybridDraftService.get_pending_drafts(session, limit=20)
+    async with session_scope(session) as db:
+        pending_drafts = await HybridDraftService.get_pending_drafts(db, limit=20)
         
         for draft in pending_drafts:
             builder = InlineKeyboardBuilder()
@@ -378,12 +354,13 @@ async def cmd_drafts_consultant(message: Message):
 
 
 @router.message(Command("stats"))
-async def cmd_stats_consultant(message: Message):
+async def cmd_stats_consultant(message: Message, session: Optional[AsyncSession] = None):
     """Статистика для консультанта"""
     success, result, markup = await _stats_logic(
         user_id=message.from_user.id,
         chat_id=message.chat.id,
-        reply_to_message_id=message.message_id
+        reply_to_message_id=message.message_id,
+        session=session
     )
     
     if not success:
@@ -442,7 +419,7 @@ async def handle_consultant_menu(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "consultant_consultations")
-async def handle_consultant_consultations(callback: CallbackQuery):
+async def handle_consultant_consultations(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Просмотр консультаций через callback"""
     if not await _check_consultant_access(callback):
         return
@@ -452,7 +429,8 @@ async def handle_consultant_consultations(callback: CallbackQuery):
         user_id=callback.from_user.id,
         chat_id=callback.message.chat.id,
         args="",
-        reply_to_message_id=callback.message.message_id
+        reply_to_message_id=callback.message.message_id,
+        session=session
     )
     if not success:
         await callback.message.answer(result, parse_mode="Markdown")
@@ -461,7 +439,7 @@ async def handle_consultant_consultations(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "consultant_orders")
-async def handle_consultant_orders(callback: CallbackQuery):
+async def handle_consultant_orders(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Просмотр заказов через callback"""
     if not await _check_consultant_access(callback):
         return
@@ -470,7 +448,8 @@ async def handle_consultant_orders(callback: CallbackQuery):
     success, result, markup = await _orders_logic(
         user_id=callback.from_user.id,
         chat_id=callback.message.chat.id,
-        reply_to_message_id=callback.message.message_id
+        reply_to_message_id=callback.message.message_id,
+        session=session
     )
     
     if not success:
@@ -486,7 +465,7 @@ async def handle_consultant_orders(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "consultant_drafts")
-async def handle_consultant_drafts(callback: CallbackQuery):
+async def handle_consultant_drafts(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Просмотр черновиков через callback"""
     if not await _check_consultant_access(callback):
         return
@@ -495,7 +474,8 @@ async def handle_consultant_drafts(callback: CallbackQuery):
     success, result, _ = await _drafts_logic(
         user_id=callback.from_user.id,
         chat_id=callback.message.chat.id,
-        reply_to_message_id=callback.message.message_id
+        reply_to_message_id=callback.message.message_id,
+        session=session
     )
     
     if not success:
@@ -506,8 +486,8 @@ async def handle_consultant_drafts(callback: CallbackQuery):
     await callback.message.answer(result, parse_mode="Markdown")
     
     # Для каждого черновика создаем inline-кнопки
-    async with session_maker() as session:
-        pending_drafts = await HybridDraftService.get_pending_drafts(session, limit=20)
+    async with session_scope(session) as db:
+        pending_drafts = await HybridDraftService.get_pending_drafts(db, limit=20)
         
         for draft in pending_drafts:
             builder = InlineKeyboardBuilder()
@@ -529,7 +509,7 @@ async def handle_consultant_drafts(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "consultant_stats")
-async def handle_consultant_stats(callback: CallbackQuery):
+async def handle_consultant_stats(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Просмотр статистики через callback"""
     if not await _check_consultant_access(callback):
         return
@@ -538,7 +518,8 @@ async def handle_consultant_stats(callback: CallbackQuery):
     success, result, markup = await _stats_logic(
         user_id=callback.from_user.id,
         chat_id=callback.message.chat.id,
-        reply_to_message_id=callback.message.message_id
+        reply_to_message_id=callback.message.message_id,
+        session=session
     )
     
     if not success:
@@ -584,7 +565,7 @@ async def handle_consultant_search_user(callback: CallbackQuery):
 
 # Callback handlers для черновиков
 @router.callback_query(lambda c: c.data.startswith("consultant_view_draft:"))
-async def handle_consultant_view_draft(callback: CallbackQuery):
+async def handle_consultant_view_draft(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Просмотр деталей черновика"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -596,8 +577,8 @@ async def handle_consultant_view_draft(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    async with session_maker() as session:
-        draft = await HybridDraftService.get_draft_by_id(session, draft_id)
+    async with session_scope(session) as db:
+        draft = await HybridDraftService.get_draft_by_id(db, draft_id)
         
         if not draft:
             await callback.answer("❌ Черновик не найден.", show_alert=True)
@@ -630,7 +611,7 @@ async def handle_consultant_view_draft(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data.startswith("consultant_approve_draft:"))
-async def handle_consultant_approve_draft(callback: CallbackQuery):
+async def handle_consultant_approve_draft(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Одобрение черновика (отправка как есть)"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -642,9 +623,9 @@ async def handle_consultant_approve_draft(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    async with session_maker() as session:
+    async with session_scope(session) as db:
         draft = await HybridDraftService.approve_draft(
-            session=session,
+            session=db,
             draft_id=draft_id,
             reviewer_id=callback.from_user.id,
             final_answer=None,  # отправляем как есть
@@ -663,7 +644,7 @@ async def handle_consultant_approve_draft(callback: CallbackQuery):
                 parse_mode="Markdown"
             )
             # Помечаем как отправленный
-            await HybridDraftService.mark_as_sent(session, draft_id)
+            await HybridDraftService.mark_as_sent(db, draft_id)
             await callback.answer("✅ Черновик одобрен и отправлен пользователю.")
             
             # Обновляем сообщение
@@ -727,7 +708,7 @@ async def handle_consultant_edit_draft(callback: CallbackQuery, state: FSMContex
 
 # Callback handlers для заказов
 @router.callback_query(lambda c: c.data == "consultant_check_screenshots")
-async def handle_consultant_check_screenshots(callback: CallbackQuery):
+async def handle_consultant_check_screenshots(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Показать заказы со скриншотами для проверки"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -735,9 +716,9 @@ async def handle_consultant_check_screenshots(callback: CallbackQuery):
     
     await callback.answer()
     
-    async with session_maker() as session:
+    async with session_scope(session) as db:
         # Заказы с скриншотами, но не оплаченные
-        orders = await OrderService(session).get_all_orders()
+        orders = await OrderService(db).get_all_orders()
         orders_with_screenshots = [o for o in orders if o.payment_screenshot and not o.is_paid]
         
         if not orders_with_screenshots:
@@ -747,7 +728,7 @@ async def handle_consultant_check_screenshots(callback: CallbackQuery):
         response = "📸 *Заказы со скриншотами для проверки:*\n\n"
         for order in orders_with_screenshots[:10]:  # первые 10
             user_info = f"👤 {order.user_id}"
-            user_settings = await UserSettingsService.get_by_user_id(session, order.user_id)
+            user_settings = await UserSettingsService.get_by_user_id(db, order.user_id)
             if user_settings and user_settings.first_name:
                 user_info = f"👤 {user_settings.first_name}"
             
@@ -778,7 +759,7 @@ async def handle_consultant_check_screenshots(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "consultant_all_orders")
-async def handle_consultant_all_orders(callback: CallbackQuery):
+async def handle_consultant_all_orders(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Показать все заказы"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -788,7 +769,8 @@ async def handle_consultant_all_orders(callback: CallbackQuery):
     success, result, markup = await _orders_logic(
         user_id=callback.from_user.id,
         chat_id=callback.message.chat.id,
-        reply_to_message_id=callback.message.message_id
+        reply_to_message_id=callback.message.message_id,
+        session=session
     )
     
     if not success:
@@ -804,7 +786,7 @@ async def handle_consultant_all_orders(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data.startswith("consultant_view_screenshot:"))
-async def handle_consultant_view_screenshot(callback: CallbackQuery):
+async def handle_consultant_view_screenshot(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Просмотр скриншота оплаты"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -816,8 +798,8 @@ async def handle_consultant_view_screenshot(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    async with session_maker() as session:
-        order = await OrderService(session).get_order_by_id(order_id)
+    async with session_scope(session) as db:
+        order = await OrderService(db).get_order_by_id(order_id)
         
         if not order:
             await callback.answer("❌ Заказ не найден.", show_alert=True)
@@ -829,7 +811,7 @@ async def handle_consultant_view_screenshot(callback: CallbackQuery):
         
         # Отправляем информацию о заказе
         user_info = f"👤 {order.user_id}"
-        user_settings = await UserSettingsService.get_by_user_id(session, order.user_id)
+        user_settings = await UserSettingsService.get_by_user_id(db, order.user_id)
         if user_settings and user_settings.first_name:
             user_info = f"👤 {user_settings.first_name} (ID: {order.user_id})"
         
@@ -858,7 +840,7 @@ async def handle_consultant_view_screenshot(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data.startswith("consultant_confirm_payment:"))
-async def handle_consultant_confirm_payment(callback: CallbackQuery):
+async def handle_consultant_confirm_payment(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Подтверждение оплаты заказа"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -870,15 +852,15 @@ async def handle_consultant_confirm_payment(callback: CallbackQuery):
         await callback.answer("❌ Ошибка формата.", show_alert=True)
         return
     
-    async with session_maker() as session:
-        success = await OrderService(session).mark_as_paid(order_id)
+    async with session_scope(session) as db:
+        success = await OrderService(db).mark_as_paid(order_id)
         
         if not success:
             await callback.answer("❌ Заказ не найден или уже оплачен.", show_alert=True)
             return
         
         # Уведомляем пользователя
-        order = await OrderService(session).get_order_by_id(order_id)
+        order = await OrderService(db).get_order_by_id(order_id)
         if order:
             try:
                 await callback.bot.send_message(
@@ -923,7 +905,7 @@ async def handle_consultant_reject_payment(callback: CallbackQuery, state: FSMCo
 
 
 @router.callback_query(lambda c: c.data == "consultant_mark_paid")
-async def handle_consultant_mark_paid(callback: CallbackQuery):
+async def handle_consultant_mark_paid(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Массовое подтверждение оплаты (показывает список)"""
     if not is_consultant(callback.from_user.id):
         await callback.answer("⛔️ Доступ запрещён.", show_alert=True)
@@ -931,9 +913,9 @@ async def handle_consultant_mark_paid(callback: CallbackQuery):
     
     await callback.answer()
     
-    async with session_maker() as session:
+    async with session_scope(session) as db:
         # Заказы с скриншотами, но не оплаченные
-        orders = await OrderService(session).get_all_orders()
+        orders = await OrderService(db).get_all_orders()
         unpaid_with_screenshots = [o for o in orders if o.payment_screenshot and not o.is_paid]
         
         if not unpaid_with_screenshots:
@@ -945,7 +927,7 @@ async def handle_consultant_mark_paid(callback: CallbackQuery):
         response += "*Список:*\n"
         for order in unpaid_with_screenshots[:10]:
             user_info = f"👤 {order.user_id}"
-            user_settings = await UserSettingsService.get_by_user_id(session, order.user_id)
+            user_settings = await UserSettingsService.get_by_user_id(db, order.user_id)
             if user_settings and user_settings.first_name:
                 user_info = f"👤 {user_settings.first_name}"
             
@@ -970,7 +952,7 @@ async def handle_consultant_mark_paid(callback: CallbackQuery):
 
 # Обработчики сообщений для состояний FSM
 @router.message(F.text & F.from_user.id == settings.telegram.admin_user_id)
-async def handle_consultant_text(message: Message, state: FSMContext):
+async def handle_consultant_text(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработчик текстовых сообщений от консультанта (для редактирования/отклонения черновиков)"""
     data = await state.get_data()
     
@@ -982,9 +964,9 @@ async def handle_consultant_text(message: Message, state: FSMContext):
             await message.answer("❌ Текст не может быть пустым.")
             return
         
-        async with session_maker() as session:
+        async with session_scope(session) as db:
             draft = await HybridDraftService.approve_draft(
-                session=session,
+                session=db,
                 draft_id=draft_id,
                 reviewer_id=message.from_user.id,
                 final_answer=edited_text,
@@ -1004,7 +986,7 @@ async def handle_consultant_text(message: Message, state: FSMContext):
                     parse_mode="Markdown"
                 )
                 # Помечаем как отправленный
-                await HybridDraftService.mark_as_sent(session, draft_id)
+                await HybridDraftService.mark_as_sent(db, draft_id)
                 await message.answer(f"✅ Черновик #{draft_id} отредактирован и отправлен пользователю.")
             except Exception as e:
                 log.error(f"Ошибка при отправке черновика пользователю: {e}")
@@ -1021,9 +1003,9 @@ async def handle_consultant_text(message: Message, state: FSMContext):
             await message.answer("❌ Причина не может быть пустой.")
             return
         
-        async with session_maker() as session:
+        async with session_scope(session) as db:
             draft = await HybridDraftService.reject_draft(
-                session=session,
+                session=db,
                 draft_id=reject_draft_id,
                 reviewer_id=message.from_user.id,
                 reviewer_notes=reason
@@ -1059,8 +1041,8 @@ async def handle_consultant_text(message: Message, state: FSMContext):
             await message.answer("❌ Причина не может быть пустой.")
             return
         
-        async with session_maker() as session:
-            order = await OrderService(session).get_order_by_id(reject_payment_order_id)
+        async with session_scope(session) as db:
+            order = await OrderService(db).get_order_by_id(reject_payment_order_id)
             if not order:
                 await message.answer("❌ Заказ не найден.")
                 await state.clear()
@@ -11,7 +11,9 @@ from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.types import Message, ContentType
 from aiogram.enums import ParseMode
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.database.engine import session_scope
 from bot.services.client_files import ClientFilesService
 from bot.services.history import ConsultationHistory
 
@@ -59,7 +61,7 @@ async def cmd_upload(message: Message):
     ContentType.VIDEO,
     ContentType.VOICE
 }))
-async def handle_file_upload(message: Message, session_maker=None):
+async def handle_file_upload(message: Message, session_maker=None, session: Optional[AsyncSession] = None):
     """Обработчик загрузки файлов любого типа."""
     if not session_maker:
         await message.answer(
@@ -109,12 +111,12 @@ async def handle_file_upload(message: Message, session_maker=None):
         log.info(f"Файл загружен: {original_filename} от {user_id}")
         
         # Получаем последнюю консультацию пользователя
-        async with session_maker() as session:
-            last_consult_id = await get_last_consultation_id(session, user_id)
+        async with session_scope(session) as db:
+            last_consult_id = await get_last_consultation_id(db, user_id)
             
             # Обрабатываем файл
             file_record = await ClientFilesService.process_uploaded_file(
-                session=session,
+                session=db,
                 user_id=user_id,
                 consultation_id=last_consult_id if last_consult_id else 0,
                 temp_file_path=temp_file_path,
@@ -182,7 +184,7 @@ async def handle_file_upload(message: Message, session_maker=None):
 
 
 @router.message(Command("myfiles"))
-async def cmd_myfiles(message: Message, session_maker=None):
+async def cmd_myfiles(message: Message, session_maker=None, session: Optional[AsyncSession] = None):
     """Показать файлы пользователя."""
     if not session_maker:
         await message.answer(
@@ -194,9 +196,9 @@ async def cmd_myfiles(message: Message, session_maker=None):
     user_id = message.from_user.id
     
     try:
-        async with session_maker() as session:
+        async with session_scope(session) as db:
             # Получаем последние 5 консультаций с файлами
-            consultations = await ConsultationHistory.get_recent(session, user_id, count=5)
+            consultations = await ConsultationHistory.get_recent(db, user_id, count=5)
             
             if not consultations:
                 await message.answer(
@@ -212,7 +214,7 @@ async def cmd_myfiles(message: Message, session_maker=None):
             
             for consult in consultations:
                 files = await ClientFilesService.get_files_for_consultation(
-                    session, consult.id, user_id
+                    db, consult.id, user_id
                 )
                 
                 if files:
@@ -4,14 +4,17 @@
 import logging
 import tempfile
 import os
-from typing import List
+from typing import List, Optional, Tuple
 
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.database.engine import session_scope
 from bot.services.history import ConsultationHistory
+from bot.services.pagination import FROM, NEXT, PREV, Page
 
 router = Router()
 log = logging.getLogger(__name__)
@@ -57,29 +60,43 @@ async def build_history_keyboard(
     page: int,
     total_pages: int,
     user_id: int,
-    total_count: int = 0
+    total_count: int = 0,
+    history_page: Optional[Page] = None
 ) -> InlineKeyboardMarkup:
-    """Построить инлайн-клавиатуру для истории."""
+    """
+    Построить инлайн-клавиатуру для истории.
+    
+    Навигация — по курсорам (keyset): history_page:<стр>:<направление>:<курсор>,
+    удаление — delete_consult:<id>:<стр>:<курсор первой записи страницы>.
+    """
     builder = InlineKeyboardBuilder()
+    first_cursor = history_page.first_cursor if history_page else None
+    current = f"{page}:{FROM}:{first_cursor}" if first_cursor else f"{page}"
 
     # Кнопки удаления для каждой консультации на странице
     for consult in consultations:
         builder.row(
             InlineKeyboardButton(
                 text=f"\u274c Удалить #{consult.id}",
-                callback_data=f"delete_consult:{consult.id}:{page}"
+                callback_data=f"delete_consult:{consult.id}:{current}"
             )
         )
 
     # Навигация
     nav_buttons = []
-    if page > 1:
+    if page > 1 and first_cursor:
         nav_buttons.append(
-            InlineKeyboardButton(text="\u2b05\ufe0f Назад", callback_data=f"history_page:{page-1}")
+            InlineKeyboardButton(
+                text="\u2b05\ufe0f Назад",
+                callback_data=f"history_page:{page-1}:{PREV}:{first_cursor}"
+            )
         )
-    if page < total_pages:
+    if history_page and history_page.next_cursor:
         nav_buttons.append(
-            InlineKeyboardButton(text="Вперёд \u27a1\ufe0f", callback_data=f"history_page:{page+1}")
+            InlineKeyboardButton(
+                text="Вперёд \u27a1\ufe0f",
+                callback_data=f"history_page:{page+1}:{NEXT}:{history_page.next_cursor}"
+            )
         )
 
     if nav_buttons:
@@ -92,7 +109,7 @@ async def build_history_keyboard(
             InlineKeyboardButton(text="\U0001f4e5 Экспорт", callback_data=f"export_history:{user_id}")
         )
     action_buttons.append(
-        InlineKeyboardButton(text="\U0001f504 Обновить", callback_data=f"history_page:{page}")
+        InlineKeyboardButton(text="\U0001f504 Обновить", callback_data=f"history_page:{current}")
     )
 
     builder.row(*action_buttons)
@@ -100,18 +117,29 @@ async def build_history_keyboard(
     return builder.as_markup()
 
 
+def parse_page_callback(parts: List[str]) -> Tuple[int, Optional[str], str]:
+    """Номер страницы, курсор и направление из частей callback_data (старый формат — без курсора)."""
+    page = int(parts[0]) if parts else 1
+    if len(parts) >= 3:
+        return page, parts[2], parts[1]
+    return 1, None, NEXT
+
+
 @router.message(Command("history"))
-async def cmd_history(message: Message, session_maker=None):
+async def cmd_history(message: Message, session_maker=None, session: Optional[AsyncSession] = None):
     """Показать историю консультаций пользователя (первая страница)."""
-    await show_history_page(message, session_maker, page=1)
+    await show_history_page(message, session_maker, page=1, session=session)
 
 
 async def show_history_page(
     message_or_callback,
     session_maker,
-    page: int = 1
+    page: int = 1,
+    cursor: Optional[str] = None,
+    direction: str = NEXT,
+    session: Optional[AsyncSession] = None
 ):
-    """Показать страницу истории консультаций."""
+    """Показать страницу истории консультаций (keyset: от cursor в направлении direction)."""
     if not session_maker:
         if isinstance(message_or_callback, Message):
             await message_or_callback.answer(
@@ -126,9 +154,9 @@ async def show_history_page(
     user_id = message_or_callback.from_user.id
 
     try:
-        async with session_maker() as session:
+        async with session_scope(session) as db:
             # Получаем общее количество
-            total_count = await ConsultationHistory.count_by_user(session, user_id)
+            total_count = await ConsultationHistory.count_by_user(db, user_id)
 
             if total_count == 0:
                 if isinstance(message_or_callback, Message):
@@ -142,22 +170,24 @@ async def show_history_page(
                     await message_or_callback.answer("История пуста", show_alert=True)
                 return
 
+            # Получаем консультации для страницы (по курсору, без OFFSET)
+            history_page = await ConsultationHistory.get_page(
+                db, user_id, limit=CONSULTATIONS_PER_PAGE, cursor=cursor, direction=direction
+            )
+            consultations = history_page.items
+
             # Рассчитываем страницы
             total_pages = (total_count + CONSULTATIONS_PER_PAGE - 1) // CONSULTATIONS_PER_PAGE
+            if history_page.at_start:
+                page = 1
             page = max(1, min(page, total_pages))
-            offset = (page - 1) * CONSULTATIONS_PER_PAGE
-
-            # Получаем консультации для страницы
-            consultations = await ConsultationHistory.get_by_user(
-                session, user_id, limit=CONSULTATIONS_PER_PAGE, offset=offset
-            )
 
             # Строим сообщение и клавиатуру
             history_text = await build_history_message(
                 consultations, total_count, page, total_pages
             )
             keyboard = await build_history_keyboard(
-                consultations, page, total_pages, user_id, total_count
+                consultations, page, total_pages, user_id, total_count, history_page
             )
 
             if isinstance(message_or_callback, Message):
@@ -187,18 +217,22 @@ async def show_history_page(
 
 
 @router.callback_query(lambda c: c.data.startswith("history_page:"))
-async def handle_history_page(callback: types.CallbackQuery, session_maker=None):
+async def handle_history_page(
+    callback: types.CallbackQuery, session_maker=None, session: Optional[AsyncSession] = None
+):
     """Обработка навигации по страницам истории."""
     try:
-        page = int(callback.data.split(":")[1])
-        await show_history_page(callback, session_maker, page)
+        page, cursor, direction = parse_page_callback(callback.data.split(":")[1:])
+        await show_history_page(callback, session_maker, page, cursor, direction, session=session)
     except Exception as e:
         log.error(f"Ошибка навигации: {e}")
         await callback.answer("Ошибка навигации", show_alert=True)
 
 
 @router.callback_query(lambda c: c.data.startswith("delete_consult:"))
-async def delete_consultation(callback: types.CallbackQuery, session_maker=None):
+async def delete_consultation(
+    callback: types.CallbackQuery, session_maker=None, session: Optional[AsyncSession] = None
+):
     """Удалить консультацию."""
     if not session_maker:
         await callback.answer("Операция недоступна", show_alert=True)
@@ -207,15 +241,15 @@ async def delete_consultation(callback: types.CallbackQuery, session_maker=None)
     try:
         data_parts = callback.data.split(":")
         consult_id = int(data_parts[1])
-        page = int(data_parts[2]) if len(data_parts) > 2 else 1
+        page, cursor, direction = parse_page_callback(data_parts[2:])
         user_id = callback.from_user.id
 
-        async with session_maker() as session:
-            deleted = await ConsultationHistory.delete(session, consult_id, user_id)
+        async with session_scope(session) as db:
+            deleted = await ConsultationHistory.delete(db, consult_id, user_id)
 
         if deleted:
-            # Показываем обновлённую страницу
-            await show_history_page(callback, session_maker, page)
+            # Показываем обновлённую страницу (с той же первой записи)
+            await show_history_page(callback, session_maker, page, cursor, direction, session=session)
             await callback.answer(f"Консультация #{consult_id} удалена")
         else:
             await callback.answer("Консультация не найдена или недоступна", show_alert=True)
@@ -226,7 +260,9 @@ async def delete_consultation(callback: types.CallbackQuery, session_maker=None)
 
 
 @router.callback_query(lambda c: c.data.startswith("export_history:"))
-async def export_history(callback: types.CallbackQuery, session_maker=None):
+async def export_history(
+    callback: types.CallbackQuery, session_maker=None, session: Optional[AsyncSession] = None
+):
     """Экспортировать все консультации в текстовый файл."""
     if not session_maker:
         await callback.answer("Операция недоступна", show_alert=True)
@@ -235,9 +271,9 @@ async def export_history(callback: types.CallbackQuery, session_maker=None):
     user_id = callback.from_user.id
 
     try:
-        async with session_maker() as session:
+        async with session_scope(session) as db:
             # Получаем все консультации
-            consultations = await ConsultationHistory.get_by_user(session, user_id, limit=1000)
+            consultations = await ConsultationHistory.get_by_user(db, user_id, limit=1000)
 
         if not consultations:
             await callback.answer("Нет консультаций для экспорта", show_alert=True)
@@ -276,7 +312,7 @@ async def export_history(callback: types.CallbackQuery, session_maker=None):
 
 
 @router.message(Command("export"))
-async def cmd_export(message: Message, session_maker=None):
+async def cmd_export(message: Message, session_maker=None, session: Optional[AsyncSession] = None):
     """Команда для экспорта истории консультаций."""
     # Просто отправляем callback для экспорта
     from aiogram.types import CallbackQuery
@@ -287,4 +323,4 @@ async def cmd_export(message: Message, session_maker=None):
         message=message
     )
     fake_callback.data = f"export_history:{message.from_user.id}"
-    await export_history(fake_callback, session_maker)
+    await export_history(fake_callback, session_maker, session)
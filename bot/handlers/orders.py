@@ -12,22 +12,14 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.services.order import OrderService, OrderStatus
-from bot.database.engine import create_engine, get_session_maker
+from bot.database.engine import session_scope
 from bot.config import settings
 
 logger = logging.getLogger(__name__)
 
-session_maker = None
-if (settings.database.url is not None):
-    try:
-        engine = create_engine(settings.database.url)
-        session_maker = get_session_maker(engine)
-    except Exception as e:
-        logger.error(f"Не удалось создать session_maker для заказов: {e}")
-
-
 router = Router()
 
 
@@ -95,7 +87,7 @@ async def start_order(callback: CallbackQuery, state: FSMContext, session_maker=
 
 
 @router.message(OrderStates.waiting_order_data)
-async def process_order_data(message: Message, state: FSMContext):
+async def process_order_data(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработка данных заказа"""
     user = message.from_user
     text = message.text.strip()
@@ -122,8 +114,8 @@ async def process_order_data(message: Message, state: FSMContext):
         return
 
     # Сохраняем заказ в БД
-    if session_maker is None:
-        logger.error("session_maker не инициализирован, заказ не будет сохранён")
+    if not settings.database.url:
+        logger.error("База данных не настроена, заказ не будет сохранён")
         await message.answer(
             "❌ *Произошла ошибка при сохранении заказа (база данных не настроена)*\n\n"
             "Попробуйте позже или обратитесь к администратору.",
@@ -132,8 +124,8 @@ async def process_order_data(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    async with session_maker() as session:
-        order_service = OrderService(session)
+    async with session_scope(session) as db:
+        order_service = OrderService(db)
         try:
             order = await order_service.create_order(
                 user_id=user.id,
@@ -172,19 +164,19 @@ async def process_order_data(message: Message, state: FSMContext):
 # Команда для просмотра заказов (только для администратора)
 @router.message(F.text.contains("/orders"))
 @router.message(F.text == "/orders")
-async def cmd_orders(message: Message):
+async def cmd_orders(message: Message, session: Optional[AsyncSession] = None):
     """Показать новые заказы (администратор)"""
     # Проверяем, является ли пользователь администратором
     if message.from_user.id != settings.telegram.admin_user_id:
         await message.answer("⛔️ Эта команда доступна только администратору.")
         return
 
-    if session_maker is None:
+    if not settings.database.url:
         await message.answer("❌ База данных не настроена, заказы недоступны.")
         return
     
-    async with session_maker() as session:
-        order_service = OrderService(session)
+    async with session_scope(session) as db:
+        order_service = OrderService(db)
         new_orders = await order_service.get_orders_by_status(OrderStatus.NEW, limit=10)
         completed_orders = await order_service.get_orders_by_status(OrderStatus.COMPLETED, limit=5)
 
@@ -3,6 +3,7 @@
 """
 
 import logging
+from typing import Optional
 from datetime import datetime, timedelta
 
 from aiogram import Router, types, F
@@ -10,27 +11,24 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.services.prediction_history_service import PredictionHistoryService
 from bot.models.prediction_history import PredictionType
-from bot.database.engine import get_session_maker, create_engine
-from bot.config import settings
+from bot.database.engine import session_scope
 
 router = Router()
 log = logging.getLogger(__name__)
 
 
 @router.message(Command("my_predictions"))
-async def cmd_my_predictions(message: Message):
+async def cmd_my_predictions(message: Message, session: Optional[AsyncSession] = None):
     """Показать историю предсказаний пользователя"""
     user_id = message.from_user.id
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
+    async with session_scope(session) as db:
         # Получаем статистику
-        stats = await PredictionHistoryService.get_user_statistics(session, user_id)
+        stats = await PredictionHistoryService.get_user_statistics(db, user_id)
         
         if stats["total"] == 0:
             await message.answer(
@@ -79,7 +77,7 @@ async def cmd_my_predictions(message: Message):
 
 
 @router.callback_query(lambda c: c.data.startswith("predictions_recent:"))
-async def handle_predictions_recent(callback: CallbackQuery):
+async def handle_predictions_recent(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Показать последние предсказания"""
     try:
         limit = int(callback.data.split(":")[1])
@@ -88,11 +86,8 @@ async def handle_predictions_recent(callback: CallbackQuery):
     
     user_id = callback.from_user.id
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        predictions = await PredictionHistoryService.get_by_user(session, user_id, limit=limit)
+    async with session_scope(session) as db:
+        predictions = await PredictionHistoryService.get_by_user(db, user_id, limit=limit)
         
         if not predictions:
             await callback.answer("📭 Нет предсказаний.", show_alert=True)
@@ -116,15 +111,12 @@ async def handle_predictions_recent(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "predictions_stats")
-async def handle_predictions_stats(callback: CallbackQuery):
+async def handle_predictions_stats(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Подробная статистика предсказаний"""
     user_id = callback.from_user.id
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        stats = await PredictionHistoryService.get_user_statistics(session, user_id)
+    async with session_scope(session) as db:
+        stats = await PredictionHistoryService.get_user_statistics(db, user_id)
         
         if stats["total"] == 0:
             await callback.answer("📭 Нет данных для статистики.", show_alert=True)
@@ -175,24 +167,21 @@ async def handle_predictions_clear_confirm(callback: CallbackQuery):
 
 
 @router.callback_query(lambda c: c.data == "predictions_clear_yes")
-async def handle_predictions_clear_yes(callback: CallbackQuery):
+async def handle_predictions_clear_yes(callback: CallbackQuery, session: Optional[AsyncSession] = None):
     """Очистка истории предсказаний"""
     user_id = callback.from_user.id
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
+    async with session_scope(session) as db:
         # Получаем все ID предсказаний пользователя
-        predictions = await PredictionHistoryService.get_by_user(session, user_id, limit=1000)
+        predictions = await PredictionHistoryService.get_by_user(db, user_id, limit=1000)
         deleted_count = 0
         
         for pred in predictions:
-            success = await PredictionHistoryService.delete_by_id(session, pred.id)
+            success = await PredictionHistoryService.delete_by_id(db, pred.id)
             if success:
                 deleted_count += 1
         
-        await session.commit()
+        await db.commit()
         
         if deleted_count > 0:
             await callback.message.answer(
@@ -223,7 +212,7 @@ async def handle_predictions_clear_no(callback: CallbackQuery):
 
 
 @router.message(Command("prediction_stats"))
-async def cmd_prediction_stats(message: Message):
+async def cmd_prediction_stats(message: Message, session: Optional[AsyncSession] = None):
     """Статистика предсказаний (админ/консультант)"""
     user_id = message.from_user.id
     
@@ -232,11 +221,8 @@ async def cmd_prediction_stats(message: Message):
     #     await message.answer("⛔️ У вас нет прав для просмотра статистики.")
     #     return
     
-    engine = create_engine(settings.database.url)
-
-    
-    async with get_session_maker(engine)() as session:
-        stats = await PredictionHistoryService.get_global_statistics(session)
+    async with session_scope(session) as db:
+        stats = await PredictionHistoryService.get_global_statistics(db)
         
         stats_text = f"""
 🌍 *Глобальная статистика предсказаний*
@@ -4,17 +4,18 @@
 
 import logging
 import random
+from typing import Optional
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.services.prediction_history_service import PredictionHistoryService
 from bot.models.prediction_history import PredictionType
-from bot.database.engine import get_session_maker, create_engine
-from bot.config import settings
+from bot.database.engine import session_scope
 
 router = Router()
 log = logging.getLogger(__name__)
@@ -87,7 +88,9 @@ async def cmd_runes(message: Message, state: FSMContext):
 
 
 @router.callback_query(lambda c: c.data.startswith("runes_"))
-async def process_runes_callback(callback: CallbackQuery, state: FSMContext):
+async def process_runes_callback(
+    callback: CallbackQuery, state: FSMContext, session: Optional[AsyncSession] = None
+):
     """Обработка всех callback-запросов рун"""
     data = callback.data
     
@@ -123,7 +126,7 @@ async def process_runes_callback(callback: CallbackQuery, state: FSMContext):
             await callback.message.edit_text(text, parse_mode="Markdown")
         else:
             # Руна дня — сразу выдаём результат
-            await generate_runes_reading(callback.message, state, "Какой совет на сегодня?")
+            await generate_runes_reading(callback.message, state, "Какой совет на сегодня?", session)
             await state.clear()
         
         await callback.answer()
@@ -149,14 +152,14 @@ async def process_runes_callback(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(RunesDivination.waiting_for_question)
-async def process_runes_question(message: Message, state: FSMContext):
+async def process_runes_question(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработка вопроса для рун"""
     question = message.text
-    await generate_runes_reading(message, state, question)
+    await generate_runes_reading(message, state, question, session)
     await state.clear()
 
 
-async def generate_runes_reading(message: Message, state: FSMContext, question: str):
+async def generate_runes_reading(message: Message, state: FSMContext, question: str, session: Optional[AsyncSession] = None):
     """Генерация расклада рун"""
     data = await state.get_data()
     spread_type = data.get("spread_type", "runes_one")
@@ -217,10 +220,9 @@ async def generate_runes_reading(message: Message, state: FSMContext, question:
     
     # Сохраняем в историю предсказаний
     try:
-        engine = create_engine(settings.database.url)
-        async with get_session_maker(engine)() as session:
+        async with session_scope(session) as db:
             await PredictionHistoryService.create_prediction(
-                session=session,
+                session=db,
                 user_id=message.from_user.id,
                 prediction_type=PredictionType.RUNES,
                 subtype=spread_type,
@@ -4,15 +4,20 @@
 
 import logging
 from datetime import time
+from typing import Optional
+
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.database.engine import session_scope
 from bot.services.user_settings import UserSettingsService
 from bot.services.daily_content import DailyContentService
+from bot.services.notification_scheduler import notification_settings_changed
 
 router = Router()
 log = logging.getLogger(__name__)
@@ -24,8 +29,16 @@ class NotificationSettings(StatesGroup):
     choosing_modules = State()
 
 
+async def _load_settings(session: Optional[AsyncSession], user_id: int):
+    """Настройки из кэша (если middleware их не передал)."""
+    async with session_scope(session) as db:
+        return await UserSettingsService.get_cached(db, user_id)
+
+
 @router.message(Command("settings"))
-async def cmd_settings(message: Message, session_maker=None):
+async def cmd_settings(
+    message: Message, session_maker=None, user_settings=None, session: Optional[AsyncSession] = None
+):
     """Команда /settings — настройки пользователя."""
     if not session_maker:
         await message.answer(
@@ -37,9 +50,8 @@ async def cmd_settings(message: Message, session_maker=None):
     
     user_id = message.from_user.id
     
-    async with session_maker() as session:
-        settings = await UserSettingsService.get_or_create(session, user_id)
-        stats = await UserSettingsService.get_user_stats(session, user_id)
+    settings = user_settings or await _load_settings(session, user_id)
+    stats = UserSettingsService.stats_of(settings)
     
     # Формируем ответ
     response = "⚙️ *Ваши настройки*\n\n"
@@ -83,7 +95,10 @@ async def cmd_settings(message: Message, session_maker=None):
 
 
 @router.callback_query(lambda c: c.data.startswith("settings_"))
-async def process_settings_callback(callback: CallbackQuery, state: FSMContext, session_maker=None):
+async def process_settings_callback(
+    callback: CallbackQuery, state: FSMContext, session_maker=None, user_settings=None,
+    session: Optional[AsyncSession] = None
+):
     """Обработка колбэков настроек."""
     action = callback.data
     
@@ -100,8 +115,7 @@ async def process_settings_callback(callback: CallbackQuery, state: FSMContext,
     
     if action == "settings_notifications":
         # Показать настройки уведомлений
-        async with session_maker() as session:
-            settings = await UserSettingsService.get_or_create(session, user_id)
+        settings = user_settings or await _load_settings(session, user_id)
         
         builder = InlineKeyboardBuilder()
         
@@ -154,8 +168,7 @@ async def process_settings_callback(callback: CallbackQuery, state: FSMContext,
     
     elif action == "settings_favorites":
         # Настройка избранных модулей
-        async with session_maker() as session:
-            settings = await UserSettingsService.get_or_create(session, user_id)
+        settings = user_settings or await _load_settings(session, user_id)
         
         favorite_modules = settings.get_favorite_modules_list()
         
@@ -203,8 +216,8 @@ async def process_settings_callback(callback: CallbackQuery, state: FSMContext,
     
     elif action == "settings_stats":
         # Подробная статистика
-        async with session_maker() as session:
-            stats = await UserSettingsService.get_user_stats(session, user_id)
+        settings = user_settings or await _load_settings(session, user_id)
+        stats = UserSettingsService.stats_of(settings)
         
         text = "📊 *Ваша статистика*\n\n"
         text += f"• Консультаций с AI: {stats.get('total_consultations', 0)}\n"
@@ -237,7 +250,7 @@ async def process_settings_callback(callback: CallbackQuery, state: FSMContext,
     
     elif action == "settings_back":
         # Возврат к основным настройкам
-        await cmd_settings(callback.message, session_maker)
+        await cmd_settings(callback.message, session_maker, session=session)
         await callback.answer()
     
     else:
@@ -245,7 +258,9 @@ async def process_settings_callback(callback: CallbackQuery, state: FSMContext,
 
 
 @router.callback_query(lambda c: c.data.startswith("notifications_"))
-async def process_notifications_callback(callback: CallbackQuery, session_maker=None):
+async def process_notifications_callback(
+    callback: CallbackQuery, session_maker=None, session: Optional[AsyncSession] = None
+):
     """Обработка колбэков уведомлений."""
     if not session_maker:
         await callback.answer("База данных недоступна", show_alert=True)
@@ -254,8 +269,8 @@ async def process_notifications_callback(callback: CallbackQuery, session_maker=
     action = callback.data
     user_id = callback.from_user.id
     
-    async with session_maker() as session:
-        settings = await UserSettingsService.get_or_create(session, user_id)
+    async with session_scope(session) as db:
+        settings = await UserSettingsService.get_or_create(db, user_id)
         
         if action.startswith("notifications_toggle_"):
             toggle_type = action.split("_")[2]  # on/off или rune_on и т.д.
@@ -288,7 +303,11 @@ async def process_notifications_callback(callback: CallbackQuery, session_maker=
                 state = action.split("_")[3]
                 settings.notify_meditation_reminder = (state == "on")
             
-            await session.commit()
+            await db.commit()
+            UserSettingsService.invalidate_cached(user_id)
+            notification_settings_changed(
+                user_id, settings.enable_daily_notifications, settings.notification_time
+            )
             await callback.answer("Настройки обновлены!")
             
             # Обновляем интерфейс
@@ -301,7 +320,8 @@ async def process_notifications_callback(callback: CallbackQuery, session_maker=
                     data="settings_notifications"
                 ),
                 callback.message.bot,
-                session_maker
+                session_maker,
+                session=db
             )
         
         elif action == "notifications_change_time":
@@ -317,7 +337,9 @@ async def process_notifications_callback(callback: CallbackQuery, session_maker=
 
 
 @router.callback_query(lambda c: c.data.startswith("favorite_toggle_"))
-async def process_favorite_callback(callback: CallbackQuery, session_maker=None):
+async def process_favorite_callback(
+    callback: CallbackQuery, session_maker=None, session: Optional[AsyncSession] = None
+):
     """Обработка колбэков избранных модулей."""
     if not session_maker:
         await callback.answer("База данных недоступна", show_alert=True)
@@ -326,16 +348,18 @@ async def process_favorite_callback(callback: CallbackQuery, session_maker=None)
     module_name = callback.data.split("_")[2]
     user_id = callback.from_user.id
     
-    async with session_maker() as session:
-        settings = await UserSettingsService.get_or_create(session, user_id)
+    async with session_scope(session) as db:
+        settings = await UserSettingsService.get_or_create(db, user_id)
         
         if module_name in settings.get_favorite_modules_list():
             settings.remove_favorite_module(module_name)
-            await session.commit()
+            await db.commit()
+            UserSettingsService.invalidate_cached(user_id)
             await callback.answer(f"Модуль удалён из избранного")
         else:
             settings.add_favorite_module(module_name)
-            await session.commit()
+            await db.commit()
+            UserSettingsService.invalidate_cached(user_id)
             await callback.answer(f"Модуль добавлен в избранное")
         
         # Обновляем интерфейс
@@ -348,7 +372,8 @@ async def process_favorite_callback(callback: CallbackQuery, session_maker=None)
                 data="settings_favorites"
             ),
             callback.message.bot,
-            session_maker
+            session_maker,
+            session=db
         )
 
 
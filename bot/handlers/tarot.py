@@ -5,6 +5,7 @@
 import logging
 import random
 import json
+from typing import Optional
 from pathlib import Path
 from aiogram import Router, types
 from aiogram.filters import Command
@@ -12,11 +13,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.services.prediction_history_service import PredictionHistoryService
 from bot.models.prediction_history import PredictionType
-from bot.database.engine import get_session_maker, create_engine
-from bot.config import settings
+from bot.database.engine import session_scope
 
 router = Router()
 log = logging.getLogger(__name__)
@@ -123,7 +124,7 @@ async def process_tarot_choice(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(TarotReading.waiting_for_question)
-async def process_question(message: Message, state: FSMContext):
+async def process_question(message: Message, state: FSMContext, session: Optional[AsyncSession] = None):
     """Обработка вопроса пользователя и генерация расклада"""
     question = message.text
     data = await state.get_data()
@@ -187,10 +188,9 @@ async def process_question(message: Message, state: FSMContext):
     
     # Сохраняем в историю предсказаний
     try:
-        engine = create_engine(settings.database.url)
-        async with get_session_maker(engine)() as session:
+        async with session_scope(session) as db:
             await PredictionHistoryService.create_prediction(
-                session=session,
+                session=db,
                 user_id=message.from_user.id,
                 prediction_type=PredictionType.TAROT,
                 subtype=spread_type,
@@ -4,7 +4,7 @@ HTTP healthcheck сервер для Docker и мониторинга.
 Запускает фоновый aiohttp‑сервер на порту 8080 (настраивается через HEALTH_PORT).
 Предоставляет эндпоинты:
 - GET /health → 200 OK с JSON статусом бота.
-- GET /metrics → метрики (заглушка для Prometheus).
+- GET /metrics → метрики Prometheus (пулы соединений LLM-провайдеров и БД).
 - GET / → краткая информация.
 
 Сервер запускается в отдельной задаче (asyncio.Task) и останавливается при завершении бота.
@@ -60,12 +60,140 @@ async def health_handler(request: web.Request) -> web.Response:
     )
 
 
+# Метрики пулов LLM: (имя, ключ в LLMProvider.pool_stats(), описание)
+LLM_POOL_METRICS = (
+    ("mysticbot_llm_requests_in_flight", "in_flight", "LLM requests currently in flight"),
+    ("mysticbot_llm_requests_in_flight_peak", "peak_in_flight", "Peak concurrent LLM requests"),
+    ("mysticbot_llm_pool_max_connections", "max_connections", "Configured pool size"),
+    ("mysticbot_llm_pool_connections_active", "connections_active", "Pool connections serving requests"),
+    ("mysticbot_llm_pool_connections_idle", "connections_idle", "Idle keep-alive connections"),
+    ("mysticbot_llm_pool_requests_waiting", "requests_waiting", "Requests waiting for a pool connection"),
+    ("mysticbot_llm_clients_created", "clients_created", "httpx clients created (recreations > 1)"),
+    ("mysticbot_llm_max_concurrency", "max_concurrency", "Configured concurrent requests per provider"),
+    ("mysticbot_llm_slots_busy", "slots_busy", "Provider concurrency slots in use"),
+)
+
+# Метрики rate limiter'а LLM: (имя, ключ в LLMProvider.pool_stats(), тип, описание)
+LLM_RATE_METRICS = (
+    ("mysticbot_llm_rate_rpm_limit", "rpm_limit", "gauge", "Requests per minute limit (0 = unknown)"),
+    ("mysticbot_llm_rate_tpm_limit", "tpm_limit", "gauge", "Tokens per minute limit (0 = unknown)"),
+    ("mysticbot_llm_rate_factor", "rate_factor", "gauge", "Share of the limit in use after 429 backoff"),
+    ("mysticbot_llm_rate_waits_total", "rate_waits", "counter", "Requests that waited for quota"),
+    ("mysticbot_llm_rate_wait_seconds_total", "rate_wait_seconds", "counter", "Seconds spent waiting for quota"),
+    ("mysticbot_llm_rate_limited_total", "rate_limited", "counter", "429 responses from the provider"),
+    ("mysticbot_llm_rate_rejected_total", "rate_rejected", "counter", "Requests sent elsewhere (quota wait too long)"),
+)
+
+# Метрики очереди LLM: (имя, ключ в LLMScheduler.stats(), тип, описание)
+LLM_QUEUE_METRICS = (
+    ("mysticbot_llm_queue_running", "running", "gauge", "LLM requests admitted by the scheduler"),
+    ("mysticbot_llm_queue_waiting", "queued", "gauge", "LLM requests waiting in the fair queue"),
+    ("mysticbot_llm_queue_capacity", "capacity", "gauge", "Concurrent LLM requests allowed (healthy providers)"),
+    ("mysticbot_llm_queue_dispatched_total", "dispatched", "counter", "LLM requests admitted since start"),
+    ("mysticbot_llm_queue_rejected_total", "rejected", "counter", "LLM requests rejected (per-user queue full)"),
+)
+
+# Метрики буфера счётчиков: (имя, ключ в CounterBuffer.stats(), тип, описание)
+COUNTER_BUFFER_METRICS = (
+    ("mysticbot_counters_pending_users", "pending_users", "gauge", "Users with counter increments not yet written"),
+    ("mysticbot_counters_cached_quotas", "cached_quotas", "gauge", "AI quota snapshots held in memory"),
+    ("mysticbot_counters_flushes_total", "flushes", "counter", "Batched counter writes to the database"),
+    ("mysticbot_counters_flushed_rows_total", "flushed_rows", "counter", "Per-user counter updates written"),
+)
+
+# Метрики пула соединений БД: (имя, ключ в InstrumentedQueuePool.stats(), тип, описание)
+DB_POOL_METRICS = (
+    ("mysticbot_db_pool_size", "size", "gauge", "Configured persistent DB connections"),
+    ("mysticbot_db_pool_max_overflow", "max_overflow", "gauge", "Configured overflow DB connections"),
+    ("mysticbot_db_pool_checked_out", "checked_out", "gauge", "DB connections in use"),
+    ("mysticbot_db_pool_checked_in", "checked_in", "gauge", "Idle DB connections in the pool"),
+    ("mysticbot_db_pool_overflow", "overflow", "gauge", "DB connections open beyond pool_size"),
+    ("mysticbot_db_pool_waiting", "waiting", "gauge", "Checkouts waiting for a DB connection"),
+    ("mysticbot_db_pool_checkouts_total", "checkouts", "counter", "DB connection checkout attempts"),
+    ("mysticbot_db_pool_wait_seconds_total", "wait_seconds", "counter", "Seconds spent waiting for a DB connection"),
+    ("mysticbot_db_pool_wait_max_seconds", "wait_max_seconds", "gauge", "Longest wait for a DB connection"),
+    ("mysticbot_db_pool_timeouts_total", "timeouts", "counter", "Checkouts that hit pool_timeout"),
+)
+
+
+def llm_pool_metrics() -> str:
+    """
+    Метрики пулов соединений, квот и очереди LLM в формате Prometheus.
+    Пусто, если LLM-сервис в этом процессе ещё не создан.
+    """
+    from bot.services import llm
+
+    service = llm._llm_service
+    if service is None:
+        return ""
+    stats = service.pool_stats()
+    lines = []
+    for name, key, help_text in LLM_POOL_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for provider, values in stats.items():
+            lines.append(f'{name}{{provider="{provider}"}} {int(values[key])}')
+    for name, key, kind, help_text in LLM_RATE_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for provider, values in stats.items():
+            lines.append(f'{name}{{provider="{provider}"}} {float(values[key]):g}')
+    queue = service.scheduler.stats()
+    for name, key, kind, help_text in LLM_QUEUE_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {int(queue[key])}")
+    return "\n".join(lines) + "\n"
+
+
+def counter_buffer_metrics() -> str:
+    """Метрики буфера счётчиков; пусто, если буфер не запущен."""
+    from bot.services.counter_buffer import get_counter_buffer
+
+    buffer = get_counter_buffer()
+    if buffer is None:
+        return ""
+    stats = buffer.stats()
+    lines = []
+    for name, key, kind, help_text in COUNTER_BUFFER_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {int(stats[key])}")
+    return "\n".join(lines) + "\n"
+
+
+def db_pool_metrics() -> str:
+    """Метрики пула соединений БД; пусто, если общий engine не создан."""
+    from bot.database.engine import pool_stats
+
+    stats = pool_stats()
+    if stats is None:
+        return ""
+    lines = []
+    for name, key, kind, help_text in DB_POOL_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {float(stats[key]):g}")
+    return "\n".join(lines) + "\n"
+
+
 async def metrics_handler(request: web.Request) -> web.Response:
-    """Заглушка для Prometheus метрик."""
-    # В будущем можно добавить реальные метрики (например, через prometheus_client)
+    """Метрики Prometheus."""
     metrics = "# HELP mysticbot_info Information about MysticBot\n"
     metrics += "# TYPE mysticbot_info gauge\n"
     metrics += 'mysticbot_info{version="1.0.0"} 1\n'
+    try:
+        metrics += llm_pool_metrics()
+    except Exception as e:
+        logger.warning(f"Не удалось собрать метрики LLM: {e}")
+    try:
+        metrics += db_pool_metrics()
+    except Exception as e:
+        logger.warning(f"Не удалось собрать метрики пула БД: {e}")
+    try:
+        metrics += counter_buffer_metrics()
+    except Exception as e:
+        logger.warning(f"Не удалось собрать метрики счётчиков: {e}")
 
     return web.Response(text=metrics, content_type="text/plain; version=0.0.4")
 
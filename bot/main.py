@@ -11,12 +11,15 @@ from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from bot.config import settings
-from bot.database.engine import create_engine, get_session_maker
+from bot.database.engine import dispose_engine, get_engine, get_session_maker, warm_up_pool
+from bot.database.writer import close_sqlite_writer, init_sqlite_writer
 from bot.models.base import Base
 import bot.models  # регистрация всех моделей в Base.metadata
 
 from bot.middlewares.throttling import ThrottlingMiddleware
 from bot.middlewares.auth import AuthMiddleware
+from bot.middlewares.db_session import DbSessionMiddleware
+from bot.middlewares.user_context import UserContextMiddleware
 
 # === Роутеры (порядок = приоритет!) ===
 from bot.handlers.ai_mode import router as ai_mode_router          # FSM — ПЕРВЫЙ
@@ -26,7 +29,7 @@ from bot.handlers.numerology import router as numerology_router
 from bot.handlers.horoscope import router as horoscope_router
 from bot.handlers.finance_calendar import router as finance_calendar_router
 from bot.handlers.profile import router as profile_router
-from bot.handlers.admin import router as admin_router
+from bot.handlers.admin import router as admin_router, resume_admin_broadcasts
 from bot.handlers.dream import router as dream_router
 from bot.handlers.runes import router as runes_router
 from bot.handlers.randomizer import router as random_router
@@ -43,6 +46,15 @@ from bot.handlers.consultant import router as consultant_router
 from bot.handlers.consultant_start import router as consultant_start_router
 from bot.handlers.admin_search import router as admin_search_router
 from bot.services.llm import get_llm_service
+from bot.services.tokenizer import preload_tokenizers
+from bot.services.conversation_store import init_conversation_store
+from bot.services.counter_buffer import init_counter_buffer, close_counter_buffer
+from bot.services.daily_stats import init_daily_stats, close_daily_stats
+from bot.services.user_profiles import UserProfileService
+from bot.services.notification_scheduler import (
+    start_notification_scheduler,
+    stop_notification_scheduler,
+)
 
 
 def setup_logging(level: str):
@@ -76,8 +88,17 @@ async def main():
 
     # --- LLM-провайдеры ---
     providers = settings.llm_providers_order
+    llm_warmup = None
     if providers:
         log.info(f"🤖 LLM провайдеры: {' → '.join(p.upper() for p in providers)}")
+        # Прогрев пулов соединений в фоне — TLS-рукопожатия не на первом запросе
+        llm_warmup = asyncio.create_task(get_llm_service().warm_up())
+        # Словари токенизаторов — до первого апдейта и вне event loop
+        try:
+            loaded = await preload_tokenizers(p.model for p in get_llm_service().providers)
+            log.info(f"🔢 Токенизаторы загружены: {', '.join(sorted(set(loaded.values())))}")
+        except Exception as e:
+            log.warning(f"⚠️ Не удалось загрузить токенизаторы: {e}")
     else:
         log.warning("⚠️ Ни один LLM-провайдер не настроен!")
 
@@ -85,15 +106,46 @@ async def main():
     db_engine = None
     session_maker = None
     try:
-        db_engine = create_engine(settings.database.url)
-        session_maker = get_session_maker(db_engine)
+        # Один engine (и пул соединений) на весь процесс
+        db_engine = get_engine()
+        session_maker = get_session_maker()
         async with db_engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         log.info("✅ База данных подключена")
+        # Справочник пользователей для поиска: первичное заполнение
+        try:
+            async with session_maker() as session:
+                if await UserProfileService.is_empty(session):
+                    added = await UserProfileService.backfill(session)
+                    log.info(f"👤 Справочник пользователей заполнен: {added}")
+        except Exception as e:
+            log.warning(f"⚠️ Не удалось заполнить справочник пользователей: {e}")
+        # Прогрев пула: первые апдейты не ждут установки соединения
+        if settings.database.warmup_connections:
+            try:
+                warmed = await warm_up_pool(db_engine, settings.database.warmup_connections)
+                log.info(f"🔥 Пул БД прогрет: {warmed} соединений")
+            except Exception as e:
+                log.warning(f"⚠️ Не удалось прогреть пул БД: {e}")
     except Exception as e:
         log.error(f"❌ Не удалось подключиться к БД: {e}")
         db_engine = None
 
+    # --- История диалогов ИИ-режима (Redis → БД → память) ---
+    conversation_store = init_conversation_store(session_maker if db_engine else None)
+
+    # --- Буфер счётчиков активности (пакетная запись в БД) ---
+    if db_engine:
+        init_counter_buffer(session_maker)
+        # SQLite: записи истории — одним писателем с group commit
+        init_sqlite_writer(session_maker)
+        # Дневная статистика (daily_stats) для панелей админки
+        try:
+            if await init_daily_stats(session_maker):
+                log.info("📊 Дневная статистика включена")
+        except Exception as e:
+            log.error(f"❌ Не удалось запустить дневную статистику: {e}")
+
     # --- FSM Storage (Redis → Memory fallback) ---
     fsm_storage = None
     redis_url = getattr(settings, "redis_url", None)
@@ -162,16 +214,33 @@ async def main():
     async def on_shutdown():
         log.info("🔄 Завершение работы...")
         # Закрытие LLM-клиентов
+        if llm_warmup and not llm_warmup.done():
+            llm_warmup.cancel()
         try:
             llm = get_llm_service()
             await llm.close()
             log.info("🔒 LLM-клиенты закрыты")
         except Exception as e:
             log.error(f"Ошибка закрытия LLM: {e}")
+        await stop_notification_scheduler()
+        await conversation_store.close()
+        # Остаток буфера счётчиков — до закрытия пула БД
+        try:
+            await close_counter_buffer()
+        except Exception as e:
+            log.error(f"Ошибка записи буфера счётчиков: {e}")
+        try:
+            await close_sqlite_writer()
+        except Exception as e:
+            log.error(f"Ошибка остановки писателя SQLite: {e}")
+        try:
+            await close_daily_stats()
+        except Exception as e:
+            log.error(f"Ошибка записи дневной статистики: {e}")
         # Закрытие пула БД
         if db_engine:
             try:
-                await db_engine.dispose()
+                await dispose_engine()
                 log.info("🔒 Connection pool БД закрыт")
             except Exception as e:
                 log.error(f"Ошибка закрытия БД: {e}")
@@ -184,7 +253,13 @@ async def main():
         window=settings.rate_window,
     ))
     if session_maker:
+        # Одна сессия БД на апдейт, в data["session"]
+        dp.message.middleware(DbSessionMiddleware(session_maker))
+        dp.callback_query.middleware(DbSessionMiddleware(session_maker))
         dp.message.middleware(AuthMiddleware(session_maker))
+        # Настройки пользователя — один раз на апдейт, в data["user_settings"]
+        dp.message.middleware(UserContextMiddleware(session_maker))
+        dp.callback_query.middleware(UserContextMiddleware(session_maker))
         dp["session_maker"] = session_maker  # DI — доступ из любого handler
 
     # ─────────────────────────────────────────────
@@ -231,6 +306,18 @@ async def main():
     dp.include_router(admin_router)
     dp.include_router(predictions_router)
 
+    # --- Прерванные рассылки администратора (после падения/рестарта) ---
+    if session_maker:
+        resume_admin_broadcasts(bot, session_maker)
+
+    # --- Ежедневные уведомления (планировщик в процессе вместо cron) ---
+    if session_maker and settings.notifications.enabled:
+        try:
+            await start_notification_scheduler(bot, session_maker)
+            log.info("✅ Планировщик уведомлений запущен")
+        except Exception as e:
+            log.error(f"❌ Не удалось запустить планировщик уведомлений: {e}")
+
     # --- Запуск ---
     await bot.delete_webhook(drop_pending_updates=True)
     log.info("✅ Бот запущен. Ожидание сообщений...")
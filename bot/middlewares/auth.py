@@ -29,19 +29,10 @@ class AuthMiddleware(BaseMiddleware):
         username = event.from_user.username
         log.debug(f"Auth middleware: user {user_id} (@{username}), message length: {len(event.text or '')}")
         
-        # Здесь можно добавить проверку подписки в базе данных
-        # если session_maker передан
+        # Проверки подписки пока нет; настройки пользователя (одним запросом
+        # на апдейт) загружает UserContextMiddleware
         is_premium = False  # По умолчанию бесплатный доступ
         
-        if self.session_maker:
-            # Проверка подписки в БД
-            try:
-                async with self.session_maker() as session:
-                    # Заглушка - нужно реализовать запрос к таблице подписок
-                    pass
-            except Exception as e:
-                log.error("Ошибка при проверке подписки: %s", e)
-        
         # Сохраняем информацию о подписке в data для использования в хендлерах
         data["is_premium"] = is_premium
         data["session_maker"] = self.session_maker
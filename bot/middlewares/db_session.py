@@ -0,0 +1,45 @@
+"""
+Middleware сессии БД: одна AsyncSession на апдейт
+"""
+
+import logging
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+log = logging.getLogger(__name__)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Открывает сессию на апдейт (data["session"]), в конце — commit или rollback"""
+
+    def __init__(self, session_maker):
+        self.session_maker = session_maker
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if "session" in data:
+            return await handler(event, data)
+
+        # Соединение из пула берётся только при первом запросе к БД
+        async with self.session_maker() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                if session.in_transaction():
+                    await session.rollback()
+                raise
+            if session.in_transaction():
+                try:
+                    await session.commit()
+                except Exception as e:
+                    log.error(f"❌ Не удалось закоммитить сессию апдейта: {e}")
+                    await session.rollback()
+            return result
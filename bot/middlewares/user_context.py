@@ -0,0 +1,66 @@
+"""
+Middleware контекста пользователя: настройки загружаются один раз на апдейт,
+username и имя из Telegram — в справочник user_profiles (только изменения)
+"""
+
+import logging
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.services.user_profiles import UserProfileService
+from bot.services.user_settings import UserSettingsService, user_settings_cache
+
+log = logging.getLogger(__name__)
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Кладёт настройки пользователя в data["user_settings"] (из кэша или одним SELECT)"""
+
+    def __init__(self, session_maker=None):
+        self.session_maker = session_maker
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and self.session_maker and "user_settings" not in data:
+            settings = user_settings_cache.get(user.id)
+            if settings is None:
+                try:
+                    session = data.get("session")   # сессия апдейта от DbSessionMiddleware
+                    if session is not None:
+                        settings = await UserSettingsService.get_or_create(session, user.id)
+                    else:
+                        async with self.session_maker() as session:
+                            settings = await UserSettingsService.get_or_create(session, user.id)
+                    # Снимок без сессии: переживает rollback сессии апдейта
+                    settings = user_settings_cache.put(settings)
+                except Exception as e:
+                    log.error("Не удалось загрузить настройки пользователя %s: %s", user.id, e)
+                    if data.get("session") is not None:
+                        # Сессия апдейта нужна handler'у — без прерванной транзакции
+                        await data["session"].rollback()
+            data["user_settings"] = settings
+            await self._touch_profile(user, data)
+
+        return await handler(event, data)
+
+    async def _touch_profile(self, user, data: Dict[str, Any]) -> None:
+        try:
+            session = data.get("session")
+            if session is not None:
+                await UserProfileService.touch(session, user.id, user.username, user.first_name)
+            else:
+                async with self.session_maker() as session:
+                    await UserProfileService.touch(session, user.id, user.username, user.first_name)
+        except Exception as e:
+            log.error("Не удалось обновить профиль пользователя %s: %s", user.id, e)
+            if data.get("session") is not None:
+                # Сессия апдейта нужна handler'у — без прерванной транзакции
+                await data["session"].rollback()
@@ -6,6 +6,9 @@ from .user_settings import UserSettings
 from .order import Order, OrderStatus
 from .hybrid_draft import HybridDraft, DraftStatus
 from .prediction_history import PredictionHistory, PredictionType
+from .conversation_message import ConversationMessage
+from .daily_stat import DailyStat
+from .user_profile import UserProfile
 
 __all__: list[str] = [
     "Base", 
@@ -17,6 +20,9 @@ __all__: list[str] = [
     "HybridDraft", 
     "DraftStatus",
     "PredictionHistory",
-    "PredictionType"
+    "PredictionType",
+    "ConversationMessage",
+    "DailyStat",
+    "UserProfile",
 
 ]
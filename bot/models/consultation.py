@@ -3,7 +3,7 @@
 """
 
 from datetime import datetime
-from sqlalchemy import Integer, BigInteger, Text, DateTime, ForeignKey
+from sqlalchemy import Integer, BigInteger, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -12,6 +12,10 @@ from .base import Base
 class Consultation(Base):
     """История консультаций пользователя с AI."""
     __tablename__ = "consultations"
+    __table_args__ = (
+        # История пользователя, новые сверху (keyset по created_at, id)
+        Index("ix_consultations_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
@@ -0,0 +1,31 @@
+"""
+Модель реплики диалога ИИ-режима (хранилище истории вне FSM).
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class ConversationMessage(Base):
+    """Реплика сессии ИИ-режима; первая строка сессии — системное сообщение."""
+    __tablename__ = "conversation_messages"
+    __table_args__ = (
+        Index("ix_conversation_messages_session", "user_id", "session_id", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=False)  # ID пользователя Telegram
+    session_id: Mapped[str] = mapped_column(String(32), nullable=False)  # ID ИИ-сессии (указатель в FSM)
+    role: Mapped[str] = mapped_column(String(16), nullable=False)  # system / user / assistant
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    tokens: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # подсчёт токенов реплики
+    tokenizer: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # чем посчитано
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ConversationMessage(id={self.id}, user_id={self.user_id}, role={self.role})>"
@@ -0,0 +1,26 @@
+"""
+Модель дневных счётчиков статистики (материализованные итоги для админки).
+"""
+
+from datetime import date
+
+from sqlalchemy import Date, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class DailyStat(Base):
+    """Значение метрики за день (UTC): одна строка на пару (день, метрика)."""
+    __tablename__ = "daily_stats"
+    __table_args__ = (
+        UniqueConstraint("metric", "day", name="uq_daily_stats_metric_day"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    day: Mapped[date] = mapped_column(Date, nullable=False, index=True)
+    metric: Mapped[str] = mapped_column(String(64), nullable=False)  # users.new, orders.status.new, ...
+    value: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<DailyStat(day={self.day}, metric={self.metric}, value={self.value})>"
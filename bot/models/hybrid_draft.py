@@ -6,7 +6,7 @@ import enum
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import BigInteger, Enum, Integer, String, Text
+from sqlalchemy import BigInteger, Enum, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 
@@ -25,6 +25,10 @@ class DraftStatus(enum.Enum):
 class HybridDraft(Base):
     """Черновик гибридного режима для проверки человеком"""
     __tablename__ = "hybrid_drafts"
+    __table_args__ = (
+        # Очередь на проверку по статусу, старые первыми (keyset по created_at, id)
+        Index("ix_hybrid_drafts_status_created_at_id", "status", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)  # ID пользователя Telegram
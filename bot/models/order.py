@@ -6,7 +6,7 @@ import enum
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import BigInteger, Boolean, Enum, Integer, String, Text
+from sqlalchemy import BigInteger, Boolean, Enum, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 
@@ -24,6 +24,10 @@ class OrderStatus(enum.Enum):
 class Order(Base):
     """Заказ консультации"""
     __tablename__ = "orders"
+    __table_args__ = (
+        # Все заказы, новые сверху (keyset по created_at, id)
+        Index("ix_orders_created_at_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)  # ID пользователя Telegram
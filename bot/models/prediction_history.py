@@ -6,7 +6,7 @@ from datetime import datetime
 from enum import Enum as PyEnum
 from typing import Any, Optional
 
-from sqlalchemy import Enum, Integer, JSON, String, Text
+from sqlalchemy import Enum, Index, Integer, JSON, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import Base
@@ -29,6 +29,10 @@ class PredictionType(PyEnum):
 class PredictionHistory(Base):
     """История предсказаний пользователя"""
     __tablename__ = "prediction_history"
+    __table_args__ = (
+        # История пользователя, новые сверху (keyset по created_at, id)
+        Index("ix_prediction_history_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)  # ID пользователя Telegram
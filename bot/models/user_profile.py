@@ -0,0 +1,93 @@
+"""
+Модель справочника пользователей (username и имя из Telegram) для поиска.
+
+Индексы поиска:
+- PostgreSQL — триграммные GIN-индексы (pg_trgm) по username и first_name:
+  ILIKE по префиксу и подстроке идёт по индексу. Расширение создаётся
+  вместе с таблицей (CREATE EXTENSION нужны права владельца БД);
+- SQLite — FTS5-таблица user_profiles_fts (внешний контент: строки
+  user_profiles, синхронизация триггерами) с префиксными индексами.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DDL, BigInteger, DateTime, Index, Integer, String, event, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+FTS_TABLE = "user_profiles_fts"
+
+
+class UserProfile(Base):
+    """Последние известные username и имя пользователя."""
+    __tablename__ = "user_profiles"
+    __table_args__ = (
+        Index(
+            "ix_user_profiles_username_trgm",
+            "username",
+            postgresql_using="gin",
+            postgresql_ops={"username": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_user_profiles_first_name_trgm",
+            "first_name",
+            postgresql_using="gin",
+            postgresql_ops={"first_name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=False, index=True)
+    username: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # без @
+    first_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<UserProfile(user_id={self.user_id}, username={self.username})>"
+
+
+def _ddl(statement: str, dialect: str) -> DDL:
+    """DDL, выполняемый только на указанном диалекте."""
+    return DDL(statement).execute_if(dialect=dialect)  # type: ignore[no-untyped-call]
+
+
+# --- PostgreSQL: триграммы ---
+event.listen(
+    UserProfile.__table__,
+    "before_create",
+    _ddl("CREATE EXTENSION IF NOT EXISTS pg_trgm", "postgresql"),
+)
+
+# --- SQLite: FTS5 поверх user_profiles (rowid = user_profiles.id) ---
+_SQLITE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        username, first_name,
+        content='user_profiles', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_profiles_fts_ai AFTER INSERT ON user_profiles BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, username, first_name)
+        VALUES (new.id, new.username, new.first_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_profiles_fts_ad AFTER DELETE ON user_profiles BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, username, first_name)
+        VALUES ('delete', old.id, old.username, old.first_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_profiles_fts_au AFTER UPDATE ON user_profiles BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, username, first_name)
+        VALUES ('delete', old.id, old.username, old.first_name);
+        INSERT INTO {FTS_TABLE}(rowid, username, first_name)
+        VALUES (new.id, new.username, new.first_name);
+    END""",
+]
+for _statement in _SQLITE_FTS_DDL:
+    event.listen(UserProfile.__table__, "after_create", _ddl(_statement, "sqlite"))
+event.listen(
+    UserProfile.__table__,
+    "after_drop",
+    _ddl(f"DROP TABLE IF EXISTS {FTS_TABLE}", "sqlite"),
+)
@@ -0,0 +1,259 @@
+"""
+MysticBot — дневной лимит ИИ-запросов: атомарная проверка и списание.
+
+try_consume(session, user_id, n) за одну операцию проверяет лимит и
+списывает n запросов, сброс на новые сутки (UTC) — там же. Параллельные
+запросы одного пользователя не превысят лимит. refund возвращает списанное,
+если запрос так и не был выполнен (например, не принят в очередь LLM).
+
+Бэкенды:
+- sql    — один условный UPDATE ... RETURNING (PostgreSQL, SQLite ≥ 3.35;
+           на старых SQLite — тот же UPDATE и SELECT в одной транзакции);
+- buffer — счётчик в буфере счётчиков (проверка и списание без await между
+           ними, в БД уходит пачкой);
+- redis  — Lua-скрипт над ключом пользователя на сутки, БД не трогается
+           (лимит пользователя кэшируется из БД).
+"""
+
+import logging
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, time as dtime
+from typing import Any, Optional
+
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings, AIQuotaConfig
+from bot.models.user_settings import UserSettings
+from bot.services.counter_buffer import get_counter_buffer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QuotaResult:
+    """Итог попытки списания."""
+    allowed: bool
+    used: int           # использовано сегодня (после списания, если allowed)
+    limit: int
+
+
+def _day_start(now: datetime) -> datetime:
+    return datetime.combine(now.date(), dtime.min)
+
+
+class AIQuota(ABC):
+    """Базовый интерфейс."""
+
+    name = "base"
+
+    @abstractmethod
+    async def try_consume(
+        self, session: AsyncSession, user_id: int, n: int = 1
+    ) -> Optional[QuotaResult]:
+        """Списать n запросов, если укладываемся в лимит. None — нет настроек пользователя."""
+
+    @abstractmethod
+    async def refund(self, session: AsyncSession, user_id: int, n: int = 1) -> None:
+        """Вернуть n списанных сегодня запросов (запрос не был выполнен)."""
+
+
+class SqlAIQuota(AIQuota):
+    """Условный UPDATE: счётчик меняется, только если остаётся в пределах лимита."""
+
+    name = "sql"
+
+    @staticmethod
+    def _supports_returning(session: AsyncSession) -> bool:
+        # SQLAlchemy выключает update_returning для SQLite < 3.35
+        return bool(session.get_bind().dialect.update_returning)
+
+    async def try_consume(
+        self, session: AsyncSession, user_id: int, n: int = 1
+    ) -> Optional[QuotaResult]:
+        table = UserSettings.__table__
+        now = datetime.utcnow()
+        # Использовано сегодня: вчерашнее значение счётчика не считается
+        used_today = case(
+            (table.c.last_ai_request_date >= _day_start(now), table.c.daily_ai_requests),
+            else_=0,
+        )
+        stmt = (
+            update(table)
+            .where(table.c.user_id == user_id, used_today + n <= table.c.ai_requests_limit)
+            .values(daily_ai_requests=used_today + n, last_ai_request_date=now)
+        )
+        returning = self._supports_returning(session)
+        if returning:
+            stmt = stmt.returning(table.c.daily_ai_requests, table.c.ai_requests_limit)
+        result = await session.execute(stmt)
+
+        if returning:
+            row = result.first()
+            allowed = row is not None
+        else:
+            allowed = result.rowcount == 1
+            row = None
+        if row is None:
+            # Отказ (или нет RETURNING): текущее состояние для сообщения
+            current = await session.execute(
+                select(used_today, table.c.ai_requests_limit).where(table.c.user_id == user_id)
+            )
+            row = current.first()
+        await session.commit()
+        if row is None:
+            return None
+        used, limit = row
+        return QuotaResult(allowed, used, limit)
+
+    async def refund(self, session: AsyncSession, user_id: int, n: int = 1) -> None:
+        table = UserSettings.__table__
+        # Только сегодняшний счётчик и не ниже нуля
+        await session.execute(
+            update(table)
+            .where(
+                table.c.user_id == user_id,
+                table.c.last_ai_request_date >= _day_start(datetime.utcnow()),
+                table.c.daily_ai_requests >= n,
+            )
+            .values(daily_ai_requests=table.c.daily_ai_requests - n)
+        )
+        await session.commit()
+
+
+class BufferAIQuota(AIQuota):
+    """Лимит в буфере счётчиков (один процесс бота)."""
+
+    name = "buffer"
+
+    async def try_consume(
+        self, session: AsyncSession, user_id: int, n: int = 1
+    ) -> Optional[QuotaResult]:
+        buffer = get_counter_buffer()
+        if buffer is None:
+            return await SqlAIQuota().try_consume(session, user_id, n)
+        quota = await buffer.ai_quota(session, user_id)
+        if quota is None:
+            return None
+        # Между проверкой и списанием нет await — другие запросы не вклинятся
+        used, limit = quota
+        if used + n > limit:
+            return QuotaResult(False, used, limit)
+        buffer.add_ai_request(user_id, n)
+        return QuotaResult(True, used + n, limit)
+
+    async def refund(self, session: AsyncSession, user_id: int, n: int = 1) -> None:
+        buffer = get_counter_buffer()
+        if buffer is None:
+            await SqlAIQuota().refund(session, user_id, n)
+            return
+        buffer.add_ai_request(user_id, -n)
+
+
+# KEYS[1] — счётчик пользователя за сутки; ARGV: n, лимит, TTL ключа
+_CONSUME_LUA = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local n = tonumber(ARGV[1])
+if used + n > tonumber(ARGV[2]) then
+    return {0, used}
+end
+used = redis.call('INCRBY', KEYS[1], n)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return {1, used}
+"""
+
+# KEYS[1] — счётчик пользователя за сутки; ARGV: n. Не ниже нуля
+_REFUND_LUA = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local n = math.min(tonumber(ARGV[1]), used)
+if n > 0 then
+    redis.call('DECRBY', KEYS[1], n)
+end
+return n
+"""
+
+
+class RedisAIQuota(AIQuota):
+    """
+    Счётчик в Redis (INCRBY под Lua — атомарно для всех процессов бота).
+    В БД счётчик дописывается через буфер счётчиков (для статистики).
+    """
+
+    name = "redis"
+    PREFIX = "mysticbot:ai_quota:"
+    LIMIT_TTL = 300         # лимит пользователя из БД перечитывается раз в 5 мин
+
+    def __init__(self, redis_url: str):
+        from redis import asyncio as aioredis
+
+        self._redis: Any = aioredis.from_url(redis_url)
+        self._script = self._redis.register_script(_CONSUME_LUA)
+        self._refund_script = self._redis.register_script(_REFUND_LUA)
+        self._limits: dict[int, tuple[int, float]] = {}
+
+    def _key(self, user_id: int, now: datetime) -> str:
+        return f"{self.PREFIX}{user_id}:{now.date().isoformat()}"
+
+    async def _limit(self, session: AsyncSession, user_id: int) -> Optional[int]:
+        cached = self._limits.get(user_id)
+        if cached and time.monotonic() - cached[1] < self.LIMIT_TTL:
+            return cached[0]
+        result = await session.execute(
+            select(UserSettings.ai_requests_limit).where(UserSettings.user_id == user_id)
+        )
+        limit = result.scalar_one_or_none()
+        if limit is not None:
+            self._limits[user_id] = (limit, time.monotonic())
+        return limit
+
+    async def try_consume(
+        self, session: AsyncSession, user_id: int, n: int = 1
+    ) -> Optional[QuotaResult]:
+        limit = await self._limit(session, user_id)
+        if limit is None:
+            return None
+        now = datetime.utcnow()
+        key = self._key(user_id, now)
+        ttl = int((_day_start(now) - now).total_seconds()) + 2 * 86400
+        allowed, used = await self._script(keys=[key], args=[n, limit, ttl])
+        if allowed:
+            buffer = get_counter_buffer()
+            if buffer is not None:
+                buffer.add_ai_request(user_id, n)
+        return QuotaResult(bool(allowed), int(used), limit)
+
+    async def refund(self, session: AsyncSession, user_id: int, n: int = 1) -> None:
+        refunded = int(await self._refund_script(keys=[self._key(user_id, datetime.utcnow())], args=[n]))
+        buffer = get_counter_buffer()
+        if refunded and buffer is not None:
+            buffer.add_ai_request(user_id, -refunded)
+
+
+def create_ai_quota(config: AIQuotaConfig, redis_url: str = "") -> AIQuota:
+    """Бэкенд по конфигу; auto — буфер счётчиков, если запущен, иначе SQL."""
+    backend = config.backend
+    if backend == "redis":
+        if redis_url:
+            try:
+                return RedisAIQuota(redis_url)
+            except Exception as e:
+                logger.warning(f"⚠️ Лимит ИИ: Redis недоступен: {e}")
+        else:
+            logger.warning("⚠️ AI_QUOTA_BACKEND=redis, но REDIS_URL не задан")
+    if backend == "buffer" or (backend in ("auto", "redis") and get_counter_buffer() is not None):
+        return BufferAIQuota()
+    return SqlAIQuota()
+
+
+_ai_quota: Optional[AIQuota] = None
+
+
+def get_ai_quota() -> AIQuota:
+    """Бэкенд лимита (создаётся при первом обращении — после запуска буфера)."""
+    global _ai_quota
+    if _ai_quota is None:
+        _ai_quota = create_ai_quota(settings.ai_quota, redis_url=settings.REDIS_URL)
+        logger.info(f"🎫 Лимит ИИ-запросов: {_ai_quota.name}")
+    return _ai_quota
@@ -0,0 +1,358 @@
+"""
+MysticBot — движок массовых рассылок.
+
+Пул отправителей с общим темпом (global_rate сообщений в секунду на бота,
+один на все одновременные рассылки) и паузой между сообщениями в один чат.
+TelegramRetryAfter ставит на паузу все рассылки бота, сетевые ошибки и 5xx
+повторяются. Пользователи,
+заблокировавшие бота, помечаются и получают enable_daily_notifications=False.
+
+Прогресс периодически сохраняется в JSON-файл (checkpoint): прерванная
+рассылка продолжается с того же места (доставка «хотя бы один раз» —
+сообщения, отправленные между последним сохранением и падением, уйдут повторно).
+Завершённые checkpoint хранятся checkpoint_keep_hours часов (защита от
+повторной отправки при догоне минут), затем удаляются.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.config import settings, BroadcastConfig
+from bot.services.user_settings import UserSettingsService
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+# Ошибки 400, после которых чат недоступен навсегда (как блокировка)
+GONE_CHAT_ERRORS = ("chat not found", "user is deactivated", "bot was kicked")
+
+ProgressCallback = Callable[["BroadcastStats"], Awaitable[None]]
+
+
+@dataclass
+class BroadcastStats:
+    """Итоги рассылки (и промежуточный прогресс)."""
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    skipped: int = 0            # уже доставлены до перезапуска (из checkpoint)
+    retry_after: int = 0        # сколько раз Telegram просил паузу
+    elapsed: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked + self.skipped
+
+    @property
+    def rate(self) -> float:
+        """Сообщений в секунду (без учёта пропущенных)."""
+        return (self.sent + self.failed + self.blocked) / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class BroadcastCheckpoint:
+    """Прогресс рассылки на диске: получатели, обработанные ID, метаданные."""
+    run_id: str
+    recipients: list[int] = field(default_factory=list)
+    done: list[int] = field(default_factory=list)
+    blocked: list[int] = field(default_factory=list)
+    meta: dict[str, Any] = field(default_factory=dict)
+    finished: bool = False
+    updated_at: float = 0.0
+
+    @staticmethod
+    def directory(config: BroadcastConfig) -> Path:
+        path = Path(config.checkpoint_dir)
+        return path if path.is_absolute() else PROJECT_ROOT / path
+
+    @classmethod
+    def path(cls, config: BroadcastConfig, run_id: str) -> Path:
+        return cls.directory(config) / f"{run_id}.json"
+
+    @classmethod
+    def load(cls, config: BroadcastConfig, run_id: str) -> Optional["BroadcastCheckpoint"]:
+        try:
+            data = json.loads(cls.path(config, run_id).read_text(encoding="utf-8"))
+            return cls(**data)
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.warning(f"⚠️ Рассылка {run_id}: повреждённый checkpoint ({e}) — начинаю заново")
+            return None
+
+    def dump(self) -> str:
+        self.updated_at = time.time()
+        return json.dumps(asdict(self))
+
+    def write(self, config: BroadcastConfig, payload: str) -> None:
+        """Атомарная запись (tmp + replace): падение не оставит полфайла."""
+        path = self.path(config, self.run_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(payload, encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def prune_checkpoints(config: Optional[BroadcastConfig] = None) -> int:
+    """Удалить завершённые checkpoint старше checkpoint_keep_hours. Возвращает число удалённых."""
+    config = config or settings.broadcast
+    directory = BroadcastCheckpoint.directory(config)
+    if not directory.exists():
+        return 0
+    deadline = time.time() - config.checkpoint_keep_hours * 3600
+    removed = 0
+    for path in directory.glob("*.json"):
+        try:
+            if path.stat().st_mtime >= deadline:
+                continue
+            checkpoint = BroadcastCheckpoint.load(config, path.stem)
+            # Незавершённые (кроме повреждённых) остаются — их можно продолжить
+            if checkpoint is None or checkpoint.finished:
+                path.unlink()
+                removed += 1
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось удалить checkpoint {path.name}: {e}")
+    return removed
+
+
+def unfinished_broadcasts(
+    prefix: str = "",
+    config: Optional[BroadcastConfig] = None,
+) -> list[BroadcastCheckpoint]:
+    """Незавершённые рассылки (для возобновления после падения)."""
+    config = config or settings.broadcast
+    directory = BroadcastCheckpoint.directory(config)
+    if not directory.exists():
+        return []
+    result = []
+    for path in sorted(directory.glob(f"{prefix}*.json")):
+        checkpoint = BroadcastCheckpoint.load(config, path.stem)
+        if checkpoint and not checkpoint.finished:
+            result.append(checkpoint)
+    return result
+
+
+class _Pacer:
+    """Общий темп отправки: слоты через 1/rate секунд, пауза по RetryAfter."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float) -> None:
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+# Один темп на бота: параллельные рассылки (ежедневные по минутам и админская)
+# делят лимит Telegram и паузу по RetryAfter
+_pacers: dict[int, _Pacer] = {}
+
+
+def _pacer_for(bot: Bot, rate: float) -> _Pacer:
+    pacer = _pacers.get(bot.id)
+    if pacer is None:
+        pacer = _pacers[bot.id] = _Pacer(rate)
+    return pacer
+
+
+class BroadcastEngine:
+    """
+    Рассылка текстов {user_id: текст} пулом отправителей.
+
+    Использование:
+        engine = BroadcastEngine(bot, session_maker)
+        stats = await engine.run("admin-1700000000", {123: "Привет"}, meta={...})
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        session_maker: Optional[async_sessionmaker] = None,
+        config: Optional[BroadcastConfig] = None,
+        parse_mode: Optional[str] = None,
+    ):
+        self.bot = bot
+        self.session_maker = session_maker
+        self.config = config or settings.broadcast
+        self.parse_mode = parse_mode
+
+    async def run(
+        self,
+        run_id: str,
+        messages: Mapping[int, str],
+        meta: Optional[dict[str, Any]] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> BroadcastStats:
+        """
+        Разослать messages. Если для run_id есть checkpoint, уже обработанные
+        получатели пропускаются.
+
+        Args:
+            run_id: Идентификатор рассылки (имя файла checkpoint)
+            messages: {user_id: текст}
+            meta: Данные для возобновления (сохраняются в checkpoint)
+            on_progress: Колбэк после каждого сохранения прогресса
+        """
+        cfg = self.config
+        checkpoint = BroadcastCheckpoint.load(cfg, run_id) or BroadcastCheckpoint(
+            run_id=run_id, recipients=list(messages), meta=dict(meta or {}),
+        )
+        done = set(checkpoint.done)
+        pending = [uid for uid in messages if uid not in done]
+        stats = BroadcastStats(total=len(messages), skipped=len(messages) - len(pending))
+        if stats.skipped:
+            logger.info(f"📢 Рассылка {run_id}: продолжение, уже обработано {stats.skipped}")
+
+        queue: asyncio.Queue[tuple[int, int]] = asyncio.Queue()
+        for uid in pending:
+            queue.put_nowait((uid, 0))
+
+        pacer = _pacer_for(self.bot, cfg.global_rate)
+        last_sent: dict[int, float] = {}
+        to_disable: list[int] = []
+        start = time.monotonic()
+        since_save = 0
+        save_lock = asyncio.Lock()
+
+        async def save(finished: bool = False) -> None:
+            async with save_lock:
+                blocked = list(to_disable)
+                # Убираем только записанных: при ошибке БД (или отмене посреди
+                # _disable) они останутся до следующего сохранения
+                if await self._disable(blocked):
+                    del to_disable[:len(blocked)]
+                checkpoint.done = list(done)
+                checkpoint.finished = finished
+                stats.elapsed = time.monotonic() - start
+                # Снимок — в цикле событий, запись файла — в потоке
+                await asyncio.to_thread(checkpoint.write, cfg, checkpoint.dump())
+            if on_progress:
+                try:
+                    await on_progress(stats)
+                except Exception as e:
+                    logger.debug(f"Колбэк прогресса рассылки: {e}")
+
+        async def finish(uid: int, outcome: str) -> None:
+            nonlocal since_save
+            done.add(uid)
+            if outcome == "sent":
+                stats.sent += 1
+            elif outcome == "blocked":
+                stats.blocked += 1
+                checkpoint.blocked.append(uid)
+                to_disable.append(uid)
+            else:
+                stats.failed += 1
+            since_save += 1
+            if since_save >= cfg.checkpoint_every:
+                since_save = 0
+                await save()
+
+        async def deliver(uid: int, attempt: int) -> None:
+            try:
+                # Пауза между сообщениями в один чат (повторы после ошибок)
+                wait = last_sent.get(uid, 0.0) + cfg.per_chat_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await pacer.wait()
+                outcome = await self._send(uid, messages[uid])
+                last_sent[uid] = time.monotonic()
+            except TelegramRetryAfter as e:
+                stats.retry_after += 1
+                logger.warning(f"⏳ Рассылка {run_id}: flood control, пауза {e.retry_after}с")
+                pacer.pause(e.retry_after)
+                queue.put_nowait((uid, attempt))
+                return
+            except (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError) as e:
+                if attempt + 1 < cfg.max_retries:
+                    await asyncio.sleep(2 ** attempt)
+                    queue.put_nowait((uid, attempt + 1))
+                    return
+                logger.error(f"❌ Рассылка {run_id}: {uid} — {e}")
+                outcome = "failed"
+            except Exception as e:
+                logger.exception(f"💥 Рассылка {run_id}: {uid} — {e}")
+                outcome = "failed"
+            await finish(uid, outcome)
+
+        async def worker() -> None:
+            while True:
+                uid, attempt = await queue.get()
+                try:
+                    await deliver(uid, attempt)
+                finally:
+                    # Только после finish() (и повторной постановки в очередь):
+                    # queue.join() не должен проснуться посреди save()
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(cfg.workers, len(pending)))]
+        completed = False
+        try:
+            await queue.join()
+            completed = True
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await save(finished=completed)
+        if completed:
+            await asyncio.to_thread(prune_checkpoints, cfg)
+
+        logger.info(
+            f"✅ Рассылка {run_id}: отправлено {stats.sent}, ошибок {stats.failed}, "
+            f"заблокировали {stats.blocked}, пропущено {stats.skipped} "
+            f"за {stats.elapsed:.1f}с ({stats.rate:.1f} msg/s)"
+        )
+        return stats
+
+    async def _send(self, user_id: int, text: str) -> str:
+        """Отправка одному получателю: sent / blocked / failed."""
+        kwargs = {"parse_mode": self.parse_mode} if self.parse_mode else {}
+        try:
+            await self.bot.send_message(chat_id=user_id, text=text, **kwargs)
+            return "sent"
+        except TelegramForbiddenError:
+            logger.info(f"🚫 Пользователь {user_id} заблокировал бота — уведомления отключены")
+            return "blocked"
+        except TelegramBadRequest as e:
+            if any(reason in str(e).lower() for reason in GONE_CHAT_ERRORS):
+                return "blocked"
+            logger.error(f"❌ Рассылка: {user_id} — {e}")
+            return "failed"
+
+    async def _disable(self, user_ids: list[int]) -> bool:
+        """Отключить уведомления заблокировавшим. False — запись в БД не удалась."""
+        if not user_ids or self.session_maker is None:
+            return True
+        try:
+            async with self.session_maker() as session:
+                await UserSettingsService.disable_notifications(session, user_ids)
+        except Exception as e:
+            logger.error(f"❌ Не удалось отключить уведомления {len(user_ids)} пользователям: {e}")
+            return False
+        return True
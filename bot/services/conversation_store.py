@@ -0,0 +1,459 @@
+"""
+MysticBot — хранилище истории диалогов ИИ-режима.
+
+FSM хранит только указатель (ai_session_id), сами реплики лежат здесь.
+Запись за ход — дельта (TurnWrite: удалить последнюю, отрезать старейшие,
+дописать новые), а не перезапись всей истории.
+
+Рядом с репликой хранится её подсчёт токенов и имя токенизатора, которым
+он сделан: кэш подсчёта (ContextLedger) восстанавливается из истории,
+реплики, посчитанные другим токенизатором, пересчитываются при загрузке.
+
+Бэкенды:
+- redis  — список JSON-реплик + ключ системного сообщения, TTL на сессию;
+- sql    — таблица conversation_messages (SQLite / PostgreSQL);
+- memory — словарь в процессе (если нет ни Redis, ни БД).
+"""
+
+import json
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.config import settings, ConversationConfig
+from bot.models.conversation_message import ConversationMessage
+
+logger = logging.getLogger(__name__)
+
+
+# Служебные поля записи реплики (в истории для LLM их нет)
+_COUNT_FIELDS = ("tokens", "tokenizer")
+
+
+@dataclass
+class TurnWrite:
+    """
+    Изменения истории за один ход; применяются одной операцией в порядке:
+    удалить последнюю реплику → отрезать старейшие → дописать новые.
+    tokens — подсчёт токенов реплик append (токенизатором tokenizer).
+    """
+    pop_last: bool = False
+    drop_oldest: int = 0
+    append: list[dict] = field(default_factory=list)
+    tokens: list[Optional[int]] = field(default_factory=list)
+    tokenizer: str = ""
+
+    def add(self, message: dict, tokens: Optional[int] = None) -> None:
+        """Дописать реплику (с подсчётом токенов, если он есть)."""
+        self.append.append(message)
+        self.tokens.append(tokens)
+
+    def records(self) -> list[dict]:
+        """Реплики append вместе с подсчётом токенов."""
+        counts = self.tokens + [None] * (len(self.append) - len(self.tokens))
+        return [_record(m, n, self.tokenizer) for m, n in zip(self.append, counts, strict=True)]
+
+
+def _record(message: dict, tokens: Optional[int], tokenizer: str) -> dict:
+    """Реплика для хранения: сообщение + подсчёт токенов (если есть)."""
+    record = {key: value for key, value in message.items() if key not in _COUNT_FIELDS}
+    if tokens is not None and tokenizer:
+        record.update(tokens=tokens, tokenizer=tokenizer)
+    return record
+
+
+def _split(record: dict, tokenizer: str) -> tuple[dict, Optional[int]]:
+    """Сообщение и его подсчёт токенов (None — нет или сделан другим токенизатором)."""
+    message = {key: value for key, value in record.items() if key not in _COUNT_FIELDS}
+    tokens = record.get("tokens")
+    if tokens is None or not tokenizer or record.get("tokenizer") != tokenizer:
+        return message, None
+    return message, int(tokens)
+
+
+def _unzip(pairs: Sequence[tuple[dict, Optional[int]]]) -> tuple[list[dict], list[Optional[int]]]:
+    return [m for m, _ in pairs], [n for _, n in pairs]
+
+
+class ConversationStore(ABC):
+    """
+    Базовый интерфейс. История сессии — [системное сообщение] + реплики;
+    системное сообщение хранится отдельно и не затрагивается drop_oldest.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def start(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        """Новая сессия с системным сообщением (tokens — его подсчёт токенов)."""
+
+    async def load(self, user_id: int, session_id: str) -> list[dict]:
+        """История сессии; пустой список, если сессии нет."""
+        messages, _ = await self.load_counted(user_id, session_id)
+        return messages
+
+    @abstractmethod
+    async def load_counted(
+        self, user_id: int, session_id: str, tokenizer: str = "",
+    ) -> tuple[list[dict], list[Optional[int]]]:
+        """
+        История сессии и подсчёт токенов каждой реплики, сделанный
+        токенизатором tokenizer (None — не посчитана или посчитана другим).
+        """
+
+    @abstractmethod
+    async def apply(self, user_id: int, session_id: str, write: TurnWrite) -> None:
+        """Применить изменения хода."""
+
+    @abstractmethod
+    async def compact(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        count: int,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        """Заменить системное сообщение и удалить count старейших реплик (атомарно)."""
+
+    @abstractmethod
+    async def delete(self, user_id: int, session_id: str) -> None:
+        """Удалить сессию."""
+
+    async def close(self) -> None:  # noqa: B027 — пустой по умолчанию: закрывать нечего
+        pass
+
+
+class MemoryConversationStore(ConversationStore):
+    """История в памяти процесса (теряется при рестарте)."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._sessions: dict[tuple[int, str], tuple[dict, list[dict]]] = {}
+
+    async def start(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        for key in [k for k in self._sessions if k[0] == user_id]:
+            del self._sessions[key]
+        self._sessions[(user_id, session_id)] = (_record(system, tokens, tokenizer), [])
+
+    async def load_counted(
+        self, user_id: int, session_id: str, tokenizer: str = "",
+    ) -> tuple[list[dict], list[Optional[int]]]:
+        entry = self._sessions.get((user_id, session_id))
+        if entry is None:
+            return [], []
+        system, turns = entry
+        return _unzip([_split(r, tokenizer) for r in [system, *turns]])
+
+    async def apply(self, user_id: int, session_id: str, write: TurnWrite) -> None:
+        entry = self._sessions.get((user_id, session_id))
+        if entry is None:
+            return
+        turns = entry[1]
+        if write.pop_last and turns:
+            turns.pop()
+        del turns[:write.drop_oldest]
+        turns.extend(write.records())
+
+    async def compact(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        count: int,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        entry = self._sessions.get((user_id, session_id))
+        if entry is None:
+            return
+        turns = entry[1]
+        del turns[:count]
+        self._sessions[(user_id, session_id)] = (_record(system, tokens, tokenizer), turns)
+
+    async def delete(self, user_id: int, session_id: str) -> None:
+        self._sessions.pop((user_id, session_id), None)
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    Redis: LIST реплик (RPUSH/RPOP/LTRIM — O(1) на ход) и строка системного
+    сообщения. TTL обновляется при каждой записи.
+    """
+
+    name = "redis"
+    PREFIX = "mysticbot:conv:"
+
+    def __init__(self, redis_url: str, ttl: int):
+        from redis import asyncio as aioredis
+
+        self._redis: Any = aioredis.from_url(redis_url)
+        self.ttl = ttl
+
+    def _keys(self, user_id: int, session_id: str) -> tuple[str, str]:
+        base = f"{self.PREFIX}{user_id}:{session_id}"
+        return base, base + ":system"
+
+    async def start(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        turns_key, system_key = self._keys(user_id, session_id)
+        record = _record(system, tokens, tokenizer)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(turns_key)
+            pipe.set(system_key, json.dumps(record, ensure_ascii=False), ex=self.ttl)
+            await pipe.execute()
+
+    async def load_counted(
+        self, user_id: int, session_id: str, tokenizer: str = "",
+    ) -> tuple[list[dict], list[Optional[int]]]:
+        turns_key, system_key = self._keys(user_id, session_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.get(system_key)
+            pipe.lrange(turns_key, 0, -1)
+            system, turns = await pipe.execute()
+        if not system:
+            return [], []
+        records = [json.loads(system)] + [json.loads(m) for m in turns]
+        return _unzip([_split(r, tokenizer) for r in records])
+
+    async def apply(self, user_id: int, session_id: str, write: TurnWrite) -> None:
+        turns_key, system_key = self._keys(user_id, session_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if write.pop_last:
+                pipe.rpop(turns_key)
+            if write.drop_oldest:
+                pipe.ltrim(turns_key, write.drop_oldest, -1)
+            if write.append:
+                pipe.rpush(
+                    turns_key,
+                    *(json.dumps(r, ensure_ascii=False) for r in write.records()),
+                )
+            pipe.expire(turns_key, self.ttl)
+            pipe.expire(system_key, self.ttl)
+            await pipe.execute()
+
+    async def compact(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        count: int,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        turns_key, system_key = self._keys(user_id, session_id)
+        record = _record(system, tokens, tokenizer)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(system_key, json.dumps(record, ensure_ascii=False), ex=self.ttl)
+            pipe.ltrim(turns_key, count, -1)
+            await pipe.execute()
+
+    async def delete(self, user_id: int, session_id: str) -> None:
+        await self._redis.delete(*self._keys(user_id, session_id))
+
+    async def close(self) -> None:
+        try:
+            await self._redis.aclose()
+        except Exception:
+            pass
+
+
+class SqlConversationStore(ConversationStore):
+    """
+    SQL (SQLite / PostgreSQL): строка на реплику в conversation_messages.
+    Ход — INSERT новых реплик и точечные DELETE, без перезаписи истории.
+    """
+
+    name = "sql"
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self.session_maker = session_maker
+
+    @staticmethod
+    def _where(user_id: int, session_id: str) -> tuple:
+        return (
+            ConversationMessage.user_id == user_id,
+            ConversationMessage.session_id == session_id,
+        )
+
+    @staticmethod
+    def _row(user_id: int, session_id: str, record: dict) -> ConversationMessage:
+        return ConversationMessage(
+            user_id=user_id,
+            session_id=session_id,
+            role=record["role"],
+            content=record["content"],
+            tokens=record.get("tokens"),
+            tokenizer=record.get("tokenizer"),
+        )
+
+    def _oldest_turns(self, user_id: int, session_id: str, count: int):
+        return (
+            select(ConversationMessage.id)
+            .where(*self._where(user_id, session_id), ConversationMessage.role != "system")
+            .order_by(ConversationMessage.id)
+            .limit(count)
+        )
+
+    async def start(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        # У пользователя одна ИИ-сессия: заодно убираем брошенные (выход по таймауту)
+        async with self.session_maker() as session:
+            await session.execute(
+                delete(ConversationMessage).where(ConversationMessage.user_id == user_id)
+            )
+            session.add(self._row(user_id, session_id, _record(system, tokens, tokenizer)))
+            await session.commit()
+
+    async def load_counted(
+        self, user_id: int, session_id: str, tokenizer: str = "",
+    ) -> tuple[list[dict], list[Optional[int]]]:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(
+                    ConversationMessage.role,
+                    ConversationMessage.content,
+                    ConversationMessage.tokens,
+                    ConversationMessage.tokenizer,
+                )
+                .where(*self._where(user_id, session_id))
+                .order_by(ConversationMessage.id)
+            )
+            return _unzip([
+                _split({"role": role, "content": content, "tokens": n, "tokenizer": name}, tokenizer)
+                for role, content, n, name in result.all()
+            ])
+
+    async def apply(self, user_id: int, session_id: str, write: TurnWrite) -> None:
+        async with self.session_maker() as session:
+            if write.pop_last:
+                last = (
+                    select(func.max(ConversationMessage.id))
+                    .where(*self._where(user_id, session_id), ConversationMessage.role != "system")
+                    .scalar_subquery()
+                )
+                await session.execute(
+                    delete(ConversationMessage).where(ConversationMessage.id == last)
+                )
+            if write.drop_oldest:
+                await session.execute(
+                    delete(ConversationMessage).where(
+                        ConversationMessage.id.in_(
+                            self._oldest_turns(user_id, session_id, write.drop_oldest)
+                        )
+                    )
+                )
+            session.add_all(self._row(user_id, session_id, r) for r in write.records())
+            await session.commit()
+
+    async def compact(
+        self,
+        user_id: int,
+        session_id: str,
+        system: dict,
+        count: int,
+        tokens: Optional[int] = None,
+        tokenizer: str = "",
+    ) -> None:
+        record = _record(system, tokens, tokenizer)
+        async with self.session_maker() as session:
+            await session.execute(
+                update(ConversationMessage)
+                .where(*self._where(user_id, session_id), ConversationMessage.role == "system")
+                .values(
+                    content=record["content"],
+                    tokens=record.get("tokens"),
+                    tokenizer=record.get("tokenizer"),
+                )
+            )
+            await session.execute(
+                delete(ConversationMessage).where(
+                    ConversationMessage.id.in_(self._oldest_turns(user_id, session_id, count))
+                )
+            )
+            await session.commit()
+
+    async def delete(self, user_id: int, session_id: str) -> None:
+        async with self.session_maker() as session:
+            await session.execute(
+                delete(ConversationMessage).where(*self._where(user_id, session_id))
+            )
+            await session.commit()
+
+
+def create_conversation_store(
+    config: ConversationConfig,
+    redis_url: str = "",
+    session_maker: Optional[async_sessionmaker] = None,
+) -> ConversationStore:
+    """
+    Бэкенд по конфигу; auto — Redis (если задан REDIS_URL), иначе БД,
+    иначе память процесса.
+    """
+    backend = config.backend
+    if backend in ("auto", "redis") and redis_url:
+        try:
+            return RedisConversationStore(redis_url, ttl=config.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ История диалогов: Redis недоступен: {e}")
+    elif backend == "redis":
+        logger.warning("⚠️ CONVERSATION_STORE=redis, но REDIS_URL не задан")
+    if backend in ("auto", "redis", "sql") and session_maker is not None:
+        return SqlConversationStore(session_maker)
+    if backend != "memory":
+        logger.warning("⚠️ История диалогов хранится в памяти (потеряется при рестарте)")
+    return MemoryConversationStore()
+
+
+_conversation_store: Optional[ConversationStore] = None
+
+
+def init_conversation_store(
+    session_maker: Optional[async_sessionmaker] = None,
+) -> ConversationStore:
+    """Создание хранилища при старте бота (session_maker — для SQL-бэкенда)."""
+    global _conversation_store
+    _conversation_store = create_conversation_store(
+        settings.conversation, redis_url=settings.REDIS_URL, session_maker=session_maker,
+    )
+    logger.info(f"💬 История диалогов ИИ-режима: {_conversation_store.name}")
+    return _conversation_store
+
+
+def get_conversation_store() -> ConversationStore:
+    """Получение хранилища (без init_conversation_store — Redis или память)."""
+    if _conversation_store is None:
+        return init_conversation_store()
+    return _conversation_store
@@ -0,0 +1,296 @@
+"""
+MysticBot — буфер счётчиков активности пользователей (write-behind).
+
+Инкременты (консультации, файлы, ИИ-запросы) копятся в памяти по
+пользователям и раз в flush_interval секунд уходят в БД пачкой
+UPDATE ... SET x = x + :n (executemany). Дневной счётчик ИИ-запросов
+пишется с учётом смены суток: CASE WHEN last_ai_request_date >= начала дня
+THEN daily_ai_requests + :n ELSE :n END, last_ai_request_date — время
+внутри дня пачки (не позже его конца).
+
+Проверка лимита ИИ обслуживается из памяти: снимок счётчика из БД
+(перечитывается раз в quota_ttl секунд) + ещё не записанные инкременты.
+Буфер рассчитан на один процесс бота — другие процессы пишут эти счётчики
+только напрямую.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time as dtime
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import bindparam, case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.config import settings, CounterBufferConfig
+from bot.models.user_settings import UserSettings
+
+logger = logging.getLogger(__name__)
+
+# Счётчики-«итоги», которые просто прибавляются
+TOTAL_COUNTERS = ("total_consultations", "total_files_uploaded")
+
+# Вызываются с ID пользователей после записи их счётчиков (сброс кэшей)
+flush_listeners: list[Callable[[Iterable[int]], None]] = []
+
+
+def _utc_today() -> date:
+    return datetime.utcnow().date()
+
+
+@dataclass
+class _Quota:
+    """Снимок дневного счётчика ИИ-запросов из БД."""
+    day: date
+    used: int           # записано в БД за day (включая уже сброшенные инкременты)
+    limit: int
+    loaded_at: float
+
+
+class CounterBuffer:
+    """
+    Использование:
+        buffer = CounterBuffer(session_maker)
+        buffer.start()
+        buffer.add(user_id, "total_consultations")
+        used, limit = await buffer.ai_quota(session, user_id)
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        config: Optional[CounterBufferConfig] = None,
+    ):
+        self.session_maker = session_maker
+        self.config = config or settings.counters
+        self._totals: dict[int, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._ai: dict[tuple[int, date], int] = defaultdict(int)
+        self._ai_inflight: dict[tuple[int, date], int] = {}
+        self._quotas: dict[int, _Quota] = {}
+        self._lock = asyncio.Lock()      # сброс и загрузка снимков не пересекаются
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    # --- Запись ---
+
+    def add(self, user_id: int, counter: str, n: int = 1) -> None:
+        """Отложенный инкремент total_consultations / total_files_uploaded."""
+        if counter not in TOTAL_COUNTERS:
+            raise ValueError(f"Неизвестный счётчик: {counter}")
+        self._totals[user_id][counter] += n
+
+    def add_ai_request(self, user_id: int, n: int = 1) -> None:
+        """Отложенный инкремент дневного счётчика ИИ-запросов (за сегодня, UTC)."""
+        self._ai[(user_id, _utc_today())] += n
+
+    def pending(self, user_id: int) -> dict[str, int]:
+        """Ещё не записанные в БД инкременты итоговых счётчиков пользователя."""
+        return dict(self._totals.get(user_id, {}))
+
+    # --- Чтение лимита ---
+
+    def _pending_ai(self, user_id: int, day: date) -> int:
+        key = (user_id, day)
+        return self._ai.get(key, 0) + self._ai_inflight.get(key, 0)
+
+    async def ai_quota(self, session: AsyncSession, user_id: int) -> Optional[tuple[int, int]]:
+        """
+        (использовано сегодня, лимит) с учётом несброшенных инкрементов.
+        None — у пользователя нет настроек.
+        """
+        today = _utc_today()
+        quota = self._quotas.get(user_id)
+        if quota is None or time.monotonic() - quota.loaded_at > self.config.quota_ttl:
+            quota = await self._load_quota(session, user_id)
+            if quota is None:
+                return None
+        if quota.day != today:
+            # Смена суток: счётчик начинается заново, в БД сбросится при записи
+            quota.day, quota.used = today, 0
+        return quota.used + self._pending_ai(user_id, today), quota.limit
+
+    async def _load_quota(self, session: AsyncSession, user_id: int) -> Optional[_Quota]:
+        async with self._lock:
+            result = await session.execute(
+                select(
+                    UserSettings.daily_ai_requests,
+                    UserSettings.ai_requests_limit,
+                    UserSettings.last_ai_request_date,
+                ).where(UserSettings.user_id == user_id)
+            )
+            row = result.first()
+            if row is None:
+                return None
+            used, limit, last = row
+            today = _utc_today()
+            if last is None or last.date() != today:
+                used = 0
+            quota = _Quota(today, used or 0, limit, time.monotonic())
+            self._quotas[user_id] = quota
+            return quota
+
+    def forget(self, user_id: int) -> None:
+        """Сбросить снимок лимита (лимит изменили в обход буфера)."""
+        self._quotas.pop(user_id, None)
+
+    # --- Сброс в БД ---
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновый сброс и записать остаток."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Буфер счётчиков: ошибка записи в БД: {e}")
+
+    async def flush(self) -> int:
+        """Записать накопленные инкременты; возвращает число обновлённых строк."""
+        if not self._totals and not self._ai:
+            return 0
+        async with self._lock:
+            totals, self._totals = self._totals, defaultdict(lambda: defaultdict(int))
+            self._ai_inflight, self._ai = dict(self._ai), defaultdict(int)
+            try:
+                rows = await self._write(totals, self._ai_inflight)
+            except BaseException:
+                # Не теряем инкременты: вернём их в буфер к следующей попытке
+                for user_id, counters in totals.items():
+                    for counter, n in counters.items():
+                        self._totals[user_id][counter] += n
+                for key, n in self._ai_inflight.items():
+                    self._ai[key] += n
+                self._ai_inflight = {}
+                raise
+            for (user_id, day), n in self._ai_inflight.items():
+                quota = self._quotas.get(user_id)
+                if quota and quota.day == day:
+                    quota.used += n
+            flushed = set(totals) | {user_id for user_id, _ in self._ai_inflight}
+            self._ai_inflight = {}
+            self._evict()
+        for listener in flush_listeners:
+            listener(flushed)
+        self.flushes += 1
+        self.flushed_rows += rows
+        logger.debug(f"💾 Буфер счётчиков: записано {rows} обновлений")
+        return rows
+
+    async def _write(
+        self,
+        totals: dict[int, dict[str, int]],
+        ai: dict[tuple[int, date], int],
+    ) -> int:
+        table = UserSettings.__table__
+        rows = 0
+        async with self.session_maker() as session:
+            for counter in TOTAL_COUNTERS:
+                params = [
+                    {"uid": user_id, "n": counters[counter]}
+                    for user_id, counters in totals.items()
+                    if counters.get(counter)
+                ]
+                if not params:
+                    continue
+                column = table.c[counter]
+                stmt = (
+                    update(table)
+                    .where(table.c.user_id == bindparam("uid"))
+                    .values({counter: column + bindparam("n")})
+                )
+                await session.execute(stmt, params)
+                rows += len(params)
+
+            # Дни по порядку: вчерашние инкременты до сегодняшних.
+            # Отметка времени — внутри дня пачки (вчерашняя пачка после полуночи
+            # не должна выглядеть сегодняшней); строку, уже перешедшую на более
+            # поздний день, пачка прошлого дня не трогает.
+            now = datetime.utcnow()
+            last = table.c.last_ai_request_date
+            for day in sorted({day for _, day in ai}):
+                day_end = datetime.combine(day, dtime.max)
+                params = [
+                    {
+                        "uid": user_id,
+                        "n": n,
+                        "day_start": datetime.combine(day, dtime.min),
+                        "day_end": day_end,
+                        "stamp": min(now, day_end),
+                    }
+                    for (user_id, d), n in ai.items()
+                    if d == day
+                ]
+                stmt = (
+                    update(table)
+                    .where(table.c.user_id == bindparam("uid"))
+                    .values(
+                        daily_ai_requests=case(
+                            (last > bindparam("day_end"), table.c.daily_ai_requests),
+                            (last >= bindparam("day_start"), table.c.daily_ai_requests + bindparam("n")),
+                            else_=bindparam("n"),
+                        ),
+                        last_ai_request_date=case(
+                            (last > bindparam("stamp"), last),
+                            else_=bindparam("stamp"),
+                        ),
+                    )
+                )
+                await session.execute(stmt, params)
+                rows += len(params)
+            await session.commit()
+        return rows
+
+    def _evict(self) -> None:
+        """Снимки лимитов без активности дольше quota_ttl больше не держим."""
+        deadline = time.monotonic() - self.config.quota_ttl
+        for user_id in [u for u, q in self._quotas.items() if q.loaded_at < deadline]:
+            del self._quotas[user_id]
+
+    def stats(self) -> dict[str, int]:
+        """Состояние буфера (для /metrics)."""
+        return {
+            "pending_users": len(set(self._totals) | {user_id for user_id, _ in self._ai}),
+            "cached_quotas": len(self._quotas),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+        }
+
+
+_counter_buffer: Optional[CounterBuffer] = None
+
+
+def init_counter_buffer(session_maker: async_sessionmaker) -> Optional[CounterBuffer]:
+    """Создание и запуск буфера при старте бота (если включён в конфиге)."""
+    global _counter_buffer
+    if not settings.counters.enabled:
+        return None
+    _counter_buffer = CounterBuffer(session_maker)
+    _counter_buffer.start()
+    logger.info(f"💾 Буфер счётчиков: сброс каждые {settings.counters.flush_interval:g}с")
+    return _counter_buffer
+
+
+async def close_counter_buffer() -> None:
+    global _counter_buffer
+    if _counter_buffer is not None:
+        await _counter_buffer.stop()
+        _counter_buffer = None
+
+
+def get_counter_buffer() -> Optional[CounterBuffer]:
+    """Запущенный буфер или None (тогда счётчики пишутся в БД сразу)."""
+    return _counter_buffer
@@ -4,8 +4,9 @@
 
 import logging
 import random
+from dataclasses import dataclass
 from datetime import datetime, date
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -160,22 +161,47 @@ class DailyContentService:
          "advice": "Доверяйте интуиции, но сохраняйте практичность."},
     ]
     
+    # Темы медитации дня
+    MEDITATION_THEMES = [
+        {"theme": "Осознанность", "duration": "10 минут", 
+         "instructions": "Сосредоточьтесь на дыхании, наблюдайте мысли без оценки."},
+        {"theme": "Благодарность", "duration": "5 минут", 
+         "instructions": "Вспомните три вещи, за которые вы благодарны сегодня."},
+        {"theme": "Любящая доброта", "duration": "15 минут", 
+         "instructions": "Направьте любящие мысли к себе, близким, всем существам."},
+        {"theme": "Тело-сканер", "duration": "12 минут", 
+         "instructions": "Медленно просканируйте тело от макушки до пят, отмечая ощущения."},
+        {"theme": "Звуковая медитация", "duration": "8 минут", 
+         "instructions": "Сосредоточьтесь на окружающих звуках, не оценивая их."},
+    ]
+    
     @classmethod
-    def _get_daily_seed(cls, user_id: Optional[int] = None) -> int:
+    def _get_daily_seed(cls, user_id: Optional[int] = None, day: Optional[date] = None) -> int:
         """Генерирует seed на основе даты и user_id для детерминированной генерации."""
-        today = date.today()
+        today = day or date.today()
         seed = today.year * 10000 + today.month * 100 + today.day
         if user_id:
             seed += user_id
         return seed
     
+    @staticmethod
+    def _pick_index(seed: int, size: int, rng: Optional[random.Random] = None) -> int:
+        """
+        Детерминированный индекс в списке длины size.
+        
+        Собственный генератор вместо random.seed(): глобальное состояние
+        random не трогается (его используют другие обработчики). randrange(n)
+        после seed даёт тот же индекс, что random.choice — выбор дня у
+        пользователей не меняется.
+        """
+        rng = rng or random.Random()
+        rng.seed(seed)
+        return rng.randrange(size)
+    
     @classmethod
     def get_rune_of_day(cls, user_id: Optional[int] = None) -> Dict[str, Any]:
         """Получить руну дня."""
-        seed = cls._get_daily_seed(user_id)
-        random.seed(seed)
-        rune = random.choice(cls.RUNES)
-        random.seed()  # сброс seed
+        rune = cls.RUNES[cls._pick_index(cls._get_daily_seed(user_id), len(cls.RUNES))]
         
         return {
             "rune": rune["name"],
@@ -188,10 +214,9 @@ class DailyContentService:
     @classmethod
     def get_affirmation_of_day(cls, user_id: Optional[int] = None) -> Dict[str, Any]:
         """Получить аффирмацию дня."""
-        seed = cls._get_daily_seed(user_id)
-        random.seed(seed)
-        affirmation = random.choice(cls.AFFIRMATIONS)
-        random.seed()
+        affirmation = cls.AFFIRMATIONS[
+            cls._pick_index(cls._get_daily_seed(user_id), len(cls.AFFIRMATIONS))
+        ]
         
         return {
             "affirmation": affirmation,
@@ -202,10 +227,7 @@ class DailyContentService:
     @classmethod
     def get_tarot_card_of_day(cls, user_id: Optional[int] = None) -> Dict[str, Any]:
         """Получить карту Таро дня."""
-        seed = cls._get_daily_seed(user_id)
-        random.seed(seed)
-        card = random.choice(cls.TAROT_MAJOR)
-        random.seed()
+        card = cls.TAROT_MAJOR[cls._pick_index(cls._get_daily_seed(user_id), len(cls.TAROT_MAJOR))]
         
         return {
             "card": card["name"],
@@ -216,8 +238,10 @@ class DailyContentService:
         }
     
     @classmethod
-    def get_zodiac_advice_of_day(cls, sign: Optional[str] = None) -> Dict[str, Any]:
-        """Получить совет по знаку зодиака."""
+    def get_zodiac_advice_of_day(
+        cls, sign: Optional[str] = None, day: Optional[date] = None
+    ) -> Dict[str, Any]:
+        """Получить совет по знаку зодиака (day — дата выбора, по умолчанию сегодня)."""
         if sign:
             sign_lower = sign.lower()
             for zodiac in cls.ZODIAC_SIGNS:
@@ -230,10 +254,9 @@ class DailyContentService:
                     }
         
         # Если знак не указан или не найден, возвращаем общий совет
-        seed = cls._get_daily_seed()
-        random.seed(seed)
-        zodiac = random.choice(cls.ZODIAC_SIGNS)
-        random.seed()
+        zodiac = cls.ZODIAC_SIGNS[
+            cls._pick_index(cls._get_daily_seed(day=day), len(cls.ZODIAC_SIGNS))
+        ]
         
         return {
             "sign": zodiac["name"],
@@ -244,26 +267,12 @@ class DailyContentService:
         }
     
     @classmethod
-    def get_daily_meditation_theme(cls) -> Dict[str, Any]:
-        """Получить тему для медитации дня."""
-        themes = [
-            {"theme": "Осознанность", "duration": "10 минут", 
-             "instructions": "Сосредоточьтесь на дыхании, наблюдайте мысли без оценки."},
-            {"theme": "Благодарность", "duration": "5 минут", 
-             "instructions": "Вспомните три вещи, за которые вы благодарны сегодня."},
-            {"theme": "Любящая доброта", "duration": "15 минут", 
-             "instructions": "Направьте любящие мысли к себе, близким, всем существам."},
-            {"theme": "Тело-сканер", "duration": "12 минут", 
-             "instructions": "Медленно просканируйте тело от макушки до пят, отмечая ощущения."},
-            {"theme": "Звуковая медитация", "duration": "8 минут", 
-             "instructions": "Сосредоточьтесь на окружающих звуках, не оценивая их."},
+    def get_daily_meditation_theme(cls, day: Optional[date] = None) -> Dict[str, Any]:
+        """Получить тему для медитации дня (day — по умолчанию сегодня)."""
+        theme = cls.MEDITATION_THEMES[
+            cls._pick_index(cls._get_daily_seed(day=day), len(cls.MEDITATION_THEMES))
         ]
         
-        seed = cls._get_daily_seed()
-        random.seed(seed)
-        theme = random.choice(themes)
-        random.seed()
-        
         return {
             "theme": theme["theme"],
             "duration": theme["duration"],
@@ -271,64 +280,188 @@ class DailyContentService:
             "emoji": "🧘",
         }
     
+    # --- Блоки уведомления (текст не зависит от пользователя — только от выбора) ---
+    
+    @staticmethod
+    def _rune_block(rune: Dict[str, Any]) -> str:
+        return (
+            f"ᚱ *Руна дня:* {rune['name']}\n"
+            f"*Значение:* {rune['meaning']}\n"
+            f"*Совет:* {rune['advice']}\n"
+        )
+    
+    @staticmethod
+    def _affirmation_block(affirmation: str) -> str:
+        return (
+            f"💫 *Аффирмация дня:*\n"
+            f"«{affirmation}»\n"
+        )
+    
+    @staticmethod
+    def _tarot_block(card: Dict[str, Any]) -> str:
+        return (
+            f"🃏 *Карта Таро дня:* {card['name']}\n"
+            f"*Значение:* {card['meaning']}\n"
+            f"*Совет:* {card['advice']}\n"
+        )
+    
     @classmethod
-    def generate_daily_notification(
-        cls, 
-        user_id: Optional[int] = None,
-        include_rune: bool = True,
-        include_affirmation: bool = True,
-        include_tarot: bool = False,
-        include_zodiac: bool = False,
-        include_meditation: bool = False,
-        zodiac_sign: Optional[str] = None,
+    def _zodiac_block(cls, sign: Optional[str] = None, day: Optional[date] = None) -> str:
+        zodiac = cls.get_zodiac_advice_of_day(sign, day)
+        return (
+            f"{zodiac['emoji']} *Совет для {zodiac['sign']}:*\n"
+            f"{zodiac['advice']}\n"
+        )
+    
+    @classmethod
+    def _meditation_block(cls, day: Optional[date] = None) -> str:
+        meditation = cls.get_daily_meditation_theme(day)
+        return (
+            f"🧘 *Медитация дня:* {meditation['theme']}\n"
+            f"*Длительность:* {meditation['duration']}\n"
+            f"*Инструкция:* {meditation['instructions']}\n"
+        )
+    
+    @classmethod
+    def _daily_fragments(cls, day: date) -> "DailyFragments":
+        """Все блоки уведомлений на день — считаются один раз (кэш на день)."""
+        cached = _fragments_cache.get(day)
+        if cached is None:
+            cached = DailyFragments(
+                day=day,
+                header=f"✨ *Ежедневные послания на {day.strftime('%d.%m.%Y')}*\n\n",
+                runes=tuple(cls._rune_block(r) for r in cls.RUNES),
+                affirmations=tuple(cls._affirmation_block(a) for a in cls.AFFIRMATIONS),
+                tarot=tuple(cls._tarot_block(c) for c in cls.TAROT_MAJOR),
+                zodiac={
+                    z["name"].lower(): cls._zodiac_block(z["name"], day) for z in cls.ZODIAC_SIGNS
+                },
+                zodiac_general=cls._zodiac_block(day=day),
+                meditation=cls._meditation_block(day),
+            )
+            _fragments_cache.clear()    # нужен только текущий день
+            _fragments_cache[day] = cached
+        return cached
+    
+    @classmethod
+    def _render_notification(
+        cls,
+        fragments: "DailyFragments",
+        user_id: Optional[int],
+        include_rune: bool,
+        include_affirmation: bool,
+        include_tarot: bool,
+        include_zodiac: bool,
+        include_meditation: bool,
+        zodiac_sign: Optional[str],
+        rng: random.Random,
     ) -> str:
-        """Сгенерировать полное ежедневное уведомление."""
+        """Собрать уведомление из готовых блоков дня."""
         parts = []
+        seed = cls._get_daily_seed(user_id, fragments.day)
         
         if include_rune:
-            rune = cls.get_rune_of_day(user_id)
-            parts.append(
-                f"ᚱ *Руна дня:* {rune['rune']}\n"
-                f"*Значение:* {rune['meaning']}\n"
-                f"*Совет:* {rune['advice']}\n"
-            )
+            parts.append(fragments.runes[cls._pick_index(seed, len(fragments.runes), rng)])
         
         if include_affirmation:
-            affirmation = cls.get_affirmation_of_day(user_id)
             parts.append(
-                f"💫 *Аффирмация дня:*\n"
-                f"«{affirmation['affirmation']}»\n"
+                fragments.affirmations[cls._pick_index(seed, len(fragments.affirmations), rng)]
             )
         
         if include_tarot:
-            tarot = cls.get_tarot_card_of_day(user_id)
-            parts.append(
-                f"🃏 *Карта Таро дня:* {tarot['card']}\n"
-                f"*Значение:* {tarot['meaning']}\n"
-                f"*Совет:* {tarot['advice']}\n"
-            )
+            parts.append(fragments.tarot[cls._pick_index(seed, len(fragments.tarot), rng)])
         
         if include_zodiac:
-            zodiac = cls.get_zodiac_advice_of_day(zodiac_sign)
             parts.append(
-                f"{zodiac['emoji']} *Совет для {zodiac['sign']}:*\n"
-                f"{zodiac['advice']}\n"
+                fragments.zodiac.get((zodiac_sign or "").lower(), fragments.zodiac_general)
             )
         
         if include_meditation:
-            meditation = cls.get_daily_meditation_theme()
-            parts.append(
-                f"🧘 *Медитация дня:* {meditation['theme']}\n"
-                f"*Длительность:* {meditation['duration']}\n"
-                f"*Инструкция:* {meditation['instructions']}\n"
-            )
+            parts.append(fragments.meditation)
         
         if not parts:
             parts.append("Сегодня нет активных уведомлений. Настройте их в /settings!")
         
-        # Добавляем заголовок и разделители
-        today = date.today().strftime("%d.%m.%Y")
-        header = f"✨ *Ежедневные послания на {today}*\n\n"
         separator = "\n" + "─" * 30 + "\n\n"
+        return fragments.header + separator.join(parts)
+    
+    @classmethod
+    def generate_daily_notification(
+        cls, 
+        user_id: Optional[int] = None,
+        include_rune: bool = True,
+        include_affirmation: bool = True,
+        include_tarot: bool = False,
+        include_zodiac: bool = False,
+        include_meditation: bool = False,
+        zodiac_sign: Optional[str] = None,
+    ) -> str:
+        """Сгенерировать полное ежедневное уведомление."""
+        return cls._render_notification(
+            cls._daily_fragments(date.today()),
+            user_id,
+            include_rune,
+            include_affirmation,
+            include_tarot,
+            include_zodiac,
+            include_meditation,
+            zodiac_sign,
+            random.Random(),
+        )
+    
+    @classmethod
+    def generate_daily_notifications(
+        cls,
+        cohort: Iterable[Any],
+        day: Optional[date] = None,
+    ) -> Dict[int, str]:
+        """
+        Пакетная генерация уведомлений для когорты (пользователи одного слота рассылки).
+        
+        Блоки дня считаются один раз на всю когорту, на пользователя остаётся
+        только выбор индексов и склейка строк. Тексты совпадают с
+        generate_daily_notification для того же пользователя и дня.
+        
+        Args:
+            cohort: Настройки пользователей (UserSettings или объекты с user_id);
+                    флаги notify_rune_of_day, notify_affirmation_of_day,
+                    notify_tarot_card_of_day, notify_horoscope_daily,
+                    notify_meditation_reminder — если есть, иначе значения
+                    по умолчанию generate_daily_notification
+            day: Дата (по умолчанию — сегодня)
         
-        return header + separator.join(parts)
\ No newline at end of file
+        Returns:
+            {user_id: текст уведомления}
+        """
+        fragments = cls._daily_fragments(day or date.today())
+        rng = random.Random()
+        return {
+            user.user_id: cls._render_notification(
+                fragments,
+                user.user_id,
+                include_rune=getattr(user, "notify_rune_of_day", True),
+                include_affirmation=getattr(user, "notify_affirmation_of_day", True),
+                include_tarot=getattr(user, "notify_tarot_card_of_day", False),
+                include_zodiac=getattr(user, "notify_horoscope_daily", False),
+                include_meditation=getattr(user, "notify_meditation_reminder", False),
+                zodiac_sign=None,
+                rng=rng,
+            )
+            for user in cohort
+        }
+
+
+@dataclass(frozen=True)
+class DailyFragments:
+    """Готовые блоки уведомлений на один день (по индексу в списках DailyContentService)."""
+    day: date
+    header: str
+    runes: Tuple[str, ...]
+    affirmations: Tuple[str, ...]
+    tarot: Tuple[str, ...]
+    zodiac: Dict[str, str]          # знак (в нижнем регистре) → блок
+    zodiac_general: str             # общий совет дня (знак не указан)
+    meditation: str
+
+
+_fragments_cache: Dict[date, DailyFragments] = {}
@@ -0,0 +1,369 @@
+"""
+MysticBot — материализованная дневная статистика (таблица daily_stats).
+
+Сервисы при записи отмечают события: record_stat("orders.created"),
+stat_transition("orders.status", старый, новый). Отметки копятся в памяти
+и раз в stats.flush_interval секунд уходят в БД одним UPSERT
+(value = value + :n). Панели читают готовые строки — SUM по метрикам
+за нужные дни, без обхода исходных таблиц.
+
+Метрики двух видов:
+- события дня (users.new, consultations, orders.created, drafts.created,
+  predictions.<тип>, ai.requests) — сколько случилось за день;
+- состояния (orders.status.<статус>, orders.paid, drafts.status.<статус>) —
+  изменения за день (+1 / −1), их сумма за всё время = текущее количество.
+
+Сверка (раз в сутки после reconcile_hour UTC и при старте): события
+последних reconcile_days дней пересчитываются по исходным таблицам
+(строки до момента сверки — отметки, сделанные после него, записываются
+как обычно), расхождение состояний с исходными таблицами записывается
+поправкой в сегодняшний день. ai.requests не сверяется — в исходной таблице
+хранится только счётчик текущего дня.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.config import settings, StatsConfig
+from bot.database.engine import dialect_insert
+from bot.models.consultation import Consultation
+from bot.models.daily_stat import DailyStat
+from bot.models.hybrid_draft import DraftStatus, HybridDraft
+from bot.models.order import Order, OrderStatus
+from bot.models.prediction_history import PredictionHistory, PredictionType
+from bot.models.user_settings import UserSettings
+
+logger = logging.getLogger(__name__)
+
+USERS_NEW = "users.new"
+AI_REQUESTS = "ai.requests"
+CONSULTATIONS = "consultations"
+ORDERS_CREATED = "orders.created"
+ORDERS_PAID = "orders.paid"
+DRAFTS_CREATED = "drafts.created"
+ORDER_STATUS = "orders.status"
+DRAFT_STATUS = "drafts.status"
+PREDICTIONS = "predictions"
+
+# События, пересчитываемые по created_at исходных таблиц
+EVENT_SOURCES = {
+    USERS_NEW: UserSettings.created_at,
+    CONSULTATIONS: Consultation.created_at,
+    ORDERS_CREATED: Order.created_at,
+    DRAFTS_CREATED: HybridDraft.created_at,
+}
+
+
+def status_metric(prefix: str, status: Any) -> str:
+    """orders.status.new, drafts.status.pending, ..."""
+    return f"{prefix}.{getattr(status, 'value', status)}"
+
+
+def prediction_metric(prediction_type: Any) -> str:
+    return f"{PREDICTIONS}.{getattr(prediction_type, 'value', prediction_type)}"
+
+
+def _utc_today() -> date:
+    return datetime.utcnow().date()
+
+
+def _as_date(value: Any) -> date:
+    # func.date(): в PostgreSQL — date, в SQLite — строка 'YYYY-MM-DD'
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+async def _upsert(session: AsyncSession, rows: list[dict], add: bool) -> None:
+    """Записать строки {day, metric, value}: прибавить (add) или заменить значение."""
+    if not rows:
+        return
+    table = DailyStat.__table__
+    stmt = dialect_insert(session)(table)
+    value = table.c.value + stmt.excluded.value if add else stmt.excluded.value
+    stmt = stmt.on_conflict_do_update(index_elements=["metric", "day"], set_={"value": value})
+    await session.execute(stmt, rows)
+
+
+class DailyStatsService:
+    """Чтение и сверка дневных счётчиков."""
+
+    @staticmethod
+    async def rollup(
+        session: AsyncSession,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        prefix: str = "",
+    ) -> dict[str, int]:
+        """Сумма каждой метрики за дни [start, end] (без границ — за всё время)."""
+        stmt = select(DailyStat.metric, func.sum(DailyStat.value)).group_by(DailyStat.metric)
+        if start is not None:
+            stmt = stmt.where(DailyStat.day >= start)
+        if end is not None:
+            stmt = stmt.where(DailyStat.day <= end)
+        if prefix:
+            stmt = stmt.where(DailyStat.metric.startswith(prefix))
+        return {metric: int(total or 0) for metric, total in (await session.execute(stmt)).all()}
+
+    @staticmethod
+    async def by_day(
+        session: AsyncSession, start: date, end: date
+    ) -> dict[date, dict[str, int]]:
+        """Значения метрик по дням [start, end] (для детализации)."""
+        stmt = (
+            select(DailyStat.day, DailyStat.metric, DailyStat.value)
+            .where(DailyStat.day >= start, DailyStat.day <= end)
+            .order_by(DailyStat.day)
+        )
+        result: dict[date, dict[str, int]] = defaultdict(dict)
+        for day, metric, value in (await session.execute(stmt)).all():
+            result[day][metric] = value
+        return dict(result)
+
+    @staticmethod
+    async def is_empty(session: AsyncSession) -> bool:
+        return (await session.execute(select(DailyStat.id).limit(1))).first() is None
+
+    @staticmethod
+    async def reconcile(
+        session: AsyncSession,
+        since: Optional[date] = None,
+        cutoff: Optional[datetime] = None,
+        pending: Optional[dict[tuple[date, str], int]] = None,
+        buffered: Optional[Callable[[], dict[str, int]]] = None,
+    ) -> dict[str, int]:
+        """
+        Сверка с исходными таблицами: события с since по сегодня
+        пересчитываются заново (since=None — за всю историю) по строкам,
+        созданным до cutoff; поправки состояний пишутся в сегодняшний день.
+        pending — отметки, накопленные до cutoff: отметки пересчитываемых
+        событий отбрасываются, остальные записываются до подсчёта поправок.
+        buffered — изменения, ещё лежащие в буфере (их запишет следующий
+        flush): читаются сразу после подсчёта состояний и вычитаются из поправок.
+        Возвращает поправки состояний.
+        """
+        today = _utc_today()
+        start = datetime.combine(since, datetime.min.time()) if since else None
+        event_metrics = list(EVENT_SOURCES) + [prediction_metric(t) for t in PredictionType]
+
+        # --- Отметки до cutoff: пересчитанные события не дублируем ---
+        await _upsert(
+            session,
+            [
+                {"day": day, "metric": metric, "value": n}
+                for (day, metric), n in (pending or {}).items()
+                if n and not (metric in event_metrics and (since is None or day >= since))
+            ],
+            add=True,
+        )
+
+        # --- События: пересчёт по дням ---
+        reset = update(DailyStat).where(DailyStat.metric.in_(event_metrics))
+        if since is not None:
+            reset = reset.where(DailyStat.day >= since)
+        await session.execute(reset.values(value=0))
+
+        rows = []
+        for metric, column in EVENT_SOURCES.items():
+            stmt = select(func.date(column), func.count()).group_by(func.date(column))
+            if start is not None:
+                stmt = stmt.where(column >= start)
+            if cutoff is not None:
+                stmt = stmt.where(column < cutoff)
+            for day, n in (await session.execute(stmt)).all():
+                if day is not None:
+                    rows.append({"day": _as_date(day), "metric": metric, "value": n})
+        column = PredictionHistory.created_at
+        stmt = select(func.date(column), PredictionHistory.prediction_type, func.count()).group_by(
+            func.date(column), PredictionHistory.prediction_type
+        )
+        if start is not None:
+            stmt = stmt.where(column >= start)
+        if cutoff is not None:
+            stmt = stmt.where(column < cutoff)
+        for day, ptype, n in (await session.execute(stmt)).all():
+            rows.append({"day": _as_date(day), "metric": prediction_metric(ptype), "value": n})
+        await _upsert(session, rows, add=False)
+
+        # --- Состояния: поправка к сумме изменений ---
+        current: dict[str, int] = {status_metric(ORDER_STATUS, s): 0 for s in OrderStatus}
+        current.update({status_metric(DRAFT_STATUS, s): 0 for s in DraftStatus})
+        for status, n in (await session.execute(select(Order.status, func.count()).group_by(Order.status))).all():
+            current[status_metric(ORDER_STATUS, status)] = n
+        for status, n in (
+            await session.execute(select(HybridDraft.status, func.count()).group_by(HybridDraft.status))
+        ).all():
+            current[status_metric(DRAFT_STATUS, status)] = n
+        paid = select(func.count()).select_from(Order).where(Order.is_paid == True)  # noqa: E712
+        current[ORDERS_PAID] = (await session.execute(paid)).scalar_one()
+        # Переходы после cutoff уже в current — и в буфере: учитываем их как записанные
+        in_buffer = buffered() if buffered else {}
+
+        recorded = await DailyStatsService.rollup(session)
+        expected = {metric: recorded.get(metric, 0) + in_buffer.get(metric, 0) for metric in current}
+        corrections = {
+            metric: n - expected[metric]
+            for metric, n in current.items()
+            if n != expected[metric]
+        }
+        await _upsert(
+            session,
+            [{"day": today, "metric": m, "value": d} for m, d in corrections.items()],
+            add=True,
+        )
+        await session.commit()
+        return corrections
+
+
+class DailyStatsRecorder:
+    """
+    Буфер отметок и фоновая задача записи/сверки.
+
+    Использование:
+        recorder = DailyStatsRecorder(session_maker)
+        await recorder.start()
+        recorder.record("orders.created")
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        config: Optional[StatsConfig] = None,
+    ):
+        self.session_maker = session_maker
+        self.config = config or settings.stats
+        self._pending: dict[tuple[date, str], int] = defaultdict(int)
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._reconciled_day: Optional[date] = None
+
+    def record(self, metric: str, n: int = 1) -> None:
+        self._pending[(_utc_today(), metric)] += n
+
+    def _buffered(self) -> dict[str, int]:
+        """Незаписанные отметки по метрикам (за все дни)."""
+        totals: dict[str, int] = defaultdict(int)
+        for (_, metric), n in self._pending.items():
+            totals[metric] += n
+        return totals
+
+    async def start(self) -> None:
+        async with self.session_maker() as session:
+            if await DailyStatsService.is_empty(session):
+                logger.info("📊 Дневная статистика: первичное заполнение по исходным таблицам")
+                await DailyStatsService.reconcile(session)
+                self._reconciled_day = _utc_today()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.flush()
+                now = datetime.utcnow()
+                if now.hour >= self.config.reconcile_hour and self._reconciled_day != now.date():
+                    await self.reconcile()
+            except Exception as e:
+                logger.error(f"❌ Дневная статистика: {e}")
+            await asyncio.sleep(self.config.flush_interval)
+
+    async def flush(self) -> int:
+        """Записать накопленные отметки одним UPSERT."""
+        if not self._pending:
+            return 0
+        async with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            rows = [{"day": d, "metric": m, "value": n} for (d, m), n in pending.items() if n]
+            try:
+                async with self.session_maker() as session:
+                    await _upsert(session, rows, add=True)
+                    await session.commit()
+            except BaseException:
+                for key, n in pending.items():
+                    self._pending[key] += n
+                raise
+        return len(rows)
+
+    async def reconcile(self) -> None:
+        """
+        Сверка последних reconcile_days дней (ночная задача). Отметки
+        забираются из буфера в момент cutoff под тем же замком: пересчёт
+        идёт по строкам до cutoff, отметки после него остаются в буфере
+        и записываются следующим flush — ни одна не считается дважды.
+        Состояния читаются без cutoff: буферизованные изменения вычитаются
+        из поправки.
+        """
+        async with self._lock:
+            cutoff = datetime.utcnow()
+            today = cutoff.date()
+            pending, self._pending = self._pending, defaultdict(int)
+            try:
+                async with self.session_maker() as session:
+                    corrections = await DailyStatsService.reconcile(
+                        session,
+                        since=today - timedelta(days=self.config.reconcile_days),
+                        cutoff=cutoff,
+                        pending=pending,
+                        buffered=self._buffered,
+                    )
+            except BaseException:
+                for key, n in pending.items():
+                    self._pending[key] += n
+                raise
+            self._reconciled_day = today
+        if corrections:
+            logger.warning(f"📊 Дневная статистика: поправки после сверки {corrections}")
+        else:
+            logger.info("📊 Дневная статистика сверена, расхождений нет")
+
+
+_recorder: Optional[DailyStatsRecorder] = None
+
+
+async def init_daily_stats(session_maker: async_sessionmaker) -> Optional[DailyStatsRecorder]:
+    """Запуск записи дневной статистики при старте бота."""
+    global _recorder
+    if not settings.stats.rollups:
+        return None
+    recorder = DailyStatsRecorder(session_maker)
+    await recorder.start()
+    _recorder = recorder
+    return _recorder
+
+
+async def close_daily_stats() -> None:
+    global _recorder
+    if _recorder is not None:
+        await _recorder.stop()
+        _recorder = None
+
+
+def rollups_active() -> bool:
+    """Запись идёт — панелям можно читать daily_stats."""
+    return _recorder is not None
+
+
+def record_stat(metric: str, n: int = 1) -> None:
+    """Отметить событие (без запущенной записи — ничего: догонит ночная сверка)."""
+    if _recorder is not None:
+        _recorder.record(metric, n)
+
+
+def stat_transition(prefix: str, old: Any, new: Any) -> None:
+    """Смена состояния: −1 старому, +1 новому (None — объекта не было / больше нет)."""
+    if old == new:
+        return
+    if old is not None:
+        record_stat(status_metric(prefix, old), -1)
+    if new is not None:
+        record_stat(status_metric(prefix, new), 1)
@@ -0,0 +1,97 @@
+"""
+MysticBot — сжатие длинных диалогов ИИ-режима.
+
+Старые реплики заменяются кратким конспектом, который хранится в конце
+системного сообщения. Так размер промпта остаётся примерно постоянным,
+сколько бы ни длилась сессия.
+"""
+
+import logging
+from typing import Optional
+
+from bot.config import settings
+from bot.services.llm import get_llm_service, LLMError, Priority
+
+logger = logging.getLogger(__name__)
+
+# Разделитель между системным промптом и конспектом в первом сообщении
+SUMMARY_HEADER = "\n\n📜 Краткое содержание предыдущей части диалога:\n"
+
+SUMMARY_SYSTEM_PROMPT = """Ты ведёшь конспект диалога пользователя с ИИ-помощником.
+Объедини прежний конспект и новые реплики в один связный конспект на русском языке.
+Сохрани факты о пользователе (имя, даты рождения, знаки, ситуацию), заданные вопросы,
+выпавшие карты/руны/числа и ключевые выводы ответов. Без вступлений, не длиннее 10 пунктов."""
+
+SPEAKERS = {"user": "Пользователь", "assistant": "ИИ"}
+
+
+def split_system(content: str) -> tuple[str, str]:
+    """Системное сообщение → (промпт, конспект); конспект пуст, если его нет."""
+    prompt, _, summary = content.partition(SUMMARY_HEADER)
+    return prompt, summary
+
+
+def join_system(prompt: str, summary: str) -> str:
+    """Промпт и конспект → содержимое системного сообщения."""
+    return f"{prompt}{SUMMARY_HEADER}{summary}" if summary else prompt
+
+
+def compaction_cut(messages: list[dict], tokens: int) -> Optional[int]:
+    """
+    Индекс, до которого историю пора сжать (messages[1:cut] → конспект),
+    или None, если порог не достигнут.
+
+    Порог — summary_trigger_tokens токенов истории или
+    summary_trigger_messages реплик. Последние summary_keep_last реплик
+    остаются дословно; хвост начинается с реплики пользователя (часть
+    провайдеров требует чередования user/assistant после system).
+    """
+    cfg = settings.llm_context
+    if not cfg.summary_enabled or not messages or messages[0].get("role") != "system":
+        return None
+    history = len(messages) - 1
+    if history < cfg.summary_trigger_messages and tokens < cfg.summary_trigger_tokens:
+        return None
+    cut = len(messages) - cfg.summary_keep_last
+    while cut > 1 and messages[cut].get("role") != "user":
+        cut -= 1
+    return cut if cut > 1 else None
+
+
+async def summarize_dialog(
+    previous: str,
+    messages: list[dict],
+    user_id: Optional[int] = None,
+) -> str:
+    """
+    Конспект: прежний конспект + новые реплики. Запрос идёт фоновой
+    полосой очереди LLM — не отнимает места у ответов пользователям.
+
+    Raises:
+        LLMError: провайдеры не ответили или ответ пустой
+    """
+    cfg = settings.llm_context
+    transcript = "\n".join(
+        f"{SPEAKERS.get(m['role'], m['role'])}: {m['content']}" for m in messages
+    )
+    prompt = (
+        f"Прежний конспект:\n{previous or '—'}\n\n"
+        f"Новые реплики:\n{transcript}"
+    )
+    result = await get_llm_service().chat_completion(
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
+        max_tokens=cfg.summary_max_tokens,
+        user_id=user_id,
+        priority=Priority.BACKGROUND,
+    )
+    try:
+        summary = (result["choices"][0]["message"]["content"] or "").strip()
+    except (KeyError, IndexError, TypeError) as e:
+        raise LLMError(f"Неожиданный формат ответа LLM: {e}")
+    if not summary:
+        raise LLMError("Пустой конспект")
+    return summary
@@ -7,9 +7,12 @@ from datetime import datetime
 from typing import List, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select, func
 
+from bot.database.writer import persist
+from bot.services.pagination import NEXT, Page, fetch_page
 from bot.models.consultation import Consultation
+from bot.services.daily_stats import CONSULTATIONS, record_stat
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +34,8 @@ class ConsultationHistory:
             answer=answer,
             created_at=datetime.utcnow()
         )
-        session.add(consultation)
-        await session.commit()
-        await session.refresh(consultation)
+        await persist(session, consultation)
+        record_stat(CONSULTATIONS)
         logger.debug(f"Консультация сохранена для пользователя {user_id}")
         return consultation
     
@@ -42,19 +44,25 @@ class ConsultationHistory:
         session: AsyncSession,
         user_id: int,
         limit: int = 10,
-        offset: int = 0
+        cursor: Optional[str] = None
     ) -> List[Consultation]:
-        """Получить историю консультаций пользователя."""
-        stmt = (
-            select(Consultation)
-            .where(Consultation.user_id == user_id)
-            .order_by(desc(Consultation.created_at))
-            .limit(limit)
-            .offset(offset)
+        """Получить историю консультаций пользователя (новые сверху, после cursor)."""
+        page = await ConsultationHistory.get_page(session, user_id, limit, cursor)
+        return page.items
+    
+    @staticmethod
+    async def get_page(
+        session: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        direction: str = NEXT
+    ) -> Page:
+        """Страница истории консультаций (keyset по created_at, id)."""
+        stmt = select(Consultation).where(Consultation.user_id == user_id)
+        return await fetch_page(
+            session, stmt, (Consultation.created_at, Consultation.id), limit, cursor, direction
         )
-        result = await session.execute(stmt)
-        consultations = result.scalars().all()
-        return consultations
     
     @staticmethod
     async def get_recent(
@@ -92,7 +100,6 @@ class ConsultationHistory:
         user_id: int
     ) -> int:
         """Получить общее количество консультаций пользователя."""
-        stmt = select(Consultation).where(Consultation.user_id == user_id)
+        stmt = select(func.count()).select_from(Consultation).where(Consultation.user_id == user_id)
         result = await session.execute(stmt)
-        count = result.scalars().all()
-        return len(count)
\ No newline at end of file
+        return result.scalar_one()
\ No newline at end of file
@@ -10,6 +10,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, desc, and_
 
 from bot.models.hybrid_draft import HybridDraft, DraftStatus
+from bot.services.daily_stats import DRAFT_STATUS, DRAFTS_CREATED, record_stat, stat_transition
+from bot.services.pagination import fetch_page
+from bot.services.stats import StatsService
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +42,8 @@ class HybridDraftService:
         session.add(draft)
         await session.commit()
         await session.refresh(draft)
+        record_stat(DRAFTS_CREATED)
+        stat_transition(DRAFT_STATUS, None, draft.status)
         
         logger.info(f"Создан черновик #{draft.id} для пользователя {user_id}")
         return draft
@@ -51,16 +56,15 @@ class HybridDraftService:
         return result.scalar_one_or_none()
     
     @staticmethod
-    async def get_pending_drafts(session: AsyncSession, limit: int = 20) -> List[HybridDraft]:
-        """Получение черновиков, ожидающих проверки"""
-        stmt = (
-            select(HybridDraft)
-            .where(HybridDraft.status == DraftStatus.PENDING)
-            .order_by(HybridDraft.created_at.asc())
-            .limit(limit)
+    async def get_pending_drafts(
+        session: AsyncSession, limit: int = 20, cursor: Optional[str] = None
+    ) -> List[HybridDraft]:
+        """Получение черновиков, ожидающих проверки (старые первыми; keyset после cursor)"""
+        stmt = select(HybridDraft).where(HybridDraft.status == DraftStatus.PENDING)
+        page = await fetch_page(
+            session, stmt, (HybridDraft.created_at, HybridDraft.id), limit, cursor, descending=False
         )
-        result = await session.execute(stmt)
-        return list(result.scalars().all())
+        return page.items
     
     @staticmethod
     async def get_drafts_by_user(session: AsyncSession, user_id: int, limit: int = 10) -> List[HybridDraft]:
@@ -87,6 +91,7 @@ class HybridDraftService:
         if not draft:
             return None
         
+        old_status = draft.status
         if final_answer:
             draft.final_answer = final_answer
             draft.status = DraftStatus.EDITED
@@ -100,6 +105,7 @@ class HybridDraftService:
         
         await session.commit()
         await session.refresh(draft)
+        stat_transition(DRAFT_STATUS, old_status, draft.status)
         
         logger.info(f"Черновик #{draft_id} одобрен проверяющим {reviewer_id}")
         return draft
@@ -111,11 +117,13 @@ class HybridDraftService:
         if not draft:
             return None
         
+        old_status = draft.status
         draft.status = DraftStatus.SENT
         draft.sent_at = datetime.now()
         
         await session.commit()
         await session.refresh(draft)
+        stat_transition(DRAFT_STATUS, old_status, draft.status)
         
         logger.info(f"Черновик #{draft_id} помечен как отправленный")
         return draft
@@ -132,6 +140,7 @@ class HybridDraftService:
         if not draft:
             return None
         
+        old_status = draft.status
         draft.status = DraftStatus.REJECTED
         draft.reviewer_id = reviewer_id
         draft.reviewer_notes = reviewer_notes
@@ -139,6 +148,7 @@ class HybridDraftService:
         
         await session.commit()
         await session.refresh(draft)
+        stat_transition(DRAFT_STATUS, old_status, draft.status)
         
         logger.info(f"Черновик #{draft_id} отклонён проверяющим {reviewer_id}")
         return draft
@@ -150,27 +160,15 @@ class HybridDraftService:
         if not draft:
             return False
         
+        old_status = draft.status
         await session.delete(draft)
         await session.commit()
+        stat_transition(DRAFT_STATUS, old_status, None)
         
         logger.info(f"Черновик #{draft_id} удалён")
         return True
     
     @staticmethod
     async def get_statistics(session: AsyncSession) -> dict:
-        """Статистика по черновикам"""
-        # Общее количество черновиков
-        stmt_total = select(HybridDraft)
-        result_total = await session.execute(stmt_total)
-        total = len(result_total.scalars().all())
-        
-        # По статусам
-        stats = {"total": total, "by_status": {}}
-        
-        for status in DraftStatus:
-            stmt = select(HybridDraft).where(HybridDraft.status == status)
-            result = await session.execute(stmt)
-            count = len(result.scalars().all())
-            stats["by_status"][status.value] = count
-        
-        return stats
\ No newline at end of file
+        """Статистика по черновикам (всего и по статусам, один GROUP BY)"""
+        return await StatsService.draft_counts(session)
\ No newline at end of file
@@ -2,20 +2,38 @@
 MysticBot — LLM Service
 Единый сервис для работы с LLM-провайдерами.
 Приоритет: Featherless → Perplexity → OpenAI.
-Поддержка: retry при 503, таймауты, graceful fallback.
+Поддержка: retry при 503, таймауты, graceful fallback, потоковая выдача (SSE),
+кэш ответов (LRU + Redis) для детерминированных запросов,
+объединение одновременных одинаковых запросов (single-flight),
+хеджирование: при задержке дольше p95 параллельно запускается следующий провайдер,
+circuit breaker: упавшие провайдеры пропускаются и проверяются в фоне,
+клиентский rate limit (RPM/TPM) с подстройкой по 429 и заголовкам x-ratelimit-*.
 """
 
 import asyncio
+import hashlib
+import json
 import logging
+import re
 import time
-from typing import Optional
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
 
 import httpx
 
-from bot.config import settings, FeatherlessConfig, PerplexityConfig, OpenAIConfig
+from bot.config import (
+    settings, FeatherlessConfig, PerplexityConfig, OpenAIConfig, LLMCacheConfig,
+    HttpTransportConfig, RateLimitConfig,
+)
+from bot.services.llm_ratelimit import ProviderRateLimiter
+from bot.services.llm_routing import CircuitBreaker, CircuitState, LatencyTracker
+from bot.services.llm_scheduler import LLMScheduler, PositionCallback, Priority, QueueFullError
+from bot.services.tokenizer import get_tokenizer
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 class LLMError(Exception):
     """Базовая ошибка LLM-сервиса."""
@@ -27,6 +45,318 @@ class AllProvidersFailedError(LLMError):
     pass
 
 
+class CircuitOpenError(LLMError):
+    """Провайдер временно отключён circuit breaker'ом."""
+    pass
+
+
+class RateLimitedError(LLMError):
+    """Квота провайдера исчерпана (429 или ожидание в лимитере дольше max_wait)."""
+    pass
+
+
+# ============================================================
+# Кэш ответов
+# ============================================================
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _normalize_content(text: str) -> str:
+    """Нормализация текста для ключа кэша: регистр, ё/е, пробелы, финальная пунктуация."""
+    text = _WS_RE.sub(" ", str(text)).strip().casefold().replace("ё", "е")
+    return text.rstrip(" ?!.…")
+
+
+def request_fingerprint(
+    messages: list[dict],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    **kwargs,
+) -> str:
+    """
+    Отпечаток запроса: нормализованные (system prompt, messages), модель,
+    temperature и прочие параметры API. Одинаковые по смыслу запросы
+    дают одинаковый ключ.
+    """
+    payload = {
+        "messages": [
+            [m.get("role", ""), _normalize_content(m.get("content", ""))]
+            for m in messages
+        ],
+        "model": model,
+        "temperature": round(float(temperature), 2),
+        "max_tokens": max_tokens,
+        "extra": kwargs,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Двухуровневый кэш ответов LLM.
+
+    1. LRU в памяти процесса (ограничен по числу записей).
+    2. Redis (опционально, общий для процессов) — SETEX с тем же TTL.
+
+    TTL задаётся по фиче (ask, ai_mode_opener, ...), счётчики hit/miss
+    доступны через stats().
+    """
+
+    REDIS_PREFIX = "mysticbot:llm_cache:"
+    REDIS_RETRY_AFTER = 60.0    # пауза после ошибки Redis (сек)
+
+    def __init__(self, config: LLMCacheConfig, redis_url: str = ""):
+        self.config = config
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._redis_url = redis_url if config.use_redis else ""
+        self._redis: Any = None
+        self._redis_disabled_until = 0.0
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl_for(self, feature: str) -> int:
+        """TTL для фичи (сек)."""
+        return self.config.feature_ttls.get(feature, self.config.default_ttl)
+
+    def is_cacheable(self, feature: Optional[str], temperature: float) -> bool:
+        """Кэшируются только помеченные фичей детерминированные/низкотемпературные запросы."""
+        return (
+            self.config.enabled
+            and bool(feature)
+            and self.ttl_for(feature) > 0
+            and temperature <= self.config.max_temperature
+        )
+
+    async def _get_redis(self) -> Any:
+        """Ленивое подключение к Redis; None, если уровень выключен или недоступен."""
+        if not self._redis_url or time.monotonic() < self._redis_disabled_until:
+            return None
+        if self._redis is None:
+            try:
+                from redis import asyncio as aioredis
+                self._redis = aioredis.from_url(self._redis_url)
+            except Exception as e:
+                logger.warning(f"⚠️ LLM-кэш: Redis недоступен: {e}")
+                self._redis_disabled_until = time.monotonic() + self.REDIS_RETRY_AFTER
+                return None
+        return self._redis
+
+    def _redis_failed(self, e: Exception) -> None:
+        logger.warning(
+            f"⚠️ LLM-кэш: ошибка Redis ({e}), "
+            f"уровень отключён на {self.REDIS_RETRY_AFTER:.0f}с"
+        )
+        self._redis_disabled_until = time.monotonic() + self.REDIS_RETRY_AFTER
+
+    def _put_local(self, key: str, value: dict, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.config.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Поиск ответа: сначала LRU, затем Redis."""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(self.REDIS_PREFIX + key)
+            except Exception as e:
+                self._redis_failed(e)
+                raw = None
+            if raw:
+                try:
+                    stored = json.loads(raw)
+                    if stored["exp"] > now:
+                        self._put_local(key, stored["data"], stored["exp"])
+                        self.hits += 1
+                        self.redis_hits += 1
+                        return stored["data"]
+                except (ValueError, KeyError, TypeError):
+                    pass
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict, feature: str) -> None:
+        """Сохранение ответа на TTL фичи в обоих уровнях."""
+        ttl = self.ttl_for(feature)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._put_local(key, value, expires_at)
+
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                await redis.set(
+                    self.REDIS_PREFIX + key,
+                    json.dumps({"exp": expires_at, "data": value}, ensure_ascii=False),
+                    ex=ttl,
+                )
+            except Exception as e:
+                self._redis_failed(e)
+
+    def stats(self) -> dict[str, int]:
+        """Счётчики кэша."""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    async def close(self) -> None:
+        """Закрытие подключения к Redis."""
+        if self._redis is not None:
+            try:
+                await self._redis.aclose()
+            except Exception:
+                pass
+            self._redis = None
+
+
+# ============================================================
+# Single-flight: объединение одинаковых запросов «в полёте»
+# ============================================================
+
+class _Flight:
+    """Один общий запрос и число его ожидающих."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """Общий поток: накопленные фрагменты + уведомление о новых."""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.chunks: list[str] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.waiters = 0
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+class SingleFlight:
+    """
+    Объединение одновременных запросов с одинаковым ключом.
+
+    Первый вызов запускает задачу, остальные ждут её результат.
+    - Ошибка задачи пробрасывается каждому ожидающему.
+    - Отмена одного ожидающего не затрагивает остальных (asyncio.shield);
+      задача отменяется, только когда ждать её больше некому.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Flight] = {}
+        self._streams: dict[str, _StreamFlight] = {}
+        self.coalesced = 0
+
+    def _forget(self, registry: dict, key: str, flight: Any) -> None:
+        if registry.get(key) is flight:
+            del registry[key]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Выполнить fn() один раз для всех одновременных вызовов с ключом key."""
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(
+                lambda t, f=flight: (self._forget(self._calls, key, f), _consume_result(t))
+            )
+        else:
+            self.coalesced += 1
+            logger.debug(f"🔗 single-flight: запрос присоединён к выполняющемуся ({flight.waiters} ждут)")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[str]],
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый вариант: один генератор factory() раздаёт фрагменты всем
+        подписчикам; подключившийся позже сначала получает накопленное.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+
+            async def produce(f: _StreamFlight = flight) -> None:
+                try:
+                    async for chunk in factory():
+                        f.chunks.append(chunk)
+                        f.notify()
+                except BaseException as e:
+                    f.error = e
+                    raise
+                finally:
+                    f.finished = True
+                    self._forget(self._streams, key, f)
+                    f.notify()
+
+            flight.task = asyncio.ensure_future(produce())
+            flight.task.add_done_callback(_consume_result)
+        else:
+            self.coalesced += 1
+            logger.debug(f"🔗 single-flight: поток присоединён к выполняющемуся ({flight.waiters} ждут)")
+
+        flight.waiters += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and flight.task and not flight.task.done():
+                flight.task.cancel()
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    """Забрать исключение задачи, чтобы asyncio не писал «exception was never retrieved»."""
+    if not task.cancelled():
+        task.exception()
+
+
 class LLMProvider:
     """
     Обёртка для одного LLM-провайдера (OpenAI-совместимый API).
@@ -42,6 +372,10 @@ class LLMProvider:
         timeout: int = 60,
         max_retries: int = 3,
         retry_delay: float = 30.0,
+        transport: Optional[HttpTransportConfig] = None,
+        context_window: int = 32768,
+        max_concurrency: int = 10,
+        rate_limit: Optional[RateLimitConfig] = None,
     ):
         self.name = name
         self.api_key = api_key
@@ -50,28 +384,161 @@ class LLMProvider:
         self.timeout = timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.context_window = context_window
+        self.max_concurrency = max_concurrency
+        # Лимит одновременных запросов к провайдеру (тариф / rate limit)
+        self.slots = asyncio.Semaphore(max_concurrency)
+        # Квоты RPM/TPM: запрос ждёт в лимитере, а не получает 429
+        self.rate_limiter = ProviderRateLimiter(name, rate_limit or RateLimitConfig())
+        self.transport = transport or HttpTransportConfig()
+        self.http2 = self.transport.http2 and _http2_available()
+        if self.transport.http2 and not self.http2:
+            logger.warning(
+                f"⚠️ [{self.name}] HTTP/2 запрошен, но пакет h2 не установлен — "
+                f"использую HTTP/1.1 (pip install 'httpx[http2]')"
+            )
 
-        # Единый httpx-клиент с настроенным таймаутом
+        # Единый httpx-клиент на всё время жизни процесса
         self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        self._clients_created = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
 
     async def _get_client(self) -> httpx.AsyncClient:
-        """Ленивая инициализация httpx-клиента."""
-        if self._client is None or self._client.is_closed:
-            self._client = httpx.AsyncClient(
-                base_url=self.base_url,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                timeout=httpx.Timeout(
-                    connect=10.0,
-                    read=float(self.timeout),
-                    write=10.0,
-                    pool=10.0,
-                ),
-            )
+        """
+        Ленивая инициализация httpx-клиента с пулом из HttpTransportConfig.
+
+        Под блокировкой: параллельные первые запросы не создают по
+        клиенту (и пулу) каждый.
+        """
+        if self._client is not None and not self._client.is_closed:
+            return self._client
+        async with self._client_lock:
+            if self._client is None or self._client.is_closed:
+                cfg = self.transport
+                if self._clients_created:
+                    logger.warning(f"♻️ [{self.name}] httpx-клиент был закрыт — создаю заново")
+                self._client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    timeout=httpx.Timeout(
+                        connect=cfg.connect_timeout,
+                        read=float(self.timeout),
+                        write=10.0,
+                        pool=cfg.pool_timeout,
+                    ),
+                    limits=httpx.Limits(
+                        max_connections=cfg.max_connections,
+                        max_keepalive_connections=cfg.max_keepalive_connections,
+                        keepalive_expiry=cfg.keepalive_expiry,
+                    ),
+                    http2=self.http2,
+                )
+                self._clients_created += 1
         return self._client
 
+    def _request_started(self) -> None:
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _request_finished(self) -> None:
+        self._in_flight -= 1
+
+    def _estimate_tokens(self, messages: list[dict], max_tokens: int) -> int:
+        """Резерв квоты TPM: промпт + лимит ответа (сверяется с usage после ответа)."""
+        tokenizer = get_tokenizer(self.model)
+        return sum(tokenizer.count_message(m) for m in messages) + max_tokens
+
+    def _settle_generated(self, reserved: int, prompt_tokens: int, generated: list[str]) -> None:
+        """Расход потока без usage (или оборванного): промпт + сгенерированное по токенизатору."""
+        used = prompt_tokens + get_tokenizer(self.model).count("".join(generated))
+        self.rate_limiter.settle(reserved, used)
+
+    async def _acquire_quota(self, reserved: int) -> None:
+        """Дождаться квоты в лимитере; слишком долгое ожидание — ошибка (fallback)."""
+        if not await self.rate_limiter.acquire(reserved):
+            raise RateLimitedError(
+                f"[{self.name}] квота исчерпана — ожидание дольше "
+                f"{self.rate_limiter.config.max_wait:.0f}с"
+            )
+
+    async def warm_up(self) -> int:
+        """
+        Прогрев пула: параллельно открыть warmup_connections соединений
+        (TCP + TLS) лёгким GET /models, чтобы первые пользователи не
+        платили за рукопожатия. Любой HTTP-ответ считается успехом —
+        важно само соединение, оставшееся в keep-alive.
+
+        Returns:
+            Число успешно открытых соединений
+        """
+        count = self.transport.warmup_connections
+        if count <= 0:
+            return 0
+        client = await self._get_client()
+        # Для HTTP/2 все запросы мультиплексируются в одно соединение
+        count = 1 if self.http2 else min(count, self.transport.max_keepalive_connections)
+
+        async def ping() -> bool:
+            try:
+                await client.get("/models")
+                return True
+            except httpx.HTTPError as e:
+                logger.debug(f"[{self.name}] прогрев не удался: {e}")
+                return False
+
+        start = time.monotonic()
+        results = await asyncio.gather(*(ping() for _ in range(count)))
+        opened = sum(results)
+        logger.info(
+            f"🔥 [{self.name}] прогрев пула: {opened}/{count} соединений "
+            f"за {time.monotonic() - start:.2f}с"
+            f"{' (HTTP/2)' if self.http2 else ''}"
+        )
+        return opened
+
+    def pool_stats(self) -> dict[str, Any]:
+        """
+        Занятость пула: запросы в полёте (пик с момента старта), лимиты и
+        соединения httpcore (активные/простаивающие), ожидающие соединения запросы.
+        """
+        stats: dict[str, Any] = {
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "max_connections": self.transport.max_connections,
+            "max_keepalive_connections": self.transport.max_keepalive_connections,
+            "http2": self.http2,
+            "clients_created": self._clients_created,
+            "max_concurrency": self.max_concurrency,
+            "slots_busy": self.max_concurrency - self.slots._value,
+            **self.rate_limiter.stats(),
+            "connections_active": 0,
+            "connections_idle": 0,
+            "requests_waiting": 0,
+        }
+        client = self._client
+        if client is None or client.is_closed:
+            return stats
+        # httpcore не даёт публичного API занятости — читаем осторожно
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        for conn in getattr(pool, "connections", None) or ():
+            try:
+                if conn.is_idle():
+                    stats["connections_idle"] += 1
+                elif not conn.is_closed():
+                    stats["connections_active"] += 1
+            except Exception:
+                continue
+        stats["requests_waiting"] = sum(
+            1 for r in getattr(pool, "_requests", None) or ()
+            if getattr(r, "connection", None) is None
+        )
+        return stats
+
     async def chat_completion(
         self,
         messages: list[dict],
@@ -94,6 +561,19 @@ class LLMProvider:
         Raises:
             LLMError: при неуспешном запросе после всех retry
         """
+        self._request_started()
+        try:
+            return await self._chat_completion(messages, temperature, max_tokens, **kwargs)
+        finally:
+            self._request_finished()
+
+    async def _chat_completion(
+        self,
+        messages: list[dict],
+        temperature: float,
+        max_tokens: int,
+        **kwargs,
+    ) -> dict:
         client = await self._get_client()
 
         payload = {
@@ -105,8 +585,11 @@ class LLMProvider:
         }
 
         last_error: Optional[Exception] = None
+        reserved = self._estimate_tokens(messages, max_tokens)
 
         for attempt in range(1, self.max_retries + 1):
+            await self._acquire_quota(reserved)
+            settled = False
             start_time = time.monotonic()
             try:
                 response = await client.post(
@@ -115,16 +598,24 @@ class LLMProvider:
                 )
 
                 elapsed = time.monotonic() - start_time
+                self.rate_limiter.observe(response.headers)
 
                 # Успешный ответ
                 if response.status_code == 200:
                     data = response.json()
+                    usage = data.get("usage") or {}
+                    self.rate_limiter.settle(reserved, usage.get("total_tokens"))
+                    settled = True
                     logger.info(
                         f"✅ [{self.name}] ответ за {elapsed:.1f}с "
                         f"(модель={self.model}, попытка={attempt})"
                     )
                     return data
 
+                # Отказ провайдера — токены не потрачены, резерв возвращается
+                self.rate_limiter.settle(reserved, 0)
+                settled = True
+
                 # 503 — модель загружается (Featherless cold start)
                 if response.status_code == 503:
                     logger.warning(
@@ -140,19 +631,17 @@ class LLMProvider:
                         f"модель {self.model} не загрузилась"
                     )
 
-                # 429 — rate limit
+                # 429 — rate limit: пауза и снижение скорости в лимитере,
+                # повтор ждёт квоту там же (или уходит к другому провайдеру)
                 if response.status_code == 429:
-                    retry_after = float(
-                        response.headers.get("Retry-After", "5")
-                    )
+                    retry_after = self.rate_limiter.on_rate_limited(response.headers)
                     logger.warning(
                         f"🚫 [{self.name}] 429 Rate Limit — "
                         f"ожидание {retry_after}с"
                     )
                     if attempt < self.max_retries:
-                        await asyncio.sleep(retry_after)
                         continue
-                    raise LLMError(
+                    raise RateLimitedError(
                         f"[{self.name}] Rate limit после {self.max_retries} попыток"
                     )
 
@@ -169,16 +658,191 @@ class LLMProvider:
                     f"(попытка {attempt}/{self.max_retries}): {e}"
                 )
                 last_error = e
-                if attempt < self.max_retries:
-                    await asyncio.sleep(5)
-                    continue
 
             except httpx.NetworkError as e:
                 logger.error(f"🔌 [{self.name}] Сетевая ошибка: {e}")
                 last_error = e
-                if attempt < self.max_retries:
-                    await asyncio.sleep(5)
-                    continue
+
+            finally:
+                if not settled:
+                    # Попытка оборвалась (таймаут, сеть, битый ответ, отмена) —
+                    # резерв возвращается до паузы и следующей попытки
+                    self.rate_limiter.settle(reserved, 0)
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(5)
+
+        raise LLMError(
+            f"[{self.name}] Все {self.max_retries} попыток исчерпаны: {last_error}"
+        )
+
+    async def stream_chat_completion(
+        self,
+        messages: list[dict],
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый запрос к /chat/completions (stream=True, SSE).
+
+        Retry при 503/429/таймаутах выполняется только до первого
+        полученного фрагмента — после начала генерации ошибка
+        пробрасывается как есть.
+
+        Yields:
+            str — очередной фрагмент текста ответа
+
+        Raises:
+            LLMError: при неуспешном запросе после всех retry
+        """
+        self._request_started()
+        stream = self._stream_chat_completion(messages, temperature, max_tokens, **kwargs)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            # Закрытый потребителем поток сразу возвращает резерв квоты
+            await stream.aclose()
+            self._request_finished()
+
+    async def _stream_chat_completion(
+        self,
+        messages: list[dict],
+        temperature: float,
+        max_tokens: int,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        client = await self._get_client()
+
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            **kwargs,
+        }
+
+        last_error: Optional[Exception] = None
+        reserved = self._estimate_tokens(messages, max_tokens)
+        prompt_tokens = reserved - max_tokens
+
+        for attempt in range(1, self.max_retries + 1):
+            await self._acquire_quota(reserved)
+            start_time = time.monotonic()
+            received = False
+            settled = False
+            generated: list[str] = []
+            try:
+                async with client.stream(
+                    "POST",
+                    "/chat/completions",
+                    json=payload,
+                ) as response:
+                    self.rate_limiter.observe(response.headers)
+                    if response.status_code != 200:
+                        # Отказ провайдера — токены не потрачены, резерв возвращается
+                        self.rate_limiter.settle(reserved, 0)
+                        settled = True
+                    if response.status_code == 503:
+                        logger.warning(
+                            f"⏳ [{self.name}] 503 — модель загружается "
+                            f"(stream, попытка {attempt}/{self.max_retries}, "
+                            f"ожидание {self.retry_delay}с)"
+                        )
+                        if attempt < self.max_retries:
+                            await asyncio.sleep(self.retry_delay)
+                            continue
+                        raise LLMError(
+                            f"[{self.name}] 503 после {self.max_retries} попыток — "
+                            f"модель {self.model} не загрузилась"
+                        )
+
+                    if response.status_code == 429:
+                        retry_after = self.rate_limiter.on_rate_limited(response.headers)
+                        logger.warning(
+                            f"🚫 [{self.name}] 429 Rate Limit (stream) — "
+                            f"ожидание {retry_after}с"
+                        )
+                        if attempt < self.max_retries:
+                            continue
+                        raise RateLimitedError(
+                            f"[{self.name}] Rate limit после {self.max_retries} попыток"
+                        )
+
+                    if response.status_code != 200:
+                        error_body = (await response.aread()).decode(
+                            "utf-8", errors="replace"
+                        )[:500]
+                        raise LLMError(
+                            f"[{self.name}] HTTP {response.status_code}: {error_body}"
+                        )
+
+                    used: Optional[int] = None
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                            used = (chunk.get("usage") or {}).get("total_tokens", used)
+                            delta = chunk["choices"][0].get("delta") or {}
+                        except (ValueError, KeyError, IndexError, AttributeError):
+                            logger.debug(f"[{self.name}] пропущен SSE-фрагмент: {data[:200]}")
+                            continue
+                        content = delta.get("content")
+                        if content:
+                            if not received:
+                                logger.info(
+                                    f"⚡ [{self.name}] первый токен за "
+                                    f"{time.monotonic() - start_time:.1f}с "
+                                    f"(модель={self.model}, попытка={attempt})"
+                                )
+                            received = True
+                            generated.append(content)
+                            yield content
+
+                if used is None:
+                    self._settle_generated(reserved, prompt_tokens, generated)
+                else:
+                    self.rate_limiter.settle(reserved, used)
+                settled = True
+                logger.info(
+                    f"✅ [{self.name}] поток завершён за "
+                    f"{time.monotonic() - start_time:.1f}с"
+                )
+                return
+
+            except httpx.TimeoutException as e:
+                elapsed = time.monotonic() - start_time
+                if received:
+                    raise LLMError(f"[{self.name}] Таймаут во время генерации: {e}")
+                logger.warning(
+                    f"⏱️ [{self.name}] Таймаут {elapsed:.1f}с "
+                    f"(stream, попытка {attempt}/{self.max_retries}): {e}"
+                )
+                last_error = e
+
+            except httpx.NetworkError as e:
+                if received:
+                    raise LLMError(f"[{self.name}] Обрыв соединения во время генерации: {e}")
+                logger.error(f"🔌 [{self.name}] Сетевая ошибка (stream): {e}")
+                last_error = e
+
+            finally:
+                if not settled:
+                    # Попытка оборвалась (таймаут, сеть, отмена, поток закрыт
+                    # потребителем): в расход — только уже сгенерированное
+                    if received:
+                        self._settle_generated(reserved, prompt_tokens, generated)
+                    else:
+                        self.rate_limiter.settle(reserved, 0)
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(5)
 
         raise LLMError(
             f"[{self.name}] Все {self.max_retries} попыток исчерпаны: {last_error}"
@@ -202,7 +866,15 @@ class LLMService:
 
     def __init__(self):
         self.providers: list[LLMProvider] = []
+        self.cache = ResponseCache(settings.llm_cache, redis_url=settings.REDIS_URL)
+        self._inflight = SingleFlight()
+        self.latency = LatencyTracker(settings.llm_routing)
         self._init_providers()
+        self.breakers: dict[str, CircuitBreaker] = {
+            p.name: CircuitBreaker(p.name, settings.llm_routing) for p in self.providers
+        }
+        self.scheduler = LLMScheduler(settings.llm_scheduler, capacity=self._capacity)
+        self._probe_task: Optional[asyncio.Task] = None
 
     def _init_providers(self):
         """Инициализация провайдеров из конфига в порядке приоритета."""
@@ -217,6 +889,10 @@ class LLMService:
                 timeout=settings.featherless.timeout,         # 180с
                 max_retries=settings.featherless.max_retries,  # 3
                 retry_delay=30.0,
+                transport=settings.featherless.transport,
+                context_window=settings.featherless.context_window,
+                max_concurrency=settings.featherless.max_concurrency,
+                rate_limit=settings.featherless.rate_limit,
             ))
             logger.info(
                 f"🪶 Featherless: модель={settings.featherless.model}, "
@@ -233,6 +909,10 @@ class LLMService:
                 timeout=settings.perplexity.timeout,
                 max_retries=2,
                 retry_delay=5.0,
+                transport=settings.perplexity.transport,
+                context_window=settings.perplexity.context_window,
+                max_concurrency=settings.perplexity.max_concurrency,
+                rate_limit=settings.perplexity.rate_limit,
             ))
             logger.info(f"🔍 Perplexity: модель={settings.perplexity.model}")
 
@@ -246,6 +926,10 @@ class LLMService:
                 timeout=settings.openai.timeout,
                 max_retries=2,
                 retry_delay=5.0,
+                transport=settings.openai.transport,
+                context_window=settings.openai.context_window,
+                max_concurrency=settings.openai.max_concurrency,
+                rate_limit=settings.openai.rate_limit,
             ))
             logger.info(f"🤖 OpenAI: модель={settings.openai.model}")
 
@@ -258,6 +942,10 @@ class LLMService:
         temperature: float = 0.7,
         max_tokens: int = 2048,
         preferred_provider: Optional[str] = None,
+        cache_feature: Optional[str] = None,
+        user_id: Optional[int] = None,
+        priority: Priority = Priority.NORMAL,
+        on_queue: Optional[PositionCallback] = None,
         **kwargs,
     ) -> dict:
         """
@@ -268,6 +956,10 @@ class LLMService:
             temperature: Температура
             max_tokens: Лимит токенов
             preferred_provider: Принудительный выбор провайдера (по имени)
+            cache_feature: Имя фичи для кэша ответов (None — без кэша)
+            user_id: Пользователь (справедливая очередь LLMScheduler)
+            priority: Полоса очереди (PAID — оплатившие)
+            on_queue: Колбэк позиции в очереди (1, 2, ...; 0 — запрос начат)
             **kwargs: Доп. параметры
 
         Returns:
@@ -275,25 +967,179 @@ class LLMService:
 
         Raises:
             AllProvidersFailedError: если все провайдеры упали
+            QueueFullError: у пользователя слишком много запросов в очереди
         """
-        errors: list[str] = []
+        request_key = self._cache_key(
+            messages, temperature, max_tokens, preferred_provider, **kwargs
+        )
+        cacheable = self.cache.is_cacheable(cache_feature, temperature)
+        if cacheable:
+            cached = await self.cache.get(request_key)
+            if cached is not None:
+                logger.debug(f"💾 LLM-кэш: попадание ({cache_feature})")
+                return cached
+
+        data = await self._chat_completion_uncached(
+            request_key,
+            user_id=user_id,
+            priority=priority,
+            on_queue=on_queue,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            preferred_provider=preferred_provider,
+            **kwargs,
+        )
+
+        if cacheable and _extract_content(data):
+            await self.cache.set(request_key, data, cache_feature)
+        return data
+
+    def _cache_key(
+        self,
+        messages: list[dict],
+        temperature: float,
+        max_tokens: int,
+        preferred_provider: Optional[str],
+        **kwargs,
+    ) -> str:
+        """Ключ кэша: отпечаток запроса + цепочка моделей провайдеров."""
+        models = ",".join(p.model for p in self._priority_order(preferred_provider))
+        return request_fingerprint(messages, models, temperature, max_tokens, **kwargs)
+
+    def _priority_order(self, preferred_provider: Optional[str] = None) -> list[LLMProvider]:
+        """Провайдеры в порядке приоритета из конфига: preferred_provider первым."""
+        if not preferred_provider:
+            return self.providers
+        return sorted(
+            self.providers,
+            key=lambda p: p.name.lower() != preferred_provider.lower(),
+        )
+
+    def _capacity(self) -> int:
+        """Ёмкость очереди: сумма лимитов параллельности здоровых провайдеров."""
+        capacity = sum(
+            p.max_concurrency for p in self.providers if self.breakers[p.name].available()
+        )
+        # Без здоровых провайдеров запрос всё равно пропускается — и быстро
+        # завершается ошибкой, а не висит в очереди
+        return max(capacity, 1)
+
+    def _ordered_providers(
+        self,
+        preferred_provider: Optional[str] = None,
+        latency_key: str = "",
+    ) -> list[LLMProvider]:
+        """
+        Провайдеры в порядке опроса с учётом здоровья.
+
+        Разомкнутые circuit breaker'ом пропускаются; остальные (при
+        prefer_fastest) сортируются по медианной задержке, провайдеры без
+        статистики получают дедлайн по умолчанию. preferred_provider — первым.
+        """
+        cfg = settings.llm_routing
+        providers = [p for p in self.providers if self.breakers[p.name].available()]
+
+        if cfg.prefer_fastest:
+            def speed(p: LLMProvider) -> float:
+                key = p.name + latency_key
+                if self.latency.count(key) < cfg.min_samples:
+                    return cfg.hedge_default_delay
+                return self.latency.percentile(key, 0.5) or cfg.hedge_default_delay
+
+            providers.sort(key=speed)
+
+        # Провайдеры с занятыми слотами или исчерпанной квотой — в конец
+        # (запрос ждал бы свободного места)
+        providers.sort(key=lambda p: p.slots.locked() or p.rate_limiter.throttled)
 
-        # Сортировка: preferred_provider первым
-        providers = self.providers
         if preferred_provider:
-            providers = sorted(
-                self.providers,
-                key=lambda p: p.name.lower() != preferred_provider.lower(),
+            providers.sort(key=lambda p: p.name.lower() != preferred_provider.lower())
+        return providers
+
+    def _no_healthy_providers(self) -> AllProvidersFailedError:
+        """Ошибка «все провайдеры отключены» (без сетевых попыток)."""
+        opened = ", ".join(
+            name for name, b in self.breakers.items() if b.state != CircuitState.CLOSED
+        )
+        return AllProvidersFailedError(
+            f"Все провайдеры временно отключены circuit breaker'ом: {opened or '—'}"
+        )
+
+    def _on_provider_failure(self, provider: LLMProvider) -> None:
+        """Учёт ошибки провайдера; при размыкании цепи — запуск фоновой проверки."""
+        breaker = self.breakers[provider.name]
+        breaker.record_failure()
+        if breaker.state == CircuitState.OPEN:
+            self._ensure_probe()
+
+    def _ensure_probe(self) -> None:
+        """Запустить фоновую проверку разомкнутых провайдеров (если ещё не запущена)."""
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    async def _probe_loop(self) -> None:
+        """
+        Пока есть разомкнутые провайдеры — раз в probe_interval проверяем их
+        через health_check и замыкаем цепь у ответивших.
+        """
+        while True:
+            await asyncio.sleep(settings.llm_routing.probe_interval)
+            opened = [
+                p for p in self.providers
+                if self.breakers[p.name].state != CircuitState.CLOSED
+            ]
+            if not opened:
+                return
+            results = await self.health_check(providers=opened)
+            for provider in opened:
+                breaker = self.breakers[provider.name]
+                if results.get(provider.name):
+                    breaker.close()
+                else:
+                    breaker.trip("фоновая проверка не прошла")
+
+    async def _chat_completion_uncached(
+        self,
+        request_key: str,
+        user_id: Optional[int] = None,
+        priority: Priority = Priority.NORMAL,
+        on_queue: Optional[PositionCallback] = None,
+        **request,
+    ) -> dict:
+        """
+        Запрос к провайдерам (без кэша) через очередь LLMScheduler.
+
+        Каждый вызов проходит очередь сам (своя полоса, позиция и лимит
+        ожидающих) и только после допуска присоединяется к одинаковому
+        запросу «в полёте» — общий ответ провайдера на всех.
+        """
+        async with self.scheduler.slot(user_id, priority, on_queue):
+            return await self._inflight.do(
+                request_key, lambda: self._chat_completion_routed(**request)
             )
 
+    async def _chat_completion_routed(
+        self,
+        messages: list[dict],
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        preferred_provider: Optional[str] = None,
+        **kwargs,
+    ) -> dict:
+        """Запрос к провайдерам: хеджированно или по очереди."""
+        providers = self._ordered_providers(preferred_provider)
+        if not providers:
+            raise self._no_healthy_providers()
+        request = dict(messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        if settings.llm_routing.hedging_enabled and len(providers) > 1:
+            return await self._hedged_chat_completion(providers, request)
+
+        errors: list[str] = []
+
         for provider in providers:
             try:
-                return await provider.chat_completion(
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    **kwargs,
-                )
+                return await self._call_provider(provider, request)
             except LLMError as e:
                 error_msg = str(e)
                 errors.append(error_msg)
@@ -308,6 +1154,353 @@ class LLMService:
             "\n".join(f"  • {e}" for e in errors)
         )
 
+    async def _call_provider(self, provider: LLMProvider, request: dict) -> dict:
+        """Запрос к одному провайдеру в пределах его лимита параллельности."""
+        async with provider.slots:
+            return await self._call_provider_unbounded(provider, request)
+
+    async def _call_provider_unbounded(self, provider: LLMProvider, request: dict) -> dict:
+        """Запрос к одному провайдеру через circuit breaker с замером задержки."""
+        breaker = self.breakers[provider.name]
+        if not breaker.acquire():
+            raise CircuitOpenError(f"[{provider.name}] circuit open — провайдер пропущен")
+
+        start = time.monotonic()
+        try:
+            data = await provider.chat_completion(**request)
+        except RateLimitedError:
+            # Исчерпанная квота — не поломка провайдера: breaker не трогаем
+            breaker.release()
+            raise
+        except LLMError:
+            self._on_provider_failure(provider)
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+
+        elapsed = time.monotonic() - start
+        self.latency.record(provider.name, elapsed)
+        breaker.record_success(elapsed)
+        return data
+
+    async def _stream_provider(self, provider: LLMProvider, request: dict) -> AsyncIterator[str]:
+        """Поток одного провайдера в пределах его лимита параллельности."""
+        async with provider.slots:
+            stream = self._stream_provider_unbounded(provider, request)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+    async def _stream_provider_unbounded(
+        self, provider: LLMProvider, request: dict,
+    ) -> AsyncIterator[str]:
+        """Поток одного провайдера через circuit breaker; задержка — до первого токена."""
+        breaker = self.breakers[provider.name]
+        if not breaker.acquire():
+            raise CircuitOpenError(f"[{provider.name}] circuit open — провайдер пропущен")
+
+        start = time.monotonic()
+        started = False
+        stream = provider.stream_chat_completion(**request)
+        try:
+            async for chunk in stream:
+                if not started:
+                    started = True
+                    elapsed = time.monotonic() - start
+                    self.latency.record(f"{provider.name}:stream", elapsed)
+                    breaker.record_success(elapsed)
+                yield chunk
+        except RateLimitedError:
+            if not started:
+                breaker.release()
+            raise
+        except LLMError:
+            self._on_provider_failure(provider)
+            raise
+        except BaseException:
+            if not started:
+                breaker.release()
+            raise
+        finally:
+            await stream.aclose()
+
+    async def _hedged_chat_completion(
+        self,
+        providers: list[LLMProvider],
+        request: dict,
+    ) -> dict:
+        """
+        Хеджированный запрос.
+
+        Стартует первый провайдер; если он не ответил за свой дедлайн
+        (p95 наблюдаемых задержек), параллельно стартует следующий.
+        Ошибка провайдера сразу запускает следующего. Побеждает первый
+        успешный ответ, остальные запросы отменяются.
+        """
+        queue = list(providers)
+        pending: dict[asyncio.Task, LLMProvider] = {}
+        errors: list[str] = []
+        deadline_at = 0.0
+
+        def launch() -> None:
+            nonlocal deadline_at
+            provider = queue.pop(0)
+            task = asyncio.ensure_future(self._call_provider(provider, request))
+            pending[task] = provider
+            deadline_at = time.monotonic() + self.latency.hedge_delay(provider.name)
+
+        launch()
+        try:
+            while pending:
+                timeout = max(0.0, deadline_at - time.monotonic()) if queue else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    slow = ", ".join(p.name for p in pending.values())
+                    logger.info(
+                        f"🏁 Хеджирование: {slow} не ответил за дедлайн — "
+                        f"параллельно запускаю {queue[0].name}"
+                    )
+                    launch()
+                    continue
+
+                failed = False
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        data = task.result()
+                    except LLMError as e:
+                        failed = True
+                        errors.append(str(e))
+                        logger.warning(f"⚠️ [{provider.name}] не удалось (hedged): {e}")
+                        continue
+                    if pending:
+                        losers = ", ".join(p.name for p in pending.values())
+                        logger.info(f"🏆 Хеджирование: ответил {provider.name}, отменяю {losers}")
+                    return data
+
+                if failed and queue:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        raise AllProvidersFailedError(
+            f"Все провайдеры недоступны:\n" +
+            "\n".join(f"  • {e}" for e in errors)
+        )
+
+    async def stream_chat_completion(
+        self,
+        messages: list[dict],
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        preferred_provider: Optional[str] = None,
+        cache_feature: Optional[str] = None,
+        user_id: Optional[int] = None,
+        priority: Priority = Priority.NORMAL,
+        on_queue: Optional[PositionCallback] = None,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый запрос к LLM с fallback.
+
+        Переключение на следующий провайдер возможно только до первого
+        фрагмента: начатый ответ не склеивается из разных моделей.
+        Попадание в кэш отдаётся одним фрагментом. Место в очереди
+        (user_id, priority, on_queue — как в chat_completion) занято
+        на всё время потока.
+
+        Yields:
+            str — фрагменты текста ответа
+
+        Raises:
+            AllProvidersFailedError: если ни один провайдер не начал отвечать
+            LLMError: если генерация оборвалась на середине
+        """
+        request_key = self._cache_key(
+            messages, temperature, max_tokens, preferred_provider, **kwargs
+        )
+        cacheable = self.cache.is_cacheable(cache_feature, temperature)
+        if cacheable:
+            cached = await self.cache.get(request_key)
+            content = _extract_content(cached) if cached else None
+            if content:
+                logger.debug(f"💾 LLM-кэш: попадание ({cache_feature}, stream)")
+                yield content
+                return
+
+        async def produce() -> AsyncIterator[str]:
+            parts: list[str] = []
+            async for chunk in self._stream_chat_completion_routed(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                preferred_provider=preferred_provider,
+                **kwargs,
+            ):
+                parts.append(chunk)
+                yield chunk
+            if cacheable and parts:
+                await self.cache.set(request_key, _completion_from_text("".join(parts)), cache_feature)
+
+        async for chunk in self._stream_chat_completion_uncached(
+            request_key, produce, user_id, priority, on_queue,
+        ):
+            yield chunk
+
+    async def _stream_chat_completion_uncached(
+        self,
+        request_key: str,
+        produce: Callable[[], AsyncIterator[str]],
+        user_id: Optional[int] = None,
+        priority: Priority = Priority.NORMAL,
+        on_queue: Optional[PositionCallback] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый опрос провайдеров (без кэша) через очередь LLMScheduler.
+        Как в _chat_completion_uncached: сначала допуск в очередь, затем
+        чтение общего потока одинаковых запросов.
+        """
+        async with self.scheduler.slot(user_id, priority, on_queue):
+            async for chunk in self._inflight.stream(request_key, produce):
+                yield chunk
+
+    async def _stream_chat_completion_routed(
+        self,
+        messages: list[dict],
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        preferred_provider: Optional[str] = None,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """Потоковый опрос провайдеров: хеджированно или по очереди."""
+        providers = self._ordered_providers(preferred_provider, latency_key=":stream")
+        if not providers:
+            raise self._no_healthy_providers()
+        request = dict(messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        if settings.llm_routing.hedging_enabled and len(providers) > 1:
+            async for chunk in self._hedged_stream(providers, request):
+                yield chunk
+            return
+
+        errors: list[str] = []
+
+        for provider in providers:
+            started = False
+            try:
+                async for chunk in self._stream_provider(provider, request):
+                    started = True
+                    yield chunk
+                return
+            except LLMError as e:
+                if started:
+                    raise
+                error_msg = str(e)
+                errors.append(error_msg)
+                logger.warning(
+                    f"⚠️ [{provider.name}] поток не начался — "
+                    f"переключаюсь на следующий провайдер: {error_msg}"
+                )
+                continue
+
+        raise AllProvidersFailedError(
+            f"Все провайдеры недоступны:\n" +
+            "\n".join(f"  • {e}" for e in errors)
+        )
+
+    async def _hedged_stream(
+        self,
+        providers: list[LLMProvider],
+        request: dict,
+    ) -> AsyncIterator[str]:
+        """
+        Хеджированный поток: дедлайн считается по времени до первого токена.
+        Победитель — первый провайдер, выдавший фрагмент; остальные потоки закрываются.
+        """
+        queue = list(providers)
+        pending: dict[asyncio.Task, tuple[LLMProvider, AsyncIterator[str], float]] = {}
+        errors: list[str] = []
+        deadline_at = 0.0
+        winner: Optional[tuple[LLMProvider, AsyncIterator[str], Optional[str]]] = None
+
+        def launch() -> None:
+            nonlocal deadline_at
+            provider = queue.pop(0)
+            stream = self._stream_provider(provider, request)
+            task = asyncio.ensure_future(stream.__anext__())
+            started_at = time.monotonic()
+            pending[task] = (provider, stream, started_at)
+            deadline_at = started_at + self.latency.hedge_delay(f"{provider.name}:stream")
+
+        launch()
+        try:
+            while pending and winner is None:
+                timeout = max(0.0, deadline_at - time.monotonic()) if queue else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    slow = ", ".join(p.name for p, _, _ in pending.values())
+                    logger.info(
+                        f"🏁 Хеджирование (stream): {slow} молчит дольше дедлайна — "
+                        f"параллельно запускаю {queue[0].name}"
+                    )
+                    launch()
+                    continue
+
+                failed = False
+                for task in done:
+                    provider, stream, started_at = pending.pop(task)
+                    try:
+                        first: Optional[str] = task.result()
+                    except StopAsyncIteration:
+                        first = None
+                    except LLMError as e:
+                        failed = True
+                        errors.append(str(e))
+                        logger.warning(f"⚠️ [{provider.name}] поток не начался (hedged): {e}")
+                        await stream.aclose()
+                        continue
+                    winner = (provider, stream, first)
+                    break
+
+                if failed and queue and winner is None:
+                    launch()
+        finally:
+            for task, (provider, stream, _) in pending.items():
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                for _, stream, _ in pending.values():
+                    await stream.aclose()
+
+        if winner is None:
+            raise AllProvidersFailedError(
+                f"Все провайдеры недоступны:\n" +
+                "\n".join(f"  • {e}" for e in errors)
+            )
+
+        provider, stream, first = winner
+        if pending:
+            logger.info(f"🏆 Хеджирование (stream): первым ответил {provider.name}")
+        if first is None:
+            return
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
     async def chat(
         self,
         user_message: str,
@@ -322,6 +1515,7 @@ class LLMService:
         Args:
             user_message: Сообщение пользователя
             system_prompt: Системный промпт
+            **kwargs: Как в chat_completion (user_id, priority, on_queue, ...)
 
         Returns:
             str — текст ответа
@@ -345,15 +1539,44 @@ class LLMService:
             logger.error(f"❌ Неожиданный формат ответа: {e}\nData: {data}")
             raise LLMError(f"Неожиданный формат ответа LLM: {e}")
 
-    async def health_check(self) -> dict[str, bool]:
+    def context_provider(self) -> Optional[LLMProvider]:
         """
-        Проверка доступности каждого провайдера.
+        Провайдер с самым узким окном контекста: запрос может уйти любому
+        (fallback, хеджирование), поэтому бюджет диалога считается по нему.
+        """
+        if not self.providers:
+            return None
+        return min(self.providers, key=lambda p: p.context_window)
+
+    async def warm_up(self) -> dict[str, int]:
+        """Прогрев пулов соединений всех провайдеров (параллельно)."""
+        results = await asyncio.gather(
+            *(p.warm_up() for p in self.providers), return_exceptions=True
+        )
+        return {
+            p.name: r if isinstance(r, int) else 0
+            for p, r in zip(self.providers, results, strict=True)
+        }
+
+    def pool_stats(self) -> dict[str, dict[str, Any]]:
+        """Занятость пулов соединений по провайдерам (для /metrics)."""
+        return {p.name: p.pool_stats() for p in self.providers}
+
+    async def health_check(
+        self,
+        providers: Optional[list[LLMProvider]] = None,
+    ) -> dict[str, bool]:
+        """
+        Проверка доступности каждого провайдера (минуя circuit breaker).
+
+        Args:
+            providers: Подмножество провайдеров (по умолчанию — все)
 
         Returns:
             {"Featherless": True, "Perplexity": False, ...}
         """
         results = {}
-        for provider in self.providers:
+        for provider in providers if providers is not None else self.providers:
             try:
                 await provider.chat_completion(
                     messages=[{"role": "user", "content": "ping"}],
@@ -367,11 +1590,36 @@ class LLMService:
 
     async def close(self):
         """Закрытие всех httpx-клиентов."""
+        if self._probe_task and not self._probe_task.done():
+            self._probe_task.cancel()
         for provider in self.providers:
             await provider.close()
+        await self.cache.close()
         logger.info("🔒 Все LLM-клиенты закрыты")
 
 
+def _http2_available() -> bool:
+    """Установлен ли пакет h2 (нужен httpx для HTTP/2)."""
+    try:
+        import h2
+    except ImportError:
+        return False
+    return True
+
+
+def _extract_content(data: Optional[dict]) -> Optional[str]:
+    """Текст ответа из формата /chat/completions (None при неожиданном формате)."""
+    try:
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _completion_from_text(text: str) -> dict:
+    """Ответ в формате /chat/completions из готового текста (для кэша стриминга)."""
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+
+
 # === Синглтон ===
 _llm_service: Optional[LLMService] = None
 
@@ -0,0 +1,304 @@
+"""
+MysticBot — клиентский rate limiter LLM-провайдеров.
+
+Два token bucket на провайдера: запросы в минуту (RPM) и токены в минуту
+(TPM). Запрос заранее резервирует квоту и ждёт своей очереди в лимитере,
+а не получает 429 от провайдера. Лимиты уточняются на ходу:
+- заголовки x-ratelimit-* / ratelimit-* задают лимит и остаток квоты;
+- 429 снижает скорость (множитель backoff_factor) и ставит паузу
+  на Retry-After; скорость затем плавно восстанавливается.
+Если лимит неизвестен (не задан и заголовков нет), первый 429 оценивает
+его по числу запросов за последнюю минуту.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Mapping, Optional
+
+from bot.config import RateLimitConfig
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 60.0               # лимиты провайдеров — в минуту
+MIN_FACTOR = 0.1            # ниже этой доли лимита скорость не опускается
+BACKOFF_COOLDOWN = 2.0      # 429 от параллельных запросов снижают скорость один раз
+ESTIMATE_TTL = 300.0        # оценка лимита по 429 забывается через 5 мин без 429
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Длительность из заголовка: "20", "1.5", "6m0s", "20ms" → секунды.
+    None — если разобрать не удалось.
+    """
+    if not value:
+        return None
+    value = value.strip().lower()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(num) * _DURATION_UNITS[unit] for num, unit in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Пауза из Retry-After (секунды или HTTP-дата) / retry-after-ms."""
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(float(ms) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _header_int(headers: Mapping[str, str], *names: str) -> Optional[int]:
+    for name in names:
+        value = headers.get(name)
+        if value:
+            try:
+                return int(float(value.split(",")[0]))
+            except ValueError:
+                continue
+    return None
+
+
+class TokenBucket:
+    """
+    Token bucket на минуту: ёмкость limit, пополнение limit/60 в секунду.
+    Резерв может увести баланс в минус — следующий запрос ждёт, пока долг
+    не вернётся (очерёдность «кто раньше зарезервировал»).
+    """
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit                  # 0 — лимит неизвестен, не ограничиваем
+        self.tokens = float(limit)
+        self._updated = time.monotonic()
+
+    @property
+    def known(self) -> bool:
+        return self.limit > 0
+
+    def _refill(self, now: float, factor: float) -> None:
+        if self.known:
+            rate = self.limit * factor / WINDOW
+            self.tokens = min(self.limit, self.tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def delay(self, amount: float, now: float, factor: float) -> float:
+        """Сколько ждать, если зарезервировать amount сейчас."""
+        self._refill(now, factor)
+        if not self.known:
+            return 0.0
+        deficit = min(amount, self.limit) - self.tokens
+        return max(deficit, 0.0) / (self.limit * factor / WINDOW)
+
+    def take(self, amount: float) -> None:
+        if self.known:
+            self.tokens -= amount
+
+    def give(self, amount: float) -> None:
+        if self.known:
+            self.tokens = min(self.limit, self.tokens + amount)
+
+    def set_limit(self, limit: int) -> None:
+        if limit <= 0 or limit == self.limit:
+            return
+        if not self.known:
+            self.tokens = float(limit)
+        else:
+            self.tokens = min(self.tokens, float(limit))
+        self.limit = limit
+
+    def sync(self, remaining: int) -> None:
+        """Остаток квоты по данным провайдера (учитывает и чужие процессы)."""
+        if self.known:
+            self.tokens = min(self.tokens, float(remaining))
+
+
+class ProviderRateLimiter:
+    """
+    Лимитер одного провайдера: RPM + TPM, пауза после 429, AIMD-подстройка.
+
+    acquire() резервирует квоту (1 запрос + оценка токенов) и ждёт своей
+    очереди; settle() после ответа возвращает неизрасходованные токены.
+    """
+
+    def __init__(self, name: str, config: RateLimitConfig):
+        self.name = name
+        self.config = config
+        self.requests = TokenBucket(config.requests_per_minute)
+        self.tokens = TokenBucket(config.tokens_per_minute)
+        self.factor = 1.0                       # доля лимита, которую используем
+        self._factor_updated = time.monotonic()
+        self._last_backoff = 0.0
+        self._blocked_until = 0.0               # пауза по Retry-After
+        self._estimated = False                 # лимит запросов оценён по 429, а не известен
+        self._recent: deque[float] = deque()    # время запросов за последнюю минуту
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+        self.rejected = 0
+
+    def _current_factor(self, now: float) -> float:
+        """Плавное восстановление скорости после 429 (recovery_per_minute)."""
+        if self.factor < 1.0:
+            minutes = (now - self._factor_updated) / WINDOW
+            self.factor = min(1.0, self.factor + minutes * self.config.recovery_per_minute)
+        self._factor_updated = now
+        return self.factor
+
+    def delay(self, tokens: int = 0) -> float:
+        """Сколько ждал бы запрос сейчас (без резерва)."""
+        if not self.config.enabled:
+            return 0.0
+        now = time.monotonic()
+        if self._estimated and now - self._last_backoff > ESTIMATE_TTL:
+            # Давно без 429 — снимаем оценку, следующий 429 оценит заново
+            self._estimated = False
+            self.requests = TokenBucket(self.config.requests_per_minute)
+        factor = self._current_factor(now)
+        return max(
+            self._blocked_until - now,
+            self.requests.delay(1, now, factor),
+            self.tokens.delay(tokens, now, factor),
+        )
+
+    @property
+    def throttled(self) -> bool:
+        """Запрос сейчас пришлось бы придержать."""
+        return self.delay() > 0
+
+    async def acquire(self, tokens: int) -> bool:
+        """
+        Зарезервировать 1 запрос и tokens токенов и дождаться квоты.
+
+        Returns:
+            False — ждать пришлось бы дольше max_wait (резерв не сделан)
+        """
+        if not self.config.enabled:
+            return True
+        wait = self.delay(tokens)
+        if wait > self.config.max_wait:
+            self.rejected += 1
+            return False
+
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        now = time.monotonic()
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - WINDOW:
+            self._recent.popleft()
+
+        if wait > 0:
+            self.waits += 1
+            self.wait_seconds += wait
+            logger.debug(f"🪣 [{self.name}] ожидание квоты {wait:.2f}с")
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Отменённый запрос возвращает резерв
+                self.requests.give(1)
+                self.tokens.give(tokens)
+                raise
+        return True
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """Сверить резерв токенов с фактическим расходом (usage из ответа)."""
+        if used is None or not self.config.enabled:
+            return
+        if used < reserved:
+            self.tokens.give(reserved - used)
+        else:
+            self.tokens.take(used - reserved)
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Лимиты и остаток квоты из заголовков ответа."""
+        if not self.config.enabled:
+            return
+        rpm = _header_int(headers, "x-ratelimit-limit-requests", "x-ratelimit-limit", "ratelimit-limit")
+        left = _header_int(
+            headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining", "ratelimit-remaining",
+        )
+        tpm = _header_int(headers, "x-ratelimit-limit-tokens")
+        tokens_left = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if rpm:
+            self._estimated = False
+            if rpm != self.requests.limit:
+                logger.info(f"🪣 [{self.name}] лимит запросов по заголовкам: {rpm}/мин")
+            self.requests.set_limit(rpm)
+        if tpm:
+            if tpm != self.tokens.limit:
+                logger.info(f"🪣 [{self.name}] лимит токенов по заголовкам: {tpm}/мин")
+            self.tokens.set_limit(tpm)
+        if left is not None:
+            self.requests.sync(left)
+        if tokens_left is not None:
+            self.tokens.sync(tokens_left)
+
+    def on_rate_limited(self, headers: Mapping[str, str], default_wait: float = 5.0) -> float:
+        """
+        Ответ 429: пауза на Retry-After и снижение скорости.
+
+        Returns:
+            float — пауза в секундах
+        """
+        self.rate_limited += 1
+        retry_after = parse_retry_after(headers)
+        if retry_after is None:
+            retry_after = default_wait
+        if not self.config.enabled:
+            return retry_after
+
+        self.observe(headers)
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + retry_after)
+        # Квота исчерпана — локальные ведра тоже пусты
+        self.requests.sync(0)
+        if _header_int(headers, "x-ratelimit-remaining-tokens") == 0:
+            self.tokens.sync(0)
+
+        if not self.requests.known:
+            observed = len(self._recent)
+            estimate = max(1, int(observed * self.config.backoff_factor))
+            self.requests.set_limit(estimate)
+            self.requests.sync(0)
+            self._estimated = True
+            logger.warning(
+                f"🪣 [{self.name}] лимит запросов неизвестен — оценка по 429: {estimate}/мин"
+            )
+        elif now - self._last_backoff > BACKOFF_COOLDOWN:
+            self.factor = max(MIN_FACTOR, self._current_factor(now) * self.config.backoff_factor)
+            logger.warning(f"🪣 [{self.name}] 429 — скорость снижена до {self.factor:.0%} лимита")
+        self._last_backoff = now
+        return retry_after
+
+    def stats(self) -> dict[str, Any]:
+        """Состояние лимитера (для /metrics)."""
+        return {
+            "rpm_limit": self.requests.limit,
+            "tpm_limit": self.tokens.limit,
+            "rate_factor": self._current_factor(time.monotonic()),
+            "rate_waits": self.waits,
+            "rate_wait_seconds": self.wait_seconds,
+            "rate_limited": self.rate_limited,
+            "rate_rejected": self.rejected,
+        }
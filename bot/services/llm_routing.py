@@ -0,0 +1,177 @@
+"""
+MysticBot — маршрутизация LLM-запросов.
+Наблюдаемые задержки провайдеров, дедлайны для хеджирования (hedged requests)
+и circuit breaker для быстрого отключения упавших провайдеров.
+"""
+
+import enum
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from typing import Optional
+
+from bot.config import LLMRoutingConfig
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """
+    Скользящие гистограммы задержек успешных ответов по провайдерам.
+
+    Хранит последние `window` замеров на ключ (имя провайдера или
+    «имя:stream» для времени до первого токена) и отдаёт перцентили.
+    """
+
+    def __init__(self, config: LLMRoutingConfig):
+        self.config = config
+        self._samples: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=config.latency_window)
+        )
+
+    def record(self, key: str, seconds: float) -> None:
+        """Добавить замер (сек)."""
+        self._samples[key].append(seconds)
+
+    def count(self, key: str) -> int:
+        """Число замеров по ключу."""
+        return len(self._samples.get(key, ()))
+
+    def percentile(self, key: str, q: float) -> Optional[float]:
+        """Перцентиль q ∈ [0, 1] (nearest-rank); None, если замеров нет."""
+        samples = self._samples.get(key)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        rank = max(1, math.ceil(q * len(ordered)))
+        return ordered[rank - 1]
+
+    def hedge_delay(self, key: str) -> float:
+        """
+        Через сколько секунд без ответа запускать следующего провайдера.
+
+        p95 (настраивается) наблюдаемых задержек, ограниченный
+        [hedge_min_delay, hedge_max_delay]; пока замеров меньше
+        min_samples — hedge_default_delay.
+        """
+        cfg = self.config
+        if self.count(key) < cfg.min_samples:
+            return cfg.hedge_default_delay
+        value = self.percentile(key, cfg.hedge_percentile) or cfg.hedge_default_delay
+        return min(max(value, cfg.hedge_min_delay), cfg.hedge_max_delay)
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """p50/p95/число замеров по каждому ключу (для логов и метрик)."""
+        return {
+            key: {
+                "count": len(samples),
+                "p50": self.percentile(key, 0.5) or 0.0,
+                "p95": self.percentile(key, 0.95) or 0.0,
+            }
+            for key, samples in self._samples.items()
+            if samples
+        }
+
+
+class CircuitState(enum.Enum):
+    """Состояния автомата circuit breaker."""
+    CLOSED = "closed"          # провайдер здоров, запросы идут
+    OPEN = "open"              # провайдер отключён, запросы пропускаются
+    HALF_OPEN = "half_open"    # пробный запрос после паузы
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker одного провайдера.
+
+    Оценка по скользящему окну `breaker_window` секунд: при доле ошибок
+    ≥ breaker_error_rate или доле медленных ответов ≥ breaker_slow_call_rate
+    (и не менее breaker_min_requests исходов) цепь размыкается на
+    breaker_open_seconds. Затем пропускается один пробный запрос
+    (HALF_OPEN): успех замыкает цепь, ошибка — снова размыкает.
+    """
+
+    def __init__(self, name: str, config: LLMRoutingConfig):
+        self.name = name
+        self.config = config
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._outcomes: deque[tuple[float, bool, bool]] = deque()  # (время, ошибка, медленно)
+
+    def _prune(self, now: float) -> None:
+        horizon = now - self.config.breaker_window
+        while self._outcomes and self._outcomes[0][0] < horizon:
+            self._outcomes.popleft()
+
+    def available(self) -> bool:
+        """Можно ли сейчас направить запрос к провайдеру (без побочных эффектов)."""
+        if not self.config.breaker_enabled or self.state == CircuitState.CLOSED:
+            return True
+        if self._trial_in_flight:
+            return False
+        if self.state == CircuitState.HALF_OPEN:
+            return True
+        return time.monotonic() - self.opened_at >= self.config.breaker_open_seconds
+
+    def acquire(self) -> bool:
+        """Занять право на запрос; в HALF_OPEN — единственный пробный."""
+        if not self.available():
+            return False
+        if self.config.breaker_enabled and self.state != CircuitState.CLOSED:
+            self.state = CircuitState.HALF_OPEN
+            self._trial_in_flight = True
+        return True
+
+    def release(self) -> None:
+        """Запрос отменён без результата (например, проигравший в хеджировании)."""
+        self._trial_in_flight = False
+
+    def record_success(self, latency: float) -> None:
+        """Успешный ответ за latency секунд."""
+        if self.state != CircuitState.CLOSED:
+            self.close()
+            return
+        self._record(failed=False, slow=latency >= self.config.breaker_slow_call_seconds)
+
+    def record_failure(self) -> None:
+        """Ошибка запроса."""
+        if self.state != CircuitState.CLOSED:
+            self.trip("пробный запрос не прошёл")
+            return
+        self._record(failed=True, slow=False)
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        now = time.monotonic()
+        self._outcomes.append((now, failed, slow))
+        self._prune(now)
+
+        total = len(self._outcomes)
+        if not self.config.breaker_enabled or total < self.config.breaker_min_requests:
+            return
+        error_rate = sum(1 for _, f, _ in self._outcomes if f) / total
+        slow_rate = sum(1 for _, _, s in self._outcomes if s) / total
+        if error_rate >= self.config.breaker_error_rate:
+            self.trip(f"ошибок {error_rate:.0%} за {self.config.breaker_window:.0f}с")
+        elif slow_rate >= self.config.breaker_slow_call_rate:
+            self.trip(f"медленных ответов {slow_rate:.0%} за {self.config.breaker_window:.0f}с")
+
+    def trip(self, reason: str = "") -> None:
+        """Разомкнуть цепь."""
+        if self.state != CircuitState.OPEN:
+            logger.warning(
+                f"🔌 [{self.name}] circuit OPEN ({reason}) — "
+                f"провайдер пропускается {self.config.breaker_open_seconds:.0f}с"
+            )
+        self.state = CircuitState.OPEN
+        self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def close(self) -> None:
+        """Замкнуть цепь и сбросить окно."""
+        if self.state != CircuitState.CLOSED:
+            logger.info(f"✅ [{self.name}] circuit CLOSED — провайдер снова в ротации")
+        self.state = CircuitState.CLOSED
+        self._trial_in_flight = False
+        self._outcomes.clear()
@@ -0,0 +1,204 @@
+"""
+MysticBot — очередь LLM-запросов.
+
+Ограничивает число одновременных запросов к провайдерам (суммарная
+ёмкость здоровых провайдеров) и распределяет свободные места между
+пользователями взвешенно-справедливо (WFQ): у каждого пользователя своя
+очередь, место получает задание с наименьшей «виртуальной» меткой
+окончания. Оплатившие пользователи идут с большим весом (приоритетная
+полоса), фоновые задачи — с меньшим.
+"""
+
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from bot.config import LLMSchedulerConfig
+
+logger = logging.getLogger(__name__)
+
+# Колбэк позиции в очереди: 1, 2, ... пока ждём; 0 — запрос запущен
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class Priority(enum.Enum):
+    """Полоса очереди."""
+    BACKGROUND = "background"   # конспекты, рассылки
+    NORMAL = "normal"
+    PAID = "paid"               # пользователи с оплаченным заказом
+
+
+class QueueFullError(Exception):
+    """У пользователя слишком много запросов в очереди."""
+
+
+@dataclass(order=True)
+class _Job:
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    user_id: int = field(compare=False)
+    granted: asyncio.Future = field(compare=False)
+    on_position: Optional[PositionCallback] = field(compare=False, default=None)
+    position: int = field(compare=False, default=0)
+
+
+class LLMScheduler:
+    """
+    Взвешенная справедливая очередь перед LLMService.
+
+    capacity — функция текущей ёмкости (сумма лимитов параллельности
+    провайдеров, не отключённых circuit breaker'ом).
+    """
+
+    def __init__(self, config: LLMSchedulerConfig, capacity: Callable[[], int]):
+        self.config = config
+        self.capacity = capacity
+        self._queue: list[_Job] = []
+        self._running = 0
+        self._vtime = 0.0
+        self._last_finish: dict[int, float] = {}
+        self._queued_per_user: dict[int, int] = {}
+        self._seq = itertools.count()
+        self._callbacks: set[asyncio.Task] = set()   # колбэки позиции (ссылки против GC)
+        self.dispatched = 0
+        self.rejected = 0
+
+    def weight(self, priority: Priority) -> float:
+        return {
+            Priority.PAID: self.config.paid_weight,
+            Priority.NORMAL: 1.0,
+            Priority.BACKGROUND: self.config.background_weight,
+        }[priority]
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: Optional[int],
+        priority: Priority = Priority.NORMAL,
+        on_position: Optional[PositionCallback] = None,
+    ) -> AsyncIterator[None]:
+        """
+        Занять место для одного LLM-запроса (на всё время запроса или потока).
+
+        Raises:
+            QueueFullError: у пользователя уже user_max_queued запросов в ожидании
+        """
+        if not self.config.enabled:
+            yield
+            return
+
+        job = self._submit(user_id or 0, priority, on_position)
+        try:
+            await job.granted
+        except asyncio.CancelledError:
+            if job.granted.done() and not job.granted.cancelled():
+                self._release()
+            else:
+                self._remove(job)
+            raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _submit(
+        self,
+        user_id: int,
+        priority: Priority,
+        on_position: Optional[PositionCallback],
+    ) -> _Job:
+        loop = asyncio.get_running_loop()
+        if not self._queue and self._running < self.capacity():
+            self._running += 1
+            self.dispatched += 1
+            future = loop.create_future()
+            future.set_result(None)
+            return _Job(0.0, 0, 0.0, user_id, future)
+
+        if self._queued_per_user.get(user_id, 0) >= self.config.user_max_queued:
+            self.rejected += 1
+            raise QueueFullError(
+                f"Пользователь {user_id}: уже {self.config.user_max_queued} запросов в очереди"
+            )
+
+        start = max(self._vtime, self._last_finish.get(user_id, 0.0))
+        finish = start + 1.0 / self.weight(priority)
+        self._last_finish[user_id] = finish
+        job = _Job(finish, next(self._seq), start, user_id, loop.create_future(), on_position)
+        heapq.heappush(self._queue, job)
+        self._queued_per_user[user_id] = self._queued_per_user.get(user_id, 0) + 1
+        self._dispatch()
+        return job
+
+    def _unqueue(self, job: _Job) -> None:
+        left = self._queued_per_user.get(job.user_id, 1) - 1
+        if left > 0:
+            self._queued_per_user[job.user_id] = left
+        else:
+            self._queued_per_user.pop(job.user_id, None)
+
+    def _remove(self, job: _Job) -> None:
+        """Отмена ожидающего задания."""
+        try:
+            self._queue.remove(job)
+        except ValueError:
+            return
+        heapq.heapify(self._queue)
+        self._unqueue(job)
+        self._dispatch()
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Выдать свободные места заданиям с наименьшей меткой и обновить позиции."""
+        while self._queue and self._running < self.capacity():
+            job = heapq.heappop(self._queue)
+            self._unqueue(job)
+            if job.granted.done():
+                continue    # ожидание отменено, задание ещё не успело удалиться
+            self._vtime = max(self._vtime, job.start)
+            self._running += 1
+            self.dispatched += 1
+            job.granted.set_result(None)
+            if job.position and job.on_position:
+                self._notify(job, 0)
+
+        if not self._queue:
+            # Все ждущие обслужены — прошлые метки пользователей больше не нужны
+            self._last_finish.clear()
+            return
+        for position, job in enumerate(sorted(self._queue), start=1):
+            if job.position != position and job.on_position:
+                self._notify(job, position)
+            job.position = position
+
+    def _notify(self, job: _Job, position: int) -> None:
+        job.position = position
+
+        async def call() -> None:
+            try:
+                await job.on_position(position)
+            except Exception as e:
+                logger.debug(f"Колбэк позиции в очереди: {e}")
+
+        task = asyncio.ensure_future(call())
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    def stats(self) -> dict[str, int]:
+        """Состояние очереди (для /metrics)."""
+        return {
+            "running": self._running,
+            "queued": len(self._queue),
+            "capacity": self.capacity(),
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,225 @@
+"""
+MysticBot — планировщик ежедневных уведомлений.
+
+Работает внутри бота вместо cron-скрипта: индекс подписчиков разложен по
+минутам суток (колесо на 1440 ячеек), цикл просыпается на границе каждой
+минуты и отправляет её ячейку через BroadcastEngine. Изменения настроек
+обновляют индекс точечно (update / remove), раз в сутки индекс сверяется с БД.
+
+Перед отправкой настройки ячейки перечитываются из БД: устаревшие записи
+индекса (уведомления выключены или время сменили в другом процессе)
+просто отбрасываются. Повторный запуск минуты не дублирует доставку —
+у рассылки минуты свой checkpoint (daily-<дата>-<ЧЧММ>).
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Coroutine, Optional
+
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.config import settings, NotificationSchedulerConfig
+from bot.services.broadcast import BroadcastCheckpoint, BroadcastEngine, unfinished_broadcasts
+from bot.services.daily_content import DailyContentService
+from bot.services.user_settings import UserSettingsService
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def minute_of_day(at: time) -> int:
+    """Ячейка колеса: минута суток (секунды отбрасываются)."""
+    return at.hour * 60 + at.minute
+
+
+class NotificationScheduler:
+    """
+    Колесо подписчиков по минутам суток и цикл отправки.
+
+    Использование:
+        scheduler = NotificationScheduler(bot, session_maker)
+        await scheduler.start()
+        scheduler.update(user_id, enabled=True, at=time(8, 30))
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        session_maker: async_sessionmaker,
+        config: Optional[NotificationSchedulerConfig] = None,
+        parse_mode: Optional[str] = "Markdown",
+    ):
+        self.bot = bot
+        self.session_maker = session_maker
+        self.config = config or settings.notifications
+        self.broadcaster = BroadcastEngine(bot, session_maker, parse_mode=parse_mode)
+        self._wheel: list[set[int]] = [set() for _ in range(MINUTES_PER_DAY)]
+        self._slot_of: dict[int, int] = {}
+        self._send_lock = asyncio.Lock()     # рассылки минут идут по очереди (общий темп)
+        self._task: Optional[asyncio.Task] = None
+        self._sends: set[asyncio.Task] = set()
+        self._last_fired: Optional[datetime] = None
+        self._loaded_day: Optional[date] = None
+
+    # --- Индекс ---
+
+    @property
+    def size(self) -> int:
+        return len(self._slot_of)
+
+    def update(self, user_id: int, enabled: bool, at: Optional[time]) -> None:
+        """Точечное обновление индекса после смены настроек пользователя."""
+        self.remove(user_id)
+        if enabled and at is not None:
+            slot = minute_of_day(at)
+            self._wheel[slot].add(user_id)
+            self._slot_of[user_id] = slot
+
+    def remove(self, user_id: int) -> None:
+        slot = self._slot_of.pop(user_id, None)
+        if slot is not None:
+            self._wheel[slot].discard(user_id)
+
+    async def reload(self) -> None:
+        """Полная загрузка индекса из БД (старт и раз в сутки)."""
+        async with self.session_maker() as session:
+            schedule = await UserSettingsService.get_notification_schedule(session)
+        for bucket in self._wheel:
+            bucket.clear()
+        self._slot_of.clear()
+        for user_id, at in schedule:
+            self.update(user_id, True, at)
+        self._loaded_day = date.today()
+        logger.info(f"🔔 Планировщик уведомлений: {self.size} подписчиков")
+
+    # --- Цикл ---
+
+    async def start(self) -> None:
+        await self.reload()
+        now = datetime.now().replace(second=0, microsecond=0)
+        # Минуты, пропущенные за время рестарта, догоняются (checkpoint не даст дублей)
+        self._last_fired = now - timedelta(minutes=self.config.catch_up_minutes + 1)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._task, *self._sends) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        # Возобновление идёт в фоне: долгий догон не должен съесть окно catch_up_minutes
+        self._resume_unfinished()
+        while True:
+            try:
+                await self._tick(datetime.now())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"💥 Планировщик уведомлений: {e}")
+            # Спим до начала следующей минуты
+            now = datetime.now()
+            await asyncio.sleep(60 - now.second - now.microsecond / 1_000_000)
+
+    async def _tick(self, now: datetime) -> None:
+        current = now.replace(second=0, microsecond=0)
+        if self._loaded_day != current.date():
+            await self.reload()
+        oldest = current - timedelta(minutes=self.config.catch_up_minutes)
+        minute = max(self._last_fired + timedelta(minutes=1), oldest)
+        if self._last_fired + timedelta(minutes=1) < oldest:
+            logger.warning(f"⚠️ Уведомления: пропущены минуты до {oldest:%H:%M} (дольше окна догона)")
+        while minute <= current:
+            self._fire(minute)
+            minute += timedelta(minutes=1)
+        self._last_fired = current
+
+    def _fire(self, minute: datetime) -> None:
+        user_ids = list(self._wheel[minute_of_day(minute.time())])
+        if not user_ids:
+            return
+        self._spawn(self._send(minute, user_ids))
+
+    def _spawn(self, coro: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coro)
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, minute: datetime, user_ids: list[int]) -> None:
+        slot = minute_of_day(minute.time())
+        async with self.session_maker() as session:
+            users = await UserSettingsService.get_users_by_ids(session, user_ids)
+        # Индекс мог устареть: отправляем только тем, у кого сейчас это время
+        due = [
+            u for u in users
+            if u.enable_daily_notifications and minute_of_day(u.notification_time) == slot
+        ]
+        for user_id in set(user_ids) - {u.user_id for u in due}:
+            if self._slot_of.get(user_id) == slot:
+                self.remove(user_id)
+        if not due:
+            return
+        day = minute.date()
+        await self._broadcast(
+            f"daily-{day.isoformat()}-{minute:%H%M}",
+            DailyContentService.generate_daily_notifications(due, day=day),
+            meta={"kind": "daily", "day": day.isoformat()},
+        )
+
+    async def _broadcast(self, run_id: str, messages: dict[int, str], meta: dict) -> None:
+        async with self._send_lock:
+            stats = await self.broadcaster.run(run_id, messages, meta=meta)
+        logger.info(
+            f"🔔 Уведомления {run_id}: отправлено {stats.sent}, ошибок {stats.failed}, "
+            f"заблокировали бота {stats.blocked}"
+        )
+
+    def _resume_unfinished(self) -> None:
+        """Рассылки сегодняшних минут, прерванные падением бота (фоновыми задачами)."""
+        today = date.today()
+        for checkpoint in unfinished_broadcasts(f"daily-{today.isoformat()}-"):
+            self._spawn(self._resume(checkpoint, today))
+
+    async def _resume(self, checkpoint: BroadcastCheckpoint, day: date) -> None:
+        try:
+            async with self.session_maker() as session:
+                users = await UserSettingsService.get_users_by_ids(session, checkpoint.recipients)
+            logger.info(f"🔁 Продолжение рассылки {checkpoint.run_id}: {len(users)} получателей")
+            await self._broadcast(
+                checkpoint.run_id,
+                DailyContentService.generate_daily_notifications(users, day=day),
+                meta=checkpoint.meta,
+            )
+        except Exception as e:
+            logger.error(f"❌ Не удалось продолжить рассылку {checkpoint.run_id}: {e}")
+
+
+_scheduler: Optional[NotificationScheduler] = None
+
+
+async def start_notification_scheduler(
+    bot: Bot,
+    session_maker: async_sessionmaker,
+) -> NotificationScheduler:
+    """Запуск планировщика при старте бота."""
+    global _scheduler
+    _scheduler = NotificationScheduler(bot, session_maker)
+    await _scheduler.start()
+    return _scheduler
+
+
+async def stop_notification_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
+
+
+def notification_settings_changed(user_id: int, enabled: bool, at: Optional[time]) -> None:
+    """Сообщить планировщику о смене настроек (без запущенного планировщика — ничего)."""
+    if _scheduler is not None:
+        _scheduler.update(user_id, enabled, at)
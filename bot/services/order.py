@@ -4,10 +4,18 @@
 
 import logging
 from typing import List, Optional
-from sqlalchemy import select, update
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.models.order import Order, OrderStatus
+from bot.services.daily_stats import (
+    ORDER_STATUS,
+    ORDERS_CREATED,
+    ORDERS_PAID,
+    record_stat,
+    stat_transition,
+)
+from bot.services.pagination import fetch_page
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +46,8 @@ class OrderService:
         self.session.add(order)
         await self.session.commit()
         await self.session.refresh(order)
+        record_stat(ORDERS_CREATED)
+        stat_transition(ORDER_STATUS, None, order.status)
         logger.info(f"Создан заказ #{order.id} для пользователя {user_id}")
         return order
 
@@ -59,11 +69,10 @@ class OrderService:
         result = await self.session.execute(stmt)
         return list(result.scalars().all())
 
-    async def get_all_orders(self, limit: int = 50) -> List[Order]:
-        """Получить все заказы (последние)"""
-        stmt = select(Order).order_by(Order.created_at.desc()).limit(limit)
-        result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+    async def get_all_orders(self, limit: int = 50, cursor: Optional[str] = None) -> List[Order]:
+        """Получить все заказы (последние; keyset после cursor)"""
+        page = await fetch_page(self.session, select(Order), (Order.created_at, Order.id), limit, cursor)
+        return page.items
 
     async def get_unpaid_orders(self, limit: int = 50) -> List[Order]:
         """Получить неоплаченные заказы"""
@@ -73,9 +82,12 @@ class OrderService:
 
     async def update_status(self, order_id: int, status: OrderStatus) -> Optional[Order]:
         """Обновить статус заказа"""
+        old_status = await self.session.scalar(select(Order.status).where(Order.id == order_id))
         stmt = update(Order).where(Order.id == order_id).values(status=status)
         await self.session.execute(stmt)
         await self.session.commit()
+        if old_status is not None:
+            stat_transition(ORDER_STATUS, old_status, status)
         return await self.get_order_by_id(order_id)
 
     async def mark_as_paid(
@@ -93,9 +105,12 @@ class OrderService:
         if admin_notes:
             update_data["admin_notes"] = admin_notes
         
+        was_paid = await self.session.scalar(select(Order.is_paid).where(Order.id == order_id))
         stmt = update(Order).where(Order.id == order_id).values(**update_data)
         await self.session.execute(stmt)
         await self.session.commit()
+        if was_paid is False:
+            record_stat(ORDERS_PAID)
         return await self.get_order_by_id(order_id)
 
     async def add_payment_screenshot(self, order_id: int, screenshot_file_id: str) -> Optional[Order]:
@@ -114,9 +129,9 @@ class OrderService:
 
     async def count_orders_by_status(self, status: OrderStatus) -> int:
         """Подсчитать количество заказов по статусу"""
-        stmt = select(Order).where(Order.status == status)
+        stmt = select(func.count()).select_from(Order).where(Order.status == status)
         result = await self.session.execute(stmt)
-        return len(result.scalars().all())
+        return result.scalar_one()
 
     async def has_paid_order(self, user_id: int) -> bool:
         """Проверить, есть ли у пользователя оплаченный заказ"""
@@ -0,0 +1,212 @@
+"""
+MysticBot — keyset-пагинация.
+
+Следующая страница продолжается «после последней строки»:
+WHERE (key, id) < (:key, :id) ORDER BY key DESC, id DESC — по индексу,
+стоимость страницы не растёт с её номером (в отличие от OFFSET).
+
+Курсор — непрозрачная короткая строка (влезает в callback_data Telegram,
+64 байта, вместе с префиксом и номером страницы): значения ключа через «.»,
+числа в base36, datetime — микросекунды от эпохи.
+
+Списки «новые сверху» листаются по (created_at, id): fetch_page отдаёт
+страницу после курсора (NEXT), перед ним (PREV) или начиная с него (FROM —
+«Обновить» текущую страницу).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, Sequence, Union
+
+from sqlalchemy import DateTime, Select, String, literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.types import TypeDecorator
+
+CursorValue = Union[int, datetime]
+
+MAX_CURSOR_LEN = 32
+
+# Направления fetch_page
+NEXT = "n"      # строки после курсора (дальше по списку)
+PREV = "p"      # строки перед курсором (предыдущая страница)
+FROM = "f"      # строки начиная с курсора включительно (обновить страницу)
+
+_EPOCH = datetime(1970, 1, 1)
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _b36(n: int) -> str:
+    if n < 0:
+        return "-" + _b36(-n)
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if not n:
+            return out
+
+
+def _encode_value(value: CursorValue) -> str:
+    if isinstance(value, datetime):
+        # t — без часового пояса, z — UTC (timezone-aware)
+        aware = value.tzinfo is not None
+        naive = value.astimezone(timezone.utc).replace(tzinfo=None) if aware else value
+        micros = (naive - _EPOCH) // timedelta(microseconds=1)
+        return ("z" if aware else "t") + _b36(micros)
+    if isinstance(value, int):
+        return "i" + _b36(value)
+    raise TypeError(f"Неподдерживаемое значение курсора: {value!r}")
+
+
+def _decode_value(token: str) -> CursorValue:
+    kind, body = token[:1], token[1:]
+    number = int(body, 36)
+    if kind == "i":
+        return number
+    if kind in ("t", "z"):
+        value = _EPOCH + timedelta(microseconds=number)
+        return value.replace(tzinfo=timezone.utc) if kind == "z" else value
+    raise ValueError(f"Неизвестный тип значения курсора: {kind!r}")
+
+
+def encode_cursor(*values: CursorValue) -> str:
+    """Курсор по значениям ключа последней строки страницы."""
+    cursor = ".".join(_encode_value(value) for value in values)
+    if len(cursor) > MAX_CURSOR_LEN:
+        raise ValueError(f"Курсор длиннее {MAX_CURSOR_LEN} символов")
+    return cursor
+
+
+def decode_cursor(cursor: str) -> tuple[CursorValue, ...]:
+    """Значения ключа из курсора; ValueError — курсор повреждён."""
+    if not cursor or len(cursor) > MAX_CURSOR_LEN:
+        raise ValueError("Некорректный курсор")
+    return tuple(_decode_value(token) for token in cursor.split("."))
+
+
+class CursorDateTime(TypeDecorator):
+    """
+    datetime из курсора как параметр запроса. В SQLite дата хранится
+    строкой и сравнивается как строка: значения из Python записаны
+    с микросекундами, значения func.now() (CURRENT_TIMESTAMP) — без них.
+    Параметр форматируется так же, как хранится строка курсора, иначе она
+    попала бы на обе страницы (или соседние строки — ни на одну).
+
+    sql_default — колонку заполняет func.now(), но в ней могут быть и
+    значения из Python: дробная часть есть только у вторых, поэтому без
+    микросекунд параметр пишется как у func.now().
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def __init__(self, sql_default: bool = False):
+        super().__init__()
+        self.sql_default = sql_default
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(String())
+        return dialect.type_descriptor(DateTime())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        seconds = self.sql_default and not value.microsecond
+        return value.strftime("%Y-%m-%d %H:%M:%S" if seconds else "%Y-%m-%d %H:%M:%S.%f")
+
+
+def _sql_default(column: Any) -> bool:
+    """Значение колонки заполняет SQL-выражение (func.now()), а не Python."""
+    default = getattr(column, "default", None)
+    if default is not None:
+        return default.is_clause_element
+    return getattr(column, "server_default", None) is not None
+
+
+def _bind(column: Any, value: CursorValue) -> Any:
+    if isinstance(value, datetime):
+        return literal(value, CursorDateTime(sql_default=_sql_default(column)))
+    return value
+
+
+def keyset_after(
+    columns: Sequence[Any],
+    cursor: str,
+    descending: bool = True,
+    inclusive: bool = False,
+) -> ColumnElement:
+    """Условие «строки после курсора» для ORDER BY columns (DESC или ASC)."""
+    values = decode_cursor(cursor)
+    if len(values) != len(columns):
+        raise ValueError("Курсор не соответствует ключу сортировки")
+    if len(columns) == 1:
+        key, bound = columns[0], _bind(columns[0], values[0])
+    else:
+        key = tuple_(*columns)
+        bound = tuple_(*(_bind(column, value) for column, value in zip(columns, values, strict=True)))
+    if descending:
+        return key <= bound if inclusive else key < bound
+    return key >= bound if inclusive else key > bound
+
+
+@dataclass
+class Page:
+    """Страница списка и курсоры для навигации."""
+    items: list = field(default_factory=list)
+    next_cursor: Optional[str] = None   # есть следующая страница — курсор её начала
+    first_cursor: Optional[str] = None  # курсор первой строки (PREV / FROM)
+    at_start: bool = False              # это первая страница списка
+
+
+async def fetch_page(
+    session: AsyncSession,
+    stmt: Select,
+    key: Sequence[Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    direction: str = NEXT,
+    descending: bool = True,
+) -> Page:
+    """
+    Страница stmt (SELECT модели с фильтрами, без ORDER BY / LIMIT),
+    упорядоченного по key (например, (Model.created_at, Model.id)).
+    Лишняя строка (limit + 1) показывает, есть ли продолжение.
+    """
+    names = [column.key for column in key]
+
+    def cursor_of(obj: Any) -> str:
+        return encode_cursor(*(getattr(obj, name) for name in names))
+
+    def ordered(desc_: bool) -> Select:
+        return stmt.order_by(*(column.desc() if desc_ else column.asc() for column in key))
+
+    async def rows(query: Select) -> list:
+        return list((await session.execute(query.limit(limit + 1))).scalars().all())
+
+    def page(items: list, more: bool, at_start: bool) -> Page:
+        return Page(
+            items=items,
+            next_cursor=cursor_of(items[-1]) if more and items else None,
+            first_cursor=cursor_of(items[0]) if items else None,
+            at_start=at_start,
+        )
+
+    if cursor is None:
+        found = await rows(ordered(descending))
+        return page(found[:limit], len(found) > limit, at_start=True)
+
+    if direction == PREV:
+        found = await rows(ordered(not descending).where(keyset_after(key, cursor, not descending)))
+        if len(found) <= limit:
+            # Перед курсором меньше страницы — это начало списка
+            return await fetch_page(session, stmt, key, limit, descending=descending)
+        return page(list(reversed(found[:limit])), True, at_start=False)
+
+    inclusive = direction == FROM
+    found = await rows(ordered(descending).where(keyset_after(key, cursor, descending, inclusive)))
+    if not found and inclusive:
+        # Строки страницы удалены, дальше пусто — показываем предыдущую
+        return await fetch_page(session, stmt, key, limit, cursor, PREV, descending)
+    return page(found[:limit], len(found) > limit, at_start=False)
@@ -9,7 +9,10 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc, and_, func
 
+from bot.database.writer import persist
 from bot.models.prediction_history import PredictionHistory, PredictionType
+from bot.services.daily_stats import prediction_metric, record_stat
+from bot.services.pagination import fetch_page
 
 logger = logging.getLogger(__name__)
 
@@ -40,9 +43,8 @@ class PredictionHistoryService:
             username=username,
             first_name=first_name,
         )
-        session.add(prediction)
-        await session.commit()
-        await session.refresh(prediction)
+        await persist(session, prediction)
+        record_stat(prediction_metric(prediction_type))
         logger.info(f"Создана запись истории предсказаний #{prediction.id} для пользователя {user_id}, тип: {prediction_type.value}")
         return prediction
     
@@ -58,18 +60,14 @@ class PredictionHistoryService:
         session: AsyncSession, 
         user_id: int, 
         limit: int = 20,
-        offset: int = 0
+        cursor: Optional[str] = None
     ) -> List[PredictionHistory]:
-        """Получить историю предсказаний пользователя"""
-        stmt = (
-            select(PredictionHistory)
-            .where(PredictionHistory.user_id == user_id)
-            .order_by(desc(PredictionHistory.created_at))
-            .limit(limit)
-            .offset(offset)
+        """Получить историю предсказаний пользователя (новые сверху, keyset после cursor)"""
+        stmt = select(PredictionHistory).where(PredictionHistory.user_id == user_id)
+        page = await fetch_page(
+            session, stmt, (PredictionHistory.created_at, PredictionHistory.id), limit, cursor
         )
-        result = await session.execute(stmt)
-        return list(result.scalars().all())
+        return page.items
     
     @staticmethod
     async def get_by_type(
@@ -0,0 +1,212 @@
+"""
+MysticBot — статистика для админки и консультанта.
+
+Все счётчики считаются в БД (COUNT / SUM(CASE) / GROUP BY) — строки
+в Python не загружаются. Одна панель — один запрос: счётчики разных
+таблиц собираются скалярными подзапросами в один SELECT.
+
+Результат панели кэшируется на stats.cache_ttl секунд (в памяти процесса):
+повторные нажатия «Обновить» не нагружают БД.
+
+Если запущена дневная статистика (STATS_ROLLUPS), итоги и «за сегодня»
+берутся из daily_stats (bot/services/daily_stats.py) — SUM по нескольким
+строкам вместо COUNT по исходным таблицам. По исходным таблицам остаются
+только «активные за неделю» и «платящие» (индексные COUNT).
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import case, distinct, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.models.consultation import Consultation
+from bot.models.hybrid_draft import DraftStatus, HybridDraft
+from bot.models.order import Order, OrderStatus
+from bot.models.prediction_history import PredictionHistory
+from bot.models.user_settings import UserSettings
+from bot.services.daily_stats import (
+    CONSULTATIONS,
+    DRAFT_STATUS,
+    ORDER_STATUS,
+    ORDERS_PAID,
+    USERS_NEW,
+    DailyStatsService,
+    rollups_active,
+    status_metric,
+)
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_DAYS = 7
+
+
+def _count(model, *where) -> Any:
+    """Скалярный подзапрос COUNT(*) по таблице модели."""
+    return select(func.count()).select_from(model).where(*where).scalar_subquery()
+
+
+def _count_if(condition) -> Any:
+    """SUM(CASE WHEN condition THEN 1 ELSE 0 END) — подсчёт внутри GROUP BY / общего SELECT."""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _today_start() -> datetime:
+    now = datetime.utcnow()
+    return datetime(now.year, now.month, now.day)
+
+
+def _active_since() -> datetime:
+    return datetime.utcnow() - timedelta(days=ACTIVE_DAYS)
+
+
+def _sum_prefix(totals: dict[str, int], prefix: str) -> int:
+    return sum(n for metric, n in totals.items() if metric.startswith(prefix + "."))
+
+
+async def _rollup_totals(session: AsyncSession) -> tuple[dict[str, int], dict[str, int]]:
+    """Суммы метрик daily_stats: за всё время и за сегодня."""
+    today = _today_start().date()
+    totals = await DailyStatsService.rollup(session)
+    today_totals = await DailyStatsService.rollup(session, start=today, end=today)
+    return totals, today_totals
+
+
+class StatsCache:
+    """Кэш панелей: ключ → (момент расчёта, данные)."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float, Any]] = {}
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        ttl = settings.stats.cache_ttl
+        cached = self._data.get(key)
+        if ttl and cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        value = await loader()
+        self._data[key] = (time.monotonic(), value)
+        return value
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+stats_cache = StatsCache()
+
+
+class StatsService:
+    """Агрегаты для панелей статистики."""
+
+    @staticmethod
+    async def consultant_dashboard(session: AsyncSession) -> dict[str, int]:
+        """Панель консультанта (/stats): пользователи, консультации, заказы, черновики."""
+
+        async def load_rollups() -> dict[str, int]:
+            totals, today = await _rollup_totals(session)
+            active = await session.scalar(
+                select(func.count()).select_from(UserSettings).where(UserSettings.last_active >= _active_since())
+            )
+            return {
+                "users_total": totals.get(USERS_NEW, 0),
+                "users_active": int(active or 0),
+                "consultations_total": totals.get(CONSULTATIONS, 0),
+                "consultations_today": today.get(CONSULTATIONS, 0),
+                "orders_total": _sum_prefix(totals, ORDER_STATUS),
+                "orders_paid": totals.get(ORDERS_PAID, 0),
+                "drafts_total": _sum_prefix(totals, DRAFT_STATUS),
+                "drafts_pending": totals.get(status_metric(DRAFT_STATUS, DraftStatus.PENDING), 0),
+            }
+
+        async def load() -> dict[str, int]:
+            stmt = select(
+                _count(UserSettings).label("users_total"),
+                _count(UserSettings, UserSettings.last_active >= _active_since()).label("users_active"),
+                _count(Consultation).label("consultations_total"),
+                _count(Consultation, Consultation.created_at >= _today_start()).label("consultations_today"),
+                _count(Order).label("orders_total"),
+                _count(Order, Order.is_paid == True).label("orders_paid"),  # noqa: E712
+                _count(HybridDraft).label("drafts_total"),
+                _count(HybridDraft, HybridDraft.status == DraftStatus.PENDING).label("drafts_pending"),
+            )
+            row = (await session.execute(stmt)).one()
+            return {key: int(value or 0) for key, value in row._mapping.items()}
+
+        return await stats_cache.get_or_load(
+            "consultant_dashboard", load_rollups if rollups_active() else load
+        )
+
+    @staticmethod
+    async def global_user_stats(session: AsyncSession) -> dict[str, Any]:
+        """Глобальная статистика пользователей (/search → «Статистика»)."""
+
+        paid_users = (
+            select(func.count(distinct(Order.user_id)))
+            .where(Order.is_paid == True)  # noqa: E712
+            .scalar_subquery()
+        )
+
+        async def load() -> dict[str, Any]:
+            if rollups_active():
+                totals, today = await _rollup_totals(session)
+                stmt = select(
+                    _count(UserSettings, UserSettings.last_active >= _active_since()), paid_users
+                )
+                active, paid = (int(v or 0) for v in (await session.execute(stmt)).one())
+                total, new_today = totals.get(USERS_NEW, 0), today.get(USERS_NEW, 0)
+            else:
+                stmt = select(
+                    func.count(UserSettings.id),
+                    _count_if(UserSettings.last_active >= _active_since()),
+                    _count_if(UserSettings.created_at >= _today_start()),
+                    paid_users,
+                )
+                row = (await session.execute(stmt)).one()
+                total, active, new_today, paid = (int(v or 0) for v in row)
+            return {
+                "total_users": total,
+                "active_users": active,
+                "paid_users": paid,
+                "new_users_today": new_today,
+                "activity_rate": round(active / total * 100, 2) if total else 0,
+                "conversion_rate": round(paid / total * 100, 2) if total else 0,
+            }
+
+        return await stats_cache.get_or_load("global_user_stats", load)
+
+    @staticmethod
+    async def order_counts(session: AsyncSession) -> dict[str, int]:
+        """Заказы: всего, оплачено и по статусам (один GROUP BY)."""
+        stmt = select(
+            Order.status, func.count(), _count_if(Order.is_paid == True)  # noqa: E712
+        ).group_by(Order.status)
+        counts = {status.value: 0 for status in OrderStatus}
+        total = paid = 0
+        for status, n, n_paid in (await session.execute(stmt)).all():
+            counts[status.value] = n
+            total += n
+            paid += int(n_paid)
+        return {"total": total, "paid": paid, **counts}
+
+    @staticmethod
+    async def draft_counts(session: AsyncSession) -> dict[str, Any]:
+        """Черновики: всего и по статусам (один GROUP BY)."""
+        stmt = select(HybridDraft.status, func.count()).group_by(HybridDraft.status)
+        by_status = {status.value: 0 for status in DraftStatus}
+        for status, n in (await session.execute(stmt)).all():
+            by_status[status.value] = n
+        return {"total": sum(by_status.values()), "by_status": by_status}
+
+    @staticmethod
+    async def predictions_by_type(
+        session: AsyncSession, user_id: Optional[int] = None
+    ) -> dict[str, int]:
+        """Предсказания по типам (для пользователя или всего)."""
+        stmt = select(PredictionHistory.prediction_type, func.count()).group_by(
+            PredictionHistory.prediction_type
+        )
+        if user_id is not None:
+            stmt = stmt.where(PredictionHistory.user_id == user_id)
+        return {ptype.value: n for ptype, n in (await session.execute(stmt)).all()}
@@ -0,0 +1,244 @@
+"""
+MysticBot — подсчёт токенов для бюджета контекста LLM.
+
+Подключаемые бэкенды:
+- tiktoken — BPE-словари OpenAI (точно для gpt-4o/gpt-4o-mini);
+- huggingface — tokenizer.json модели с HuggingFace Hub (Featherless);
+- heuristic — оценка по классам символов без зависимостей.
+
+Режим "auto" выбирает по модели первый доступный бэкенд и откатывается
+на эвристику, если пакета или словаря нет. Словари скачиваются при первом
+обращении, поэтому для моделей провайдеров они загружаются на старте
+(preload_tokenizers) — в потоке, а не в event loop.
+"""
+
+import asyncio
+import logging
+import math
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterable, Optional, Sequence
+
+from bot.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены разметки чата на одно сообщение (role, разделители)
+MESSAGE_OVERHEAD = 4
+
+_CYRILLIC = re.compile(r"[Ѐ-ӿ]")
+_WHITESPACE = re.compile(r"\s")
+
+
+class Tokenizer(ABC):
+    """Базовый счётчик токенов; name попадает в FSM рядом с кэшем подсчётов."""
+
+    name = "base"
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """Число токенов текста."""
+
+    def count_message(self, message: dict) -> int:
+        """Токены одного сообщения чата с учётом служебной разметки."""
+        return self.count(message.get("content") or "") + MESSAGE_OVERHEAD
+
+
+class HeuristicTokenizer(Tokenizer):
+    """
+    Оценка без словаря: кириллица ≈ 2.2 символа на токен, латиница и
+    прочее ≈ 4, пробелы почти бесплатны. С запасом в большую сторону —
+    для русского текста BPE-словари дробят слова мельче, чем латиницу.
+    """
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cyrillic = len(_CYRILLIC.findall(text))
+        spaces = len(_WHITESPACE.findall(text))
+        other = len(text) - cyrillic - spaces
+        return math.ceil(cyrillic / 2.2 + other / 4 + spaces / 8)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """Словарь tiktoken для модели (неизвестные модели — o200k_base)."""
+
+    def __init__(self, model: str):
+        import tiktoken
+
+        try:
+            self._encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("o200k_base")
+        self.name = f"tiktoken:{self._encoding.name}"
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=())) if text else 0
+
+
+class HuggingFaceTokenizer(Tokenizer):
+    """tokenizer.json модели с HuggingFace Hub (пакет tokenizers)."""
+
+    def __init__(self, model: str):
+        from tokenizers import Tokenizer as HFTokenizer
+
+        self._tokenizer = HFTokenizer.from_pretrained(model)
+        self.name = f"hf:{model}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _candidates(model: str, backend: str) -> list[type[Tokenizer]]:
+    """Бэкенды в порядке попыток для модели."""
+    if backend == "tiktoken":
+        return [TiktokenTokenizer]
+    if backend == "huggingface":
+        return [HuggingFaceTokenizer]
+    if backend == "heuristic":
+        return []
+    # auto: модели с HuggingFace-идентификатором (org/name) — их собственный словарь
+    if "/" in model:
+        return [HuggingFaceTokenizer, TiktokenTokenizer]
+    return [TiktokenTokenizer]
+
+
+@lru_cache(maxsize=16)
+def get_tokenizer(model: str, backend: str = "") -> Tokenizer:
+    """
+    Счётчик токенов для модели (кэшируется на процесс).
+
+    Args:
+        model: Имя модели провайдера
+        backend: auto | tiktoken | huggingface | heuristic
+                 (по умолчанию — settings.llm_context.tokenizer)
+    """
+    backend = (backend or settings.llm_context.tokenizer).lower()
+    for cls in _candidates(model, backend):
+        try:
+            tokenizer = cls(model)
+            logger.info(f"🔢 Токенизатор для {model}: {tokenizer.name}")
+            return tokenizer
+        except ImportError:
+            logger.debug(f"{cls.__name__}: пакет не установлен")
+        except Exception as e:
+            logger.warning(f"⚠️ {cls.__name__} для {model} недоступен: {e}")
+    if backend != "heuristic":
+        logger.info(f"🔢 Токенизатор для {model}: эвристика (словарь недоступен)")
+    return HeuristicTokenizer()
+
+
+async def preload_tokenizers(models: Iterable[str]) -> dict[str, str]:
+    """
+    Загрузить токенизаторы моделей в кэш get_tokenizer заранее.
+
+    Скачивание словаря (HuggingFace Hub, BPE-файлы tiktoken) синхронное и
+    может ждать до таймаута HTTP — выполняется в потоке, чтобы не
+    останавливать обработку апдейтов.
+
+    Returns:
+        {модель: имя выбранного токенизатора}
+    """
+    loaded = {}
+    for model in dict.fromkeys(models):
+        tokenizer = await asyncio.to_thread(get_tokenizer, model)
+        loaded[model] = tokenizer.name
+    return loaded
+
+
+@dataclass
+class ContextLedger:
+    """
+    Кэш подсчёта токенов диалога: counts[i] — токены messages[i], total — их сумма.
+
+    Подсчёт каждой реплики хранится вместе с ней в хранилище диалогов и
+    обновляется инкрементально: новое сообщение считается один раз,
+    обрезка вычитает удалённые — без пересчёта всей истории на каждом ходе.
+    """
+
+    tokenizer: str
+    counts: list[int] = field(default_factory=list)
+    total: int = 0
+
+    @classmethod
+    def load(
+        cls,
+        messages: list[dict],
+        counts: Sequence[Optional[int]],
+        tokenizer: Tokenizer,
+    ) -> "ContextLedger":
+        """
+        Восстановить по сохранённым подсчётам реплик (counts[i] — для
+        messages[i], этим токенизатором). Считаются только реплики без
+        подсчёта (None) и не попавшие в counts.
+        """
+        ledger = cls(tokenizer=tokenizer.name)
+        for i, message in enumerate(messages):
+            tokens = counts[i] if i < len(counts) else None
+            ledger._add(tokenizer.count_message(message) if tokens is None else tokens)
+        return ledger
+
+    def _add(self, tokens: int) -> None:
+        self.counts.append(tokens)
+        self.total += tokens
+
+    def append(self, messages: list[dict], message: dict, tokenizer: Tokenizer) -> int:
+        """Добавить сообщение в историю и учесть его токены; возвращает подсчёт."""
+        messages.append(message)
+        tokens = tokenizer.count_message(message)
+        self._add(tokens)
+        return tokens
+
+    def pop(self, messages: list[dict]) -> dict:
+        """Удалить последнее сообщение истории."""
+        self.total -= self.counts.pop()
+        return messages.pop()
+
+    def trim(
+        self,
+        messages: list[dict],
+        max_messages: int,
+        max_tokens: int,
+        keep_last: int = 2,
+    ) -> list[dict]:
+        """
+        Удалить старейшие сообщения (системное первое сохраняется), пока
+        история длиннее max_messages или сумма больше max_tokens.
+        Последние keep_last сообщений не удаляются никогда.
+
+        Returns:
+            Обрезанный список сообщений (ledger синхронизирован с ним)
+        """
+        head = 1 if messages and messages[0].get("role") == "system" else 0
+        history_len = len(messages) - head
+        drop = 0
+        total = self.total
+        while history_len - drop > keep_last and (
+            history_len - drop > max_messages or total > max_tokens
+        ):
+            total -= self.counts[head + drop]
+            drop += 1
+        if not drop:
+            return messages
+        self.counts = self.counts[:head] + self.counts[head + drop:]
+        self.total = total
+        return messages[:head] + messages[head + drop:]
+
+    def compact(
+        self,
+        messages: list[dict],
+        cut: int,
+        replacement: dict,
+        tokenizer: Tokenizer,
+    ) -> list[dict]:
+        """Заменить messages[:cut] одним сообщением (например, системным с конспектом)."""
+        tokens = tokenizer.count_message(replacement)
+        self.total += tokens - sum(self.counts[:cut])
+        self.counts = [tokens] + self.counts[cut:]
+        return [replacement] + messages[cut:]
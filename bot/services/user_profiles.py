@@ -0,0 +1,178 @@
+"""
+MysticBot — справочник пользователей (user_profiles) и поиск по нему.
+
+Username и имя из Telegram записываются при каждом взаимодействии
+(UserContextMiddleware), но в БД идут только изменения: последние
+известные значения держатся в памяти процесса (LRU), совпадающие не пишутся.
+
+Поиск — по префиксам слов: «макс» находит «Максим», «@max» — «max_power».
+SQLite: FTS5 (user_profiles_fts, префиксные запросы "слово"*).
+PostgreSQL: ILIKE 'слово%' / '% слово%' по триграммным индексам (pg_trgm).
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import Select, and_, column, func, literal_column, or_, select, table, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.database.engine import dialect_insert
+from bot.models.hybrid_draft import HybridDraft
+from bot.models.order import Order
+from bot.models.prediction_history import PredictionHistory
+from bot.models.user_profile import FTS_TABLE, UserProfile
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ("username", "first_name")
+MAX_TERMS = 5
+
+
+class KnownProfiles:
+    """Последние записанные (username, first_name) по user_id (LRU)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[int, tuple[Optional[str], Optional[str]]] = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[tuple[Optional[str], Optional[str]]]:
+        item = self._items.get(user_id)
+        if item is not None:
+            self._items.move_to_end(user_id)
+        return item
+
+    def put(self, user_id: int, value: tuple[Optional[str], Optional[str]]) -> None:
+        self._items[user_id] = value
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+known_profiles = KnownProfiles(settings.user_context.cache_size)
+
+
+def _terms(query: str) -> list[str]:
+    """Слова запроса без @ (не больше MAX_TERMS)."""
+    return [word.lstrip("@") for word in query.split() if word.lstrip("@")][:MAX_TERMS]
+
+
+def _fts_query(terms: list[str], field: Optional[str]) -> str:
+    # Каждое слово — фраза в кавычках с префиксом: спецсимволы FTS5 не работают
+    phrases = ['"' + term.replace('"', '""') + '"*' for term in terms]
+    if field:
+        phrases = [f"{field} : {phrase}" for phrase in phrases]
+    return " ".join(phrases)
+
+
+def _like_prefix(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class UserProfileService:
+    """Запись и поиск по справочнику пользователей."""
+
+    @staticmethod
+    async def touch(
+        session: AsyncSession,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+    ) -> bool:
+        """Записать username и имя, если они изменились (UPSERT). True — была запись."""
+        value = (username or None, first_name or None)
+        if known_profiles.get(user_id) == value:
+            return False
+        profiles = UserProfile.__table__
+        stmt = dialect_insert(session)(profiles).values(
+            user_id=user_id, username=value[0], first_name=value[1]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                "username": stmt.excluded.username,
+                "first_name": stmt.excluded.first_name,
+                "updated_at": func.now(),
+            },
+            # Строку с теми же значениями не переписываем (и не трогаем FTS)
+            where=or_(
+                profiles.c.username.is_distinct_from(stmt.excluded.username),
+                profiles.c.first_name.is_distinct_from(stmt.excluded.first_name),
+            ),
+        )
+        await session.execute(stmt)
+        await session.commit()
+        known_profiles.put(user_id, value)
+        return True
+
+    @staticmethod
+    def matching_user_ids(
+        dialect: str, query: str, field: Optional[str] = None
+    ) -> Optional[Select]:
+        """
+        SELECT user_id профилей, у которых каждое слово запроса — префикс
+        слова в username или имени (field — только в этом поле).
+        None — в запросе нет слов.
+        """
+        terms = _terms(query)
+        if not terms:
+            return None
+        fields = (field,) if field else SEARCH_FIELDS
+
+        if dialect == "sqlite":
+            fts = table(FTS_TABLE, column("rowid"))
+            profile_ids = select(fts.c.rowid).where(
+                literal_column(FTS_TABLE).match(_fts_query(terms, field))
+            )
+            return select(UserProfile.user_id).where(UserProfile.id.in_(profile_ids))
+
+        conditions = []
+        for term in terms:
+            pattern = _like_prefix(term)
+            variants = []
+            for name in fields:
+                field_column = getattr(UserProfile, name)
+                variants.append(field_column.ilike(f"{pattern}%", escape="\\"))
+                if name == "first_name":
+                    variants.append(field_column.ilike(f"% {pattern}%", escape="\\"))
+            conditions.append(or_(*variants))
+        return select(UserProfile.user_id).where(and_(*conditions))
+
+    @staticmethod
+    async def is_empty(session: AsyncSession) -> bool:
+        return (await session.execute(select(UserProfile.id).limit(1))).first() is None
+
+    @staticmethod
+    async def backfill(session: AsyncSession) -> int:
+        """
+        Заполнить справочник по уже сохранённым заказам, черновикам и
+        предсказаниям (последние username/имя пользователя). Существующие
+        профили не меняются. Возвращает число добавленных.
+        """
+        sources = union_all(
+            *(
+                select(model.user_id, model.username, model.first_name, model.created_at).where(
+                    or_(model.username.is_not(None), model.first_name.is_not(None))
+                )
+                for model in (Order, HybridDraft, PredictionHistory)
+            )
+        ).subquery()
+        ranked = select(
+            sources.c.user_id,
+            sources.c.username,
+            sources.c.first_name,
+            func.row_number()
+            .over(partition_by=sources.c.user_id, order_by=sources.c.created_at.desc())
+            .label("rn"),
+        ).subquery()
+        latest = select(ranked.c.user_id, ranked.c.username, ranked.c.first_name).where(ranked.c.rn == 1)
+
+        before = await session.scalar(select(func.count()).select_from(UserProfile))
+        stmt = dialect_insert(session)(UserProfile.__table__).from_select(
+            ["user_id", "username", "first_name"], latest
+        )
+        await session.execute(stmt.on_conflict_do_nothing(index_elements=["user_id"]))
+        await session.commit()
+        after = await session.scalar(select(func.count()).select_from(UserProfile))
+        return (after or 0) - (before or 0)
@@ -1,19 +1,23 @@
 """
 Сервис расширенного поиска пользователей для админ-панели.
 Поддерживает фильтры по ID, имени, активности, заказам и т.д.
+Имена и username ищутся по справочнику user_profiles (индекс FTS5 / pg_trgm).
 """
 
 import logging
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any, Tuple
-from sqlalchemy import select, func, and_, or_, desc, distinct, String
+from sqlalchemy import select, func, and_, or_, desc, case, false
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql import text
 
 from bot.models.user_settings import UserSettings
 from bot.models.order import Order, OrderStatus
 from bot.models.consultation import Consultation
 from bot.models.prediction_history import PredictionHistory, PredictionType
+from bot.models.user_profile import UserProfile
+from bot.services.pagination import encode_cursor, keyset_after
+from bot.services.stats import StatsService
+from bot.services.user_profiles import UserProfileService
 
 log = logging.getLogger(__name__)
 
@@ -37,14 +41,21 @@ class UserSearchService:
         is_active: Optional[bool] = None,  # активен за последние N дней
         active_days: int = 7,
         limit: int = 50,
-        offset: int = 0
-    ) -> Tuple[List[Dict[str, Any]], int]:
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[str]]:
         """
-        Поиск пользователей с фильтрами
+        Поиск пользователей с фильтрами (новые — первыми).
+        
+        query — ID пользователя или начала слов username / имени
+        (по справочнику user_profiles, по индексу); «@слово» — только username.
+        Пагинация — по курсору (keyset по user_settings.id).
         
         Returns:
-            (список пользователей, общее количество)
+            (список пользователей, общее количество — только для первой
+            страницы, курсор следующей страницы или None)
         """
+        dialect = self.session.get_bind().dialect.name
+        
         # Базовый запрос для пользователей
         stmt = select(UserSettings)
         
@@ -53,24 +64,20 @@ class UserSearchService:
             stmt = stmt.where(UserSettings.user_id == user_id)
         
         if query:
-            # Поиск по username или first_name
-            query_like = f"%{query}%"
-            stmt = stmt.where(
-                or_(
-                    UserSettings.user_id.cast(String).ilike(query_like),
-                    text("EXISTS (SELECT 1 FROM orders WHERE orders.user_id = user_settings.user_id AND (orders.username ILIKE :q OR orders.first_name ILIKE :q))")
-                )
-            )
-        
-        if username:
-            stmt = stmt.where(
-                text("EXISTS (SELECT 1 FROM orders WHERE orders.user_id = user_settings.user_id AND orders.username ILIKE :username)")
-            )
+            query = query.strip()
+            conditions = []
+            if query.isdigit():
+                conditions.append(UserSettings.user_id == int(query))
+            field = "username" if query.startswith("@") else None
+            matched = UserProfileService.matching_user_ids(dialect, query, field)
+            if matched is not None:
+                conditions.append(UserSettings.user_id.in_(matched))
+            stmt = stmt.where(or_(*conditions) if conditions else false())
         
-        if first_name:
-            stmt = stmt.where(
-                text("EXISTS (SELECT 1 FROM orders WHERE orders.user_id = user_settings.user_id AND orders.first_name ILIKE :first_name)")
-            )
+        for field, value in (("username", username), ("first_name", first_name)):
+            if value:
+                matched = UserProfileService.matching_user_ids(dialect, value, field)
+                stmt = stmt.where(UserSettings.user_id.in_(matched) if matched is not None else false())
         
         if min_consultations is not None:
             stmt = stmt.where(
@@ -78,14 +85,12 @@ class UserSearchService:
             )
         
         if has_paid_order is not None:
-            if has_paid_order:
-                stmt = stmt.where(
-                    text("EXISTS (SELECT 1 FROM orders WHERE orders.user_id = user_settings.user_id AND orders.is_paid = TRUE)")
-                )
-            else:
-                stmt = stmt.where(
-                    text("NOT EXISTS (SELECT 1 FROM orders WHERE orders.user_id = user_settings.user_id AND orders.is_paid = TRUE)")
-                )
+            paid = (
+                select(Order.id)
+                .where(Order.user_id == UserSettings.user_id, Order.is_paid == True)
+                .exists()
+            )
+            stmt = stmt.where(paid if has_paid_order else ~paid)
         
         if is_active is not None:
             active_date = datetime.utcnow() - timedelta(days=active_days)
@@ -94,81 +99,155 @@ class UserSearchService:
             else:
                 stmt = stmt.where(UserSettings.last_active < active_date)
         
-        # Подсчет общего количества
-        count_stmt = select(func.count()).select_from(stmt.subquery())
-        total_result = await self.session.execute(count_stmt)
-        total = total_result.scalar()
-        
-        # Получение данных с пагинацией
-        stmt = stmt.order_by(desc(UserSettings.last_active)).limit(limit).offset(offset)
-        result = await self.session.execute(stmt)
-        users = result.scalars().all()
+        stmt = stmt.order_by(desc(UserSettings.id))
+        total = None
+        if cursor:
+            # Следующие страницы: строки после курсора, одна лишняя — есть ли ещё
+            stmt = stmt.where(keyset_after([UserSettings.id], cursor))
+            rows = (await self.session.execute(stmt.limit(limit + 1))).all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        else:
+            # Первая страница и общее количество — одним запросом (COUNT(*) OVER ())
+            page_stmt = stmt.add_columns(func.count().over().label("total")).limit(limit)
+            rows = (await self.session.execute(page_stmt)).all()
+            total = rows[0].total if rows else 0
+            has_more = total > len(rows)
         
-        # Обогащаем данные дополнительной информацией
-        enriched_users = []
-        for user in users:
-            user_data = await self._enrich_user_data(user)
-            enriched_users.append(user_data)
+        users = [row[0] for row in rows]
+        next_cursor = encode_cursor(users[-1].id) if has_more and users else None
         
-        return enriched_users, total
+        # Обогащаем данные статистикой — один запрос на всю страницу
+        enriched_users = await self._enrich_users(users)
+        return enriched_users, total, next_cursor
     
-    async def _enrich_user_data(self, user: UserSettings) -> Dict[str, Any]:
-        """Обогащает данные пользователя статистикой"""
-        # Статистика заказов
-        orders_stmt = select(func.count(Order.id)).where(Order.user_id == user.user_id)
-        orders_result = await self.session.execute(orders_stmt)
-        total_orders = orders_result.scalar() or 0
-        
-        # Оплаченные заказы
-        paid_orders_stmt = select(func.count(Order.id)).where(
-            and_(Order.user_id == user.user_id, Order.is_paid == True)
-        )
-        paid_orders_result = await self.session.execute(paid_orders_stmt)
-        paid_orders = paid_orders_result.scalar() or 0
-        
-        # Консультации
-        consultations_stmt = select(func.count(Consultation.id)).where(Consultation.user_id == user.user_id)
-        consultations_result = await self.session.execute(consultations_stmt)
-        total_consultations = consultations_result.scalar() or 0
-        
-        # Предсказания
-        predictions_stmt = select(func.count(PredictionHistory.id)).where(PredictionHistory.user_id == user.user_id)
-        predictions_result = await self.session.execute(predictions_stmt)
-        total_predictions = predictions_result.scalar() or 0
+    async def _enrich_users(self, users: List[UserSettings]) -> List[Dict[str, Any]]:
+        """
+        Обогащает данные пользователей статистикой.
         
-        # Последний заказ
-        last_order_stmt = select(Order).where(Order.user_id == user.user_id).order_by(desc(Order.created_at)).limit(1)
-        last_order_result = await self.session.execute(last_order_stmt)
-        last_order = last_order_result.scalar_one_or_none()
+        Один запрос на список: счётчики — сгруппированные подзапросы по
+        user_id страницы, последние заказ и консультация — ROW_NUMBER()
+        по user_id, имя — из справочника user_profiles (по которому и шёл
+        поиск; без записи в справочнике — из последнего заказа). Число
+        запросов не зависит от размера страницы.
+        """
+        if not users:
+            return []
+        user_ids = [user.user_id for user in users]
         
-        # Последняя консультация
-        last_consultation_stmt = select(Consultation).where(Consultation.user_id == user.user_id).order_by(desc(Consultation.created_at)).limit(1)
-        last_consultation_result = await self.session.execute(last_consultation_stmt)
-        last_consultation = last_consultation_result.scalar_one_or_none()
+        orders = (
+            select(
+                Order.user_id,
+                func.count(Order.id).label("total_orders"),
+                func.sum(case((Order.is_paid == True, 1), else_=0)).label("paid_orders"),
+            )
+            .where(Order.user_id.in_(user_ids))
+            .group_by(Order.user_id)
+            .subquery()
+        )
+        consultations = (
+            select(Consultation.user_id, func.count(Consultation.id).label("total_consultations"))
+            .where(Consultation.user_id.in_(user_ids))
+            .group_by(Consultation.user_id)
+            .subquery()
+        )
+        predictions = (
+            select(PredictionHistory.user_id, func.count(PredictionHistory.id).label("total_predictions"))
+            .where(PredictionHistory.user_id.in_(user_ids))
+            .group_by(PredictionHistory.user_id)
+            .subquery()
+        )
+        last_order = (
+            select(
+                Order.user_id,
+                Order.id,
+                Order.status,
+                Order.is_paid,
+                Order.created_at,
+                Order.username,
+                Order.first_name,
+                func.row_number()
+                .over(partition_by=Order.user_id, order_by=(desc(Order.created_at), desc(Order.id)))
+                .label("rn"),
+            )
+            .where(Order.user_id.in_(user_ids))
+            .subquery()
+        )
+        last_consultation = (
+            select(
+                Consultation.user_id,
+                Consultation.id,
+                Consultation.created_at,
+                func.row_number()
+                .over(
+                    partition_by=Consultation.user_id,
+                    order_by=(desc(Consultation.created_at), desc(Consultation.id)),
+                )
+                .label("rn"),
+            )
+            .where(Consultation.user_id.in_(user_ids))
+            .subquery()
+        )
         
+        stmt = (
+            select(
+                UserSettings.user_id,
+                orders.c.total_orders,
+                orders.c.paid_orders,
+                consultations.c.total_consultations,
+                predictions.c.total_predictions,
+                last_order.c.id.label("last_order_id"),
+                last_order.c.status.label("last_order_status"),
+                last_order.c.is_paid.label("last_order_is_paid"),
+                last_order.c.created_at.label("last_order_created_at"),
+                func.coalesce(UserProfile.username, last_order.c.username).label("username"),
+                func.coalesce(UserProfile.first_name, last_order.c.first_name).label("first_name"),
+                last_consultation.c.id.label("last_consultation_id"),
+                last_consultation.c.created_at.label("last_consultation_created_at"),
+            )
+            .outerjoin(UserProfile, UserProfile.user_id == UserSettings.user_id)
+            .outerjoin(orders, orders.c.user_id == UserSettings.user_id)
+            .outerjoin(consultations, consultations.c.user_id == UserSettings.user_id)
+            .outerjoin(predictions, predictions.c.user_id == UserSettings.user_id)
+            .outerjoin(last_order, and_(last_order.c.user_id == UserSettings.user_id, last_order.c.rn == 1))
+            .outerjoin(
+                last_consultation,
+                and_(last_consultation.c.user_id == UserSettings.user_id, last_consultation.c.rn == 1),
+            )
+            .where(UserSettings.user_id.in_(user_ids))
+        )
+        stats = {row.user_id: row for row in (await self.session.execute(stmt)).all()}
+        return [self._user_data(user, stats.get(user.user_id)) for user in users]
+    
+    @staticmethod
+    def _user_data(user: UserSettings, row: Any) -> Dict[str, Any]:
+        """Словарь пользователя для выдачи поиска (row — строка из _enrich_users)"""
+        last_order_id = row.last_order_id if row else None
+        last_consultation_id = row.last_consultation_id if row else None
         return {
             "user_id": user.user_id,
-            "preferred_language": user.preferred_language,
+            "username": row.username if row else None,
+            "first_name": row.first_name if row else None,
             "last_active": user.last_active.isoformat() if user.last_active else None,
-            "total_consultations": total_consultations,
-            "total_orders": total_orders,
-            "paid_orders": paid_orders,
-            "total_predictions": total_predictions,
+            "total_consultations": (row.total_consultations if row else None) or 0,
+            "total_orders": (row.total_orders if row else None) or 0,
+            "paid_orders": int((row.paid_orders if row else None) or 0),
+            "total_predictions": (row.total_predictions if row else None) or 0,
             "ai_mode": user.ai_mode,
             "hybrid_mode": user.hybrid_mode,
             "daily_ai_requests": user.daily_ai_requests,
             "ai_requests_limit": user.ai_requests_limit,
             "created_at": user.created_at.isoformat() if user.created_at else None,
             "last_order": {
-                "id": last_order.id,
-                "status": last_order.status.value,
-                "is_paid": last_order.is_paid,
-                "created_at": last_order.created_at.isoformat() if last_order else None
-            } if last_order else None,
+                "id": last_order_id,
+                "status": row.last_order_status.value,
+                "is_paid": row.last_order_is_paid,
+                "created_at": row.last_order_created_at.isoformat() if row.last_order_created_at else None
+            } if last_order_id else None,
             "last_consultation": {
-                "id": last_consultation.id,
-                "created_at": last_consultation.created_at.isoformat() if last_consultation else None
-            } if last_consultation else None
+                "id": last_consultation_id,
+                "created_at": row.last_consultation_created_at.isoformat() if row.last_consultation_created_at else None
+            } if last_consultation_id else None
         }
     
     async def get_user_detailed_stats(self, user_id: int) -> Dict[str, Any]:
@@ -181,29 +260,23 @@ class UserSearchService:
         if not user:
             return {"error": "User not found"}
         
-        # Все заказы
-        orders_stmt = select(Order).where(Order.user_id == user_id).order_by(desc(Order.created_at))
+        # 10 последних заказов
+        orders_stmt = select(Order).where(Order.user_id == user_id).order_by(desc(Order.created_at)).limit(10)
         orders_result = await self.session.execute(orders_stmt)
         orders = orders_result.scalars().all()
         
-        # Все консультации
-        consultations_stmt = select(Consultation).where(Consultation.user_id == user_id).order_by(desc(Consultation.created_at))
+        # 10 последних консультаций
+        consultations_stmt = select(Consultation).where(Consultation.user_id == user_id).order_by(desc(Consultation.created_at)).limit(10)
         consultations_result = await self.session.execute(consultations_stmt)
         consultations = consultations_result.scalars().all()
         
-        # Предсказания по типам
-        predictions_stmt = select(PredictionHistory).where(PredictionHistory.user_id == user_id).order_by(desc(PredictionHistory.created_at))
-        predictions_result = await self.session.execute(predictions_stmt)
-        predictions = predictions_result.scalars().all()
-        
-        # Группировка предсказаний по типам
-        prediction_counts = {}
-        for pred in predictions:
-            pred_type = pred.prediction_type.value
-            prediction_counts[pred_type] = prediction_counts.get(pred_type, 0) + 1
+        # Предсказания по типам (GROUP BY) и последнее предсказание
+        prediction_counts = await StatsService.predictions_by_type(self.session, user_id)
+        last_prediction_stmt = select(PredictionHistory.created_at).where(PredictionHistory.user_id == user_id).order_by(desc(PredictionHistory.created_at)).limit(1)
+        last_prediction_at = (await self.session.execute(last_prediction_stmt)).scalar_one_or_none()
         
         return {
-            "user": await self._enrich_user_data(user),
+            "user": (await self._enrich_users([user]))[0],
             "orders": [
                 {
                     "id": order.id,
@@ -212,7 +285,7 @@ class UserSearchService:
                     "is_paid": order.is_paid,
                     "created_at": order.created_at.isoformat() if order.created_at else None
                 }
-                for order in orders[:10]  # Ограничиваем 10 последними
+                for order in orders
             ],
             "consultations": [
                 {
@@ -220,64 +293,26 @@ class UserSearchService:
                     "question": consult.question[:100] + "..." if len(consult.question) > 100 else consult.question,
                     "created_at": consult.created_at.isoformat() if consult.created_at else None
                 }
-                for consult in consultations[:10]
+                for consult in consultations
             ],
             "predictions_by_type": prediction_counts,
-            "total_predictions": len(predictions),
+            "total_predictions": sum(prediction_counts.values()),
             "recent_activity": {
                 "last_order": orders[0].created_at.isoformat() if orders else None,
                 "last_consultation": consultations[0].created_at.isoformat() if consultations else None,
-                "last_prediction": predictions[0].created_at.isoformat() if predictions else None
+                "last_prediction": last_prediction_at.isoformat() if last_prediction_at else None
             }
         }
     
     async def get_global_stats(self) -> Dict[str, Any]:
-        """Глобальная статистика по всем пользователям"""
-        # Общее количество пользователей
-        total_users_stmt = select(func.count(UserSettings.id))
-        total_users_result = await self.session.execute(total_users_stmt)
-        total_users = total_users_result.scalar() or 0
-        
-        # Активные пользователи (за последние 7 дней)
-        active_date = datetime.utcnow() - timedelta(days=7)
-        active_users_stmt = select(func.count(UserSettings.id)).where(UserSettings.last_active >= active_date)
-        active_users_result = await self.session.execute(active_users_stmt)
-        active_users = active_users_result.scalar() or 0
-        
-        # Пользователи с оплаченными заказами
-        paid_users_stmt = select(func.count(distinct(Order.user_id))).where(Order.is_paid == True)
-        paid_users_result = await self.session.execute(paid_users_stmt)
-        paid_users = paid_users_result.scalar() or 0
-        
-        # Новые пользователи за сегодня
-        today = datetime.utcnow().date()
-        new_users_today_stmt = select(func.count(UserSettings.id)).where(
-            func.date(UserSettings.created_at) == today
-        )
-        new_users_today_result = await self.session.execute(new_users_today_stmt)
-        new_users_today = new_users_today_result.scalar() or 0
-        
-        # Распределение по языкам
-        languages_stmt = select(
-            UserSettings.preferred_language,
-            func.count(UserSettings.id)
-        ).group_by(UserSettings.preferred_language)
-        languages_result = await self.session.execute(languages_stmt)
-        languages = dict(languages_result.all())
-        
-        return {
-            "total_users": total_users,
-            "active_users": active_users,
-            "paid_users": paid_users,
-            "new_users_today": new_users_today,
-            "activity_rate": round((active_users / total_users * 100), 2) if total_users > 0 else 0,
-            "conversion_rate": round((paid_users / total_users * 100), 2) if total_users > 0 else 0,
-            "languages": languages
-        }
+        """Глобальная статистика по всем пользователям (один запрос, кэшируется)"""
+        return await StatsService.global_user_stats(self.session)
 
 
 # Утилитарные функции для работы с поиском
-async def search_users_by_criteria(session: AsyncSession, **kwargs) -> Tuple[List[Dict[str, Any]], int]:
+async def search_users_by_criteria(
+    session: AsyncSession, **kwargs
+) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[str]]:
     """Упрощённый интерфейс для поиска пользователей"""
     service = UserSearchService(session)
     return await service.search_users(**kwargs)
@@ -3,17 +3,91 @@
 """
 
 import logging
+import time as clock
+from collections import OrderedDict
 from datetime import datetime, time
-from typing import Optional
+from typing import Iterable, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import inspect, select, update
 
+from bot.config import settings as bot_settings, UserContextConfig
 from bot.models.user_settings import UserSettings
+from bot.services import counter_buffer
+from bot.services.counter_buffer import get_counter_buffer
+from bot.services.ai_quota import get_ai_quota
+from bot.services.daily_stats import AI_REQUESTS, USERS_NEW, record_stat
 
 logger = logging.getLogger(__name__)
 
 
+class UserSettingsCache:
+    """
+    Настройки пользователей в памяти процесса на короткий TTL (LRU).
+    Хранятся копии значений колонок, не привязанные к сессии: rollback
+    сессии, из которой загружена строка, не делает запись в кэше expired.
+    Объекты из кэша — только для чтения: изменения идут через сессию,
+    после commit запись сбрасывается (invalidate).
+    """
+
+    def __init__(self, config: UserContextConfig):
+        self.ttl = config.cache_ttl
+        self.max_size = config.cache_size
+        self._items: OrderedDict[int, tuple[float, UserSettings]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[UserSettings]:
+        item = self._items.get(user_id)
+        if item is None or clock.monotonic() - item[0] > self.ttl:
+            self.misses += 1
+            return None
+        self._items.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, settings: UserSettings) -> UserSettings:
+        """Сохранить снимок настроек; возвращает этот снимок."""
+        state = inspect(settings)
+        # Колонки, которые БД заполняет сама (onupdate), после flush не загружены
+        snapshot = UserSettings(**{
+            attr.key: getattr(settings, attr.key)
+            for attr in state.mapper.column_attrs
+            if attr.key not in state.unloaded
+        })
+        if self.ttl <= 0:
+            return snapshot
+        self._items[snapshot.user_id] = (clock.monotonic(), snapshot)
+        self._items.move_to_end(snapshot.user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: int) -> None:
+        self._items.pop(user_id, None)
+
+    def invalidate_many(self, user_ids: Iterable[int]) -> None:
+        for user_id in user_ids:
+            self._items.pop(user_id, None)
+
+
+user_settings_cache = UserSettingsCache(bot_settings.user_context)
+# Записанные буфером счётчики делают закэшированные итоги устаревшими
+counter_buffer.flush_listeners.append(user_settings_cache.invalidate_many)
+
+AI_PREMIUM_REQUIRED = (
+    "⚠️ *Доступ ограничен*\n\nЗапросы к ИИ доступны только платным подписчикам.\n\n"
+    "Для получения доступа закажите консультацию через раздел «💎 Консультация (777 ₽)»."
+)
+
+
+def _ai_limit_reached(used: int, limit: int) -> str:
+    return (
+        f"⚠️ *Дневной лимит исчерпан*\n\nВы использовали {used} из {limit} запросов ИИ "
+        f"за сегодня.\n\nЛимит обновится в 00:00 по UTC."
+    )
+
+
 class UserSettingsService:
     """Сервис для работы с настройками пользователя."""
     
@@ -33,6 +107,7 @@ class UserSettingsService:
             session.add(settings)
             await session.commit()
             await session.refresh(settings)
+            record_stat(USERS_NEW)
             logger.debug(f"Созданы настройки для пользователя {user_id}")
         else:
             # Обновляем last_active
@@ -41,6 +116,34 @@ class UserSettingsService:
         
         return settings
     
+    @staticmethod
+    async def get_cached(
+        session: AsyncSession,
+        user_id: int,
+        create: bool = True
+    ) -> Optional[UserSettings]:
+        """
+        Настройки из кэша; при промахе — из БД (с созданием, если create).
+        Результат только для чтения.
+        """
+        settings = user_settings_cache.get(user_id)
+        if settings is not None:
+            return settings
+        if create:
+            settings = await UserSettingsService.get_or_create(session, user_id)
+        else:
+            stmt = select(UserSettings).where(UserSettings.user_id == user_id)
+            result = await session.execute(stmt)
+            settings = result.scalar_one_or_none()
+        if settings is not None:
+            settings = user_settings_cache.put(settings)
+        return settings
+    
+    @staticmethod
+    def invalidate_cached(user_id: int) -> None:
+        """Сбросить кэш настроек пользователя (после изменения в БД)."""
+        user_settings_cache.invalidate(user_id)
+    
     @staticmethod
     async def update_settings(
         session: AsyncSession,
@@ -62,6 +165,7 @@ class UserSettingsService:
         
         settings.updated_at = datetime.utcnow()
         await session.commit()
+        user_settings_cache.invalidate(user_id)
         await session.refresh(settings)
         logger.debug(f"Обновлены настройки для пользователя {user_id}")
         return settings
@@ -70,44 +174,109 @@ class UserSettingsService:
     async def get_users_with_daily_notifications(
         session: AsyncSession,
         target_hour: int,
-        target_minute: int
+        target_minute: int,
+        window_minutes: int = 1
     ) -> list[UserSettings]:
-        """Получить пользователей, у которых включены ежедневные уведомления на указанное время."""
-        stmt = select(UserSettings).where(
+        """
+        Получить пользователей, у которых включены ежедневные уведомления
+        на время из интервала [target, target + window_minutes).
+        """
+        start = target_hour * 60 + target_minute
+        end = start + window_minutes
+        conditions = [
             UserSettings.enable_daily_notifications == True,
-            UserSettings.notification_time == time(target_hour, target_minute)
-        )
+            UserSettings.notification_time >= time(target_hour, target_minute),
+        ]
+        if end < 24 * 60:
+            conditions.append(UserSettings.notification_time < time(end // 60, end % 60))
+        stmt = select(UserSettings).where(*conditions)
         result = await session.execute(stmt)
         users = result.scalars().all()
         return users
-    
+
+    @staticmethod
+    async def get_notification_schedule(session: AsyncSession) -> list[tuple[int, time]]:
+        """Пары (user_id, notification_time) всех подписчиков ежедневных уведомлений."""
+        stmt = select(UserSettings.user_id, UserSettings.notification_time).where(
+            UserSettings.enable_daily_notifications == True  # noqa: E712
+        )
+        result = await session.execute(stmt)
+        return [(user_id, at) for user_id, at in result.all()]
+
+    @staticmethod
+    async def get_users_by_ids(
+        session: AsyncSession,
+        user_ids: list[int]
+    ) -> list[UserSettings]:
+        """Получить настройки пользователей по списку ID (возобновление рассылки)."""
+        if not user_ids:
+            return []
+        stmt = select(UserSettings).where(UserSettings.user_id.in_(user_ids))
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def get_broadcast_recipients(session: AsyncSession) -> list[int]:
+        """ID всех пользователей бота для рассылки (по возрастанию)."""
+        stmt = select(UserSettings.user_id).order_by(UserSettings.user_id)
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def disable_notifications(
+        session: AsyncSession,
+        user_ids: list[int]
+    ) -> int:
+        """Отключить ежедневные уведомления (пользователь заблокировал бота)."""
+        if not user_ids:
+            return 0
+        stmt = (
+            update(UserSettings)
+            .where(UserSettings.user_id.in_(user_ids))
+            .values(enable_daily_notifications=False, updated_at=datetime.utcnow())
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        user_settings_cache.invalidate_many(user_ids)
+        return result.rowcount or 0
+
     @staticmethod
     async def increment_consultation_count(
         session: AsyncSession,
         user_id: int
     ) -> None:
-        """Увеличить счётчик консультаций пользователя."""
-        stmt = select(UserSettings).where(UserSettings.user_id == user_id)
-        result = await session.execute(stmt)
-        settings = result.scalar_one_or_none()
-        
-        if settings:
-            settings.total_consultations += 1
-            await session.commit()
+        """Увеличить счётчик консультаций пользователя (через буфер счётчиков)."""
+        buffer = get_counter_buffer()
+        if buffer is not None:
+            buffer.add(user_id, "total_consultations")
+            return
+        stmt = (
+            update(UserSettings)
+            .where(UserSettings.user_id == user_id)
+            .values(total_consultations=UserSettings.total_consultations + 1)
+        )
+        await session.execute(stmt)
+        await session.commit()
+        user_settings_cache.invalidate(user_id)
     
     @staticmethod
     async def increment_files_count(
         session: AsyncSession,
         user_id: int
     ) -> None:
-        """Увеличить счётчик загруженных файлов."""
-        stmt = select(UserSettings).where(UserSettings.user_id == user_id)
-        result = await session.execute(stmt)
-        settings = result.scalar_one_or_none()
-        
-        if settings:
-            settings.total_files_uploaded += 1
-            await session.commit()
+        """Увеличить счётчик загруженных файлов (через буфер счётчиков)."""
+        buffer = get_counter_buffer()
+        if buffer is not None:
+            buffer.add(user_id, "total_files_uploaded")
+            return
+        stmt = (
+            update(UserSettings)
+            .where(UserSettings.user_id == user_id)
+            .values(total_files_uploaded=UserSettings.total_files_uploaded + 1)
+        )
+        await session.execute(stmt)
+        await session.commit()
+        user_settings_cache.invalidate(user_id)
     
     @staticmethod
     async def set_ai_mode(
@@ -137,9 +306,7 @@ class UserSettingsService:
         user_id: int
     ) -> bool:
         """Получить состояние режима ИИ."""
-        stmt = select(UserSettings).where(UserSettings.user_id == user_id)
-        result = await session.execute(stmt)
-        settings = result.scalar_one_or_none()
+        settings = await UserSettingsService.get_cached(session, user_id, create=False)
         if settings:
             return settings.ai_mode
         return False
@@ -150,9 +317,7 @@ class UserSettingsService:
         user_id: int
     ) -> bool:
         """Получить состояние гибридного режима."""
-        stmt = select(UserSettings).where(UserSettings.user_id == user_id)
-        result = await session.execute(stmt)
-        settings = result.scalar_one_or_none()
+        settings = await UserSettingsService.get_cached(session, user_id, create=False)
         if settings:
             return settings.hybrid_mode
         return False
@@ -163,17 +328,18 @@ class UserSettingsService:
         user_id: int
     ) -> dict:
         """Получить статистику пользователя."""
-        stmt = select(UserSettings).where(UserSettings.user_id == user_id)
-        result = await session.execute(stmt)
-        settings = result.scalar_one_or_none()
-        
-        if not settings:
-            return {}
-        
+        settings = await UserSettingsService.get_cached(session, user_id, create=False)
+        return UserSettingsService.stats_of(settings) if settings else {}
+    
+    @staticmethod
+    def stats_of(settings: UserSettings) -> dict:
+        """Статистика по уже загруженным настройкам (без запроса к БД)."""
+        buffer = get_counter_buffer()
+        pending = buffer.pending(settings.user_id) if buffer is not None else {}
         return {
             "user_id": settings.user_id,
-            "total_consultations": settings.total_consultations,
-            "total_files_uploaded": settings.total_files_uploaded,
+            "total_consultations": settings.total_consultations + pending.get("total_consultations", 0),
+            "total_files_uploaded": settings.total_files_uploaded + pending.get("total_files_uploaded", 0),
             "last_active": settings.last_active,
             "favorite_modules": settings.get_favorite_modules_list(),
             "notification_time": settings.notification_time.strftime("%H:%M"),
@@ -192,41 +358,89 @@ class UserSettingsService:
         Returns:
             (can_request: bool, reason: str)
         """
-        stmt = select(UserSettings).where(UserSettings.user_id == user_id)
-        result = await session.execute(stmt)
-        settings = result.scalar_one_or_none()
-        
-        if not settings:
-            # Создаём настройки по умолчанию
-            settings = await UserSettingsService.get_or_create(session, user_id)
+        buffer = get_counter_buffer()
+        if buffer is not None:
+            # Счётчик из памяти: снимок БД + ещё не записанные инкременты
+            quota = await buffer.ai_quota(session, user_id)
+            if quota is None:
+                # Создаём настройки по умолчанию
+                await UserSettingsService.get_or_create(session, user_id)
+                quota = await buffer.ai_quota(session, user_id)
+            used, limit = quota
+        else:
+            stmt = select(UserSettings).where(UserSettings.user_id == user_id)
+            result = await session.execute(stmt)
+            settings = result.scalar_one_or_none()
+            
+            if not settings:
+                # Создаём настройки по умолчанию
+                settings = await UserSettingsService.get_or_create(session, user_id)
+            
+            # Сброс дневного счётчика учитывается при чтении, без записи в БД
+            today = datetime.utcnow().date()
+            last_request_date = settings.last_ai_request_date.date() if settings.last_ai_request_date else None
+            used = settings.daily_ai_requests if last_request_date == today else 0
+            limit = settings.ai_requests_limit
         
         # Если пользователь не платный, отказываем
         if not is_premium_user:
-            return False, "⚠️ *Доступ ограничен*\n\nЗапросы к ИИ доступны только платным подписчикам.\n\nДля получения доступа закажите консультацию через раздел «💎 Консультация (777 ₽)»."
+            return False, AI_PREMIUM_REQUIRED
         
-        # Проверяем сброс дневного счётчика
-        today = datetime.utcnow().date()
-        last_request_date = settings.last_ai_request_date.date() if settings.last_ai_request_date else None
+        # Проверяем лимит
+        if used >= limit:
+            return False, _ai_limit_reached(used, limit)
         
-        if last_request_date != today:
-            # Сбрасываем счётчик на новый день
-            settings.daily_ai_requests = 0
-            settings.last_ai_request_date = datetime.utcnow()
-            await session.commit()
+        return True, ""
+    
+    @staticmethod
+    async def try_consume_ai_request(
+        session: AsyncSession,
+        user_id: int,
+        is_premium_user: bool,
+        n: int = 1
+    ) -> tuple[bool, str]:
+        """
+        Проверить лимит ИИ и сразу списать n запросов — одной атомарной
+        операцией (параллельные запросы пользователя не превысят лимит).
         
-        # Проверяем лимит
-        limit = settings.ai_requests_limit
-        if settings.daily_ai_requests >= limit:
-            return False, f"⚠️ *Дневной лимит исчерпан*\n\nВы использовали {settings.daily_ai_requests} из {limit} запросов ИИ за сегодня.\n\nЛимит обновится в 00:00 по UTC."
+        Returns:
+            (allowed: bool, reason: str)
+        """
+        if not is_premium_user:
+            return False, AI_PREMIUM_REQUIRED
         
+        quota = get_ai_quota()
+        result = await quota.try_consume(session, user_id, n)
+        if result is None:
+            # Создаём настройки по умолчанию
+            await UserSettingsService.get_or_create(session, user_id)
+            result = await quota.try_consume(session, user_id, n)
+        
+        if not result.allowed:
+            return False, _ai_limit_reached(result.used, result.limit)
+        record_stat(AI_REQUESTS, n)
         return True, ""
     
+    @staticmethod
+    async def refund_ai_request(
+        session: AsyncSession,
+        user_id: int,
+        n: int = 1
+    ) -> None:
+        """Вернуть n запросов, списанных try_consume_ai_request (запрос не выполнен)."""
+        await get_ai_quota().refund(session, user_id, n)
+        record_stat(AI_REQUESTS, -n)
+    
     @staticmethod
     async def increment_ai_request_count(
         session: AsyncSession,
         user_id: int
     ) -> None:
-        """Увеличить счётчик запросов ИИ."""
+        """Увеличить счётчик запросов ИИ (через буфер счётчиков)."""
+        buffer = get_counter_buffer()
+        if buffer is not None:
+            buffer.add_ai_request(user_id)
+            return
         stmt = select(UserSettings).where(UserSettings.user_id == user_id)
         result = await session.execute(stmt)
         settings = result.scalar_one_or_none()
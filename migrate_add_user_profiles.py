@@ -0,0 +1,61 @@
+"""
+Миграция для добавления справочника user_profiles (поиск пользователей
+по username и имени) и заполнения его по заказам, черновикам и предсказаниям.
+
+PostgreSQL: создаётся расширение pg_trgm и триграммные GIN-индексы.
+SQLite: создаётся FTS5-таблица user_profiles_fts с триггерами синхронизации.
+"""
+
+import asyncio
+import logging
+from sqlalchemy import inspect, text
+from bot.database.engine import create_engine
+from bot.models.base import Base
+import bot.models  # регистрация всех моделей
+from bot.models.user_profile import FTS_TABLE
+from bot.config import settings
+from bot.services.user_profiles import UserProfileService
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+async def main():
+    """Добавляем таблицу user_profiles и заполняем её"""
+
+    engine = create_engine(settings.database.url)
+
+    log.info("Создаём таблицу user_profiles...")
+
+    async with engine.begin() as conn:
+        # Создаём все таблицы, которых ещё нет (и индексы поиска вместе с user_profiles)
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Проверяем существование таблицы
+    async with engine.begin() as conn:
+        columns = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_columns("user_profiles")
+        )
+        log.info("✅ Таблица user_profiles существует:")
+        for col in columns:
+            log.info(f"  - {col['name']} ({col['type']})")
+
+    # Заполнение по уже сохранённым данным (повторный запуск безопасен)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        added = await UserProfileService.backfill(session)
+    log.info(f"✅ Добавлено профилей: {added}")
+
+    if engine.dialect.name == "sqlite":
+        # Пересборка полнотекстового индекса по содержимому user_profiles
+        async with engine.begin() as conn:
+            await conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        log.info(f"✅ Индекс {FTS_TABLE} пересобран")
+
+    # Закрываем соединение
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
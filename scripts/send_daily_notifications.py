@@ -8,7 +8,7 @@
 import asyncio
 import logging
 import sys
-from datetime import datetime, time
+from datetime import date, datetime, time
 from pathlib import Path
 
 # Р”РѕР±Р°РІР»СЏРµРј РїСѓС‚СЊ Рє РїСЂРѕРµРєС‚Сѓ
@@ -17,12 +17,12 @@ sys.path.insert(0, str(Path(__file__).parent))
 from bot.database.engine import create_engine, get_session_maker
 from bot.services.user_settings import UserSettingsService
 from bot.services.daily_content import DailyContentService
-from bot.config import Settings
+from bot.services.broadcast import BroadcastEngine, unfinished_broadcasts
+from bot.config import Settings, settings as app_settings
 
 # Telegram Bot
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
-from aiogram.exceptions import TelegramAPIError
 
 
 logging.basicConfig(
@@ -36,6 +36,9 @@ logging.basicConfig(
 )
 log = logging.getLogger("cron_notifications")
 
+# РЁР°Рі Р·Р°РїСѓСЃРєР° cron: Р±РµСЂС‘Рј РІСЃРµС…, С‡СЊС‘ РІСЂРµРјСЏ РїРѕРїР°РґР°РµС‚ РІ С‚РµРєСѓС‰РёР№ 5-РјРёРЅСѓС‚РЅС‹Р№ СЃР»РѕС‚
+CRON_INTERVAL_MINUTES = 5
+
 
 class TelegramSender:
     """РћС‚РїСЂР°РІС‰РёРє СЃРѕРѕР±С‰РµРЅРёР№ С‡РµСЂРµР· Telegram Bot API."""
@@ -43,59 +46,19 @@ class TelegramSender:
     def __init__(self, token: str):
         self.bot = Bot(token=token, default=DefaultBotProperties(parse_mode="Markdown"))
     
-    async def send_message(self, user_id: int, text: str) -> bool:
-        """РћС‚РїСЂР°РІРёС‚СЊ СЃРѕРѕР±С‰РµРЅРёРµ РїРѕР»СЊР·РѕРІР°С‚РµР»СЋ."""
-        try:
-            await self.bot.send_message(chat_id=user_id, text=text)
-            log.debug(f"РЎРѕРѕР±С‰РµРЅРёРµ РѕС‚РїСЂР°РІР»РµРЅРѕ РїРѕР»СЊР·РѕРІР°С‚РµР»СЋ {user_id}")
-            return True
-        except TelegramAPIError as e:
-            log.error(f"РћС€РёР±РєР° Telegram API РґР»СЏ РїРѕР»СЊР·РѕРІР°С‚РµР»СЏ {user_id}: {e}")
-            return False
-        except Exception as e:
-            log.error(f"РќРµРёР·РІРµСЃС‚РЅР°СЏ РѕС€РёР±РєР° РїСЂРё РѕС‚РїСЂР°РІРєРµ РїРѕР»СЊР·РѕРІР°С‚РµР»СЋ {user_id}: {e}")
-            return False
-    
     async def close(self):
         """Р—Р°РєСЂС‹С‚СЊ СЃРµСЃСЃРёСЋ Р±РѕС‚Р°."""
         await self.bot.session.close()
 
 
-async def send_notification_to_user(user_id: int, settings, sender: TelegramSender) -> bool:
-    """
-    РћС‚РїСЂР°РІРёС‚СЊ СѓРІРµРґРѕРјР»РµРЅРёРµ РїРѕР»СЊР·РѕРІР°С‚РµР»СЋ.
-    Р’РѕР·РІСЂР°С‰Р°РµС‚ True РµСЃР»Рё РѕС‚РїСЂР°РІР»РµРЅРѕ СѓСЃРїРµС€РЅРѕ, False РІ СЃР»СѓС‡Р°Рµ РѕС€РёР±РєРё.
-    """
-    # Р“РµРЅРµСЂРёСЂСѓРµРј СѓРІРµРґРѕРјР»РµРЅРёРµ РЅР° РѕСЃРЅРѕРІРµ РЅР°СЃС‚СЂРѕРµРє
-    try:
-        notification_text = DailyContentService.generate_daily_notification(
-            user_id=user_id,
-            include_rune=settings.notify_rune_of_day,
-            include_affirmation=settings.notify_affirmation_of_day,
-            include_tarot=settings.notify_tarot_card_of_day,
-            include_zodiac=settings.notify_horoscope_daily,
-            include_meditation=settings.notify_meditation_reminder,
-        )
-        
-        log.info(f"рџ“Ё РћС‚РїСЂР°РІРєР° СѓРІРµРґРѕРјР»РµРЅРёСЏ РїРѕР»СЊР·РѕРІР°С‚РµР»СЋ {user_id}")
-        success = await sender.send_message(user_id, notification_text)
-        
-        if success:
-            log.info(f"вњ… РЈРІРµРґРѕРјР»РµРЅРёРµ РѕС‚РїСЂР°РІР»РµРЅРѕ РїРѕР»СЊР·РѕРІР°С‚РµР»СЋ {user_id}")
-        else:
-            log.warning(f"вќЊ РќРµ СѓРґР°Р»РѕСЃСЊ РѕС‚РїСЂР°РІРёС‚СЊ СѓРІРµРґРѕРјР»РµРЅРёРµ РїРѕР»СЊР·РѕРІР°С‚РµР»СЋ {user_id}")
-        
-        return success
-        
-    except Exception as e:
-        log.error(f"РћС€РёР±РєР° РіРµРЅРµСЂР°С†РёРё СѓРІРµРґРѕРјР»РµРЅРёСЏ РґР»СЏ {user_id}: {e}")
-        return False
-
-
 async def process_daily_notifications():
     """РћСЃРЅРѕРІРЅР°СЏ С„СѓРЅРєС†РёСЏ РѕР±СЂР°Р±РѕС‚РєРё СѓРІРµРґРѕРјР»РµРЅРёР№."""
     log.info("рџ”„ Р—Р°РїСѓСЃРє РїСЂРѕРІРµСЂРєРё РµР¶РµРґРЅРµРІРЅС‹С… СѓРІРµРґРѕРјР»РµРЅРёР№")
     
+    if app_settings.notifications.enabled:
+        log.info("в„№пёЏ РЈРІРµРґРѕРјР»РµРЅРёСЏ СЂР°СЃСЃС‹Р»Р°РµС‚ РїР»Р°РЅРёСЂРѕРІС‰РёРє РІРЅСѓС‚СЂРё Р±РѕС‚Р° (NOTIFICATION_SCHEDULER_ENABLED=true)")
+        return
+    
     settings = Settings()
     engine = create_engine(settings.DATABASE_URL)
     session_maker = get_session_maker(engine)
@@ -103,41 +66,51 @@ async def process_daily_notifications():
     
     current_time = datetime.now().time()
     current_hour = current_time.hour
-    current_minute = current_time.minute
+    current_minute = current_time.minute - current_time.minute % CRON_INTERVAL_MINUTES
     
     log.info(f"вЏ° РўРµРєСѓС‰РµРµ РІСЂРµРјСЏ: {current_hour:02d}:{current_minute:02d}")
     
+    today = date.today()
+    broadcaster = BroadcastEngine(sender.bot, session_maker)
+    
     try:
+        # Р Р°СЃСЃС‹Р»РєРё СЃР»РѕС‚РѕРІ, РїСЂРµСЂРІР°РЅРЅС‹Рµ РїР°РґРµРЅРёРµРј РїСЂРµРґС‹РґСѓС‰РµРіРѕ Р·Р°РїСѓСЃРєР°
+        for checkpoint in unfinished_broadcasts(f"daily-{today.isoformat()}-"):
+            async with session_maker() as session:
+                users = await UserSettingsService.get_users_by_ids(session, checkpoint.recipients)
+            log.info(f"рџ”Ѓ РџСЂРѕРґРѕР»Р¶РµРЅРёРµ СЂР°СЃСЃС‹Р»РєРё {checkpoint.run_id}: {len(users)} РїРѕР»СѓС‡Р°С‚РµР»РµР№")
+            await broadcaster.run(
+                checkpoint.run_id,
+                DailyContentService.generate_daily_notifications(users, day=today),
+                meta=checkpoint.meta,
+            )
+        
         async with session_maker() as session:
             # РџРѕР»СѓС‡Р°РµРј РїРѕР»СЊР·РѕРІР°С‚РµР»РµР№ СЃ РІРєР»СЋС‡РµРЅРЅС‹РјРё СѓРІРµРґРѕРјР»РµРЅРёСЏРјРё РЅР° С‚РµРєСѓС‰РµРµ РІСЂРµРјСЏ
             users = await UserSettingsService.get_users_with_daily_notifications(
-                session, current_hour, current_minute
+                session, current_hour, current_minute, CRON_INTERVAL_MINUTES
             )
-            
-            log.info(f"рџ‘¤ РќР°Р№РґРµРЅРѕ РїРѕР»СЊР·РѕРІР°С‚РµР»РµР№ РґР»СЏ СѓРІРµРґРѕРјР»РµРЅРёР№: {len(users)}")
-            
-            sent_count = 0
-            error_count = 0
-            
-            for user_settings in users:
-                log.debug(f"РћР±СЂР°Р±РѕС‚РєР° РїРѕР»СЊР·РѕРІР°С‚РµР»СЏ {user_settings.user_id}")
-                success = await send_notification_to_user(
-                    user_settings.user_id, 
-                    user_settings, 
-                    sender
-                )
-                if success:
-                    sent_count += 1
-                else:
-                    error_count += 1
-                
-                # РќРµР±РѕР»СЊС€Р°СЏ Р·Р°РґРµСЂР¶РєР° РјРµР¶РґСѓ РїРѕР»СЊР·РѕРІР°С‚РµР»СЏРјРё
-                await asyncio.sleep(0.3)
         
-        log.info(f"вњ… РЈРІРµРґРѕРјР»РµРЅРёСЏ РѕС‚РїСЂР°РІР»РµРЅС‹: {sent_count}, РѕС€РёР±РѕРє: {error_count}")
+        log.info(f"рџ‘¤ РќР°Р№РґРµРЅРѕ РїРѕР»СЊР·РѕРІР°С‚РµР»РµР№ РґР»СЏ СѓРІРµРґРѕРјР»РµРЅРёР№: {len(users)}")
         
-        if sent_count == 0 and error_count == 0:
+        if not users:
             log.info("в„№пёЏ РќРµС‚ РїРѕР»СЊР·РѕРІР°С‚РµР»РµР№ РґР»СЏ СѓРІРµРґРѕРјР»РµРЅРёР№ РІ СЌС‚Рѕ РІСЂРµРјСЏ.")
+            return
+        
+        # РўРµРєСЃС‚С‹ РІСЃРµР№ РєРѕРіРѕСЂС‚С‹ СЃР»РѕС‚Р°: РѕР±С‰РёРµ Р±Р»РѕРєРё РґРЅСЏ СЃС‡РёС‚Р°СЋС‚СЃСЏ РѕРґРёРЅ СЂР°Р·
+        notifications = DailyContentService.generate_daily_notifications(users, day=today)
+        
+        # РџСѓР» РѕС‚РїСЂР°РІРёС‚РµР»РµР№ РІ С‚РµРјРїРµ Р»РёРјРёС‚РѕРІ Telegram, РїСЂРѕРіСЂРµСЃСЃ вЂ” РІ checkpoint
+        stats = await broadcaster.run(
+            f"daily-{today.isoformat()}-{current_hour:02d}{current_minute:02d}",
+            notifications,
+            meta={"kind": "daily", "day": today.isoformat()},
+        )
+        
+        log.info(
+            f"вњ… РЈРІРµРґРѕРјР»РµРЅРёСЏ РѕС‚РїСЂР°РІР»РµРЅС‹: {stats.sent}, РѕС€РёР±РѕРє: {stats.failed}, "
+            f"Р·Р°Р±Р»РѕРєРёСЂРѕРІР°Р»Рё Р±РѕС‚Р°: {stats.blocked}"
+        )
     
     finally:
         await sender.close()
@@ -0,0 +1,37 @@
+# tests/test_ai_mode_finalize.py
+from unittest.mock import AsyncMock, MagicMock, call
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from bot.handlers.ai_mode import _finalize_part
+
+
+def _retry_after() -> TelegramRetryAfter:
+    return TelegramRetryAfter(method=MagicMock(), message="Too Many Requests", retry_after=0)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_keeps_markdown():
+    msg = MagicMock()
+    msg.edit_text = AsyncMock(side_effect=[_retry_after(), _retry_after(), None])
+
+    await _finalize_part(msg, "*ответ*", parse_mode="Markdown")
+
+    assert msg.edit_text.await_args_list == [call("*ответ*", parse_mode="Markdown")] * 3
+
+
+@pytest.mark.asyncio
+async def test_parse_error_drops_markdown():
+    msg = MagicMock()
+    msg.edit_text = AsyncMock(side_effect=[
+        TelegramBadRequest(method=MagicMock(), message="Bad Request: can't parse entities"),
+        _retry_after(),
+        None,
+    ])
+
+    await _finalize_part(msg, "*ответ", parse_mode="Markdown")
+
+    assert msg.edit_text.await_args_list == [
+        call("*ответ", parse_mode="Markdown"), call("*ответ"), call("*ответ"),
+    ]
@@ -0,0 +1,56 @@
+# tests/test_ai_quota.py
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.engine import create_engine
+from bot.models.base import Base
+from bot.models.user_settings import UserSettings
+from bot.services import ai_quota
+from bot.services.ai_quota import BufferAIQuota, SqlAIQuota
+from bot.services.counter_buffer import CounterBuffer
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'quota.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with maker() as session:
+        session.add(UserSettings(user_id=1, daily_ai_requests=0, ai_requests_limit=2))
+        await session.commit()
+    yield maker
+    await engine.dispose()
+
+
+async def _used(session_maker) -> int:
+    async with session_maker() as session:
+        return (
+            await session.execute(select(UserSettings.daily_ai_requests).where(UserSettings.user_id == 1))
+        ).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_sql_refund_returns_consumed_request(session_maker):
+    quota = SqlAIQuota()
+    async with session_maker() as session:
+        assert (await quota.try_consume(session, 1)).allowed
+        await quota.refund(session, 1)
+        await quota.refund(session, 1)      # лишний возврат не уводит счётчик ниже нуля
+    assert await _used(session_maker) == 0
+
+
+@pytest.mark.asyncio
+async def test_buffer_refund_frees_the_slot(session_maker, monkeypatch):
+    buffer = CounterBuffer(session_maker)
+    monkeypatch.setattr(ai_quota, "get_counter_buffer", lambda: buffer)
+    quota = BufferAIQuota()
+    async with session_maker() as session:
+        assert (await quota.try_consume(session, 1, 2)).allowed
+        await quota.refund(session, 1)
+        assert (await quota.try_consume(session, 1)).allowed
+        assert not (await quota.try_consume(session, 1)).allowed
+    await buffer.flush()
+    assert await _used(session_maker) == 2
@@ -0,0 +1,58 @@
+# tests/test_broadcast.py
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError
+
+from bot.config import BroadcastConfig
+from bot.services import broadcast
+from bot.services.broadcast import BroadcastEngine, _pacer_for
+
+
+def _bot(bot_id: int = 42) -> MagicMock:
+    bot = MagicMock()
+    bot.id = bot_id
+    bot.send_message = AsyncMock(
+        side_effect=TelegramForbiddenError(method=MagicMock(), message="bot was blocked by the user")
+    )
+    return bot
+
+
+@pytest.fixture
+def config(tmp_path):
+    return BroadcastConfig(
+        workers=2, global_rate=0, per_chat_interval=0,
+        checkpoint_every=1, checkpoint_dir=str(tmp_path),
+    )
+
+
+def test_pacer_is_shared_per_bot():
+    first = _pacer_for(_bot(1), 25.0)
+    assert _pacer_for(_bot(1), 25.0) is first
+    assert _pacer_for(_bot(2), 25.0) is not first
+
+
+@pytest.mark.asyncio
+async def test_blocked_users_kept_until_disable_succeeds(config, monkeypatch):
+    written: list[int] = []
+    calls = 0
+
+    async def disable(session, user_ids):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("database is locked")
+        written.extend(user_ids)
+        return len(user_ids)
+
+    monkeypatch.setattr(broadcast.UserSettingsService, "disable_notifications", disable)
+    session_maker = MagicMock()
+    session_maker.return_value.__aenter__ = AsyncMock()
+    session_maker.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    engine = BroadcastEngine(_bot(), session_maker, config=config)
+    stats = await engine.run("test-blocked", {10: "a", 20: "b", 30: "c"})
+
+    assert stats.blocked == 3
+    # Первая запись упала — её пользователи ушли в следующую
+    assert sorted(written) == [10, 20, 30]
@@ -0,0 +1,87 @@
+# tests/test_counter_buffer.py
+from datetime import date, datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from bot.database.engine import create_engine
+from bot.models.base import Base
+from bot.models.user_settings import UserSettings
+from bot.services import counter_buffer
+from bot.services.counter_buffer import CounterBuffer
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+YESTERDAY = date(2026, 5, 1)
+TODAY = date(2026, 5, 2)
+
+
+class _Clock:
+    """Подменяемое «сейчас» для буфера (UTC)."""
+
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def utcnow(self) -> datetime:
+        return self.now
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'counters.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with maker() as session:
+        session.add(UserSettings(user_id=1, daily_ai_requests=0))
+        await session.commit()
+    yield maker
+    await engine.dispose()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock(datetime(2026, 5, 1, 23, 59, 30))
+    fake = type("fake_datetime", (datetime,), {"utcnow": staticmethod(clock.utcnow)})
+    monkeypatch.setattr(counter_buffer, "datetime", fake)
+    return clock
+
+
+async def _row(session_maker):
+    async with session_maker() as session:
+        return (
+            await session.execute(
+                select(UserSettings.daily_ai_requests, UserSettings.last_ai_request_date)
+                .where(UserSettings.user_id == 1)
+            )
+        ).one()
+
+
+@pytest.mark.asyncio
+async def test_flush_after_midnight_keeps_yesterday_out_of_today(session_maker, clock):
+    buffer = CounterBuffer(session_maker)
+    buffer.add_ai_request(1, 3)            # 23:59:30 — вчера
+    clock.now = datetime(2026, 5, 2, 0, 0, 10)
+    buffer.add_ai_request(1, 2)            # 00:00:10 — сегодня
+    await buffer.flush()
+
+    used, last = await _row(session_maker)
+    assert (used, last.date()) == (2, TODAY)
+
+    async with session_maker() as session:
+        assert await buffer.ai_quota(session, 1) == (2, 10)
+
+
+@pytest.mark.asyncio
+async def test_yesterday_batch_flushed_after_midnight_is_stamped_yesterday(session_maker, clock):
+    buffer = CounterBuffer(session_maker)
+    buffer.add_ai_request(1, 4)            # вчера, записывается уже после полуночи
+    clock.now = datetime(2026, 5, 2, 0, 0, 10)
+    await buffer.flush()
+
+    used, last = await _row(session_maker)
+    assert (used, last.date()) == (4, YESTERDAY)
+
+    buffer.forget(1)
+    async with session_maker() as session:
+        assert await buffer.ai_quota(session, 1) == (0, 10)
@@ -0,0 +1,42 @@
+# tests/test_daily_stats.py
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.engine import create_engine
+from bot.models.base import Base
+from bot.models.order import Order, OrderStatus
+from bot.services import daily_stats
+from bot.services.daily_stats import ORDER_STATUS, DailyStatsRecorder, DailyStatsService, status_metric
+
+NEW_ORDERS = status_metric(ORDER_STATUS, OrderStatus.NEW)
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_transition_after_cutoff_not_counted_twice(session_maker, monkeypatch):
+    recorder = DailyStatsRecorder(session_maker)
+    reconcile = DailyStatsService.reconcile
+
+    async def reconcile_with_new_order(session, **kwargs):
+        # Заказ создан во время сверки: он уже в таблице, его отметка — в буфере
+        session.add(Order(user_id=1, question="?", birth_date="01.01.1990"))
+        await session.commit()
+        recorder.record(NEW_ORDERS)
+        return await reconcile(session, **kwargs)
+
+    monkeypatch.setattr(daily_stats.DailyStatsService, "reconcile", reconcile_with_new_order)
+    await recorder.reconcile()
+    await recorder.flush()
+
+    async with session_maker() as session:
+        totals = await DailyStatsService.rollup(session, prefix=ORDER_STATUS)
+    assert totals.get(NEW_ORDERS) == 1
@@ -0,0 +1,72 @@
+# tests/test_llm_coalescing.py
+import asyncio
+
+import pytest
+
+from bot.config import LLMSchedulerConfig
+from bot.services.llm import LLMService, Priority, QueueFullError
+from bot.services.llm_scheduler import LLMScheduler
+
+QUESTION = [{"role": "user", "content": "Что значит Башня?"}]
+ANSWER = {"choices": [{"message": {"content": "Перемены"}}]}
+
+
+class _Provider:
+    """Подмена опроса провайдеров: отвечает после gate, считает вызовы."""
+
+    def __init__(self):
+        self.calls = 0
+        self.gate = asyncio.Event()
+
+    async def __call__(self, **request) -> dict:
+        self.calls += 1
+        await self.gate.wait()
+        return ANSWER
+
+
+def _service(monkeypatch, capacity: int) -> tuple[LLMService, _Provider]:
+    service = LLMService()
+    provider = _Provider()
+    monkeypatch.setattr(service, "_chat_completion_routed", provider)
+    service.scheduler = LLMScheduler(LLMSchedulerConfig(user_max_queued=1), capacity=lambda: capacity)
+    return service, provider
+
+
+@pytest.mark.asyncio
+async def test_admitted_identical_requests_share_one_call(monkeypatch):
+    service, provider = _service(monkeypatch, capacity=2)
+    first = asyncio.create_task(service.chat_completion(QUESTION, user_id=1))
+    second = asyncio.create_task(service.chat_completion(QUESTION, user_id=2))
+    await asyncio.sleep(0)
+    provider.gate.set()
+
+    assert await asyncio.wait_for(asyncio.gather(first, second), 1) == [ANSWER, ANSWER]
+    assert provider.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_joined_caller_queues_in_own_lane(monkeypatch):
+    service, provider = _service(monkeypatch, capacity=1)
+    positions: list[int] = []
+
+    async def on_queue(position: int) -> None:
+        positions.append(position)
+
+    first = asyncio.create_task(service.chat_completion(QUESTION, user_id=1))
+    await asyncio.sleep(0)
+    other = asyncio.create_task(
+        service.chat_completion([{"role": "user", "content": "другое"}], user_id=1)
+    )
+    paid = asyncio.create_task(
+        service.chat_completion(QUESTION, user_id=2, priority=Priority.PAID, on_queue=on_queue)
+    )
+    await asyncio.sleep(0)
+
+    # Очередь пользователя 1 занята — отказ только ему, не пользователю 2
+    with pytest.raises(QueueFullError):
+        await asyncio.wait_for(service.chat_completion(QUESTION, user_id=1), 1)
+
+    provider.gate.set()
+    assert await asyncio.wait_for(asyncio.gather(first, other, paid), 1) == [ANSWER] * 3
+    # Оплативший ждал в своей полосе и видел позицию
+    assert positions and positions[0] == 1
@@ -0,0 +1,97 @@
+# tests/test_llm_provider_quota.py
+import json
+
+import httpx
+import pytest
+
+from bot.config import RateLimitConfig
+from bot.services import llm
+from bot.services.llm import LLMError, LLMProvider
+
+TPM = 100_000
+MESSAGES = [{"role": "user", "content": "Расклад на неделю"}]
+
+
+def _provider(*responses: httpx.Response | Exception) -> LLMProvider:
+    provider = LLMProvider(
+        name="Test", api_key="key", base_url="https://llm.test/v1", model="test-model",
+        max_retries=len(responses), retry_delay=0,
+        rate_limit=RateLimitConfig(tokens_per_minute=TPM),
+    )
+    replies = iter(responses)
+
+    def reply(request: httpx.Request) -> httpx.Response:
+        response = next(replies)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    provider._client = httpx.AsyncClient(
+        base_url=provider.base_url,
+        transport=httpx.MockTransport(reply),
+    )
+    return provider
+
+
+@pytest.fixture
+def no_retry_pause(monkeypatch):
+    async def sleep(delay, result=None):
+        return result
+    monkeypatch.setattr(llm.asyncio, "sleep", sleep)
+
+
+@pytest.mark.asyncio
+async def test_failed_attempts_refund_reservation():
+    provider = _provider(
+        httpx.Response(503),
+        httpx.Response(200, json={"choices": [], "usage": {"total_tokens": 10}}),
+    )
+    await provider.chat_completion(MESSAGES, max_tokens=2048)
+    # В квоте остался только фактический расход удачной попытки
+    assert provider.rate_limiter.tokens.tokens >= TPM - 10
+    await provider.close()
+
+
+@pytest.mark.asyncio
+async def test_final_failure_refunds_reservation():
+    provider = _provider(httpx.Response(500, text="boom"))
+    with pytest.raises(LLMError):
+        await provider.chat_completion(MESSAGES, max_tokens=2048)
+    assert provider.rate_limiter.tokens.tokens >= TPM - 1
+    await provider.close()
+
+
+@pytest.mark.asyncio
+async def test_stream_rejection_refunds_reservation():
+    provider = _provider(httpx.Response(429, headers={"retry-after": "0"}))
+    with pytest.raises(LLMError):
+        async for _ in provider.stream_chat_completion(MESSAGES, max_tokens=2048):
+            pass
+    assert provider.rate_limiter.tokens.tokens >= TPM - 1
+    await provider.close()
+
+
+@pytest.mark.asyncio
+async def test_timeout_then_success_refunds_timed_out_attempt(no_retry_pause):
+    provider = _provider(
+        httpx.ReadTimeout("read timed out"),
+        httpx.Response(200, json={"choices": [], "usage": {"total_tokens": 10}}),
+    )
+    await provider.chat_completion(MESSAGES, max_tokens=2048)
+    assert provider.rate_limiter.tokens.tokens >= TPM - 10
+    await provider.close()
+
+
+@pytest.mark.asyncio
+async def test_aborted_stream_keeps_only_generated_tokens():
+    chunks = "".join(
+        f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n"
+        for text in ("Руна", " дня", " — Феху")
+    )
+    provider = _provider(httpx.Response(200, text=chunks + "data: [DONE]\n\n"))
+    stream = provider.stream_chat_completion(MESSAGES, max_tokens=2048)
+    assert await anext(stream) == "Руна"
+    await stream.aclose()                   # пользователь прервал ответ / проигравший хедж
+    # Резерв под max_tokens вернулся: в расходе промпт и один фрагмент
+    assert provider.rate_limiter.tokens.tokens >= TPM - 100
+    await provider.close()
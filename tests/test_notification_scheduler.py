@@ -0,0 +1,40 @@
+# tests/test_notification_scheduler.py
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from bot.config import NotificationSchedulerConfig
+from bot.services import notification_scheduler
+from bot.services.broadcast import BroadcastCheckpoint
+from bot.services.notification_scheduler import NotificationScheduler
+
+
+@pytest.mark.asyncio
+async def test_ticks_while_interrupted_broadcast_resumes(monkeypatch):
+    scheduler = NotificationScheduler(MagicMock(), MagicMock(), config=NotificationSchedulerConfig())
+    checkpoint = BroadcastCheckpoint(run_id="daily-resume", recipients=[1, 2])
+    monkeypatch.setattr(
+        notification_scheduler, "unfinished_broadcasts", lambda prefix: [checkpoint],
+    )
+    resume_done = asyncio.Event()
+    ticked = asyncio.Event()
+
+    async def resume(cp, day):
+        # Долгое возобновление: завершится только после первого тика
+        await ticked.wait()
+        resume_done.set()
+
+    async def tick(now):
+        ticked.set()
+
+    monkeypatch.setattr(scheduler, "_resume", resume)
+    monkeypatch.setattr(scheduler, "_tick", tick)
+
+    task = asyncio.create_task(scheduler._run())
+    try:
+        await asyncio.wait_for(resume_done.wait(), timeout=1)
+    finally:
+        await scheduler.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,133 @@
+# tests/test_pagination.py
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.engine import create_engine
+from bot.models.base import Base
+from bot.models.order import Order
+from bot.services.pagination import (
+    FROM,
+    MAX_CURSOR_LEN,
+    NEXT,
+    PREV,
+    decode_cursor,
+    encode_cursor,
+    fetch_page,
+)
+
+KEY = (Order.created_at, Order.id)
+
+
+# --- Курсор ---
+
+@pytest.mark.parametrize("values", [
+    (0,),
+    (-42, 2**40),
+    (datetime(2026, 5, 1, 12, 0, 0, 123456), 987654321),
+    (datetime(2026, 5, 1, 12, 0, 0), 1),
+    (datetime(2026, 5, 1, 9, 30, 0, 1, tzinfo=timezone.utc), 7),
+])
+def test_cursor_round_trip(values):
+    assert decode_cursor(encode_cursor(*values)) == values
+
+
+def test_cursor_fits_callback_data():
+    # created_at с микросекундами + id BIGINT-порядка — в пределах лимита
+    cursor = encode_cursor(datetime(2099, 12, 31, 23, 59, 59, 999999), 2**53)
+    assert len(cursor) <= MAX_CURSOR_LEN
+
+
+def test_cursor_length_limit():
+    with pytest.raises(ValueError):
+        encode_cursor(*([datetime(2026, 5, 1, 12, 0, 0, 1)] * 3))
+    with pytest.raises(ValueError):
+        decode_cursor("i1." * 11 + "i1")
+
+
+@pytest.mark.parametrize("cursor", ["", "x1", "t", "i1.zz!"])
+def test_broken_cursor_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+# --- Страницы на SQLite: func.now() (секунды) вперемешку с datetime из Python ---
+
+@pytest_asyncio.fixture
+async def session(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'pages.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        # created_at как у func.now() — строка без микросекунд
+        for second in ("12:00:00", "12:00:00", "12:00:00", "12:00:01"):
+            session.add(_order(func.datetime(f"2026-05-01 {second}")))
+        # created_at из Python — с микросекундами, в той же секунде
+        for micro in (250000, 750000):
+            session.add(_order(datetime(2026, 5, 1, 12, 0, 0, micro)))
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+
+def _order(created_at) -> Order:
+    return Order(user_id=1, question="?", birth_date="01.01.1990", created_at=created_at)
+
+
+async def _expected(session) -> list[int]:
+    stmt = select(Order.id).order_by(Order.created_at.desc(), Order.id.desc())
+    return list((await session.execute(stmt)).scalars().all())
+
+
+def _ids(page) -> list[int]:
+    return [order.id for order in page.items]
+
+
+@pytest.mark.asyncio
+async def test_next_pages_cover_list_once(session):
+    seen: list[int] = []
+    cursor = None
+    while True:
+        page = await fetch_page(session, select(Order), KEY, 2, cursor, NEXT)
+        seen += _ids(page)
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert seen == await _expected(session)
+
+
+@pytest.mark.asyncio
+async def test_prev_and_from_return_same_rows(session):
+    first = await fetch_page(session, select(Order), KEY, 2)
+    second = await fetch_page(session, select(Order), KEY, 2, first.next_cursor, NEXT)
+    third = await fetch_page(session, select(Order), KEY, 2, second.next_cursor, NEXT)
+
+    back = await fetch_page(session, select(Order), KEY, 2, third.first_cursor, PREV)
+    assert _ids(back) == _ids(second)
+    assert not back.at_start
+
+    refreshed = await fetch_page(session, select(Order), KEY, 2, second.first_cursor, FROM)
+    assert _ids(refreshed) == _ids(second)
+
+
+@pytest.mark.asyncio
+async def test_prev_near_start_returns_first_page(session):
+    first = await fetch_page(session, select(Order), KEY, 4)
+    second = await fetch_page(session, select(Order), KEY, 4, first.next_cursor, NEXT)
+    back = await fetch_page(session, select(Order), KEY, 4, second.first_cursor, PREV)
+    assert back.at_start
+    assert _ids(back) == _ids(first)
+
+
+@pytest.mark.asyncio
+async def test_from_after_deleted_tail_shows_previous_page(session):
+    first = await fetch_page(session, select(Order), KEY, 4)
+    second = await fetch_page(session, select(Order), KEY, 4, first.next_cursor, NEXT)
+    await session.execute(delete(Order).where(Order.id.in_(_ids(second))))
+    await session.commit()
+
+    refreshed = await fetch_page(session, select(Order), KEY, 4, second.first_cursor, FROM)
+    assert _ids(refreshed) == _ids(first)
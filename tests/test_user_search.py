@@ -0,0 +1,35 @@
+# tests/test_user_search.py
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.engine import create_engine
+from bot.models.base import Base
+from bot.models.user_profile import UserProfile
+from bot.models.user_settings import UserSettings
+from bot.services.user_search_service import UserSearchService
+
+
+@pytest_asyncio.fixture
+async def session(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'search.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_name_comes_from_profile_without_orders(session):
+    session.add_all([
+        UserSettings(user_id=7),
+        UserProfile(user_id=7, username="luna_tarot", first_name="Луна"),
+    ])
+    await session.commit()
+
+    users, total, _ = await UserSearchService(session).search_users(query="Луна")
+
+    assert total == 1
+    assert (users[0]["username"], users[0]["first_name"]) == ("luna_tarot", "Луна")
+    assert users[0]["last_order"] is None
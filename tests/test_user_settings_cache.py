@@ -0,0 +1,47 @@
+# tests/test_user_settings_cache.py
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.config import UserContextConfig
+from bot.database.engine import create_engine
+from bot.models.base import Base
+from bot.models.user_settings import UserSettings
+from bot.services import user_settings
+from bot.services.user_settings import UserSettingsCache, UserSettingsService
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'settings.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with maker() as session:
+        session.add(UserSettings(user_id=1, ai_mode=True, total_consultations=3))
+        await session.commit()
+    yield maker
+    await engine.dispose()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = UserSettingsCache(UserContextConfig())
+    monkeypatch.setattr(user_settings, "user_settings_cache", cache)
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_cached_settings_survive_rollback_of_loading_session(session_maker, cache):
+    async with session_maker() as session:
+        loaded = await UserSettingsService.get_cached(session, 1)
+        await session.execute(select(UserSettings.id))   # дальше handler работает в той же сессии
+        await session.rollback()            # как DbSessionMiddleware при ошибке handler'а
+
+    assert loaded.ai_mode is True
+    async with session_maker() as session:
+        assert await UserSettingsService.get_ai_mode(session, 1) is True
+        stats = await UserSettingsService.get_user_stats(session, 1)
+    assert stats["total_consultations"] == 3
+    assert cache.hits == 2